@@ -0,0 +1,415 @@
+import argparse
+import io
+import json
+import os
+import re
+import statistics
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import psycopg
+from common import bench_config, drop_database, parse_utc, recreate_database
+from feed import FeedSpec, SyntheticFeed
+from psycopg.conninfo import conninfo_to_dict
+
+from nextspyke import db, ingest
+from nextspyke.health import health_check
+from nextspyke.logging import utc_now
+
+ROOT = Path(__file__).resolve().parents[1]
+DASHBOARD_DIR = ROOT / "observability" / "grafana" / "dashboards"
+SAMPLE_BIKE = "700000"
+
+CITY_STATUS_FILL_SQL = """
+    INSERT INTO city_status (
+        snapshot_id, fetched_at, city_uid, booked_bikes, set_point_bikes, available_bikes,
+        bike_type_counts
+    )
+    SELECT s.snapshot_id, s.fetched_at, c.city_uid, 0, %(bikes)s, %(bikes)s, '{}'::int[]
+    FROM snapshot s
+    CROSS JOIN city c
+    WHERE s.fetched_at >= %(start)s AND s.fetched_at < %(end)s
+"""
+
+PLACE_STATUS_FILL_SQL = """
+    INSERT INTO place_status (
+        snapshot_id, fetched_at, place_uid, booked_bikes, bikes, bikes_available_to_rent,
+        bike_racks, free_racks, special_racks, free_special_racks, bike_type_counts
+    )
+    SELECT
+        s.snapshot_id, s.fetched_at, p.place_uid, 0, x.bikes, x.bikes,
+        p.bike_racks, GREATEST(p.bike_racks - x.bikes, 0), 0, 0, '{}'::int[]
+    FROM snapshot s
+    CROSS JOIN place p
+    CROSS JOIN LATERAL (
+        SELECT (
+            abs(hashtext(
+                p.place_uid || ':' || extract(epoch FROM s.fetched_at)::bigint / 3600
+            )::bigint) %% 12
+        )::int AS bikes
+    ) x
+    WHERE p.spot IS TRUE
+      AND s.fetched_at >= %(start)s AND s.fetched_at < %(end)s
+"""
+
+# Every bike stays at a pseudo-random station for a bike-specific 2-11 hours, so movements
+# come out of the data the same way they do in production.
+BIKE_STATUS_FILL_SQL = """
+    WITH stations AS (
+        SELECT array_agg(place_uid ORDER BY place_uid) AS uids FROM place WHERE spot IS TRUE
+    ),
+    dwell AS (
+        SELECT
+            bike_id,
+            bike_number,
+            3600 * (2 + abs(hashtext(bike_number)::bigint) %% 10) AS period_s,
+            abs(hashtext(bike_number || ':offset')::bigint) %% 36000 AS offset_s
+        FROM bike
+    )
+    INSERT INTO bike_status (
+        snapshot_id, fetched_at, bike_id, place_uid, active, state, pedelec_battery,
+        battery_pack_pct, battery_range_km, geom
+    )
+    SELECT
+        s.snapshot_id, s.fetched_at, d.bike_id, p.place_uid, true, 'ok', 80, 80, NULL,
+        p.geom
+    FROM snapshot s
+    CROSS JOIN dwell d
+    CROSS JOIN stations st
+    JOIN place p ON p.place_uid = st.uids[
+        1 + abs(hashtext(
+            d.bike_number || ':'
+            || (extract(epoch FROM s.fetched_at)::bigint + d.offset_s) / d.period_s
+        )::bigint) %% cardinality(st.uids)
+    ]
+    WHERE s.fetched_at >= %(start)s AND s.fetched_at < %(end)s
+"""
+
+TABLE_ROWS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM snapshot),
+        (SELECT COUNT(*) FROM place_status),
+        (SELECT COUNT(*) FROM bike_status),
+        (SELECT COUNT(*) FROM bike_movement),
+        pg_database_size(current_database())
+"""
+
+TIME_GROUP_MACRO = re.compile(r"\$__timeGroup(Alias)?\(([^,()]+),\s*'?([0-9]+[smhd])'?[^)]*\)")
+TIME_FILTER_MACRO = re.compile(r"\$__timeFilter\(([^()]+)\)")
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def render_grafana_sql(raw_sql: str, start: datetime, end: datetime, interval: str) -> str:
+    """Expand the Grafana macros the dashboards use, the way the postgres datasource does."""
+    query = raw_sql.replace("$__interval", interval)
+    query = query.replace("${bike_number:sqlstring}", f"'{SAMPLE_BIKE}'")
+
+    def time_group(match: re.Match) -> str:
+        column, spec = match.group(2).strip(), match.group(3)
+        seconds = int(spec[:-1]) * INTERVAL_UNITS[spec[-1]]
+        expression = f"floor(extract(epoch from {column})/{seconds})*{seconds}"
+        return f'{expression} AS "time"' if match.group(1) else expression
+
+    query = TIME_GROUP_MACRO.sub(time_group, query)
+    query = TIME_FILTER_MACRO.sub(
+        lambda match: (
+            f"{match.group(1).strip()} BETWEEN '{start.isoformat()}' AND '{end.isoformat()}'"
+        ),
+        query,
+    )
+    query = query.replace("$__timeFrom()", f"'{start.isoformat()}'")
+    return query.replace("$__timeTo()", f"'{end.isoformat()}'")
+
+
+def dashboard_queries() -> list[tuple[str, str]]:
+    queries = []
+    for path in sorted(DASHBOARD_DIR.glob("*.json")):
+        dashboard = json.loads(path.read_text(encoding="utf-8"))
+        for panel in dashboard.get("panels", []):
+            for target in panel.get("targets", []):
+                if target.get("rawSql"):
+                    name = f"{path.stem}#{panel['id']}{target.get('refId', '')} {panel['title']}"
+                    queries.append((name, target["rawSql"]))
+        for variable in dashboard.get("templating", {}).get("list", []):
+            if variable.get("type") == "query" and isinstance(variable.get("query"), str):
+                queries.append((f"{path.stem} ${variable['name']}", variable["query"]))
+    return queries
+
+
+def seed_metadata(conn: psycopg.Connection, spec: FeedSpec, seen_at: datetime) -> None:
+    country = SyntheticFeed(spec).snapshot()["countries"][0]
+    with conn.transaction():
+        with conn.cursor() as cur:
+            ingest.upsert_country(cur, country)
+            ingest.upsert_cities(cur, spec.domain, country["cities"])
+            type_ids = set()
+            bikes = []
+            for city in country["cities"]:
+                stations = [place for place in city["places"] if place.get("spot") is True]
+                ingest.upsert_places(cur, city["uid"], stations)
+                for place in city["places"]:
+                    for bike in place["bike_list"]:
+                        type_ids.add(str(bike["bike_type"]))
+                        bikes.append(
+                            (
+                                bike["number"],
+                                bike["boardcomputer"],
+                                str(bike["bike_type"]),
+                                bike["electric_lock"],
+                                bike["lock_types"],
+                                seen_at,
+                                seen_at,
+                            )
+                        )
+            ingest.upsert_vehicle_types(cur, type_ids)
+            ingest.upsert_bikes(cur, bikes)
+
+
+def month_starts(start: datetime, end: datetime) -> list[datetime]:
+    months = []
+    current = db.month_bounds(start)[0]
+    while current < end:
+        months.append(current)
+        current = db.month_bounds(current)[1]
+    return months
+
+
+def fill_snapshots(
+    cur: psycopg.Cursor, start: datetime, end: datetime, step: timedelta, domain: str
+) -> None:
+    for month in month_starts(start, end):
+        db.ensure_partitions(cur, month)
+    cur.execute(
+        """
+        INSERT INTO snapshot (fetched_at, domain, source)
+        SELECT ts, %s, 'bench-history'
+        FROM generate_series(%s::timestamptz, %s::timestamptz - %s::interval, %s::interval) ts
+        """,
+        (domain, start, end, step, step),
+    )
+    cur.execute("SELECT COUNT(*) FROM bike")
+    params = {"start": start, "end": end, "bikes": cur.fetchone()[0]}
+    cur.execute(CITY_STATUS_FILL_SQL, params)
+    cur.execute(PLACE_STATUS_FILL_SQL, params)
+    cur.execute(BIKE_STATUS_FILL_SQL, params)
+
+
+def fill_history(
+    conn: psycopg.Connection,
+    start: datetime,
+    end: datetime,
+    history_end: datetime,
+    step: timedelta,
+    domain: str,
+) -> None:
+    # One day per transaction keeps WAL and lock footprints bounded on long fills.
+    day = start
+    while day < end:
+        day_end = min(day + timedelta(days=1), end)
+        with conn.transaction():
+            with conn.cursor() as cur:
+                fill_snapshots(cur, day, day_end, step, domain)
+        day = day_end
+    with conn.transaction():
+        with conn.cursor() as cur:
+            ingest.backfill_bike_movements(cur, 10)
+            # Movements into the previously filled range change its first hour, so the
+            # route rollup is rebuilt up to the end of the history.
+            ingest.backfill_route_stats(cur, start, history_end)
+            cur.execute("ANALYZE")
+
+
+def timed(repeat: int, run) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def time_ingest_statements(
+    conn: psycopg.Connection, end: datetime, step: timedelta, domain: str, repeat: int
+) -> dict[str, float]:
+    """Time the per-snapshot ingest statements for one more snapshot, then roll it back."""
+    samples: dict[str, list[float]] = {}
+    for _ in range(repeat):
+        with conn.transaction(force_rollback=True):
+            with conn.cursor() as cur:
+                fetched_at = end
+                started = time.perf_counter()
+                # Run once at startup to seed gap detection; no longer per snapshot.
+                ingest.latest_snapshot_at(cur, domain)
+                samples.setdefault("latest_snapshot_at", []).append(
+                    (time.perf_counter() - started) * 1000
+                )
+                fill_snapshots(cur, fetched_at, fetched_at + step, step, domain)
+                cur.execute("SELECT snapshot_id FROM snapshot WHERE fetched_at = %s", (fetched_at,))
+                snapshot_id = cur.fetchone()[0]
+                for name, run in (
+                    (
+                        "insert_bike_movements",
+                        lambda: ingest.insert_bike_movements(cur, snapshot_id, fetched_at, 10),
+                    ),
+                    (
+                        "update_bike_last_status",
+                        lambda: ingest.update_bike_last_status(cur, snapshot_id, fetched_at),
+                    ),
+                ):
+                    started = time.perf_counter()
+                    run()
+                    samples.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def measure(args: argparse.Namespace, dsn: str, conn: psycopg.Connection) -> dict[str, float]:
+    step = timedelta(seconds=args.fill_interval)
+    timings = time_ingest_statements(conn, args.end, step, args.domain, args.repeat)
+
+    os.environ["DATABASE_URL"] = dsn
+    config = bench_config(args.domain, args.fill_interval)
+    with redirect_stdout(io.StringIO()):
+        timings["health_check"] = timed(args.repeat, lambda: health_check(config))
+
+    window_start = args.end - timedelta(hours=args.window_hours)
+    for name, raw_sql in dashboard_queries():
+        query = render_grafana_sql(raw_sql, window_start, args.end, args.interval)
+
+        def run(query=query):
+            with conn.transaction(force_rollback=True):
+                conn.execute(query).fetchall()
+
+        try:
+            timings[name] = timed(args.repeat, run)
+        except psycopg.Error as exc:
+            print(f"{name}: {exc}".splitlines()[0])
+            timings[name] = float("nan")
+    return timings
+
+
+def print_table(tiers: list[int], results: dict[int, dict], threshold: float) -> list[str]:
+    names = list(results[tiers[0]]["timings"])
+    width = max(len(name) for name in names)
+    header = "".join(f"{f'{days}d ms':>12}" for days in tiers)
+    print(f"\n{'query':<{width}}{header}{'growth':>10}")
+    for label, key in (("bike_status rows", "bike_status"), ("database MB", "database_mb")):
+        values = "".join(f"{results[days][key]:>12}" for days in tiers)
+        print(f"{label:<{width}}{values}")
+    growing = []
+    for name in names:
+        values = [results[days]["timings"][name] for days in tiers]
+        first, last = values[0], values[-1]
+        growth = last / first if first and first == first and last == last else float("nan")
+        flag = " GROWS" if growth > threshold else ""
+        cells = "".join(f"{value:>12.2f}" for value in values)
+        print(f"{name:<{width}}{cells}{growth:>9.1f}x{flag}")
+        if flag:
+            growing.append(name)
+    return growing
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Time ingest and dashboard queries against growing synthetic history."
+    )
+    parser.add_argument("--tiers", default="30,180,365", help="Days of history to measure at")
+    parser.add_argument("--stations", type=int, default=150)
+    parser.add_argument("--bikes", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--fill-interval", type=int, default=600, help="Seconds between synthetic snapshots"
+    )
+    parser.add_argument(
+        "--end",
+        type=parse_utc,
+        default=db.hour_floor(utc_now()),
+        help="End of the synthetic history; defaults to the current hour because several "
+        "dashboard queries are relative to NOW()",
+    )
+    parser.add_argument(
+        "--window-hours", type=int, default=24, help="Dashboard time range, ending at --end"
+    )
+    parser.add_argument("--interval", default="5m", help="Value substituted for $__interval")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--growth-threshold",
+        type=float,
+        default=2.0,
+        help="Flag queries whose time grows by more than this factor from first to last tier",
+    )
+    parser.add_argument("--domain", default="fg")
+    parser.add_argument(
+        "--dsn",
+        default=os.getenv("BENCH_DATABASE_URL") or db.build_dsn(),
+        help="Server to benchmark on; the run uses its own scratch database there",
+    )
+    parser.add_argument("--dbname", default="nextspyke_history_bench")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--output", type=Path, help="Write the raw results as JSON")
+    args = parser.parse_args()
+
+    tiers = sorted({int(days) for days in args.tiers.split(",")})
+    if conninfo_to_dict(args.dsn).get("dbname") == args.dbname:
+        parser.error("--dsn must point at a different database than --dbname")
+    spec = FeedSpec(stations=args.stations, bikes=args.bikes, seed=args.seed, domain=args.domain)
+    step = timedelta(seconds=args.fill_interval)
+
+    dsn = recreate_database(args.dsn, args.dbname)
+    results: dict[int, dict] = {}
+    try:
+        with psycopg.connect(dsn) as conn:
+            db.init_db(conn)
+            seed_metadata(conn, spec, args.end)
+            filled_days = 0
+            for days in tiers:
+                # History grows backwards so the dashboard window always sees the same data.
+                started = time.perf_counter()
+                fill_history(
+                    conn,
+                    args.end - timedelta(days=days),
+                    args.end - timedelta(days=filled_days),
+                    args.end,
+                    step,
+                    args.domain,
+                )
+                if not filled_days:
+                    with conn.transaction():
+                        with conn.cursor() as cur:
+                            cur.execute(
+                                "SELECT snapshot_id, fetched_at FROM snapshot "
+                                "ORDER BY fetched_at DESC LIMIT 1"
+                            )
+                            ingest.update_bike_last_status(cur, *cur.fetchone())
+                filled_days = days
+                snapshots, place_rows, bike_rows, movements, size = conn.execute(
+                    TABLE_ROWS_SQL
+                ).fetchone()
+                conn.commit()
+                print(
+                    f"{days}d filled in {time.perf_counter() - started:.0f}s: "
+                    f"{snapshots} snapshots, {place_rows} place_status, {bike_rows} bike_status, "
+                    f"{movements} movements"
+                )
+                results[days] = {
+                    "snapshots": snapshots,
+                    "bike_status": bike_rows,
+                    "place_status": place_rows,
+                    "bike_movement": movements,
+                    "database_mb": round(size / 1024 / 1024),
+                    "timings": measure(args, dsn, conn),
+                }
+    finally:
+        if not args.keep_db:
+            drop_database(args.dsn, args.dbname)
+
+    growing = print_table(tiers, results, args.growth_threshold)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    return 1 if growing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+from unittest.mock import patch
+
+import psycopg
+from common import (
+    bench_config,
+    compare_metrics,
+    drop_database,
+    parse_utc,
+    percentile,
+    recreate_database,
+)
+from feed import FeedSpec, SyntheticFeed
+from psycopg.conninfo import conninfo_to_dict
+
+from nextspyke import db, ingest
+
+DEFAULT_START = datetime(2026, 1, 5, tzinfo=timezone.utc)
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "results" / "ingest_baseline.json"
+# Stages whose row counts are rows written per snapshot.
+WRITE_STAGES = ("city_status", "insert_place_status", "insert_bike_status", "bike_movement")
+# Metric name -> True when higher is better.
+COMPARED_METRICS = {
+    "snapshots_per_s": True,
+    "rows_per_s": True,
+    "iteration_p50_ms": False,
+    "iteration_p99_ms": False,
+    "wal_bytes_per_snapshot": False,
+    "peak_rss_mb": False,
+}
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = self.server.payload
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        return None
+
+
+class SimulatedClock:
+    def __init__(self, start: datetime, step: timedelta) -> None:
+        self.now = start
+        self.step = step
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self) -> None:
+        self.now += self.step
+
+
+def wal_lsn(conn: psycopg.Connection) -> str:
+    return conn.execute("SELECT pg_current_wal_lsn()").fetchone()[0]
+
+
+def wal_bytes(conn: psycopg.Connection, start_lsn: str, end_lsn: str) -> int:
+    return int(conn.execute("SELECT pg_wal_lsn_diff(%s, %s)", (end_lsn, start_lsn)).fetchone()[0])
+
+
+def run(args: argparse.Namespace, dsn: str) -> dict:
+    spec = FeedSpec(
+        cities=args.cities,
+        stations=args.stations,
+        bikes=args.bikes,
+        move_rate=args.move_rate,
+        seed=args.seed,
+    )
+    feed = SyntheticFeed(spec)
+    config = bench_config(spec.domain, args.poll_interval, args.store_raw_json)
+    clock = SimulatedClock(args.start, timedelta(seconds=args.poll_interval))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    feed_url = f"http://127.0.0.1:{server.server_address[1]}/nextbike-live.json"
+
+    latencies_ms = []
+    rows_written = 0
+    measured_s = 0.0
+    try:
+        with psycopg.connect(dsn) as conn, psycopg.connect(dsn, autocommit=True) as probe:
+            db.init_db(conn)
+            with patch.object(ingest, "LIVE_BASE_URL", feed_url):
+                with patch.object(ingest, "utc_now", clock):
+                    for iteration in range(args.warmup + args.snapshots):
+                        if iteration == args.warmup:
+                            start_lsn = wal_lsn(probe)
+                        # Rendering the feed is the stub server's job, not part of the iteration.
+                        server.payload = feed.payload()
+                        started = time.perf_counter()
+                        result = ingest.ingest_once(conn, config)
+                        elapsed_s = time.perf_counter() - started
+                        if iteration >= args.warmup:
+                            measured_s += elapsed_s
+                            latencies_ms.append(elapsed_s * 1000)
+                            rows_written += sum(
+                                result["stages"].get(stage, {}).get("rows", 0)
+                                for stage in WRITE_STAGES
+                            )
+                        feed.advance()
+                        clock.advance()
+            end_lsn = wal_lsn(probe)
+            total_wal = wal_bytes(probe, start_lsn, end_lsn)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    rss_divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "params": {
+            **asdict(spec),
+            "snapshots": args.snapshots,
+            "warmup": args.warmup,
+            "poll_interval": args.poll_interval,
+            "store_raw_json": args.store_raw_json,
+        },
+        "snapshots_per_s": round(args.snapshots / measured_s, 3),
+        "rows_per_s": round(rows_written / measured_s, 1),
+        "rows_per_snapshot": round(rows_written / args.snapshots, 1),
+        "iteration_p50_ms": round(percentile(latencies_ms, 50), 2),
+        "iteration_p99_ms": round(percentile(latencies_ms, 99), 2),
+        "iteration_mean_ms": round(statistics.fmean(latencies_ms), 2),
+        "wal_bytes_per_snapshot": round(total_wal / args.snapshots),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_divisor, 1),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    if baseline.get("params") != result["params"]:
+        print("baseline was recorded with different parameters; not comparing")
+        return []
+    return compare_metrics(result, baseline, COMPARED_METRICS, tolerance)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ingest_once against synthetic feeds.")
+    parser.add_argument("--cities", type=int, default=1)
+    parser.add_argument("--stations", type=int, default=200, help="Stations per city")
+    parser.add_argument("--bikes", type=int, default=1500)
+    parser.add_argument("--move-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--snapshots", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--poll-interval", type=int, default=60)
+    parser.add_argument("--store-raw-json", action="store_true")
+    parser.add_argument("--start", type=parse_utc, default=DEFAULT_START)
+    parser.add_argument(
+        "--dsn",
+        default=os.getenv("BENCH_DATABASE_URL") or db.build_dsn(),
+        help="Server to benchmark on; the run uses its own scratch database there",
+    )
+    parser.add_argument("--dbname", default="nextspyke_bench")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    if conninfo_to_dict(args.dsn).get("dbname") == args.dbname:
+        parser.error("--dsn must point at a different database than --dbname")
+    dsn = recreate_database(args.dsn, args.dbname)
+    try:
+        result = run(args, dsn)
+    finally:
+        if not args.keep_db:
+            drop_database(args.dsn, args.dbname)
+
+    print(json.dumps(result, indent=2))
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.is_file():
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    return 1 if compare(result, baseline, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+import argparse
+import json
+import sys
+import timeit
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+
+from common import bench_config, compare_metrics
+from feed import FeedSpec, SyntheticFeed
+from psycopg.types.json import Json, JsonDumper
+
+from nextspyke.config import hash_config, sanitize_config
+from nextspyke.ingest import bike_type_counts, bike_type_ids, build_bike_rows
+from nextspyke.logging import log_event, utc_now
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "results" / "python_baseline.json"
+
+
+class NullStream:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        return None
+
+
+def measure(fn, repeat: int) -> dict[str, float]:
+    """Best-of-`repeat` time per call and the allocation peak of a single call."""
+    timer = timeit.Timer(fn)
+    number, _elapsed = timer.autorange()
+    best_s = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        fn()
+        before, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "us": round(best_s * 1_000_000, 2),
+        "peak_kib": round((peak - before) / 1024, 1),
+        "retained_kib": round((after - before) / 1024, 1),
+    }
+
+
+def build_cases(bikes: int) -> dict:
+    feed = SyntheticFeed(FeedSpec(bikes=bikes, stations=max(1, bikes // 8)))
+    payload = feed.payload()
+    live_data = json.loads(payload)
+    places = [place for city in live_data["countries"][0]["cities"] for place in city["places"]]
+    stations = [place for place in places if place.get("spot") is True]
+    fetched_at = utc_now()
+    config = bench_config("fg", 60)
+    config_payload = {key.upper(): value for key, value in asdict(config).items()}
+    config_payload["DATABASE_URL"] = "postgresql://nextspyke:secret@db:5432/nextspyke"
+    dumper = JsonDumper(Json)
+    ordinals = {type_id: index for index, type_id in enumerate(sorted(bike_type_ids(stations)), 1)}
+    try:
+        raise RuntimeError("synthetic failure")
+    except RuntimeError as exc:
+        error = exc
+
+    return {
+        "json_decode": lambda: json.loads(payload),
+        "build_bike_rows": lambda: build_bike_rows(places, 1, fetched_at),
+        "place_status_json_adapter": lambda: [
+            dumper.dump(Json(place.get("bike_types") or {})) for place in stations
+        ],
+        "place_status_type_counts": lambda: [
+            bike_type_counts(place.get("bike_types"), ordinals) for place in stations
+        ],
+        "raw_json_adapter": lambda: dumper.dump(Json(live_data)),
+        "log_event": lambda: log_event(
+            "info",
+            "ingest",
+            "Ingest iteration succeeded",
+            event="ingest_success",
+            config=config,
+            extra={"snapshot_id": 1, "bikes": bikes, "duration_ms": 812},
+        ),
+        "log_event_with_exception": lambda: log_event(
+            "error",
+            "ingest",
+            "Ingest iteration failed",
+            event="ingest_failed",
+            config=config,
+            exc=error,
+        ),
+        "sanitize_config": lambda: sanitize_config(config_payload),
+        "hash_config": lambda: hash_config(config_payload),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark the pure-Python ingest and logging hot paths."
+    )
+    parser.add_argument(
+        "--bikes", type=int, default=1000, help="Bikes in the feed for the per-feed cases"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="Only run cases containing this text")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    results = {}
+    stdout = sys.stdout
+    # log_event writes to sys.stdout; measure encoding, not the terminal.
+    sys.stdout = NullStream()
+    try:
+        for name, fn in build_cases(args.bikes).items():
+            if args.filter in name:
+                results[name] = measure(fn, args.repeat)
+    finally:
+        sys.stdout = stdout
+
+    width = max(len(name) for name in results)
+    print(f"{'case':<{width}} {'us/call':>12} {'peak KiB':>10} {'retained KiB':>13}")
+    for name, values in results.items():
+        print(
+            f"{name:<{width}} {values['us']:>12.2f} {values['peak_kib']:>10.1f} "
+            f"{values['retained_kib']:>13.1f}"
+        )
+
+    flat = {"bikes": args.bikes}
+    flat |= {
+        f"{name}.{metric}": value
+        for name, values in results.items()
+        for metric, value in values.items()
+        if metric != "retained_kib"
+    }
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(flat, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.is_file():
+        return 0
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("bikes") != args.bikes:
+        print("baseline was recorded with a different feed size; not comparing")
+        return 0
+    lower_is_better = {metric: False for metric in flat if metric != "bikes"}
+    return 1 if compare_metrics(flat, baseline, lower_is_better, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,81 @@
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.config import AppConfig
+
+
+def bench_config(domain: str, poll_interval: int, store_raw_json: bool = False) -> AppConfig:
+    return AppConfig(
+        service="nextspyke",
+        env="bench",
+        version="bench",
+        commit="bench",
+        domain=domain,
+        city_id=0,
+        poll_interval=poll_interval,
+        fetch_zones=False,
+        fetch_gbfs=False,
+        store_raw_json=store_raw_json,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="",
+        metrics_enabled=False,
+        metrics_port=0,
+        config_source="bench",
+        config_hash="bench",
+    )
+
+
+def parse_utc(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        raise argparse.ArgumentTypeError("timestamp needs a UTC offset")
+    return parsed
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def compare_metrics(
+    result: dict, baseline: dict, higher_is_better: dict[str, bool], tolerance: float
+) -> list[str]:
+    """Print each metric against the baseline and return those worse by more than `tolerance`."""
+    regressions = []
+    for metric, higher in higher_is_better.items():
+        before = baseline.get(metric)
+        after = result.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        worse = -change if higher else change
+        marker = "REGRESSION" if worse > tolerance else "ok"
+        print(f"{metric:<40} {before:>12} -> {after:>12} ({change:+.1%}) {marker}")
+        if worse > tolerance:
+            regressions.append(metric)
+    return regressions
+
+
+def recreate_database(admin_dsn: str, dbname: str) -> str:
+    """Create an empty scratch database next to the one `admin_dsn` points at."""
+    with psycopg.connect(admin_dsn, autocommit=True) as admin:
+        admin.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(dbname)))
+        admin.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname)))
+    return make_conninfo(admin_dsn, dbname=dbname)
+
+
+def drop_database(admin_dsn: str, dbname: str) -> None:
+    with psycopg.connect(admin_dsn, autocommit=True) as admin:
+        admin.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(dbname)))
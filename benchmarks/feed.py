@@ -0,0 +1,212 @@
+import json
+import random
+from dataclasses import dataclass
+
+# Karlsruhe; generated stations are spread over roughly 10 x 10 km around it.
+CENTER_LAT = 49.0069
+CENTER_LNG = 8.4037
+SPREAD_DEG = 0.045
+BIKE_TYPES = (196, 210, 249)
+
+
+@dataclass(frozen=True)
+class FeedSpec:
+    cities: int = 1
+    stations: int = 200
+    bikes: int = 1500
+    # Share of bikes that change position between two consecutive snapshots.
+    move_rate: float = 0.02
+    # Share of bikes that park as free-floating spots instead of at a station.
+    spot_rate: float = 0.1
+    seed: int = 42
+    domain: str = "fg"
+
+
+class SyntheticFeed:
+    """Deterministic nextbike-live payloads: the same spec and seed give the same snapshots."""
+
+    def __init__(self, spec: FeedSpec) -> None:
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+        self.stations = []
+        for index in range(spec.cities * spec.stations):
+            self.stations.append(
+                {
+                    "uid": 100000 + index,
+                    "number": 5000 + index,
+                    "name": f"Bench Station {index}",
+                    "lat": round(CENTER_LAT + self.random.uniform(-SPREAD_DEG, SPREAD_DEG), 6),
+                    "lng": round(CENTER_LNG + self.random.uniform(-SPREAD_DEG, SPREAD_DEG), 6),
+                    "bike_racks": self.random.randint(6, 20),
+                }
+            )
+        self.bikes = {}
+        for index in range(spec.bikes):
+            self.bikes[str(700000 + index)] = {
+                "bike_type": self.random.choice(BIKE_TYPES),
+                "position": self._random_position(),
+                "battery": self.random.randint(20, 100),
+            }
+        self.tick = 0
+
+    def _random_position(self) -> tuple[int, float | None, float | None]:
+        station = self.random.randrange(len(self.stations))
+        if self.random.random() >= self.spec.spot_rate:
+            return station, None, None
+        anchor = self.stations[station]
+        return (
+            station,
+            round(anchor["lat"] + self.random.uniform(-0.004, 0.004), 6),
+            round(anchor["lng"] + self.random.uniform(-0.004, 0.004), 6),
+        )
+
+    def advance(self) -> None:
+        self.tick += 1
+        numbers = sorted(self.bikes)
+        moving = round(len(numbers) * self.spec.move_rate)
+        for number in self.random.sample(numbers, moving):
+            bike = self.bikes[number]
+            bike["position"] = self._random_position()
+            bike["battery"] = max(5, bike["battery"] - self.random.randint(0, 8))
+
+    def snapshot(self) -> dict:
+        at_station: dict[int, list[dict]] = {}
+        spots: dict[int, list[dict]] = {}
+        for number, bike in self.bikes.items():
+            station, lat, lng = bike["position"]
+            entry = {
+                "number": number,
+                "bike_type": bike["bike_type"],
+                "lock_types": ["frame_lock"],
+                "active": True,
+                "state": "ok",
+                "electric_lock": True,
+                "boardcomputer": int(number) + 1000000,
+                "pedelec_battery": bike["battery"],
+                "battery_pack": {"percentage": bike["battery"]},
+            }
+            if lat is None:
+                at_station.setdefault(station, []).append(entry)
+            else:
+                spots.setdefault(station, []).append({**entry, "_lat": lat, "_lng": lng})
+
+        cities = []
+        for city_index in range(self.spec.cities):
+            city_uid = 9000 + city_index
+            places = []
+            first = city_index * self.spec.stations
+            for index in range(first, first + self.spec.stations):
+                station = self.stations[index]
+                bikes = at_station.get(index, [])
+                places.append(self._station_place(station, bikes))
+                for spot in spots.get(index, []):
+                    places.append(self._spot_place(spot))
+            cities.append(
+                {
+                    "uid": city_uid,
+                    "lat": CENTER_LAT,
+                    "lng": CENTER_LNG,
+                    "zoom": 13,
+                    "maps_icon": "",
+                    "alias": f"bench-{city_index}",
+                    "break": False,
+                    "name": f"Bench City {city_index}",
+                    "num_places": len(places),
+                    "refresh_rate": "60",
+                    "bounds": {
+                        "south_west": {
+                            "lat": CENTER_LAT - SPREAD_DEG,
+                            "lng": CENTER_LNG - SPREAD_DEG,
+                        },
+                        "north_east": {
+                            "lat": CENTER_LAT + SPREAD_DEG,
+                            "lng": CENTER_LNG + SPREAD_DEG,
+                        },
+                    },
+                    "booked_bikes": 0,
+                    "set_point_bikes": self.spec.bikes // self.spec.cities,
+                    "available_bikes": sum(len(place["bike_list"]) for place in places),
+                    "return_to_official_only": False,
+                    "bike_types": {},
+                    "website": "https://example.invalid",
+                    "places": places,
+                }
+            )
+        return {
+            "countries": [
+                {
+                    "lat": CENTER_LAT,
+                    "lng": CENTER_LNG,
+                    "zoom": 11,
+                    "name": "Bench nextbike",
+                    "hotline": "+49000",
+                    "domain": self.spec.domain,
+                    "language": "de",
+                    "email": "bench@example.invalid",
+                    "timezone": "Europe/Berlin",
+                    "currency": "EUR",
+                    "country_calling_code": "+49",
+                    "system_operator_address": "",
+                    "country": "DE",
+                    "country_name": "Germany",
+                    "terms": "",
+                    "policy": "",
+                    "website": "https://example.invalid",
+                    "pricing": "",
+                    "cities": cities,
+                }
+            ]
+        }
+
+    @staticmethod
+    def _station_place(station: dict, bikes: list[dict]) -> dict:
+        types: dict[str, int] = {}
+        for bike in bikes:
+            types[str(bike["bike_type"])] = types.get(str(bike["bike_type"]), 0) + 1
+        return {
+            "uid": station["uid"],
+            "lat": station["lat"],
+            "lng": station["lng"],
+            "bike": False,
+            "name": station["name"],
+            "address": None,
+            "spot": True,
+            "number": station["number"],
+            "booked_bikes": 0,
+            "bikes": len(bikes),
+            "bikes_available_to_rent": len(bikes),
+            "active_place": 1,
+            "bike_racks": station["bike_racks"],
+            "free_racks": max(0, station["bike_racks"] - len(bikes)),
+            "special_racks": 0,
+            "free_special_racks": 0,
+            "maintenance": False,
+            "terminal_type": "free",
+            "bike_list": bikes,
+            "bike_numbers": [bike["number"] for bike in bikes],
+            "bike_types": types,
+            "place_type": "0",
+            "rack_locks": False,
+        }
+
+    @staticmethod
+    def _spot_place(spot: dict) -> dict:
+        bike = {key: value for key, value in spot.items() if not key.startswith("_")}
+        return {
+            # Free-floating bikes are reported as places with spot=false and no station uid.
+            "uid": 900000000 + int(bike["number"]),
+            "lat": spot["_lat"],
+            "lng": spot["_lng"],
+            "bike": True,
+            "name": f"BIKE {bike['number']}",
+            "spot": False,
+            "number": 0,
+            "bikes": 1,
+            "bikes_available_to_rent": 1,
+            "bike_list": [bike],
+            "bike_numbers": [bike["number"]],
+            "place_type": "12",
+        }
+
+    def payload(self) -> bytes:
+        return json.dumps(self.snapshot(), separators=(",", ":")).encode("utf-8")
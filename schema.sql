@@ -191,6 +191,109 @@ CREATE TABLE IF NOT EXISTS bike_movement (
   created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Hourly origin/destination rollup of bike_movement, maintained by the collector and rebuilt
+-- with `backfill-route-stats`. NULL place uids are free-floating ends.
+CREATE TABLE IF NOT EXISTS route_stats (
+  start_place_uid INTEGER,
+  end_place_uid INTEGER,
+  bucket_start TIMESTAMPTZ NOT NULL,
+  movements INTEGER NOT NULL,
+  distance_m_sum BIGINT NOT NULL DEFAULT 0,
+  duration_seconds_sum BIGINT NOT NULL DEFAULT 0
+);
+
+-- Completed stays of a bike at one location, closed by the collector when the bike moves on.
+-- Stays whose arrival was never observed are not recorded.
+CREATE TABLE IF NOT EXISTS bike_dwell (
+  bike_number TEXT REFERENCES bike(bike_number),
+  place_uid INTEGER,
+  geom GEOMETRY(Point, 4326),
+  dwell_start TIMESTAMPTZ NOT NULL,
+  dwell_end TIMESTAMPTZ NOT NULL,
+  seconds INTEGER NOT NULL,
+  PRIMARY KEY (bike_number, dwell_start)
+);
+
+CREATE TABLE IF NOT EXISTS place_dwell_histogram (
+  place_uid INTEGER NOT NULL,
+  bucket_day DATE NOT NULL,
+  lower_bound_s INTEGER NOT NULL,
+  dwells INTEGER NOT NULL,
+  seconds_sum BIGINT NOT NULL,
+  PRIMARY KEY (place_uid, bucket_day, lower_bound_s)
+);
+
+-- One row per bike and UTC day: the ordered path of detected movements, starting at the
+-- departure point of the first movement, with a timestamp and place per path point.
+CREATE TABLE IF NOT EXISTS bike_trajectory (
+  bike_number TEXT NOT NULL REFERENCES bike(bike_number),
+  day DATE NOT NULL,
+  path GEOMETRY(LineString, 4326) NOT NULL,
+  point_times TIMESTAMPTZ[] NOT NULL,
+  place_uids INTEGER[] NOT NULL,
+  PRIMARY KEY (bike_number, day)
+);
+
+-- Downsampled place_status tiers, rolled up from complete hours by the `maintenance` command.
+CREATE TABLE IF NOT EXISTS place_status_5m (
+  place_uid INTEGER NOT NULL,
+  bucket_start TIMESTAMPTZ NOT NULL,
+  samples INTEGER NOT NULL,
+  bikes_min INTEGER,
+  bikes_max INTEGER,
+  bikes_avg DOUBLE PRECISION,
+  bikes_last INTEGER,
+  free_racks_min INTEGER,
+  free_racks_max INTEGER,
+  free_racks_avg DOUBLE PRECISION,
+  free_racks_last INTEGER,
+  bikes_available_to_rent_min INTEGER,
+  bikes_available_to_rent_max INTEGER,
+  bikes_available_to_rent_avg DOUBLE PRECISION,
+  bikes_available_to_rent_last INTEGER,
+  PRIMARY KEY (place_uid, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS place_status_1h (
+  place_uid INTEGER NOT NULL,
+  bucket_start TIMESTAMPTZ NOT NULL,
+  samples INTEGER NOT NULL,
+  bikes_min INTEGER,
+  bikes_max INTEGER,
+  bikes_avg DOUBLE PRECISION,
+  bikes_last INTEGER,
+  free_racks_min INTEGER,
+  free_racks_max INTEGER,
+  free_racks_avg DOUBLE PRECISION,
+  free_racks_last INTEGER,
+  bikes_available_to_rent_min INTEGER,
+  bikes_available_to_rent_max INTEGER,
+  bikes_available_to_rent_avg DOUBLE PRECISION,
+  bikes_available_to_rent_last INTEGER,
+  PRIMARY KEY (place_uid, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS maintenance_state (
+  name TEXT PRIMARY KEY,
+  value TIMESTAMPTZ NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Partitions moved to Parquet files under COLD_STORAGE_DIR by `tier-cold`; `path` is
+-- relative to that directory.
+CREATE TABLE IF NOT EXISTS cold_partition (
+  partition_name TEXT PRIMARY KEY,
+  table_name TEXT NOT NULL,
+  range_start TIMESTAMPTZ NOT NULL,
+  range_end TIMESTAMPTZ NOT NULL,
+  path TEXT NOT NULL,
+  row_count BIGINT NOT NULL,
+  checksum TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_cold_partition_range ON cold_partition (table_name, range_start);
+
 ALTER TABLE city
   ADD COLUMN IF NOT EXISTS place_types JSONB,
   ADD COLUMN IF NOT EXISTS return_to_official_only BOOLEAN;
@@ -200,32 +303,444 @@ ALTER TABLE vehicle_type
   ADD COLUMN IF NOT EXISTS rider_capacity INTEGER,
   ADD COLUMN IF NOT EXISTS vehicle_image TEXT;
 
+-- Position of the type in bike_type_counts arrays (1-based); never reassigned.
+ALTER TABLE vehicle_type
+  ADD COLUMN IF NOT EXISTS ordinal INTEGER GENERATED BY DEFAULT AS IDENTITY;
+
 ALTER TABLE place_status
   ADD COLUMN IF NOT EXISTS bike_types JSONB;
 
+-- Bikes per vehicle type, indexed by vehicle_type.ordinal. Replaces the bike_types JSONB
+-- columns, which are NULL for new rows and emptied by `migrate-bike-types`.
+ALTER TABLE place_status
+  ADD COLUMN IF NOT EXISTS bike_type_counts INTEGER[];
+
+ALTER TABLE city_status
+  ADD COLUMN IF NOT EXISTS bike_type_counts INTEGER[];
+
 ALTER TABLE bike_status
   ADD COLUMN IF NOT EXISTS battery_range_km DOUBLE PRECISION;
 
+-- FALSE when the snapshot only wrote the place_status rows that changed since the last write.
+ALTER TABLE snapshot
+  ADD COLUMN IF NOT EXISTS place_status_keyframe BOOLEAN NOT NULL DEFAULT TRUE;
+
+ALTER TABLE bike_last_status
+  ADD COLUMN IF NOT EXISTS dwell_started_at TIMESTAMPTZ;
+
 ALTER TABLE bike_movement
   ADD COLUMN IF NOT EXISTS movement_reason TEXT NOT NULL DEFAULT 'place_change';
 
+-- Integer surrogate for bike_number, stored by the history tables instead of the text key.
+ALTER TABLE bike
+  ADD COLUMN IF NOT EXISTS bike_id INTEGER GENERATED BY DEFAULT AS IDENTITY;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bike_id ON bike (bike_id);
+
+-- New bike_status and bike_movement rows carry bike_id and leave bike_number NULL. Older rows
+-- keep bike_number until `migrate-bike-ids` rewrites them; v_bike_status and v_bike_movement
+-- show both columns for every row.
+ALTER TABLE bike_status
+  ADD COLUMN IF NOT EXISTS bike_id INTEGER;
+
+ALTER TABLE bike_movement
+  ADD COLUMN IF NOT EXISTS bike_id INTEGER;
+
+ALTER TABLE bike_last_status
+  ADD COLUMN IF NOT EXISTS bike_id INTEGER;
+
+-- The tables above are created with bike_number as the key. A new database switches them to
+-- bike_id here. An existing one keeps that layout until `migrate-bike-ids` converts it without
+-- stopping the collector; doing it here would rebuild the bike_status key over every history
+-- partition and validate the foreign keys against the whole tables on startup.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM bike_status LIMIT 1)
+     AND NOT EXISTS (SELECT 1 FROM bike_movement LIMIT 1)
+     AND NOT EXISTS (SELECT 1 FROM bike_last_status LIMIT 1) THEN
+    IF EXISTS (
+      SELECT 1 FROM pg_constraint
+      WHERE conrelid = 'bike_status'::regclass AND conname = 'bike_status_pkey'
+    ) THEN
+      ALTER TABLE bike_status DROP CONSTRAINT bike_status_pkey;
+      ALTER TABLE bike_status ALTER COLUMN bike_number DROP NOT NULL;
+      ALTER TABLE bike_status ADD CONSTRAINT bike_status_bike_id_fkey
+        FOREIGN KEY (bike_id) REFERENCES bike(bike_id);
+      ALTER TABLE bike_movement ADD CONSTRAINT bike_movement_bike_id_fkey
+        FOREIGN KEY (bike_id) REFERENCES bike(bike_id);
+    END IF;
+    IF EXISTS (
+      SELECT 1 FROM pg_attribute
+      WHERE attrelid = 'bike_last_status'::regclass
+        AND attname = 'bike_number'
+        AND NOT attisdropped
+    ) THEN
+      ALTER TABLE bike_last_status DROP COLUMN bike_number;
+      ALTER TABLE bike_last_status ADD PRIMARY KEY (bike_id);
+      ALTER TABLE bike_last_status ADD CONSTRAINT bike_last_status_bike_id_fkey
+        FOREIGN KEY (bike_id) REFERENCES bike(bike_id);
+    END IF;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_bike_status_key
+      ON bike_status (snapshot_id, bike_id, fetched_at);
+    CREATE INDEX IF NOT EXISTS idx_bike_status_unmigrated
+      ON bike_status (fetched_at) WHERE bike_id IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_bike_movement_bike_id_time
+      ON bike_movement (bike_id, end_fetched_at);
+    CREATE INDEX IF NOT EXISTS idx_bike_movement_unmigrated
+      ON bike_movement (end_fetched_at) WHERE bike_id IS NULL;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_bike_movement_bike_id_unique
+      ON bike_movement (bike_id, start_snapshot_id, end_snapshot_id);
+  END IF;
+END;
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_vehicle_type_ordinal ON vehicle_type (ordinal);
 CREATE INDEX IF NOT EXISTS idx_snapshot_fetched_at ON snapshot (fetched_at);
 CREATE INDEX IF NOT EXISTS idx_snapshot_domain_fetched_at
   ON snapshot (domain, fetched_at DESC);
+CREATE INDEX IF NOT EXISTS idx_snapshot_keyframe
+  ON snapshot (domain, fetched_at DESC) WHERE place_status_keyframe;
 CREATE INDEX IF NOT EXISTS idx_snapshot_gap_end ON snapshot_gap (gap_end);
 CREATE INDEX IF NOT EXISTS idx_snapshot_gap_domain_end ON snapshot_gap (domain, gap_end);
-CREATE INDEX IF NOT EXISTS idx_bike_status_bike_time ON bike_status (bike_number, fetched_at);
-CREATE INDEX IF NOT EXISTS idx_place_status_place_time ON place_status (place_uid, fetched_at);
 CREATE INDEX IF NOT EXISTS idx_city_status_city_time ON city_status (city_uid, fetched_at);
 CREATE INDEX IF NOT EXISTS idx_place_geom ON place USING GIST (geom);
-CREATE INDEX IF NOT EXISTS idx_bike_status_geom ON bike_status USING GIST (geom);
 CREATE INDEX IF NOT EXISTS idx_zone_geom ON zone USING GIST (geom);
-CREATE INDEX IF NOT EXISTS idx_bike_movement_bike_time ON bike_movement (bike_number, end_fetched_at);
-CREATE INDEX IF NOT EXISTS idx_bike_movement_time ON bike_movement (end_fetched_at);
 CREATE INDEX IF NOT EXISTS idx_bike_movement_places ON bike_movement (start_place_uid, end_place_uid);
 CREATE INDEX IF NOT EXISTS idx_bike_movement_end_geom ON bike_movement USING GIST (end_geom);
-CREATE UNIQUE INDEX IF NOT EXISTS idx_bike_movement_unique
-  ON bike_movement (bike_number, start_snapshot_id, end_snapshot_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_route_stats_key
+  ON route_stats (start_place_uid, end_place_uid, bucket_start) NULLS NOT DISTINCT;
+CREATE INDEX IF NOT EXISTS idx_route_stats_bucket ON route_stats (bucket_start);
+CREATE INDEX IF NOT EXISTS idx_bike_dwell_end ON bike_dwell (dwell_end);
+CREATE INDEX IF NOT EXISTS idx_bike_trajectory_day ON bike_trajectory (day);
+-- Lookups by bike, place or location are served by per-partition indexes that are only built
+-- once a month partition is closed (see nextspyke.indexes). A new database starts with that
+-- layout. An existing one keeps its indexes until `migrate-indexes` switches it over without
+-- blocking the collector; building these here would lock the history tables on startup.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM bike_status LIMIT 1)
+     AND NOT EXISTS (SELECT 1 FROM place_status LIMIT 1)
+     AND NOT EXISTS (SELECT 1 FROM bike_movement LIMIT 1) THEN
+    CREATE INDEX IF NOT EXISTS idx_bike_status_fetched_at_brin
+      ON bike_status USING BRIN (fetched_at);
+    CREATE INDEX IF NOT EXISTS idx_place_status_fetched_at_brin
+      ON place_status USING BRIN (fetched_at);
+    CREATE INDEX IF NOT EXISTS idx_bike_movement_time_covering
+      ON bike_movement (end_fetched_at)
+      INCLUDE (distance_m, duration_seconds, start_place_uid, end_place_uid);
+  END IF;
+END;
+$$;
+CREATE INDEX IF NOT EXISTS idx_place_status_5m_bucket ON place_status_5m (bucket_start);
+CREATE INDEX IF NOT EXISTS idx_place_status_1h_bucket ON place_status_1h (bucket_start);
+CREATE INDEX IF NOT EXISTS idx_bike_dwell_place_end ON bike_dwell (place_uid, dwell_end);
+CREATE INDEX IF NOT EXISTS idx_place_dwell_histogram_day
+  ON place_dwell_histogram (bucket_day);
+
+-- Path points of one bike in a time range, read from one bike_trajectory row per day. The
+-- departure point of the first leg in range is included; the repeated point where one day's
+-- row continues the previous one is dropped.
+CREATE OR REPLACE FUNCTION bike_path(p_bike_number TEXT, p_from TIMESTAMPTZ, p_to TIMESTAMPTZ)
+RETURNS TABLE (seq INTEGER, geom GEOMETRY, point_time TIMESTAMPTZ, place_uid INTEGER)
+LANGUAGE sql STABLE AS $$
+  WITH points AS (
+    SELECT t.day,
+           pt.idx,
+           ST_PointN(t.path, pt.idx) AS geom,
+           t.point_times[pt.idx] AS point_time,
+           t.place_uids[pt.idx] AS place_uid
+    FROM bike_trajectory t
+    CROSS JOIN LATERAL generate_series(1, ST_NPoints(t.path)) AS pt(idx)
+    WHERE t.bike_number = p_bike_number
+      AND t.day >= (p_from AT TIME ZONE 'UTC')::date
+      AND t.day <= (p_to AT TIME ZONE 'UTC')::date
+      AND t.point_times[pt.idx] < p_to
+      AND (
+        t.point_times[pt.idx] >= p_from
+        OR (t.point_times[pt.idx + 1] >= p_from AND t.point_times[pt.idx + 1] < p_to)
+      )
+  ), linked AS (
+    SELECT p.*, LAG(p.geom) OVER (ORDER BY p.day, p.idx) AS prev_geom
+    FROM points p
+  )
+  SELECT (row_number() OVER (ORDER BY l.day, l.idx))::int, l.geom, l.point_time, l.place_uid
+  FROM linked l
+  WHERE l.idx > 1 OR l.prev_geom IS NULL OR NOT ST_Equals(l.geom, l.prev_geom)
+  ORDER BY l.day, l.idx;
+$$;
+
+CREATE OR REPLACE FUNCTION bike_number_of(p_bike_id INTEGER)
+RETURNS TEXT
+LANGUAGE sql STABLE AS $$
+  SELECT b.bike_number FROM bike b WHERE b.bike_id = p_bike_id;
+$$;
+
+-- bike_status, bike_movement and bike_last_status with bike_number, for dashboards and other
+-- readers that identify bikes by number. Rows not rewritten by `migrate-bike-ids` yet are
+-- matched on bike_number; the partial unmigrated indexes keep that branch cheap.
+CREATE OR REPLACE VIEW v_bike_status AS
+SELECT bs.snapshot_id, bs.fetched_at, bs.bike_id, b.bike_number, bs.place_uid, bs.active,
+       bs.state, bs.pedelec_battery, bs.battery_pack_pct, bs.battery_range_km, bs.geom
+FROM bike_status bs
+JOIN bike b ON b.bike_id = bs.bike_id
+UNION ALL
+SELECT bs.snapshot_id, bs.fetched_at, b.bike_id, b.bike_number, bs.place_uid, bs.active,
+       bs.state, bs.pedelec_battery, bs.battery_pack_pct, bs.battery_range_km, bs.geom
+FROM bike_status bs
+JOIN bike b ON b.bike_number = bs.bike_number
+WHERE bs.bike_id IS NULL;
+
+CREATE OR REPLACE VIEW v_bike_movement AS
+SELECT bm.movement_id, bm.bike_id, b.bike_number, bm.start_snapshot_id, bm.start_fetched_at,
+       bm.end_snapshot_id, bm.end_fetched_at, bm.start_place_uid, bm.end_place_uid,
+       bm.start_geom, bm.end_geom, bm.distance_m, bm.duration_seconds,
+       bm.is_station_to_station, bm.confidence, bm.movement_reason, bm.created_at
+FROM bike_movement bm
+JOIN bike b ON b.bike_id = bm.bike_id
+UNION ALL
+SELECT bm.movement_id, b.bike_id, b.bike_number, bm.start_snapshot_id, bm.start_fetched_at,
+       bm.end_snapshot_id, bm.end_fetched_at, bm.start_place_uid, bm.end_place_uid,
+       bm.start_geom, bm.end_geom, bm.distance_m, bm.duration_seconds,
+       bm.is_station_to_station, bm.confidence, bm.movement_reason, bm.created_at
+FROM bike_movement bm
+JOIN bike b ON b.bike_number = bm.bike_number
+WHERE bm.bike_id IS NULL;
+
+CREATE OR REPLACE VIEW v_bike_last_status AS
+SELECT bls.bike_id, b.bike_number, bls.snapshot_id, bls.fetched_at, bls.place_uid, bls.geom,
+       bls.active, bls.state, bls.pedelec_battery, bls.battery_pack_pct,
+       bls.battery_range_km, bls.dwell_started_at
+FROM bike_last_status bls
+JOIN bike b ON b.bike_id = bls.bike_id;
+
+CREATE OR REPLACE FUNCTION vehicle_type_ordinal(p_vehicle_type_id TEXT)
+RETURNS INTEGER
+LANGUAGE sql STABLE AS $$
+  SELECT vt.ordinal FROM vehicle_type vt WHERE vt.vehicle_type_id = p_vehicle_type_id;
+$$;
+
+-- Bikes of one type in a bike_type_counts array. IMMUTABLE and inlined, so it can back an
+-- expression index, e.g. ON place_status ((bike_type_count(bike_type_counts, 3))), and a
+-- filter like bike_type_count(bike_type_counts, vehicle_type_ordinal('196')) > 0 can use it.
+CREATE OR REPLACE FUNCTION bike_type_count(p_counts INTEGER[], p_ordinal INTEGER)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE AS $$
+  SELECT COALESCE(p_counts[p_ordinal], 0);
+$$;
+
+-- The old {vehicle_type_id: count} object, for readers that still want JSON. Types without
+-- bikes are left out.
+CREATE OR REPLACE FUNCTION bike_types_json(p_counts INTEGER[])
+RETURNS JSONB
+LANGUAGE sql STABLE STRICT AS $$
+  SELECT COALESCE(jsonb_object_agg(vt.vehicle_type_id, c.count), '{}'::jsonb)
+  FROM unnest(p_counts) WITH ORDINALITY AS c(count, ordinal)
+  JOIN vehicle_type vt ON vt.ordinal = c.ordinal
+  WHERE c.count <> 0;
+$$;
+
+-- Encodes a bike_types object; every key must already be a vehicle_type.
+CREATE OR REPLACE FUNCTION bike_type_counts_from_json(p_bike_types JSONB)
+RETURNS INTEGER[]
+LANGUAGE sql STABLE STRICT AS $$
+  WITH typed AS (
+    SELECT vt.ordinal, e.value::int AS count
+    FROM jsonb_each_text(p_bike_types) e
+    JOIN vehicle_type vt ON vt.vehicle_type_id = e.key
+  )
+  SELECT COALESCE(array_agg(COALESCE(t.count, 0) ORDER BY o.ordinal), '{}')
+  FROM generate_series(1, (SELECT MAX(ordinal) FROM typed)) AS o(ordinal)
+  LEFT JOIN typed t ON t.ordinal = o.ordinal;
+$$;
+
+-- place_status_filled and place_status_at returned bike_types JSONB before bike_type_counts;
+-- a changed result type cannot be replaced in place.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_proc
+    WHERE proname = 'place_status_filled' AND 'bike_types' = ANY(proargnames)
+  ) THEN
+    DROP FUNCTION IF EXISTS place_status_at(TEXT, TIMESTAMPTZ);
+    DROP FUNCTION place_status_filled(TIMESTAMPTZ, TIMESTAMPTZ, TEXT);
+  END IF;
+END;
+$$;
+
+-- One place_status row per snapshot and station in [p_from, p_to), as if every snapshot had
+-- written every station. Snapshots that are not keyframes only wrote the stations that
+-- changed, so each station carries its last written row forward until it is written again
+-- or the domain's next keyframe starts over.
+CREATE OR REPLACE FUNCTION place_status_filled(
+  p_from TIMESTAMPTZ,
+  p_to TIMESTAMPTZ,
+  p_domain TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  snapshot_id BIGINT,
+  fetched_at TIMESTAMPTZ,
+  place_uid INTEGER,
+  booked_bikes INTEGER,
+  bikes INTEGER,
+  bikes_available_to_rent INTEGER,
+  bike_racks INTEGER,
+  free_racks INTEGER,
+  special_racks INTEGER,
+  free_special_racks INTEGER,
+  bike_type_counts INTEGER[]
+)
+LANGUAGE sql STABLE AS $$
+  WITH domains AS (
+    SELECT DISTINCT s.domain
+    FROM snapshot s
+    WHERE s.fetched_at >= p_from AND s.fetched_at < p_to
+      AND (p_domain IS NULL OR s.domain = p_domain)
+  ), start_at AS (
+    SELECT COALESCE(MIN(k.fetched_at), p_from) AS fetched_at
+    FROM domains d
+    CROSS JOIN LATERAL (
+      SELECT s.fetched_at
+      FROM snapshot s
+      WHERE s.domain = d.domain AND s.place_status_keyframe AND s.fetched_at <= p_from
+      ORDER BY s.fetched_at DESC
+      LIMIT 1
+    ) k
+  ), snaps AS (
+    SELECT s.snapshot_id, s.fetched_at, s.domain,
+           MAX(s.fetched_at) FILTER (WHERE s.place_status_keyframe)
+             OVER (PARTITION BY s.domain ORDER BY s.fetched_at) AS keyframe_at
+    FROM snapshot s, start_at
+    WHERE s.fetched_at >= start_at.fetched_at AND s.fetched_at < p_to
+      AND s.domain IN (SELECT d.domain FROM domains d)
+  ), written AS (
+    SELECT sn.domain, sn.keyframe_at, ps.*,
+           LEAD(ps.fetched_at, 1, 'infinity') OVER (
+             PARTITION BY sn.domain, sn.keyframe_at, ps.place_uid ORDER BY ps.fetched_at
+           ) AS written_until
+    FROM place_status ps
+    JOIN snaps sn ON sn.snapshot_id = ps.snapshot_id AND sn.fetched_at = ps.fetched_at
+    WHERE ps.fetched_at >= (SELECT st.fetched_at FROM start_at st) AND ps.fetched_at < p_to
+  )
+  SELECT sn.snapshot_id, sn.fetched_at, w.place_uid, w.booked_bikes, w.bikes,
+         w.bikes_available_to_rent, w.bike_racks, w.free_racks, w.special_racks,
+         w.free_special_racks,
+         COALESCE(w.bike_type_counts, bike_type_counts_from_json(w.bike_types))
+  FROM snaps sn
+  JOIN written w
+    ON w.domain = sn.domain
+   AND w.keyframe_at = sn.keyframe_at
+   AND w.fetched_at <= sn.fetched_at
+   AND sn.fetched_at < w.written_until
+  WHERE sn.fetched_at >= p_from;
+$$;
+
+-- Every station's status as of p_at: the domain's latest snapshot at or before p_at, filled.
+CREATE OR REPLACE FUNCTION place_status_at(p_domain TEXT, p_at TIMESTAMPTZ)
+RETURNS TABLE (
+  snapshot_id BIGINT,
+  fetched_at TIMESTAMPTZ,
+  place_uid INTEGER,
+  booked_bikes INTEGER,
+  bikes INTEGER,
+  bikes_available_to_rent INTEGER,
+  bike_racks INTEGER,
+  free_racks INTEGER,
+  special_racks INTEGER,
+  free_special_racks INTEGER,
+  bike_type_counts INTEGER[]
+)
+LANGUAGE sql STABLE AS $$
+  SELECT f.*
+  FROM (
+    SELECT s.fetched_at
+    FROM snapshot s
+    WHERE s.domain = p_domain AND s.fetched_at <= p_at
+    ORDER BY s.fetched_at DESC
+    LIMIT 1
+  ) latest
+  CROSS JOIN LATERAL place_status_filled(
+    latest.fetched_at, latest.fetched_at + INTERVAL '1 microsecond', p_domain
+  ) f;
+$$;
+
+-- Station occupancy for a time range from the cheapest tier that covers it: raw rows for short
+-- ranges still in place_status, otherwise 5-minute or hourly rollups. Rows not rolled up yet
+-- are aggregated on the fly.
+CREATE OR REPLACE FUNCTION place_status_series(p_from TIMESTAMPTZ, p_to TIMESTAMPTZ)
+RETURNS TABLE (
+  bucket_start TIMESTAMPTZ,
+  place_uid INTEGER,
+  samples INTEGER,
+  bikes_min INTEGER,
+  bikes_max INTEGER,
+  bikes_avg DOUBLE PRECISION,
+  bikes_last INTEGER,
+  free_racks_min INTEGER,
+  free_racks_max INTEGER,
+  free_racks_avg DOUBLE PRECISION,
+  free_racks_last INTEGER,
+  bikes_available_to_rent_min INTEGER,
+  bikes_available_to_rent_max INTEGER,
+  bikes_available_to_rent_avg DOUBLE PRECISION,
+  bikes_available_to_rent_last INTEGER
+)
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+  raw_from TIMESTAMPTZ;
+  rolled_until TIMESTAMPTZ;
+  tier_table TEXT;
+  tier_bucket INTERVAL;
+BEGIN
+  SELECT ms.value INTO raw_from FROM maintenance_state ms WHERE ms.name = 'place_status_raw_from';
+  SELECT ms.value INTO rolled_until
+  FROM maintenance_state ms
+  WHERE ms.name = 'place_status_rolled_until';
+
+  IF p_to - p_from <= INTERVAL '2 days' AND p_from >= COALESCE(raw_from, '-infinity') THEN
+    RETURN QUERY
+    SELECT ps.fetched_at, ps.place_uid, 1,
+           ps.bikes, ps.bikes, ps.bikes::double precision, ps.bikes,
+           ps.free_racks, ps.free_racks, ps.free_racks::double precision, ps.free_racks,
+           ps.bikes_available_to_rent, ps.bikes_available_to_rent,
+           ps.bikes_available_to_rent::double precision, ps.bikes_available_to_rent
+    FROM place_status_filled(p_from, p_to) ps;
+    RETURN;
+  END IF;
+
+  IF p_to - p_from <= INTERVAL '14 days' THEN
+    tier_table := 'place_status_5m';
+    tier_bucket := INTERVAL '5 minutes';
+  ELSE
+    tier_table := 'place_status_1h';
+    tier_bucket := INTERVAL '1 hour';
+  END IF;
+
+  RETURN QUERY EXECUTE format(
+    'SELECT t.bucket_start, t.place_uid, t.samples,
+            t.bikes_min, t.bikes_max, t.bikes_avg, t.bikes_last,
+            t.free_racks_min, t.free_racks_max, t.free_racks_avg, t.free_racks_last,
+            t.bikes_available_to_rent_min, t.bikes_available_to_rent_max,
+            t.bikes_available_to_rent_avg, t.bikes_available_to_rent_last
+     FROM %I t
+     WHERE t.bucket_start >= $1 AND t.bucket_start < LEAST($2, $3)',
+    tier_table
+  ) USING p_from, p_to, COALESCE(rolled_until, '-infinity'::timestamptz);
+
+  RETURN QUERY
+  SELECT date_bin(tier_bucket, ps.fetched_at, TIMESTAMPTZ '2001-01-01 00:00:00+00'),
+         ps.place_uid,
+         COUNT(*)::int,
+         MIN(ps.bikes), MAX(ps.bikes), AVG(ps.bikes)::double precision,
+         (array_agg(ps.bikes ORDER BY ps.fetched_at DESC))[1],
+         MIN(ps.free_racks), MAX(ps.free_racks), AVG(ps.free_racks)::double precision,
+         (array_agg(ps.free_racks ORDER BY ps.fetched_at DESC))[1],
+         MIN(ps.bikes_available_to_rent), MAX(ps.bikes_available_to_rent),
+         AVG(ps.bikes_available_to_rent)::double precision,
+         (array_agg(ps.bikes_available_to_rent ORDER BY ps.fetched_at DESC))[1]
+  FROM place_status_filled(GREATEST(p_from, COALESCE(rolled_until, '-infinity')), p_to) ps
+  GROUP BY 1, 2;
+END;
+$$;
 
 -- These full-history rollups made ingest latency grow with database size. Dashboards now
 -- aggregate bounded time windows directly from bike_movement and bike_last_status.
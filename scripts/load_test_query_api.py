@@ -0,0 +1,71 @@
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+DEFAULT_PATHS = [
+    "/summary",
+    "/hotspots",
+    "/routes",
+]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def timed_request(url: str, timeout: float) -> tuple[float, int]:
+    started = time.perf_counter()
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except HTTPError as exc:
+        status = exc.code
+    except URLError:
+        status = 0
+    return (time.perf_counter() - started) * 1000, status
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure query API latency.")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument(
+        "--path",
+        action="append",
+        dest="paths",
+        help="Path to request, may be repeated (default: summary, hotspots and routes)",
+    )
+    args = parser.parse_args()
+
+    paths = args.paths or DEFAULT_PATHS
+    urls = [args.base_url.rstrip("/") + paths[i % len(paths)] for i in range(args.requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda url: timed_request(url, args.timeout), urls))
+    elapsed_s = time.perf_counter() - started
+
+    latencies = [latency for latency, status in results if status == 200]
+    failures = len(results) - len(latencies)
+    print(f"requests={len(results)} failures={failures} elapsed_s={elapsed_s:.2f}")
+    if not latencies:
+        return 1
+    print(
+        f"rps={len(results) / elapsed_s:.1f} "
+        f"p50_ms={percentile(latencies, 50):.1f} "
+        f"p99_ms={percentile(latencies, 99):.1f} "
+        f"mean_ms={statistics.fmean(latencies):.1f} "
+        f"max_ms={max(latencies):.1f}"
+    )
+    return 0 if failures == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
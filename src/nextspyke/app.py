@@ -1,14 +1,42 @@
 import signal
 import sys
 import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
 
 import psycopg
 
 from nextspyke.config import AppConfig, env_bool, load_config
-from nextspyke.db import build_dsn, init_db
-from nextspyke.health import health_check
-from nextspyke.ingest import backfill_bike_movements, ingest_once
-from nextspyke.logging import iso_ts, log_event, utc_now
+from nextspyke.db import build_dsn, day_floor, hour_floor, init_db
+from nextspyke.dbstats import QueryStatsSampler
+from nextspyke.export import export_history, parse_export_args
+from nextspyke.health import HealthState, health_check, start_health_server
+from nextspyke.indexes import (
+    build_closed_partition_indexes,
+    format_index_report,
+    index_report,
+    migrate_indexes,
+)
+from nextspyke.ingest import (
+    FetchedFeed,
+    audit_snapshot_gaps,
+    backfill_bike_movements,
+    backfill_bike_trajectories,
+    backfill_route_stats,
+    fetch_live_feed,
+    ingest_batch,
+    ingest_once,
+    is_connection_failure,
+)
+from nextspyke.leader import LeaderElection
+from nextspyke.logging import configure_logging, flush_logs, iso_ts, log_event, utc_now
+from nextspyke.maintenance import (
+    convert_bike_id_keys,
+    migrate_bike_ids,
+    migrate_bike_types,
+    require_bike_id_keys,
+    run_place_status_maintenance,
+)
 from nextspyke.metrics import (
     classify_failure_reason,
     init_metrics,
@@ -17,10 +45,17 @@ from nextspyke.metrics import (
     mark_shutdown,
     start_metrics_server,
 )
+from nextspyke.profiling import IterationProfiler
+from nextspyke.query_api import invalidate_query_cache, start_query_api
+from nextspyke.scheduler import MaintenanceScheduler
+from nextspyke.spool import SnapshotBuffer, SnapshotSpool, drain_spool
+from nextspyke.tiering import tier_cold_partitions
 
 _shutdown_requested = False
 _shutdown_reason = "signal"
 
+BACKFILL_CHUNK = timedelta(days=1)
+
 
 def _connect_and_init_db() -> psycopg.Connection:
     conn = psycopg.connect(build_dsn(), connect_timeout=5)
@@ -83,6 +118,104 @@ def _handle_signal(signum, _frame) -> None:
         _shutdown_reason = f"signal_{signum}"
 
 
+def _spool_feed(spool: SnapshotSpool, config: AppConfig, feed: FetchedFeed) -> None:
+    dropped = spool.append(feed)
+    log_event(
+        "warn",
+        "app.spool",
+        "Database unavailable; feed spooled",
+        event="feed_spooled",
+        config=config,
+        extra={
+            "fetched_at": iso_ts(feed.fetched_at),
+            "spooled_snapshots": len(spool),
+            "spool_bytes": spool.size_bytes,
+            "dropped_snapshots": dropped,
+        },
+    )
+
+
+def _keep_unstored_feeds(
+    spool: SnapshotSpool,
+    config: AppConfig,
+    feeds: list[FetchedFeed],
+    exc: BaseException,
+) -> None:
+    if not feeds:
+        return
+    if spool.enabled and is_connection_failure(exc):
+        for feed in feeds:
+            _spool_feed(spool, config, feed)
+        return
+    log_event(
+        "warn",
+        "app.ingest",
+        "Fetched snapshots were not stored",
+        event="snapshots_dropped",
+        config=config,
+        extra={"snapshots": len(feeds), "fetched_at": iso_ts(feeds[0].fetched_at)},
+    )
+
+
+def _flush_batch_on_shutdown(
+    conn: psycopg.Connection | None,
+    config: AppConfig,
+    batch: SnapshotBuffer,
+    spool: SnapshotSpool,
+) -> psycopg.Connection | None:
+    try:
+        if _connection_closed(conn):
+            conn = _connect_and_init_db()
+        assert conn is not None
+        result = ingest_batch(conn, config, batch.entries)
+        batch.take()
+        log_event(
+            "info",
+            "app.ingest",
+            "Buffered snapshots stored before shutdown",
+            event="batch_flushed",
+            config=config,
+            extra={"snapshots": result["snapshots"], "snapshot_id": result["snapshot_id"]},
+        )
+    except Exception as exc:
+        log_event(
+            "error",
+            "app.ingest",
+            "Storing buffered snapshots before shutdown failed",
+            event="batch_flush_failed",
+            config=config,
+            exc=exc,
+        )
+        _keep_unstored_feeds(spool, config, batch.take(), exc)
+    return conn
+
+
+def _drain_spool(conn: psycopg.Connection, config: AppConfig, spool: SnapshotSpool) -> None:
+    result = drain_spool(conn, config, spool)
+    log_event(
+        "info",
+        "app.spool",
+        "Spooled feeds stored",
+        event="spool_drained",
+        config=config,
+        extra=result,
+    )
+
+
+def _discard_spool(spool: SnapshotSpool, config: AppConfig) -> None:
+    # Another replica ingested in the meantime; replaying could duplicate its snapshots.
+    discarded = spool.clear()
+    if discarded:
+        log_event(
+            "warn",
+            "app.spool",
+            "Discarding spooled feeds on standby",
+            event="spool_discarded",
+            config=config,
+            extra={"discarded_snapshots": discarded},
+        )
+
+
 def _run_movement_backfill(config: AppConfig) -> None:
     started_at = utc_now()
     conn = _connect_and_init_db()
@@ -109,6 +242,262 @@ def _run_movement_backfill(config: AppConfig) -> None:
         _close_connection(conn)
 
 
+def _first_movement_at(conn: psycopg.Connection) -> datetime | None:
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(end_fetched_at) FROM bike_movement")
+        row = cur.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+
+def _backfill_in_chunks(
+    conn: psycopg.Connection,
+    backfill: Callable[[psycopg.Cursor, datetime, datetime], int],
+    start: datetime,
+    end: datetime,
+) -> tuple[int, int]:
+    rows = 0
+    chunks = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + BACKFILL_CHUNK, end)
+        with conn.transaction():
+            with conn.cursor() as cur:
+                rows += backfill(cur, chunk_start, chunk_end)
+        chunks += 1
+        chunk_start = chunk_end
+    return rows, chunks
+
+
+def _run_route_stats_backfill(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        first_movement_at = _first_movement_at(conn)
+        # The collector keeps incrementing the current hour, so the rebuild stops before it.
+        end = hour_floor(started_at)
+        start = hour_floor(first_movement_at) if first_movement_at else end
+        rows, chunks = _backfill_in_chunks(conn, backfill_route_stats, start, end)
+        log_event(
+            "info",
+            "app.backfill",
+            "Route stats backfill completed",
+            event="route_stats_backfill_complete",
+            config=config,
+            extra={
+                "route_stats_rows": rows,
+                "chunks": chunks,
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_trajectory_backfill(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        first_movement_at = _first_movement_at(conn)
+        # Trajectories are keyed by UTC day, so the rebuild runs on whole days up to today.
+        end = day_floor(started_at) + BACKFILL_CHUNK
+        start = day_floor(first_movement_at) if first_movement_at else end
+        rows, chunks = _backfill_in_chunks(conn, backfill_bike_trajectories, start, end)
+        log_event(
+            "info",
+            "app.backfill",
+            "Trajectory backfill completed",
+            event="trajectory_backfill_complete",
+            config=config,
+            extra={
+                "trajectory_rows": rows,
+                "chunks": chunks,
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_gap_audit(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                result = audit_snapshot_gaps(cur, config.domain, config.poll_interval)
+        log_event(
+            "info",
+            "app.backfill",
+            "Snapshot gap audit completed",
+            event="gap_audit_complete",
+            config=config,
+            extra={
+                **result,
+                "expected_interval_s": config.poll_interval,
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_export(config: AppConfig, argv: list[str]) -> None:
+    args = parse_export_args(argv)
+    started_at = utc_now()
+    conn = psycopg.connect(build_dsn(), connect_timeout=5)
+    conn.read_only = True
+    try:
+        result = export_history(conn, args.tables, args.start, args.end, args.out)
+        log_event(
+            "info",
+            "app.export",
+            "Export completed",
+            event="export_complete",
+            config=config,
+            extra={
+                **result,
+                "tables": args.tables,
+                "from": iso_ts(args.start),
+                "to": iso_ts(args.end),
+                "out": str(args.out),
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_cold_tiering(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        tiered = tier_cold_partitions(conn, config)
+        log_event(
+            "info",
+            "app.maintenance",
+            "Cold tiering completed",
+            event="cold_tiering_complete",
+            config=config,
+            extra={
+                "tiered_partitions": [entry["partition"] for entry in tiered],
+                "tiered_rows": sum(entry["rows"] for entry in tiered),
+                "cold_storage_dir": config.cold_storage_dir,
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_bike_type_migration(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        result = migrate_bike_types(conn)
+        log_event(
+            "info",
+            "app.maintenance",
+            "Bike type migration completed",
+            event="bike_type_migration_complete",
+            config=config,
+            extra={
+                "partitions": result["partitions"],
+                "migrated_rows": result["rows"],
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_bike_id_migration(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        if convert_bike_id_keys(conn):
+            log_event(
+                "info",
+                "app.maintenance",
+                "Bike id keys converted; the collector can be started",
+                event="bike_id_keys_converted",
+                config=config,
+            )
+        result = migrate_bike_ids(conn)
+        log_event(
+            "info",
+            "app.maintenance",
+            "Bike id migration completed",
+            event="bike_id_migration_complete",
+            config=config,
+            extra={
+                "built_indexes": result["built_indexes"],
+                "migrated_rows": result["rows"],
+                "completed_tables": result["completed_tables"],
+                "foreign_keys": result["foreign_keys"],
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_index_migration(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        result = migrate_indexes(conn)
+        log_event(
+            "info",
+            "app.maintenance",
+            "Index migration completed",
+            event="index_migration_complete",
+            config=config,
+            extra={
+                "built_indexes": result["built_indexes"],
+                "dropped_indexes": result["dropped_indexes"],
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_maintenance(config: AppConfig) -> None:
+    started_at = utc_now()
+    conn = _connect_and_init_db()
+    try:
+        result = run_place_status_maintenance(conn, config)
+        indexes = build_closed_partition_indexes(conn)
+        log_event(
+            "info",
+            "app.maintenance",
+            "Maintenance completed",
+            event="maintenance_complete",
+            config=config,
+            extra={
+                "rolled_rows": result["rolled_rows"],
+                "rolled_until": iso_ts(result["rolled_until"]) if result["rolled_until"] else None,
+                "dropped_partitions": result["dropped_partitions"],
+                "built_indexes": indexes["built_indexes"],
+                "duration_ms": int((utc_now() - started_at).total_seconds() * 1000),
+            },
+        )
+    finally:
+        _close_connection(conn)
+
+
+def _run_index_report() -> None:
+    conn = _connect_and_init_db()
+    try:
+        with conn.cursor() as cur:
+            rows = index_report(cur)
+        for line in format_index_report(rows):
+            print(line)
+    finally:
+        _close_connection(conn)
+
+
 def main() -> None:
     config = load_config()
     if len(sys.argv) > 1 and sys.argv[1] == "health":
@@ -116,10 +505,45 @@ def main() -> None:
     if len(sys.argv) > 1 and sys.argv[1] == "backfill-movements":
         _run_movement_backfill(config)
         return
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill-route-stats":
+        _run_route_stats_backfill(config)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill-trajectories":
+        _run_trajectory_backfill(config)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "gap-audit":
+        _run_gap_audit(config)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        _run_export(config, sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "tier-cold":
+        _run_cold_tiering(config)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "maintenance":
+        _run_maintenance(config)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "index-report":
+        _run_index_report()
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-bike-types":
+        _run_bike_type_migration(config)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-bike-ids":
+        _run_bike_id_migration(config)
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-indexes":
+        _run_index_migration(config)
+        return
 
     run_once = env_bool("RUN_ONCE", False)
+    configure_logging(config)
     init_metrics(config)
     start_metrics_server(config)
+    start_query_api(config)
+    health_state = HealthState()
+    start_health_server(config, health_state)
 
     log_event(
         "info",
@@ -131,8 +555,24 @@ def main() -> None:
 
     signal.signal(signal.SIGINT, _handle_signal)
     signal.signal(signal.SIGTERM, _handle_signal)
+    profiler = IterationProfiler(config)
+    query_stats = QueryStatsSampler(config)
+    leader = LeaderElection(config)
+    spool = SnapshotSpool(config.spool_dir, config.spool_max_mb * 1024 * 1024)
+    batch = SnapshotBuffer(1 if run_once else config.batch_snapshots, config.batch_max_delay_s)
+    scheduler = MaintenanceScheduler(config, may_run=lambda: leader.may_ingest)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profiler.request)
 
     conn: psycopg.Connection | None = _connect_and_init_db()
+    try:
+        require_bike_id_keys(conn)
+    except Exception:
+        conn.close()
+        raise
+    health_state.mark_connected()
+    if not run_once:
+        scheduler.start()
 
     log_event(
         "info",
@@ -148,6 +588,7 @@ def main() -> None:
             if _shutdown_requested:
                 shutdown_started_at = utc_now()
                 mark_shutdown()
+                health_state.mark_shutdown()
                 log_event(
                     "info",
                     "app.lifecycle",
@@ -156,14 +597,60 @@ def main() -> None:
                     config=config,
                     extra={"reason": _shutdown_reason},
                 )
+                if len(batch):
+                    conn = _flush_batch_on_shutdown(conn, config, batch, spool)
                 break
             iteration_started = utc_now()
+            profile = None
+            feed = None
             try:
+                if (spool.enabled or batch.enabled) and leader.may_ingest:
+                    # Fetch before touching the database so an outage cannot lose the feed.
+                    feed = fetch_live_feed(config)
+                    if batch.enabled:
+                        batch.add(feed)
                 if _connection_closed(conn):
                     conn = _connect_and_init_db()
                 assert conn is not None
-                result = ingest_once(conn, config)
+                if not leader.ensure(conn):
+                    _discard_spool(spool, config)
+                    batch.take()
+                    health_state.mark_standby()
+                    if run_once:
+                        break
+                    time.sleep(config.poll_interval)
+                    continue
+                if len(spool):
+                    with scheduler.ingesting():
+                        _drain_spool(conn, config, spool)
+                if batch.enabled and not batch.due(utc_now()):
+                    health_state.mark_connected()
+                    time.sleep(config.poll_interval)
+                    continue
+                profile = profiler.start()
+                explain_plans = query_stats.start()
+                with scheduler.ingesting():
+                    if batch.enabled:
+                        result = ingest_batch(
+                            conn,
+                            config,
+                            batch.entries,
+                            refresh_metadata=not scheduler.running,
+                            explain_plans=explain_plans,
+                        )
+                        batch.take()
+                    else:
+                        result = ingest_once(
+                            conn,
+                            config,
+                            feed,
+                            refresh_metadata=not scheduler.running,
+                            explain_plans=explain_plans,
+                        )
+                invalidate_query_cache()
+                health_state.mark_success(result["snapshot_id"], result["fetched_at"])
                 duration_s = (utc_now() - iteration_started).total_seconds()
+                profiler.finish(profile, duration_s, result["snapshot_id"])
                 mark_iteration_success(duration_s)
                 log_event(
                     "info",
@@ -174,15 +661,19 @@ def main() -> None:
                     extra={
                         "snapshot_id": result["snapshot_id"],
                         "fetched_at": iso_ts(result["fetched_at"]),
+                        "snapshots": result.get("snapshots", 1),
                         "cities": result["cities"],
                         "places": result["places"],
                         "bikes": result["bikes"],
                         "movements": result["movements"],
                         "duration_ms": int(duration_s * 1000),
+                        "stages": result["stages"],
                     },
                 )
+                query_stats.finish(conn)
             except Exception as exc:
                 duration_s = (utc_now() - iteration_started).total_seconds()
+                profiler.finish(profile, duration_s, None)
                 mark_iteration_failure(duration_s, classify_failure_reason(exc))
                 log_event(
                     "error",
@@ -195,7 +686,14 @@ def main() -> None:
                     },
                     exc=exc,
                 )
+                if batch.enabled:
+                    # A due batch was being stored or is past its window; keep what it can.
+                    unstored = batch.take() if batch.due(utc_now()) else []
+                else:
+                    unstored = [feed] if feed is not None else []
+                _keep_unstored_feeds(spool, config, unstored, exc)
                 conn = _recover_connection_after_failure(conn, config, exc)
+                health_state.mark_failure(exc, connected=not _connection_closed(conn))
             if run_once:
                 break
             time.sleep(config.poll_interval)
@@ -211,6 +709,7 @@ def main() -> None:
         raise
     finally:
         mark_shutdown()
+        scheduler.stop()
         _close_connection(conn)
         if shutdown_started_at:
             log_event(
@@ -225,6 +724,7 @@ def main() -> None:
                     )
                 },
             )
+        flush_logs()
 
 
 if __name__ == "__main__":
@@ -23,6 +23,28 @@ class AppConfig:
     metrics_port: int
     config_source: str
     config_hash: str
+    place_status_raw_retention_days: int = 0
+    query_api_enabled: bool = False
+    query_api_port: int = 8001
+    query_api_pool_size: int = 4
+    profile_slow_iteration_s: float = 0.0
+    profile_dir: str = "profiles"
+    profile_keep: int = 20
+    query_stats_interval: int = 0
+    log_async: bool = False
+    log_queue_size: int = 10000
+    log_flush_interval_s: float = 1.0
+    log_duplicate_window_s: float = 0.0
+    health_server_enabled: bool = False
+    health_port: int = 8002
+    cold_storage_dir: str = "cold"
+    cold_tier_after_days: int = 0
+    leader_election_enabled: bool = False
+    spool_dir: str = "spool"
+    spool_max_mb: int = 0
+    batch_snapshots: int = 1
+    batch_max_delay_s: float = 60.0
+    place_status_keyframe_minutes: int = 0
 
 
 def env_bool(name: str, default: bool) -> bool:
@@ -38,7 +60,7 @@ def sanitize_config(config: dict) -> dict:
         if value is None:
             redacted[key] = None
             continue
-        if "PASSWORD" in key or key in {"DATABASE_URL"}:
+        if "PASSWORD" in key or key in {"DATABASE_URL", "QUERY_DATABASE_URL"}:
             redacted[key] = "***"
         else:
             redacted[key] = value
@@ -72,6 +94,31 @@ def load_config() -> AppConfig:
     gbfs_system_id = os.getenv("GBFS_SYSTEM_ID", f"nextbike_{domain}")
     metrics_enabled = env_bool("METRICS_ENABLED", False)
     metrics_port = int(os.getenv("METRICS_PORT", "8000"))
+    place_status_raw_retention_days = max(
+        0,
+        int(os.getenv("PLACE_STATUS_RAW_RETENTION_DAYS", "0")),
+    )
+    query_api_enabled = env_bool("QUERY_API_ENABLED", False)
+    query_api_port = int(os.getenv("QUERY_API_PORT", "8001"))
+    query_api_pool_size = max(1, int(os.getenv("QUERY_API_POOL_SIZE", "4")))
+    profile_slow_iteration_s = max(0.0, float(os.getenv("PROFILE_SLOW_ITERATION_SECONDS", "0")))
+    profile_dir = os.getenv("PROFILE_DIR", "profiles")
+    profile_keep = max(1, int(os.getenv("PROFILE_KEEP", "20")))
+    query_stats_interval = max(0, int(os.getenv("QUERY_STATS_INTERVAL_ITERATIONS", "0")))
+    log_async = env_bool("LOG_ASYNC", False)
+    log_queue_size = max(1, int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    log_flush_interval_s = max(0.01, float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "1")))
+    log_duplicate_window_s = max(0.0, float(os.getenv("LOG_DUPLICATE_WINDOW_SECONDS", "0")))
+    health_server_enabled = env_bool("HEALTH_SERVER_ENABLED", False)
+    health_port = int(os.getenv("HEALTH_PORT", "8002"))
+    cold_storage_dir = os.getenv("COLD_STORAGE_DIR", "cold")
+    cold_tier_after_days = max(0, int(os.getenv("COLD_TIER_AFTER_DAYS", "0")))
+    leader_election_enabled = env_bool("LEADER_ELECTION_ENABLED", False)
+    spool_dir = os.getenv("SPOOL_DIR", "spool")
+    spool_max_mb = max(0, int(os.getenv("SPOOL_MAX_MB", "0")))
+    batch_snapshots = max(1, int(os.getenv("BATCH_SNAPSHOTS", "1")))
+    batch_max_delay_s = max(0.0, float(os.getenv("BATCH_MAX_DELAY_SECONDS", "60")))
+    place_status_keyframe_minutes = max(0, int(os.getenv("PLACE_STATUS_KEYFRAME_MINUTES", "0")))
     config_source = "env"
 
     config_payload = sanitize_config(
@@ -92,12 +139,35 @@ def load_config() -> AppConfig:
             "GBFS_SYSTEM_ID": gbfs_system_id,
             "METRICS_ENABLED": metrics_enabled,
             "METRICS_PORT": metrics_port,
+            "PLACE_STATUS_RAW_RETENTION_DAYS": place_status_raw_retention_days,
+            "QUERY_API_ENABLED": query_api_enabled,
+            "QUERY_API_PORT": query_api_port,
+            "QUERY_API_POOL_SIZE": query_api_pool_size,
+            "PROFILE_SLOW_ITERATION_SECONDS": profile_slow_iteration_s,
+            "PROFILE_DIR": profile_dir,
+            "PROFILE_KEEP": profile_keep,
+            "QUERY_STATS_INTERVAL_ITERATIONS": query_stats_interval,
+            "LOG_ASYNC": log_async,
+            "LOG_QUEUE_SIZE": log_queue_size,
+            "LOG_FLUSH_INTERVAL_SECONDS": log_flush_interval_s,
+            "LOG_DUPLICATE_WINDOW_SECONDS": log_duplicate_window_s,
+            "HEALTH_SERVER_ENABLED": health_server_enabled,
+            "HEALTH_PORT": health_port,
+            "COLD_STORAGE_DIR": cold_storage_dir,
+            "COLD_TIER_AFTER_DAYS": cold_tier_after_days,
+            "LEADER_ELECTION_ENABLED": leader_election_enabled,
+            "SPOOL_DIR": spool_dir,
+            "SPOOL_MAX_MB": spool_max_mb,
+            "BATCH_SNAPSHOTS": batch_snapshots,
+            "BATCH_MAX_DELAY_SECONDS": batch_max_delay_s,
+            "PLACE_STATUS_KEYFRAME_MINUTES": place_status_keyframe_minutes,
             "PGHOST": os.getenv("PGHOST"),
             "PGPORT": os.getenv("PGPORT"),
             "PGDATABASE": os.getenv("PGDATABASE"),
             "PGUSER": os.getenv("PGUSER"),
             "PGPASSWORD": os.getenv("PGPASSWORD"),
             "DATABASE_URL": os.getenv("DATABASE_URL"),
+            "QUERY_DATABASE_URL": os.getenv("QUERY_DATABASE_URL"),
         }
     )
     config_hash = hash_config(config_payload)
@@ -121,4 +191,26 @@ def load_config() -> AppConfig:
         metrics_port=metrics_port,
         config_source=config_source,
         config_hash=config_hash,
+        place_status_raw_retention_days=place_status_raw_retention_days,
+        query_api_enabled=query_api_enabled,
+        query_api_port=query_api_port,
+        query_api_pool_size=query_api_pool_size,
+        profile_slow_iteration_s=profile_slow_iteration_s,
+        profile_dir=profile_dir,
+        profile_keep=profile_keep,
+        query_stats_interval=query_stats_interval,
+        log_async=log_async,
+        log_queue_size=log_queue_size,
+        log_flush_interval_s=log_flush_interval_s,
+        log_duplicate_window_s=log_duplicate_window_s,
+        health_server_enabled=health_server_enabled,
+        health_port=health_port,
+        cold_storage_dir=cold_storage_dir,
+        cold_tier_after_days=cold_tier_after_days,
+        leader_election_enabled=leader_election_enabled,
+        spool_dir=spool_dir,
+        spool_max_mb=spool_max_mb,
+        batch_snapshots=batch_snapshots,
+        batch_max_delay_s=batch_max_delay_s,
+        place_status_keyframe_minutes=place_status_keyframe_minutes,
     )
@@ -1,10 +1,14 @@
 import os
+import re
 from datetime import datetime, timezone
 from pathlib import Path
 
 import psycopg
 from psycopg import sql
 
+# Held until init_db commits.
+INIT_DB_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtextextended('nextspyke.init_db', 0))"
+
 
 def build_dsn() -> str:
     url = os.getenv("DATABASE_URL")
@@ -18,6 +22,10 @@ def build_dsn() -> str:
     return f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
 
 
+def build_query_dsn() -> str:
+    return os.getenv("QUERY_DATABASE_URL") or build_dsn()
+
+
 def load_schema_sql() -> str:
     candidates = []
     env_path = os.getenv("SCHEMA_PATH")
@@ -34,10 +42,23 @@ def load_schema_sql() -> str:
 def init_db(conn: psycopg.Connection) -> None:
     schema_sql = load_schema_sql()
     with conn.cursor() as cur:
+        # Replicas starting together apply the schema one after the other; the second one
+        # then finds every change already made.
+        cur.execute(INIT_DB_LOCK_SQL)
         cur.execute(schema_sql)
     conn.commit()
 
 
+def hour_floor(ts: datetime) -> datetime:
+    # Timestamps read back follow the session TimeZone; hours with a half-hour offset
+    # would otherwise not line up with date_trunc('hour', ..., 'UTC').
+    return ts.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_floor(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
 def month_bounds(ts: datetime) -> tuple[datetime, datetime]:
     start = datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
     if ts.month == 12:
@@ -70,3 +91,37 @@ def ensure_month_partition(cur: psycopg.Cursor, table: str, ts: datetime) -> Non
 def ensure_partitions(cur: psycopg.Cursor, ts: datetime) -> None:
     for table in ("snapshot", "city_status", "place_status", "bike_status"):
         ensure_month_partition(cur, table, ts)
+
+
+def list_month_partitions(cur: psycopg.Cursor, table: str) -> list[tuple[str, datetime, datetime]]:
+    cur.execute(
+        """
+        SELECT child.relname
+        FROM pg_inherits i
+        JOIN pg_class child ON child.oid = i.inhrelid
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        WHERE parent.relname = %s
+        """,
+        (table,),
+    )
+    pattern = re.compile(rf"^{re.escape(table)}_(\d{{4}})(\d{{2}})$")
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = pattern.match(name)
+        if not match:
+            continue
+        start, end = month_bounds(
+            datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+        )
+        partitions.append((name, start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def drop_partition(cur: psycopg.Cursor, table: str, partition: str) -> None:
+    cur.execute(
+        sql.SQL("ALTER TABLE {table} DETACH PARTITION {partition}").format(
+            table=sql.Identifier(table),
+            partition=sql.Identifier(partition),
+        )
+    )
+    cur.execute(sql.SQL("DROP TABLE {partition}").format(partition=sql.Identifier(partition)))
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import re
+from datetime import datetime
+
+import psycopg
+from prometheus_client import Counter, Gauge
+
+from nextspyke.config import AppConfig
+from nextspyke.ingest import (
+    APPEND_BIKE_TRAJECTORIES_SQL,
+    CLOSE_BIKE_DWELLS_SQL,
+    DWELL_HISTOGRAM_BOUNDS_S,
+    INSERT_BIKE_MOVEMENTS_SQL,
+    UPDATE_BIKE_LAST_STATUS_SQL,
+    UPSERT_ROUTE_STATS_SQL,
+    PlanHook,
+)
+from nextspyke.logging import log_event
+
+# Statements keyed by the table they write, in the order ingest_once runs them.
+EXPLAINED_STATEMENTS = (
+    ("bike_movement", INSERT_BIKE_MOVEMENTS_SQL, "movement"),
+    ("route_stats", UPSERT_ROUTE_STATS_SQL, "snapshot"),
+    ("bike_dwell", CLOSE_BIKE_DWELLS_SQL, "dwell"),
+    ("bike_trajectory", APPEND_BIKE_TRAJECTORIES_SQL, "snapshot"),
+    ("bike_last_status", UPDATE_BIKE_LAST_STATUS_SQL, "snapshot"),
+)
+TRACKED_TABLES = frozenset(
+    {
+        "place",
+        "place_status",
+        "bike",
+        "bike_status",
+        "city_status",
+        "snapshot",
+        *(name for name, _sql, _params in EXPLAINED_STATEMENTS),
+    }
+)
+INSERT_TARGET = re.compile(r"\bINSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+PARTITION_SUFFIX = re.compile(r"_(\d{6}|default)$")
+
+DB_EXPLAIN_EXECUTION_SECONDS = Gauge(
+    "app_db_explain_execution_seconds",
+    "Execution time of the last sampled EXPLAIN ANALYZE per ingest statement",
+    ["statement"],
+)
+DB_EXPLAIN_SHARED_BLKS_HIT = Gauge(
+    "app_db_explain_shared_blks_hit",
+    "Shared buffer hits of the last sampled EXPLAIN ANALYZE per ingest statement",
+    ["statement"],
+)
+DB_EXPLAIN_SHARED_BLKS_READ = Gauge(
+    "app_db_explain_shared_blks_read",
+    "Shared buffer reads of the last sampled EXPLAIN ANALYZE per ingest statement",
+    ["statement"],
+)
+DB_PLAN_CHANGES_TOTAL = Counter(
+    "app_db_plan_changes_total",
+    "Plan shape changes seen between EXPLAIN samples",
+    ["statement"],
+)
+DB_STATEMENT_CALLS_TOTAL = Counter(
+    "app_db_statement_calls_total",
+    "pg_stat_statements calls per ingest statement",
+    ["statement"],
+)
+DB_STATEMENT_SECONDS_TOTAL = Counter(
+    "app_db_statement_seconds_total",
+    "pg_stat_statements execution time per ingest statement",
+    ["statement"],
+)
+DB_STATEMENT_SHARED_BLKS_HIT_TOTAL = Counter(
+    "app_db_statement_shared_blks_hit_total",
+    "pg_stat_statements shared buffer hits per ingest statement",
+    ["statement"],
+)
+DB_STATEMENT_SHARED_BLKS_READ_TOTAL = Counter(
+    "app_db_statement_shared_blks_read_total",
+    "pg_stat_statements shared buffer reads per ingest statement",
+    ["statement"],
+)
+DB_STATEMENT_ROWS_TOTAL = Counter(
+    "app_db_statement_rows_total",
+    "pg_stat_statements rows per ingest statement",
+    ["statement"],
+)
+
+STAT_STATEMENTS_SQL = """
+    SELECT query, calls, total_exec_time, shared_blks_hit, shared_blks_read, rows
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND query ILIKE '%INSERT INTO%'
+"""
+STAT_COUNTERS = (
+    ("calls", DB_STATEMENT_CALLS_TOTAL, 1.0),
+    ("total_exec_time", DB_STATEMENT_SECONDS_TOTAL, 0.001),
+    ("shared_blks_hit", DB_STATEMENT_SHARED_BLKS_HIT_TOTAL, 1.0),
+    ("shared_blks_read", DB_STATEMENT_SHARED_BLKS_READ_TOTAL, 1.0),
+    ("rows", DB_STATEMENT_ROWS_TOTAL, 1.0),
+)
+
+STAT_FIELDS = tuple(field for field, _counter, _scale in STAT_COUNTERS)
+
+
+def plan_shape(plan: dict) -> str:
+    """Node types and relations of a plan tree, with monthly partition suffixes removed."""
+    relation = plan.get("Relation Name")
+    node = plan.get("Node Type", "?")
+    if relation:
+        node = f"{node}:{PARTITION_SUFFIX.sub('', relation)}"
+    children = plan.get("Plans") or []
+    if not children:
+        return node
+    return f"{node}({','.join(plan_shape(child) for child in children)})"
+
+
+def statement_target(query: str) -> str | None:
+    match = INSERT_TARGET.search(query)
+    if not match:
+        return None
+    table = match.group(1).lower()
+    return table if table in TRACKED_TABLES else None
+
+
+class QueryStatsSampler:
+    """Samples plans and pg_stat_statements for the main ingest statements every N iterations.
+
+    EXPLAIN ANALYZE executes the statements, so ingest hands the sample its cursor right
+    before it writes the snapshot's movements, while bike_last_status still holds the previous
+    snapshot, and the sample runs inside a savepoint that is always rolled back.
+    """
+
+    def __init__(self, config: AppConfig) -> None:
+        self.config = config
+        self.interval = config.query_stats_interval
+        self.iterations = 0
+        self.sampling = False
+        self.plan_shapes: dict[str, str] = {}
+        self.stat_statements_available: bool | None = None
+        self.previous_stats: dict[str, dict[str, float]] | None = None
+
+    def start(self) -> PlanHook | None:
+        """Count an iteration and return the plan hook for ingest if this one is sampled."""
+        if self.interval <= 0:
+            return None
+        self.iterations += 1
+        if self.iterations % self.interval:
+            return None
+        self.sampling = True
+        return self.sample_plans
+
+    def finish(self, conn: psycopg.Connection) -> bool:
+        """Sample pg_stat_statements after the commit of a sampled iteration."""
+        if not self.sampling:
+            return False
+        self.sampling = False
+        try:
+            self.sample_stat_statements(conn)
+        except psycopg.Error as exc:
+            self._log_failure(exc)
+            return False
+        return True
+
+    def _log_failure(self, exc: psycopg.Error) -> None:
+        log_event(
+            "warn",
+            "app.dbstats",
+            "Query statistics sample failed",
+            event="query_stats_failed",
+            config=self.config,
+            exc=exc,
+        )
+
+    def _params(self, kind: str, snapshot_id: int, fetched_at: datetime) -> tuple:
+        if kind == "movement":
+            return (snapshot_id, fetched_at, self.config.movement_min_distance_m)
+        if kind == "dwell":
+            bounds = list(DWELL_HISTOGRAM_BOUNDS_S)
+            return (snapshot_id, fetched_at, bounds, bounds)
+        return (snapshot_id, fetched_at)
+
+    def sample_plans(self, cur: psycopg.Cursor, snapshot_id: int, fetched_at: datetime) -> None:
+        # A failed sample only rolls back its savepoint; the snapshot is still stored.
+        try:
+            with cur.connection.transaction(force_rollback=True):
+                for name, query, kind in EXPLAINED_STATEMENTS:
+                    cur.execute(
+                        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query,
+                        self._params(kind, snapshot_id, fetched_at),
+                    )
+                    explain = cur.fetchone()[0]
+                    if isinstance(explain, str):
+                        explain = json.loads(explain)
+                    self._record_plan(name, explain[0])
+        except psycopg.Error as exc:
+            self._log_failure(exc)
+
+    def _record_plan(self, name: str, explain: dict) -> None:
+        plan = explain["Plan"]
+        DB_EXPLAIN_EXECUTION_SECONDS.labels(statement=name).set(
+            explain.get("Execution Time", 0.0) / 1000
+        )
+        DB_EXPLAIN_SHARED_BLKS_HIT.labels(statement=name).set(plan.get("Shared Hit Blocks", 0))
+        DB_EXPLAIN_SHARED_BLKS_READ.labels(statement=name).set(plan.get("Shared Read Blocks", 0))
+
+        shape = plan_shape(plan)
+        previous = self.plan_shapes.get(name)
+        self.plan_shapes[name] = shape
+        if previous is None or previous == shape:
+            return
+        DB_PLAN_CHANGES_TOTAL.labels(statement=name).inc()
+        log_event(
+            "warn",
+            "app.dbstats",
+            "Query plan changed",
+            event="query_plan_changed",
+            config=self.config,
+            extra={
+                "statement": name,
+                "previous_plan": hashlib.sha1(previous.encode("utf-8")).hexdigest()[:12],
+                "plan": hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12],
+                "plan_shape": shape,
+            },
+        )
+
+    def sample_stat_statements(self, conn: psycopg.Connection) -> None:
+        if self.stat_statements_available is False:
+            return
+        with conn.transaction():
+            with conn.cursor() as cur:
+                if self.stat_statements_available is None:
+                    cur.execute(
+                        "SELECT EXISTS (SELECT 1 FROM pg_extension "
+                        "WHERE extname = 'pg_stat_statements')"
+                    )
+                    self.stat_statements_available = bool(cur.fetchone()[0])
+                    if not self.stat_statements_available:
+                        return
+                cur.execute(STAT_STATEMENTS_SQL)
+                rows = cur.fetchall()
+
+        current: dict[str, dict[str, float]] = {}
+        for query, *values in rows:
+            name = statement_target(query)
+            if name is None:
+                continue
+            totals = current.setdefault(name, dict.fromkeys(STAT_FIELDS, 0.0))
+            for (field, _counter, _scale), value in zip(STAT_COUNTERS, values, strict=True):
+                totals[field] += float(value or 0)
+
+        previous = self.previous_stats
+        self.previous_stats = current
+        if previous is None:
+            return
+        for name, totals in current.items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            for field, counter, scale in STAT_COUNTERS:
+                delta = totals[field] - before[field]
+                # A pg_stat_statements_reset() makes the delta negative; skip that interval.
+                if delta > 0:
+                    counter.labels(statement=name).inc(delta * scale)
@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import psycopg
+from psycopg import sql
+
+from nextspyke.db import day_floor, list_month_partitions, month_bounds
+from nextspyke.logging import iso_ts, utc_now
+
+EXPORT_BATCH_ROWS = 50_000
+MANIFEST_NAME = "manifest.json"
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+DAY = timedelta(days=1)
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    name: str
+    # (column, kind) in query order; the first two columns are always fetched_at and city_uid.
+    columns: tuple[tuple[str, str], ...]
+    query: str
+    # Change marker for one export unit, compared against the manifest: row count and highest
+    # id over the unit's range.
+    signature_query: str
+    partitioned: bool
+
+
+BIKE_STATUS_EXPORT = ExportTable(
+    name="bike_status",
+    columns=(
+        ("fetched_at", "timestamp"),
+        ("city_uid", "int32"),
+        ("snapshot_id", "int64"),
+        ("bike_number", "dictionary"),
+        ("place_uid", "int32"),
+        ("active", "bool_"),
+        ("state", "string"),
+        ("pedelec_battery", "int32"),
+        ("battery_pack_pct", "int32"),
+        ("battery_range_km", "float64"),
+        ("lat", "float64"),
+        ("lon", "float64"),
+    ),
+    query="""
+        SELECT
+            bs.fetched_at, COALESCE(p.city_uid, c.city_uid), bs.snapshot_id,
+            COALESCE(bs.bike_number, b.bike_number), bs.place_uid, bs.active, bs.state,
+            bs.pedelec_battery, bs.battery_pack_pct, bs.battery_range_km,
+            ST_Y(bs.geom), ST_X(bs.geom)
+        FROM {source} bs
+        LEFT JOIN bike b ON b.bike_id = bs.bike_id
+        LEFT JOIN place p ON p.place_uid = bs.place_uid
+        -- Bikes away from a station belong to the smallest city whose bounds contain them.
+        LEFT JOIN LATERAL (
+            SELECT city.city_uid
+            FROM city
+            WHERE p.city_uid IS NULL AND ST_Contains(city.bounds, bs.geom)
+            ORDER BY ST_Area(city.bounds), city.city_uid
+            LIMIT 1
+        ) c ON TRUE
+        WHERE bs.fetched_at >= %s AND bs.fetched_at < %s
+    """,
+    signature_query="""
+        SELECT COUNT(*), MAX(snapshot_id)
+        FROM {source}
+        WHERE fetched_at >= %(start)s AND fetched_at < %(end)s
+    """,
+    partitioned=True,
+)
+
+BIKE_MOVEMENT_EXPORT = ExportTable(
+    name="bike_movement",
+    columns=(
+        ("end_fetched_at", "timestamp"),
+        ("city_uid", "int32"),
+        ("movement_id", "int64"),
+        ("bike_number", "dictionary"),
+        ("start_snapshot_id", "int64"),
+        ("start_fetched_at", "timestamp"),
+        ("end_snapshot_id", "int64"),
+        ("start_place_uid", "int32"),
+        ("end_place_uid", "int32"),
+        ("start_lat", "float64"),
+        ("start_lon", "float64"),
+        ("end_lat", "float64"),
+        ("end_lon", "float64"),
+        ("distance_m", "int32"),
+        ("duration_seconds", "int32"),
+        ("is_station_to_station", "bool_"),
+        ("confidence", "int16"),
+        ("movement_reason", "string"),
+    ),
+    query="""
+        SELECT
+            m.end_fetched_at, COALESCE(pe.city_uid, ps.city_uid), m.movement_id,
+            COALESCE(m.bike_number, b.bike_number), m.start_snapshot_id, m.start_fetched_at,
+            m.end_snapshot_id, m.start_place_uid,
+            m.end_place_uid, ST_Y(m.start_geom), ST_X(m.start_geom), ST_Y(m.end_geom),
+            ST_X(m.end_geom), m.distance_m, m.duration_seconds, m.is_station_to_station,
+            m.confidence, m.movement_reason
+        FROM {source} m
+        LEFT JOIN bike b ON b.bike_id = m.bike_id
+        LEFT JOIN place ps ON ps.place_uid = m.start_place_uid
+        LEFT JOIN place pe ON pe.place_uid = m.end_place_uid
+        WHERE m.end_fetched_at >= %s AND m.end_fetched_at < %s
+    """,
+    signature_query="""
+        SELECT COUNT(*), MAX(movement_id)
+        FROM {source}
+        WHERE end_fetched_at >= %(start)s AND end_fetched_at < %(end)s
+    """,
+    partitioned=False,
+)
+
+EXPORT_TABLES = {table.name: table for table in (BIKE_STATUS_EXPORT, BIKE_MOVEMENT_EXPORT)}
+
+
+@dataclass(frozen=True)
+class ExportUnit:
+    """One monthly partition (or month of an unpartitioned table) clipped to the range."""
+
+    key: str
+    source: str
+    start: datetime
+    end: datetime
+
+
+def load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise RuntimeError(
+            "Parquet files need pyarrow, which is not a runtime dependency; "
+            "install the parquet extra with `poetry install --extras parquet`"
+        ) from exc
+    return pyarrow, pyarrow.parquet
+
+
+def _arrow_type(pa, kind: str):
+    if kind == "timestamp":
+        return pa.timestamp("us", tz="UTC")
+    if kind == "dictionary":
+        return pa.dictionary(pa.int32(), pa.string())
+    return getattr(pa, kind)()
+
+
+class ParquetSink:
+    """zstd-compressed Parquet file written batch by batch and renamed into place on close."""
+
+    def __init__(self, path: Path, columns: tuple[tuple[str, str], ...]) -> None:
+        self._pa, pq = load_pyarrow()
+        self.path = path
+        self._tmp_path = path.with_name(f"{path.name}.tmp")
+        self._schema = self._pa.schema(
+            [(name, _arrow_type(self._pa, kind)) for name, kind in columns]
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = pq.ParquetWriter(self._tmp_path, self._schema, compression="zstd")
+
+    def write(self, rows: list[tuple]) -> None:
+        arrays = [
+            self._pa.array(values, type=field.type)
+            for values, field in zip(zip(*rows, strict=True), self._schema, strict=True)
+        ]
+        self._writer.write_batch(self._pa.record_batch(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._writer.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def _month_starts(start: datetime, end: datetime) -> list[datetime]:
+    months = []
+    month_start = month_bounds(start)[0]
+    while month_start < end:
+        months.append(month_start)
+        month_start = month_bounds(month_start)[1]
+    return months
+
+
+def plan_units(
+    cur: psycopg.Cursor, table: ExportTable, start: datetime, end: datetime
+) -> list[ExportUnit]:
+    if table.partitioned:
+        months = list_month_partitions(cur, table.name)
+    else:
+        months = [
+            (f"{table.name}_{month.year}{month.month:02d}", *month_bounds(month))
+            for month in _month_starts(start, end)
+        ]
+    units = []
+    for key, month_start, month_end in months:
+        if month_end <= start or month_start >= end:
+            continue
+        source = key if table.partitioned else table.name
+        units.append(ExportUnit(key, source, max(start, month_start), min(end, month_end)))
+    return units
+
+
+def unit_signature(cur: psycopg.Cursor, table: ExportTable, unit: ExportUnit) -> list:
+    cur.execute(
+        sql.SQL(table.signature_query).format(source=sql.Identifier(unit.source)),
+        {"start": unit.start, "end": unit.end},
+    )
+    row = cur.fetchone()
+    return list(row or ())
+
+
+def load_manifest(out_dir: Path) -> dict:
+    path = out_dir / MANIFEST_NAME
+    if not path.is_file():
+        return {"tables": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(out_dir: Path, manifest: dict) -> None:
+    path = out_dir / MANIFEST_NAME
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _day_path(out_dir: Path, table: ExportTable, day: datetime, city_uid: object) -> Path:
+    city = NULL_PARTITION if city_uid is None else str(city_uid)
+    return (
+        out_dir
+        / table.name
+        / f"date={day.astimezone(timezone.utc).date().isoformat()}"
+        / f"city_uid={city}"
+        / "data.parquet"
+    )
+
+
+def export_unit(
+    conn: psycopg.Connection,
+    table: ExportTable,
+    unit: ExportUnit,
+    out_dir: Path,
+    sink_factory: Callable[[Path, tuple], ParquetSink] = ParquetSink,
+) -> dict:
+    """Stream one unit day by day through a server-side cursor, one file per day and city.
+
+    Each day runs in its own short read transaction, so the export never pins old row
+    versions for longer than a day's worth of rows takes to read.
+    """
+    query = sql.SQL(table.query).format(source=sql.Identifier(unit.source))
+    rows_total = 0
+    files = []
+    day = unit.start
+    while day < unit.end:
+        day_end = min(day_floor(day) + DAY, unit.end)
+        sinks: dict[object, ParquetSink] = {}
+        try:
+            with conn.transaction():
+                with conn.cursor(name=f"export_{unit.key}") as cur:
+                    cur.itersize = EXPORT_BATCH_ROWS
+                    cur.execute(query, (day, day_end))
+                    while rows := cur.fetchmany(EXPORT_BATCH_ROWS):
+                        by_city: dict[object, list[tuple]] = {}
+                        for row in rows:
+                            by_city.setdefault(row[1], []).append(row)
+                        for city_uid, city_rows in by_city.items():
+                            sink = sinks.get(city_uid)
+                            if sink is None:
+                                path = _day_path(out_dir, table, day, city_uid)
+                                sink = sinks[city_uid] = sink_factory(path, table.columns)
+                            sink.write(city_rows)
+                        rows_total += len(rows)
+        except BaseException:
+            # Never publish a partial day; the unit is retried on the next run.
+            for sink in sinks.values():
+                sink.abort()
+            raise
+        for sink in sinks.values():
+            sink.close()
+        files.extend(str(sink.path.relative_to(out_dir)) for sink in sinks.values())
+        day = day_end
+    return {"rows": rows_total, "files": sorted(files)}
+
+
+def export_history(
+    conn: psycopg.Connection,
+    tables: list[str],
+    start: datetime,
+    end: datetime,
+    out_dir: Path,
+    sink_factory: Callable[[Path, tuple], ParquetSink] = ParquetSink,
+) -> dict:
+    """Export every unit in [start, end) whose signature differs from the manifest."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    summary = {"exported_units": 0, "skipped_units": 0, "rows": 0, "files": 0}
+    for name in tables:
+        table = EXPORT_TABLES[name]
+        entries = manifest["tables"].setdefault(table.name, {})
+        with conn.cursor() as cur:
+            units = plan_units(cur, table, start, end)
+            signatures = {unit.key: unit_signature(cur, table, unit) for unit in units}
+        conn.commit()
+        for unit in units:
+            previous = entries.get(unit.key)
+            expected = {
+                "start": iso_ts(unit.start),
+                "end": iso_ts(unit.end),
+                "signature": signatures[unit.key],
+            }
+            if previous and all(previous.get(key) == value for key, value in expected.items()):
+                summary["skipped_units"] += 1
+                continue
+            for stale in (previous or {}).get("files", []):
+                (out_dir / stale).unlink(missing_ok=True)
+            result = export_unit(conn, table, unit, out_dir, sink_factory)
+            entries[unit.key] = {**expected, **result, "exported_at": iso_ts(utc_now())}
+            save_manifest(out_dir, manifest)
+            summary["exported_units"] += 1
+            summary["rows"] += result["rows"]
+            summary["files"] += len(result["files"])
+    return summary
+
+
+def _parse_utc(value: str) -> datetime:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"invalid timestamp {value!r}") from exc
+    if parsed.tzinfo is None:
+        raise argparse.ArgumentTypeError("timestamp needs a UTC offset")
+    return parsed.astimezone(timezone.utc)
+
+
+def _parse_tables(value: str) -> list[str]:
+    tables = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = sorted(set(tables) - set(EXPORT_TABLES))
+    if not tables or unknown:
+        raise argparse.ArgumentTypeError(
+            f"tables must be a comma separated subset of {', '.join(EXPORT_TABLES)}"
+        )
+    return tables
+
+
+def parse_export_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m nextspyke.app export",
+        description="Export history to Parquet, partitioned by day and city.",
+    )
+    parser.add_argument("--from", dest="start", type=_parse_utc, required=True)
+    parser.add_argument(
+        "--to",
+        dest="end",
+        type=_parse_utc,
+        default=day_floor(utc_now()),
+        help="Exclusive end (default: start of the current UTC day)",
+    )
+    parser.add_argument("--out", type=Path, default=Path("exports"))
+    parser.add_argument("--tables", type=_parse_tables, default=list(EXPORT_TABLES))
+    args = parser.parse_args(argv)
+    if args.start >= args.end:
+        parser.error("--from must be before --to")
+    return args
@@ -1,13 +1,214 @@
 import json
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import urlopen
 
 import psycopg
 
 from nextspyke.config import AppConfig
 from nextspyke.db import build_dsn
 from nextspyke.logging import RUN_ID, iso_ts, utc_now
+from nextspyke.query_api import ReadOnlyPool
+
+HEALTH_ENDPOINT_TIMEOUT_S = 2.0
+
+
+def snapshot_max_age_seconds(config: AppConfig) -> int:
+    return max(config.poll_interval * 3, 180)
+
+
+def _ms_since(start: datetime) -> int:
+    return int((utc_now() - start).total_seconds() * 1000)
+
+
+def _age_seconds(value: datetime | None) -> int | None:
+    return int((utc_now() - value).total_seconds()) if value else None
+
+
+def _payload(config: AppConfig, checks: list[dict]) -> dict:
+    status = "ok" if all(c["status"] == "ok" for c in checks) else "fail"
+    return {
+        "status": status,
+        "service": config.service,
+        "env": config.env,
+        "version": config.version,
+        "commit": config.commit,
+        "run_id": RUN_ID,
+        "config_hash": config.config_hash,
+        "timestamp": iso_ts(utc_now()),
+        "checks": checks,
+    }
+
+
+class HealthState:
+    """What the collector loop last saw, kept in memory so probes never touch the database."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._last_activity_at = utc_now()
+        self._connected = False
+        self._shutting_down = False
+        self._standby = False
+        self._snapshot_id: int | None = None
+        self._snapshot_fetched_at: datetime | None = None
+        self._last_error: str | None = None
+        self._last_error_at: datetime | None = None
+
+    def mark_connected(self) -> None:
+        with self._lock:
+            self._connected = True
+            self._last_activity_at = utc_now()
+
+    def mark_standby(self) -> None:
+        with self._lock:
+            self._connected = True
+            self._standby = True
+            self._last_activity_at = utc_now()
+
+    def mark_success(self, snapshot_id: int, fetched_at: datetime) -> None:
+        with self._lock:
+            self._connected = True
+            self._standby = False
+            self._last_activity_at = utc_now()
+            self._snapshot_id = snapshot_id
+            self._snapshot_fetched_at = fetched_at
+
+    def mark_failure(self, exc: BaseException, connected: bool) -> None:
+        with self._lock:
+            self._connected = connected
+            self._last_activity_at = utc_now()
+            self._last_error = f"{type(exc).__name__}: {exc}"
+            self._last_error_at = self._last_activity_at
+
+    def mark_shutdown(self) -> None:
+        with self._lock:
+            self._shutting_down = True
+
+    def liveness_checks(self, config: AppConfig) -> list[dict]:
+        max_age_seconds = snapshot_max_age_seconds(config)
+        with self._lock:
+            age_seconds = _age_seconds(self._last_activity_at)
+        return [
+            {"name": "self", "status": "ok", "latency_ms": 0},
+            {
+                "name": "loop",
+                "status": "ok" if age_seconds <= max_age_seconds else "fail",
+                "age_seconds": age_seconds,
+                "max_age_seconds": max_age_seconds,
+            },
+        ]
+
+    def readiness_checks(self, config: AppConfig) -> list[dict]:
+        max_age_seconds = snapshot_max_age_seconds(config)
+        with self._lock:
+            connected = self._connected and not self._shutting_down
+            standby = self._standby
+            snapshot_id = self._snapshot_id
+            age_seconds = _age_seconds(self._snapshot_fetched_at)
+            last_error = self._last_error
+            last_error_at = self._last_error_at
+        fresh = age_seconds is not None and age_seconds <= max_age_seconds
+        # A standby does not write snapshots; it is ready as long as it can take over.
+        return [
+            {"name": "self", "status": "ok", "latency_ms": 0},
+            {
+                "name": "db",
+                "status": "ok" if connected else "fail",
+                "last_error": last_error,
+                "last_error_at": iso_ts(last_error_at) if last_error_at else None,
+            },
+            {
+                "name": "snapshot_freshness",
+                "status": "ok" if fresh or standby else "fail",
+                "role": "standby" if standby else "leader",
+                "snapshot_id": snapshot_id,
+                "age_seconds": age_seconds,
+                "max_age_seconds": max_age_seconds,
+            },
+        ]
+
+
+class HealthEndpoints:
+    def __init__(self, config: AppConfig, state: HealthState, pool: ReadOnlyPool) -> None:
+        self.config = config
+        self.state = state
+        self.pool = pool
+
+    def _deep_check(self) -> dict:
+        start = utc_now()
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("SELECT 1")
+            status = "ok"
+        except psycopg.Error:
+            status = "fail"
+        return {"name": "db_query", "status": status, "latency_ms": _ms_since(start)}
+
+    def handle(self, target: str) -> tuple[int, bytes]:
+        parts = urlsplit(target)
+        if parts.path == "/healthz":
+            checks = self.state.liveness_checks(self.config)
+        elif parts.path == "/readyz":
+            checks = self.state.readiness_checks(self.config)
+            if parse_qs(parts.query).get("deep") == ["1"]:
+                checks.append(self._deep_check())
+        else:
+            return 404, json.dumps({"error": "not found"}).encode("utf-8")
+        payload = _payload(self.config, checks)
+        status = 200 if payload["status"] == "ok" else 503
+        return status, json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    server_version = "nextspyke-health"
+
+    def do_GET(self) -> None:
+        status, body = self.server.endpoints.handle(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Probes arrive every few seconds; they are not worth a log line each.
+        return None
+
+
+def start_health_server(config: AppConfig, state: HealthState) -> ThreadingHTTPServer | None:
+    if not config.health_server_enabled:
+        return None
+    # Deep checks share one long-lived connection instead of connecting per probe.
+    pool = ReadOnlyPool(build_dsn(), 1)
+    server = ThreadingHTTPServer(("", config.health_port), HealthHandler)
+    server.daemon_threads = True
+    server.endpoints = HealthEndpoints(config, state, pool)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _query_health_endpoint(config: AppConfig) -> tuple[int, str] | None:
+    url = f"http://127.0.0.1:{config.health_port}/readyz"
+    try:
+        with urlopen(url, timeout=HEALTH_ENDPOINT_TIMEOUT_S) as response:
+            return response.status, response.read().decode("utf-8")
+    except HTTPError as exc:
+        return exc.code, exc.read().decode("utf-8")
+    except OSError:
+        return None
 
 
 def health_check(config: AppConfig) -> int:
+    if config.health_server_enabled:
+        response = _query_health_endpoint(config)
+        if response is not None:
+            status, body = response
+            print(body)
+            return 0 if status == 200 else 1
+
     checks = []
     start = utc_now()
     checks.append(
@@ -26,7 +227,7 @@ def health_check(config: AppConfig) -> int:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
                 snapshot_start = utc_now()
-                max_age_seconds = max(config.poll_interval * 3, 180)
+                max_age_seconds = snapshot_max_age_seconds(config)
                 try:
                     cur.execute(
                         """
@@ -72,17 +273,6 @@ def health_check(config: AppConfig) -> int:
     if snapshot_check:
         checks.append(snapshot_check)
 
-    status = "ok" if all(c["status"] == "ok" for c in checks) else "fail"
-    payload = {
-        "status": status,
-        "service": config.service,
-        "env": config.env,
-        "version": config.version,
-        "commit": config.commit,
-        "run_id": RUN_ID,
-        "config_hash": config.config_hash,
-        "timestamp": iso_ts(utc_now()),
-        "checks": checks,
-    }
+    payload = _payload(config, checks)
     print(json.dumps(payload, separators=(",", ":")))
-    return 0 if status == "ok" else 1
+    return 0 if payload["status"] == "ok" else 1
@@ -0,0 +1,348 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+import psycopg
+from psycopg import sql
+
+from nextspyke.db import list_month_partitions, month_bounds
+from nextspyke.logging import utc_now
+
+
+@dataclass(frozen=True)
+class PartitionIndex:
+    table: str
+    # Appended to the partition name, e.g. bike_status_202606_geom.
+    suffix: str
+    definition: str
+
+
+# Indexes that only pay off for reads over finished months. Keeping them off the partition the
+# collector writes to leaves it with its key and the BRIN index on fetched_at.
+CLOSED_PARTITION_INDEXES = (
+    PartitionIndex("bike_status", "geom", "USING GIST (geom)"),
+    PartitionIndex("bike_status", "bike_id_time", "(bike_id, fetched_at)"),
+    PartitionIndex("place_status", "place_time", "(place_uid, fetched_at)"),
+)
+
+
+@dataclass(frozen=True)
+class ParentIndex:
+    table: str
+    name: str
+    # Appended to the partition name for the index built on each partition.
+    suffix: str
+    definition: str
+    unique: bool = False
+
+
+# Indexes a new database creates in schema.sql and `migrate-indexes` adds to an existing one.
+MIGRATED_PARENT_INDEXES = (
+    ParentIndex(
+        "bike_status",
+        "idx_bike_status_fetched_at_brin",
+        "fetched_at_brin",
+        "USING BRIN (fetched_at)",
+    ),
+    ParentIndex(
+        "place_status",
+        "idx_place_status_fetched_at_brin",
+        "fetched_at_brin",
+        "USING BRIN (fetched_at)",
+    ),
+)
+MIGRATED_TABLE_INDEXES = (
+    (
+        "bike_movement",
+        "idx_bike_movement_time_covering",
+        "(end_fetched_at) INCLUDE (distance_m, duration_seconds, start_place_uid, end_place_uid)",
+    ),
+)
+# Indexes replaced by the above and CLOSED_PARTITION_INDEXES, dropped once those exist.
+REPLACED_PARTITIONED_INDEXES = (
+    "idx_bike_status_bike_id_time",
+    "idx_bike_status_geom",
+    "idx_place_status_place_time",
+)
+REPLACED_TABLE_INDEXES = ("idx_bike_movement_time",)
+# bike_id indexes a new database creates in schema.sql and `migrate-bike-ids` adds to an
+# existing one.
+BIKE_ID_PARENT_INDEXES = (
+    ParentIndex(
+        "bike_status",
+        "idx_bike_status_key",
+        "key",
+        "(snapshot_id, bike_id, fetched_at)",
+        unique=True,
+    ),
+    ParentIndex(
+        "bike_status",
+        "idx_bike_status_unmigrated",
+        "unmigrated",
+        "(fetched_at) WHERE bike_id IS NULL",
+    ),
+)
+BIKE_ID_TABLE_INDEXES = (
+    ("bike_movement", "idx_bike_movement_bike_id_time", "(bike_id, end_fetched_at)", False),
+    (
+        "bike_movement",
+        "idx_bike_movement_unmigrated",
+        "(end_fetched_at) WHERE bike_id IS NULL",
+        False,
+    ),
+    (
+        "bike_movement",
+        "idx_bike_movement_bike_id_unique",
+        "(bike_id, start_snapshot_id, end_snapshot_id)",
+        True,
+    ),
+)
+# Dropping an index on a partitioned table needs a short exclusive lock; give up rather than
+# queue in front of the collector.
+MIGRATION_LOCK_TIMEOUT = "5s"
+
+INDEX_STATE_SQL = """
+    SELECT c.relname, i.indisvalid
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = ANY(%s) AND pg_table_is_visible(c.oid)
+"""
+
+PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits i
+    JOIN pg_class child ON child.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass
+    ORDER BY child.relname
+"""
+
+# Partitions that already have an index attached to the given partitioned index, for example
+# ones created while the migration was running.
+ATTACHED_PARTITIONS_SQL = """
+    SELECT t.relname
+    FROM pg_inherits i
+    JOIN pg_index x ON x.indexrelid = i.inhrelid
+    JOIN pg_class t ON t.oid = x.indrelid
+    WHERE i.inhparent = %s::regclass
+"""
+
+# Partition indexes are folded into their parent index, or, for the per-partition indexes
+# above, into one row per table and suffix.
+INDEX_REPORT_SQL = """
+    SELECT
+        COALESCE(parent_table.relname, s.relname) AS table_name,
+        COALESCE(parent_index.relname, regexp_replace(s.indexrelname, '_[0-9]{6}_', '_*_'))
+            AS index_name,
+        COUNT(*) AS indexes,
+        SUM(pg_relation_size(s.indexrelid)) AS size_bytes,
+        SUM(s.idx_scan) AS scans,
+        SUM(s.idx_tup_read) AS tuples_read
+    FROM pg_stat_user_indexes s
+    LEFT JOIN pg_inherits index_parent ON index_parent.inhrelid = s.indexrelid
+    LEFT JOIN pg_class parent_index ON parent_index.oid = index_parent.inhparent
+    LEFT JOIN pg_inherits table_parent ON table_parent.inhrelid = s.relid
+    LEFT JOIN pg_class parent_table ON parent_table.oid = table_parent.inhparent
+    GROUP BY 1, 2
+    ORDER BY size_bytes DESC, table_name, index_name
+"""
+
+
+def closed_partition_index_names(
+    cur: psycopg.Cursor, now: datetime
+) -> list[tuple[PartitionIndex, str, str]]:
+    """(index, partition, index name) for every closed month partition."""
+    current_month = month_bounds(now)[0]
+    names = []
+    for table in dict.fromkeys(index.table for index in CLOSED_PARTITION_INDEXES):
+        for partition, _start, end in list_month_partitions(cur, table):
+            if end > current_month:
+                continue
+            for index in CLOSED_PARTITION_INDEXES:
+                if index.table == table:
+                    names.append((index, partition, f"{partition}_{index.suffix}"))
+    return names
+
+
+def build_closed_partition_indexes(conn: psycopg.Connection, now: datetime | None = None) -> dict:
+    """Create the CLOSED_PARTITION_INDEXES on month partitions that have ended.
+
+    Indexes are built with CREATE INDEX CONCURRENTLY, one statement at a time outside a
+    transaction, so the collector keeps writing. A build that failed half way leaves an invalid
+    index behind; it is dropped and built again.
+    """
+    with conn.cursor() as cur:
+        wanted = closed_partition_index_names(cur, now or utc_now())
+        cur.execute(INDEX_STATE_SQL, ([name for _index, _partition, name in wanted],))
+        valid = dict(cur.fetchall())
+    conn.commit()
+
+    built = []
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for index, partition, name in wanted:
+            if _create_index_concurrently(conn, name, partition, index.definition, valid):
+                built.append(name)
+    finally:
+        conn.autocommit = autocommit
+    return {"closed_partition_indexes": len(wanted), "built_indexes": built}
+
+
+def migrate_indexes(conn: psycopg.Connection, now: datetime | None = None) -> dict:
+    """Switch an existing database to the index layout above without blocking the collector.
+
+    Builds the closed partition indexes, the BRIN and covering indexes, each concurrently,
+    and only then drops the indexes they replace. Safe to run again after a failure.
+    """
+    built = build_closed_partition_indexes(conn, now)["built_indexes"]
+    dropped = []
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for index in MIGRATED_PARENT_INDEXES:
+            built.extend(create_partitioned_index_concurrently(conn, index))
+        for table, name, definition in MIGRATED_TABLE_INDEXES:
+            if _create_index_concurrently(
+                conn, name, table, definition, _index_state(conn, [name])
+            ):
+                built.append(name)
+
+        conn.execute("SELECT set_config('lock_timeout', %s, false)", (MIGRATION_LOCK_TIMEOUT,))
+        replaced = _index_state(conn, REPLACED_PARTITIONED_INDEXES + REPLACED_TABLE_INDEXES)
+        for name in REPLACED_PARTITIONED_INDEXES:
+            if name in replaced:
+                # Partitioned indexes cannot be dropped concurrently.
+                conn.execute(
+                    sql.SQL("DROP INDEX IF EXISTS {name}").format(name=sql.Identifier(name))
+                )
+                dropped.append(name)
+        for name in REPLACED_TABLE_INDEXES:
+            if name in replaced:
+                conn.execute(
+                    sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {name}").format(
+                        name=sql.Identifier(name)
+                    )
+                )
+                dropped.append(name)
+    finally:
+        conn.autocommit = autocommit
+    return {"built_indexes": built, "dropped_indexes": dropped}
+
+
+def build_bike_id_indexes(conn: psycopg.Connection) -> list[str]:
+    """Build the BIKE_ID indexes that are missing, concurrently, and return their names."""
+    built = []
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for index in BIKE_ID_PARENT_INDEXES:
+            built.extend(create_partitioned_index_concurrently(conn, index))
+        for table, name, definition, unique in BIKE_ID_TABLE_INDEXES:
+            if _create_index_concurrently(
+                conn, name, table, definition, _index_state(conn, [name]), unique
+            ):
+                built.append(name)
+    finally:
+        conn.autocommit = autocommit
+    return built
+
+
+def partition_names(cur: psycopg.Cursor, table: str) -> list[str]:
+    """Every partition of `table`, including the default one."""
+    cur.execute(PARTITIONS_SQL, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def _index_state(conn: psycopg.Connection, names) -> dict[str, bool]:
+    with conn.cursor() as cur:
+        cur.execute(INDEX_STATE_SQL, (list(names),))
+        return dict(cur.fetchall())
+
+
+def _create_index_concurrently(
+    conn: psycopg.Connection,
+    name: str,
+    table: str,
+    definition: str,
+    valid: dict[str, bool],
+    unique: bool = False,
+) -> bool:
+    """Build `name` unless it exists and is valid; an invalid leftover is dropped first."""
+    if valid.get(name):
+        return False
+    if name in valid:
+        conn.execute(
+            sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {name}").format(name=sql.Identifier(name))
+        )
+    conn.execute(
+        sql.SQL(
+            "CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}"
+        ).format(
+            unique=sql.SQL("UNIQUE " if unique else ""),
+            name=sql.Identifier(name),
+            table=sql.Identifier(table),
+            definition=sql.SQL(definition),
+        )
+    )
+    return True
+
+
+def create_partitioned_index_concurrently(
+    conn: psycopg.Connection, index: ParentIndex
+) -> list[str]:
+    """Create `index` on a partitioned table one partition at a time.
+
+    CREATE INDEX CONCURRENTLY does not work on partitioned tables. The parent index is created
+    ON ONLY the parent, which is instant and leaves it invalid, each partition gets its own
+    index built concurrently and attached, and the parent turns valid with the last attach.
+    """
+    if _index_state(conn, [index.name]).get(index.name):
+        return []
+    conn.execute(
+        sql.SQL("CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}").format(
+            unique=sql.SQL("UNIQUE " if index.unique else ""),
+            name=sql.Identifier(index.name),
+            table=sql.Identifier(index.table),
+            definition=sql.SQL(index.definition),
+        )
+    )
+    with conn.cursor() as cur:
+        partitions = partition_names(cur, index.table)
+        cur.execute(ATTACHED_PARTITIONS_SQL, (index.name,))
+        attached = {row[0] for row in cur.fetchall()}
+    partitions = [partition for partition in partitions if partition not in attached]
+    names = [f"{partition}_{index.suffix}" for partition in partitions]
+    valid = _index_state(conn, names)
+    built = []
+    for partition, name in zip(partitions, names, strict=True):
+        if _create_index_concurrently(conn, name, partition, index.definition, valid, index.unique):
+            built.append(name)
+        conn.execute(
+            sql.SQL("ALTER INDEX {parent} ATTACH PARTITION {name}").format(
+                parent=sql.Identifier(index.name), name=sql.Identifier(name)
+            )
+        )
+    return built
+
+
+def index_report(cur: psycopg.Cursor) -> list[dict]:
+    cur.execute(INDEX_REPORT_SQL)
+    columns = ("table", "index", "indexes", "size_bytes", "scans", "tuples_read")
+    return [dict(zip(columns, row, strict=True)) for row in cur.fetchall()]
+
+
+def format_index_report(rows: list[dict]) -> list[str]:
+    """Index size against scans since the statistics were last reset, largest first.
+
+    Indexes that were never scanned are flagged; they cost every insert and may be dropped.
+    """
+    width = max([len(f"{row['table']}.{row['index']}") for row in rows] + [5])
+    lines = [f"{'index':<{width}} {'count':>6} {'size MB':>10} {'scans':>12} {'tuples read':>14}"]
+    for row in rows:
+        name = f"{row['table']}.{row['index']}"
+        scans = int(row["scans"] or 0)
+        flag = "  unused" if scans == 0 else ""
+        lines.append(
+            f"{name:<{width}} {row['indexes']:>6} {row['size_bytes'] / 1024 / 1024:>10.1f} "
+            f"{scans:>12} {int(row['tuples_read'] or 0):>14}{flag}"
+        )
+    return lines
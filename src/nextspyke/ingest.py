@@ -1,28 +1,76 @@
 import json
-from datetime import datetime
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
 import psycopg
+from psycopg import sql
 from psycopg.types.json import Json
 
 from nextspyke.config import AppConfig
-from nextspyke.db import ensure_partitions
+from nextspyke.db import ensure_partitions, list_month_partitions, month_bounds
 from nextspyke.logging import log_event, utc_now
+from nextspyke.metrics import StageTimings, mark_place_status_rows, observe_snapshot
 
 LIVE_BASE_URL = "https://maps.nextbike.net/maps/nextbike-live.json"
 ZONE_BASE_URL = "https://zone-service.nextbikecloud.net/v1/zones/city/{city_id}"
 FLEXZONE_URL = "https://api.nextbike.net/reservation/geojson/flexzone_{domain}.json"
 GBFS_ROOT_URL = "https://gbfs.nextbike.net/maps/gbfs/v2/{system_id}/gbfs.json"
+DWELL_HISTOGRAM_BOUNDS_S = (0, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400, 259200, 604800)
 
+# Last committed snapshot per domain. Seeded from the database the first time a domain is
+# ingested, then advanced after every commit, so gap detection needs no query per poll.
+_last_fetched_at: dict[str, datetime | None] = {}
 
-def fetch_json(url: str, params: dict | None = None) -> dict:
+
+@dataclass
+class _WrittenPlaceStatus:
+    keyframe_at: datetime
+    written_at: datetime
+    values: dict[object, tuple]
+
+
+# Station values last written to place_status per domain, so unchanged stations can be
+# skipped. Dropped whenever a write may not have been committed; the next snapshot is then
+# written in full.
+_written_place_status: dict[str, _WrittenPlaceStatus] = {}
+
+# vehicle_type ordinals by vehicle_type_id; ordinals never change once assigned.
+_vehicle_type_ordinals: dict[str, int] = {}
+
+# bike_id by bike_number; like ordinals, ids never change once assigned.
+_bike_ids: dict[str, int] = {}
+
+
+def _request(url: str, params: dict | None) -> Request:
     if params:
         url = f"{url}?{urlencode(params)}"
-    request = Request(url, headers={"User-Agent": "NextSpyke/0.1"})
-    with urlopen(request, timeout=30) as response:
-        payload = response.read().decode("utf-8")
-    return json.loads(payload)
+    return Request(url, headers={"User-Agent": "NextSpyke/0.1"})
+
+
+def fetch_text(url: str, params: dict | None = None) -> str:
+    with urlopen(_request(url, params), timeout=30) as response:
+        return response.read().decode("utf-8")
+
+
+def fetch_feed(url: str, params: dict | None = None) -> tuple[str, datetime | None]:
+    """Body plus the Last-Modified time the server reports for it, if any."""
+    with urlopen(_request(url, params), timeout=30) as response:
+        body = response.read().decode("utf-8")
+        last_modified = response.headers.get("Last-Modified")
+    try:
+        updated_at = parsedate_to_datetime(last_modified) if last_modified else None
+    except (TypeError, ValueError):
+        updated_at = None
+    return body, updated_at
+
+
+def fetch_json(url: str, params: dict | None = None) -> dict:
+    return json.loads(fetch_text(url, params))
 
 
 def log_optional_failure(config: AppConfig, source: str, exc: BaseException) -> None:
@@ -209,6 +257,52 @@ def upsert_vehicle_types(cur: psycopg.Cursor, type_ids: set[str]) -> None:
     )
 
 
+def vehicle_type_ordinals(cur: psycopg.Cursor, type_ids: set[str]) -> dict[str, int]:
+    """Return the ordinal of every vehicle type seen so far, registering unknown `type_ids`."""
+    missing = sorted(type_ids - _vehicle_type_ordinals.keys())
+    if missing:
+        cur.execute(
+            """
+            INSERT INTO vehicle_type (vehicle_type_id)
+            SELECT unnest(%s::text[])
+            ON CONFLICT DO NOTHING
+            """,
+            (missing,),
+        )
+        cur.execute(
+            "SELECT vehicle_type_id, ordinal FROM vehicle_type WHERE vehicle_type_id = ANY(%s)",
+            (missing,),
+        )
+        _vehicle_type_ordinals.update(cur.fetchall())
+    return _vehicle_type_ordinals
+
+
+def bike_ids(cur: psycopg.Cursor, bike_numbers: set[str]) -> dict[str, int]:
+    """Return the bike_id of every bike seen so far; `bike_numbers` must already be in bike."""
+    missing = sorted(bike_numbers - _bike_ids.keys())
+    if missing:
+        cur.execute(
+            "SELECT bike_number, bike_id FROM bike WHERE bike_number = ANY(%s)",
+            (missing,),
+        )
+        _bike_ids.update(cur.fetchall())
+    return _bike_ids
+
+
+def bike_type_counts(bike_types: dict | None, ordinals: dict[str, int]) -> list[int]:
+    """Encode a feed's {vehicle_type_id: count} object as counts indexed by ordinal (1-based)."""
+    if not bike_types:
+        return []
+    counts = [0] * max(ordinals[str(type_id)] for type_id in bike_types)
+    for type_id, count in bike_types.items():
+        counts[ordinals[str(type_id)] - 1] = int(count or 0)
+    return counts
+
+
+def bike_type_ids(items: list[dict]) -> set[str]:
+    return {str(type_id) for item in items for type_id in item.get("bike_types") or {}}
+
+
 def upsert_bikes(cur: psycopg.Cursor, bikes: list[tuple]) -> None:
     if not bikes:
         return
@@ -231,13 +325,17 @@ def upsert_bikes(cur: psycopg.Cursor, bikes: list[tuple]) -> None:
 
 
 def insert_city_status(
-    cur: psycopg.Cursor, snapshot_id: int, fetched_at: datetime, city: dict
+    cur: psycopg.Cursor,
+    snapshot_id: int,
+    fetched_at: datetime,
+    city: dict,
+    ordinals: dict[str, int],
 ) -> None:
     cur.execute(
         """
         INSERT INTO city_status (
             snapshot_id, fetched_at, city_uid, booked_bikes, set_point_bikes, available_bikes,
-            bike_types
+            bike_type_counts
         )
         VALUES (%s, %s, %s, %s, %s, %s, %s)
         """,
@@ -248,14 +346,41 @@ def insert_city_status(
             city.get("booked_bikes"),
             city.get("set_point_bikes"),
             city.get("available_bikes"),
-            Json(city.get("bike_types") or {}),
+            bike_type_counts(city.get("bike_types"), ordinals),
         ),
     )
 
 
-def insert_place_status(
-    cur: psycopg.Cursor, snapshot_id: int, fetched_at: datetime, places: list[dict]
-) -> None:
+PLACE_STATUS_COLUMNS = (
+    "snapshot_id",
+    "fetched_at",
+    "place_uid",
+    "booked_bikes",
+    "bikes",
+    "bikes_available_to_rent",
+    "bike_racks",
+    "free_racks",
+    "special_racks",
+    "free_special_racks",
+    "bike_type_counts",
+)
+BIKE_STATUS_COLUMNS = (
+    "snapshot_id",
+    "fetched_at",
+    "bike_id",
+    "place_uid",
+    "active",
+    "state",
+    "pedelec_battery",
+    "battery_pack_pct",
+    "battery_range_km",
+    "geom",
+)
+
+
+def place_status_rows(
+    snapshot_id: int, fetched_at: datetime, places: list[dict], ordinals: dict[str, int]
+) -> list[tuple]:
     rows = []
     for place in places:
         if place.get("spot") is not True:
@@ -272,15 +397,73 @@ def insert_place_status(
                 place.get("free_racks"),
                 place.get("special_racks"),
                 place.get("free_special_racks"),
-                Json(place.get("bike_types") or {}),
+                bike_type_counts(place.get("bike_types"), ordinals),
             )
         )
+    return rows
+
+
+def place_status_values(place: dict) -> tuple:
+    return (
+        place.get("booked_bikes"),
+        place.get("bikes"),
+        place.get("bikes_available_to_rent"),
+        place.get("bike_racks"),
+        place.get("free_racks"),
+        place.get("special_racks"),
+        place.get("free_special_racks"),
+        place.get("bike_types") or {},
+    )
+
+
+def next_place_status_keyframe(keyframe_at: datetime, interval_minutes: int) -> datetime:
+    # Each month partition starts with a keyframe, so it can be read or tiered on its own.
+    return min(keyframe_at + timedelta(minutes=interval_minutes), month_bounds(keyframe_at)[1])
+
+
+def diff_place_status(
+    config: AppConfig, fetched_at: datetime, stations: list[dict]
+) -> tuple[set, bool]:
+    """Return the uids of stations whose status has to be written, and whether the snapshot
+    is a keyframe that writes every station.
+
+    Without PLACE_STATUS_KEYFRAME_MINUTES every snapshot is a keyframe.
+    """
+    values = {station.get("uid"): place_status_values(station) for station in stations}
+    interval = config.place_status_keyframe_minutes
+    if interval <= 0:
+        return set(values), True
+    previous = _written_place_status.get(config.domain)
+    keyframe = (
+        previous is None
+        or fetched_at <= previous.written_at
+        or fetched_at >= next_place_status_keyframe(previous.keyframe_at, interval)
+        # Nothing records that a station left the feed; a keyframe ends its forward fill.
+        or not previous.values.keys() <= values.keys()
+    )
+    if keyframe:
+        _written_place_status[config.domain] = _WrittenPlaceStatus(fetched_at, fetched_at, values)
+        return set(values), True
+    changed = {uid for uid, value in values.items() if previous.values.get(uid) != value}
+    previous.values.update((uid, values[uid]) for uid in changed)
+    previous.written_at = fetched_at
+    return changed, False
+
+
+def insert_place_status(
+    cur: psycopg.Cursor,
+    snapshot_id: int,
+    fetched_at: datetime,
+    places: list[dict],
+    ordinals: dict[str, int],
+) -> None:
+    rows = place_status_rows(snapshot_id, fetched_at, places, ordinals)
     if rows:
         cur.executemany(
             """
             INSERT INTO place_status (
                 snapshot_id, fetched_at, place_uid, booked_bikes, bikes, bikes_available_to_rent,
-                bike_racks, free_racks, special_racks, free_special_racks, bike_types
+                bike_racks, free_racks, special_racks, free_special_racks, bike_type_counts
             )
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """,
@@ -288,13 +471,20 @@ def insert_place_status(
         )
 
 
-def insert_bike_status(cur: psycopg.Cursor, snapshot_id: int, bike_rows: list[tuple]) -> None:
+def bike_status_id_rows(bike_rows: list[tuple], ids: dict[str, int]) -> list[tuple]:
+    """Swap the bike_number of `build_bike_rows` status rows for its bike_id."""
+    return [(row[0], row[1], ids[row[2]], *row[3:]) for row in bike_rows]
+
+
+def insert_bike_status(
+    cur: psycopg.Cursor, snapshot_id: int, bike_rows: list[tuple], ids: dict[str, int]
+) -> None:
     if not bike_rows:
         return
     cur.executemany(
         """
         INSERT INTO bike_status (
-            snapshot_id, fetched_at, bike_number, place_uid, active, state, pedelec_battery,
+            snapshot_id, fetched_at, bike_id, place_uid, active, state, pedelec_battery,
             battery_pack_pct, battery_range_km, geom
         )
         VALUES (
@@ -302,188 +492,813 @@ def insert_bike_status(cur: psycopg.Cursor, snapshot_id: int, bike_rows: list[tu
             ST_SetSRID(ST_MakePoint(%s, %s), 4326)
         )
         """,
-        bike_rows,
+        bike_status_id_rows(bike_rows, ids),
+    )
+
+
+def _ewkt_point(lon: float | None, lat: float | None) -> str | None:
+    # COPY cannot call ST_MakePoint; PostGIS parses the point from EWKT text instead.
+    return None if lon is None or lat is None else f"SRID=4326;POINT({lon} {lat})"
+
+
+def copy_rows(cur: psycopg.Cursor, table: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+    if not rows:
+        return
+    statement = sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+        table=sql.Identifier(table),
+        columns=sql.SQL(", ").join(sql.Identifier(column) for column in columns),
     )
+    with cur.copy(statement) as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def copy_place_status(
+    cur: psycopg.Cursor,
+    snapshot_id: int,
+    fetched_at: datetime,
+    places: list[dict],
+    ordinals: dict[str, int],
+) -> None:
+    copy_rows(
+        cur,
+        "place_status",
+        PLACE_STATUS_COLUMNS,
+        place_status_rows(snapshot_id, fetched_at, places, ordinals),
+    )
+
+
+def copy_bike_status(
+    cur: psycopg.Cursor, snapshot_id: int, bike_rows: list[tuple], ids: dict[str, int]
+) -> None:
+    rows = [(*row[:9], _ewkt_point(row[9], row[10])) for row in bike_status_id_rows(bike_rows, ids)]
+    copy_rows(cur, "bike_status", BIKE_STATUS_COLUMNS, rows)
 
 
 def insert_snapshot(
-    cur: psycopg.Cursor, fetched_at: datetime, domain: str, raw_json: dict | None
+    cur: psycopg.Cursor,
+    fetched_at: datetime,
+    domain: str,
+    raw_json: dict | None,
+    place_status_keyframe: bool = True,
 ) -> int:
     cur.execute(
         """
-        INSERT INTO snapshot (fetched_at, domain, source, raw_json)
-        VALUES (%s, %s, %s, %s)
+        INSERT INTO snapshot (fetched_at, domain, source, raw_json, place_status_keyframe)
+        VALUES (%s, %s, %s, %s, %s)
         RETURNING snapshot_id
         """,
-        (fetched_at, domain, "nextbike-live", Json(raw_json) if raw_json else None),
+        (
+            fetched_at,
+            domain,
+            "nextbike-live",
+            Json(raw_json) if raw_json else None,
+            place_status_keyframe,
+        ),
     )
     return cur.fetchone()[0]
 
 
-def record_snapshot_gap(
-    cur: psycopg.Cursor, fetched_at: datetime, domain: str, expected_interval_s: int
-) -> dict | None:
+def forget_last_snapshots() -> None:
+    """Drop the remembered snapshot times and station values; the next ingest reads the
+    times from the database and writes every station."""
+    _last_fetched_at.clear()
+    _written_place_status.clear()
+
+
+def latest_snapshot_at(cur: psycopg.Cursor, domain: str) -> datetime | None:
     cur.execute(
         "SELECT fetched_at FROM snapshot WHERE domain = %s ORDER BY fetched_at DESC LIMIT 1",
         (domain,),
     )
     row = cur.fetchone()
-    if not row:
-        return None
-    prev_fetched_at = row[0]
-    gap_seconds = int((fetched_at - prev_fetched_at).total_seconds())
+    return row[0] if row else None
+
+
+def snapshot_gap(
+    prev_fetched_at: datetime, fetched_at: datetime, expected_interval_s: int
+) -> dict | None:
     if expected_interval_s <= 0:
         return None
+    gap_seconds = int((fetched_at - prev_fetched_at).total_seconds())
     threshold = int(expected_interval_s * 1.5)
     if gap_seconds <= threshold:
         return None
-    missing_count = max(int(gap_seconds // expected_interval_s) - 1, 0)
-    cur.execute(
-        """
-        INSERT INTO snapshot_gap (
-            domain, gap_start, gap_end, gap_seconds, expected_interval_s, missing_count
-        )
-        VALUES (%s, %s, %s, %s, %s, %s)
-        """,
-        (
-            domain,
-            prev_fetched_at,
-            fetched_at,
-            gap_seconds,
-            expected_interval_s,
-            missing_count,
-        ),
-    )
     return {
         "gap_start": prev_fetched_at,
         "gap_end": fetched_at,
         "gap_seconds": gap_seconds,
         "expected_interval_s": expected_interval_s,
-        "missing_count": missing_count,
+        "missing_count": max(int(gap_seconds // expected_interval_s) - 1, 0),
     }
 
 
+INSERT_SNAPSHOT_GAP_SQL = """
+    INSERT INTO snapshot_gap (
+        domain, gap_start, gap_end, gap_seconds, expected_interval_s, missing_count
+    )
+    SELECT %(domain)s, %(gap_start)s, %(gap_end)s, %(gap_seconds)s, %(expected_interval_s)s,
+        %(missing_count)s
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM snapshot_gap
+        WHERE domain = %(domain)s AND gap_start = %(gap_start)s AND gap_end = %(gap_end)s
+    )
+"""
+
+
+def record_snapshot_gap(
+    cur: psycopg.Cursor,
+    fetched_at: datetime,
+    domain: str,
+    expected_interval_s: int,
+    prev_fetched_at: datetime | None,
+) -> dict | None:
+    """Write a snapshot_gap row if `fetched_at` is too far behind the previous snapshot."""
+    if prev_fetched_at is None:
+        return None
+    gap = snapshot_gap(prev_fetched_at, fetched_at, expected_interval_s)
+    if gap is None:
+        return None
+    cur.execute(INSERT_SNAPSHOT_GAP_SQL, {"domain": domain, **gap})
+    return gap
+
+
+SNAPSHOT_GAP_AUDIT_SQL = """
+    SELECT prev_at, fetched_at, last_at
+    FROM (
+        SELECT
+            fetched_at,
+            LAG(fetched_at) OVER (ORDER BY fetched_at) AS prev_at,
+            MAX(fetched_at) OVER () AS last_at
+        FROM {partition}
+        WHERE domain = %s
+    ) s
+    WHERE prev_at IS NULL OR fetched_at - prev_at > %s
+    ORDER BY fetched_at
+"""
+
+
+def audit_snapshot_gaps(cur: psycopg.Cursor, domain: str, expected_interval_s: int) -> dict:
+    """Find gaps across the whole snapshot history and record those not recorded yet.
+
+    Each monthly partition is read once with a window over its own rows; the boundary
+    between two partitions is checked against the last snapshot of the previous one.
+    """
+    threshold = timedelta(seconds=int(expected_interval_s * 1.5))
+    partitions = list_month_partitions(cur, "snapshot")
+    gaps = []
+    prev_last_at = None
+    for partition, _start, _end in partitions:
+        cur.execute(
+            sql.SQL(SNAPSHOT_GAP_AUDIT_SQL).format(partition=sql.Identifier(partition)),
+            (domain, threshold),
+        )
+        for prev_at, fetched_at, last_at in cur.fetchall():
+            prev_at = prev_at or prev_last_at
+            gap = snapshot_gap(prev_at, fetched_at, expected_interval_s) if prev_at else None
+            if gap:
+                gaps.append(gap)
+            prev_last_at = last_at
+    recorded = 0
+    for gap in gaps:
+        cur.execute(INSERT_SNAPSHOT_GAP_SQL, {"domain": domain, **gap})
+        recorded += cur.rowcount or 0
+    return {"partitions": len(partitions), "gaps": len(gaps), "recorded_gaps": recorded}
+
+
+INSERT_BIKE_MOVEMENTS_SQL = """
+    WITH current AS (
+        SELECT bike_id, snapshot_id, fetched_at, place_uid, geom
+        FROM bike_status
+        WHERE snapshot_id = %s AND fetched_at = %s
+    ),
+    pairs AS (
+        SELECT
+            c.bike_id,
+            p.snapshot_id AS start_snapshot_id,
+            p.fetched_at AS start_fetched_at,
+            c.snapshot_id AS end_snapshot_id,
+            c.fetched_at AS end_fetched_at,
+            p.place_uid AS start_place_uid,
+            c.place_uid AS end_place_uid,
+            p.geom AS start_geom,
+            c.geom AS end_geom,
+            ROUND(ST_Distance(p.geom::geography, c.geom::geography))::int AS distance_m,
+            ps.spot AS start_spot,
+            pe.spot AS end_spot
+        FROM current c
+        JOIN bike_last_status p ON p.bike_id = c.bike_id
+        LEFT JOIN place ps ON ps.place_uid = p.place_uid
+        LEFT JOIN place pe ON pe.place_uid = c.place_uid
+        WHERE c.geom IS NOT NULL
+          AND p.geom IS NOT NULL
+    )
+    INSERT INTO bike_movement (
+        bike_id,
+        start_snapshot_id,
+        start_fetched_at,
+        end_snapshot_id,
+        end_fetched_at,
+        start_place_uid,
+        end_place_uid,
+        start_geom,
+        end_geom,
+        distance_m,
+        duration_seconds,
+        is_station_to_station,
+        confidence,
+        movement_reason
+    )
+    SELECT
+        bike_id,
+        start_snapshot_id,
+        start_fetched_at,
+        end_snapshot_id,
+        end_fetched_at,
+        start_place_uid,
+        end_place_uid,
+        start_geom,
+        end_geom,
+        distance_m,
+        GREATEST(EXTRACT(EPOCH FROM end_fetched_at - start_fetched_at)::int, 0),
+        start_spot IS TRUE AND end_spot IS TRUE,
+        CASE
+            WHEN start_spot IS TRUE AND end_spot IS TRUE THEN 100
+            WHEN start_place_uid <> end_place_uid THEN 75
+            ELSE 60
+        END,
+        CASE
+            WHEN start_spot IS TRUE
+             AND end_spot IS TRUE
+             AND start_place_uid IS DISTINCT FROM end_place_uid
+            THEN 'station_change'
+            ELSE 'coordinate_change'
+        END
+    FROM pairs
+    WHERE distance_m >= %s
+    ON CONFLICT DO NOTHING
+"""
+
+
 def insert_bike_movements(
     cur: psycopg.Cursor,
     snapshot_id: int,
     fetched_at: datetime,
     min_distance_m: float,
 ) -> int:
+    cur.execute(INSERT_BIKE_MOVEMENTS_SQL, (snapshot_id, fetched_at, min_distance_m))
+    return cur.rowcount or 0
+
+
+UPSERT_ROUTE_STATS_SQL = """
+    INSERT INTO route_stats (
+        start_place_uid, end_place_uid, bucket_start, movements, distance_m_sum,
+        duration_seconds_sum
+    )
+    SELECT
+        start_place_uid,
+        end_place_uid,
+        date_trunc('hour', end_fetched_at, 'UTC'),
+        COUNT(*),
+        COALESCE(SUM(distance_m), 0),
+        COALESCE(SUM(duration_seconds), 0)
+    FROM bike_movement
+    WHERE end_snapshot_id = %s AND end_fetched_at = %s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (start_place_uid, end_place_uid, bucket_start) DO UPDATE SET
+        movements = route_stats.movements + EXCLUDED.movements,
+        distance_m_sum = route_stats.distance_m_sum + EXCLUDED.distance_m_sum,
+        duration_seconds_sum = route_stats.duration_seconds_sum + EXCLUDED.duration_seconds_sum
+"""
+
+
+def upsert_route_stats(cur: psycopg.Cursor, snapshot_id: int, fetched_at: datetime) -> None:
+    cur.execute(UPSERT_ROUTE_STATS_SQL, (snapshot_id, fetched_at))
+
+
+def backfill_route_stats(cur: psycopg.Cursor, start: datetime, end: datetime) -> int:
+    cur.execute(
+        "DELETE FROM route_stats WHERE bucket_start >= %s AND bucket_start < %s",
+        (start, end),
+    )
     cur.execute(
         """
-        WITH current AS (
-            SELECT bike_number, snapshot_id, fetched_at, place_uid, geom
-            FROM bike_status
-            WHERE snapshot_id = %s AND fetched_at = %s
-        ),
-        pairs AS (
-            SELECT
-                c.bike_number,
-                p.snapshot_id AS start_snapshot_id,
-                p.fetched_at AS start_fetched_at,
-                c.snapshot_id AS end_snapshot_id,
-                c.fetched_at AS end_fetched_at,
-                p.place_uid AS start_place_uid,
-                c.place_uid AS end_place_uid,
-                p.geom AS start_geom,
-                c.geom AS end_geom,
-                ROUND(ST_Distance(p.geom::geography, c.geom::geography))::int AS distance_m,
-                ps.spot AS start_spot,
-                pe.spot AS end_spot
-            FROM current c
-            JOIN bike_last_status p ON p.bike_number = c.bike_number
-            LEFT JOIN place ps ON ps.place_uid = p.place_uid
-            LEFT JOIN place pe ON pe.place_uid = c.place_uid
-            WHERE c.geom IS NOT NULL
-              AND p.geom IS NOT NULL
+        INSERT INTO route_stats (
+            start_place_uid, end_place_uid, bucket_start, movements, distance_m_sum,
+            duration_seconds_sum
         )
-        INSERT INTO bike_movement (
-            bike_number,
-            start_snapshot_id,
-            start_fetched_at,
-            end_snapshot_id,
-            end_fetched_at,
+        SELECT
             start_place_uid,
             end_place_uid,
-            start_geom,
-            end_geom,
-            distance_m,
-            duration_seconds,
-            is_station_to_station,
-            confidence,
-            movement_reason
-        )
+            date_trunc('hour', end_fetched_at, 'UTC'),
+            COUNT(*),
+            COALESCE(SUM(distance_m), 0),
+            COALESCE(SUM(duration_seconds), 0)
+        FROM bike_movement
+        WHERE end_fetched_at >= %s AND end_fetched_at < %s
+        GROUP BY 1, 2, 3
+        """,
+        (start, end),
+    )
+    return cur.rowcount or 0
+
+
+APPEND_BIKE_TRAJECTORIES_SQL = """
+    INSERT INTO bike_trajectory (bike_number, day, path, point_times, place_uids)
+    SELECT
+        b.bike_number,
+        (end_fetched_at AT TIME ZONE 'UTC')::date,
+        ST_MakeLine(start_geom, end_geom),
+        ARRAY[start_fetched_at, end_fetched_at],
+        ARRAY[start_place_uid, end_place_uid]
+    FROM bike_movement bm
+    JOIN bike b ON b.bike_id = bm.bike_id
+    WHERE end_snapshot_id = %s
+      AND end_fetched_at = %s
+      AND start_geom IS NOT NULL
+      AND end_geom IS NOT NULL
+    ON CONFLICT (bike_number, day) DO UPDATE SET
+        path = ST_AddPoint(bike_trajectory.path, ST_EndPoint(EXCLUDED.path)),
+        point_times = array_append(bike_trajectory.point_times, EXCLUDED.point_times[2]),
+        place_uids = array_append(bike_trajectory.place_uids, EXCLUDED.place_uids[2])
+"""
+
+
+def append_bike_trajectories(cur: psycopg.Cursor, snapshot_id: int, fetched_at: datetime) -> None:
+    # A new day row starts with the departure point, later movements only add their arrival.
+    cur.execute(APPEND_BIKE_TRAJECTORIES_SQL, (snapshot_id, fetched_at))
+
+
+def backfill_bike_trajectories(cur: psycopg.Cursor, start: datetime, end: datetime) -> int:
+    cur.execute(
+        "DELETE FROM bike_trajectory WHERE day >= %s::date AND day < %s::date",
+        (start, end),
+    )
+    cur.execute(
+        """
+        INSERT INTO bike_trajectory (bike_number, day, path, point_times, place_uids)
         SELECT
             bike_number,
-            start_snapshot_id,
-            start_fetched_at,
-            end_snapshot_id,
-            end_fetched_at,
-            start_place_uid,
-            end_place_uid,
-            start_geom,
-            end_geom,
-            distance_m,
-            GREATEST(EXTRACT(EPOCH FROM end_fetched_at - start_fetched_at)::int, 0),
-            start_spot IS TRUE AND end_spot IS TRUE,
-            CASE
-                WHEN start_spot IS TRUE AND end_spot IS TRUE THEN 100
-                WHEN start_place_uid <> end_place_uid THEN 75
-                ELSE 60
-            END,
-            CASE
-                WHEN start_spot IS TRUE
-                 AND end_spot IS TRUE
-                 AND start_place_uid IS DISTINCT FROM end_place_uid
-                THEN 'station_change'
-                ELSE 'coordinate_change'
-            END
-        FROM pairs
-        WHERE distance_m >= %s
-        ON CONFLICT DO NOTHING
+            (end_fetched_at AT TIME ZONE 'UTC')::date,
+            ST_MakeLine(
+                (array_agg(start_geom ORDER BY end_fetched_at))[1:1]
+                || array_agg(end_geom ORDER BY end_fetched_at)
+            ),
+            (array_agg(start_fetched_at ORDER BY end_fetched_at))[1:1]
+            || array_agg(end_fetched_at ORDER BY end_fetched_at),
+            (array_agg(start_place_uid ORDER BY end_fetched_at))[1:1]
+            || array_agg(end_place_uid ORDER BY end_fetched_at)
+        FROM v_bike_movement
+        WHERE end_fetched_at >= %s
+          AND end_fetched_at < %s
+          AND start_geom IS NOT NULL
+          AND end_geom IS NOT NULL
+        GROUP BY 1, 2
         """,
-        (snapshot_id, fetched_at, min_distance_m),
+        (start, end),
     )
     return cur.rowcount or 0
 
 
+CLOSE_BIKE_DWELLS_SQL = """
+    WITH closed AS (
+        INSERT INTO bike_dwell (
+            bike_number, place_uid, geom, dwell_start, dwell_end, seconds
+        )
+        SELECT
+            b.bike_number,
+            bm.start_place_uid,
+            bm.start_geom,
+            bls.dwell_started_at,
+            bm.start_fetched_at,
+            GREATEST(
+                EXTRACT(EPOCH FROM bm.start_fetched_at - bls.dwell_started_at)::int,
+                0
+            )
+        FROM bike_movement bm
+        JOIN bike b ON b.bike_id = bm.bike_id
+        JOIN bike_last_status bls ON bls.bike_id = bm.bike_id
+        WHERE bm.end_snapshot_id = %s
+          AND bm.end_fetched_at = %s
+          AND bls.dwell_started_at IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING place_uid, dwell_end, seconds
+    ),
+    histogram AS (
+        INSERT INTO place_dwell_histogram (
+            place_uid, bucket_day, lower_bound_s, dwells, seconds_sum
+        )
+        SELECT
+            place_uid,
+            (dwell_end AT TIME ZONE 'UTC')::date,
+            (%s::int[])[width_bucket(seconds, %s::int[])],
+            COUNT(*),
+            SUM(seconds)
+        FROM closed
+        WHERE place_uid IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (place_uid, bucket_day, lower_bound_s) DO UPDATE SET
+            dwells = place_dwell_histogram.dwells + EXCLUDED.dwells,
+            seconds_sum = place_dwell_histogram.seconds_sum + EXCLUDED.seconds_sum
+    )
+    SELECT COUNT(*) FROM closed
+"""
+
+
+def close_bike_dwells(cur: psycopg.Cursor, snapshot_id: int, fetched_at: datetime) -> int:
+    bounds = list(DWELL_HISTOGRAM_BOUNDS_S)
+    cur.execute(CLOSE_BIKE_DWELLS_SQL, (snapshot_id, fetched_at, bounds, bounds))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+UPDATE_BIKE_LAST_STATUS_SQL = """
+    INSERT INTO bike_last_status (
+        bike_id, snapshot_id, fetched_at, place_uid, geom, active, state,
+        pedelec_battery, battery_pack_pct, battery_range_km, dwell_started_at
+    )
+    SELECT
+        bs.bike_id, bs.snapshot_id, bs.fetched_at, bs.place_uid, bs.geom, bs.active,
+        bs.state, bs.pedelec_battery, bs.battery_pack_pct, bs.battery_range_km,
+        CASE
+            WHEN EXISTS (
+                SELECT 1
+                FROM bike_movement bm
+                WHERE bm.bike_id = bs.bike_id
+                  AND bm.end_fetched_at = bs.fetched_at
+                  AND bm.end_snapshot_id = bs.snapshot_id
+            )
+            THEN bs.fetched_at
+        END
+    FROM bike_status bs
+    WHERE bs.snapshot_id = %s AND bs.fetched_at = %s
+    ON CONFLICT (bike_id) DO UPDATE SET
+        snapshot_id = EXCLUDED.snapshot_id,
+        fetched_at = EXCLUDED.fetched_at,
+        place_uid = EXCLUDED.place_uid,
+        geom = EXCLUDED.geom,
+        active = EXCLUDED.active,
+        state = EXCLUDED.state,
+        pedelec_battery = EXCLUDED.pedelec_battery,
+        battery_pack_pct = EXCLUDED.battery_pack_pct,
+        battery_range_km = EXCLUDED.battery_range_km,
+        dwell_started_at = COALESCE(
+            EXCLUDED.dwell_started_at,
+            bike_last_status.dwell_started_at
+        )
+    WHERE bike_last_status.fetched_at < EXCLUDED.fetched_at
+"""
+
+
 def update_bike_last_status(
     cur: psycopg.Cursor,
     snapshot_id: int,
     fetched_at: datetime,
 ) -> None:
-    cur.execute(
-        """
-        INSERT INTO bike_last_status (
-            bike_number, snapshot_id, fetched_at, place_uid, geom, active, state,
-            pedelec_battery, battery_pack_pct, battery_range_km
+    cur.execute(UPDATE_BIKE_LAST_STATUS_SQL, (snapshot_id, fetched_at))
+
+
+# Batched ingest pairs every sighting with the bike's previous one in memory and stages the
+# pairs whose position changed here, so the movements of a whole batch are written, rolled up
+# and folded into bike_last_status by one statement each instead of one set per snapshot.
+# Distances are still computed by PostGIS, so they match what unbatched polling stores.
+MOVEMENT_BATCH_COLUMNS = (
+    "bike_id",
+    "start_snapshot_id",
+    "start_fetched_at",
+    "end_snapshot_id",
+    "end_fetched_at",
+    "start_place_uid",
+    "end_place_uid",
+    "start_geom",
+    "end_geom",
+)
+CREATE_MOVEMENT_BATCH_SQL = """
+    CREATE TEMP TABLE bike_movement_batch (
+        bike_id BIGINT NOT NULL,
+        start_snapshot_id BIGINT NOT NULL,
+        start_fetched_at TIMESTAMPTZ NOT NULL,
+        end_snapshot_id BIGINT NOT NULL,
+        end_fetched_at TIMESTAMPTZ NOT NULL,
+        start_place_uid INTEGER,
+        end_place_uid INTEGER,
+        start_geom GEOMETRY(Point, 4326) NOT NULL,
+        end_geom GEOMETRY(Point, 4326) NOT NULL
+    ) ON COMMIT DROP
+"""
+DROP_MOVEMENT_BATCH_SQL = "DROP TABLE bike_movement_batch"
+LAST_BIKE_POSITIONS_SQL = """
+    SELECT bike_id, snapshot_id, fetched_at, place_uid, ST_X(geom), ST_Y(geom)
+    FROM bike_last_status
+    WHERE bike_id = ANY(%s)
+"""
+INSERT_BATCH_MOVEMENTS_SQL = """
+    WITH pairs AS (
+        SELECT
+            m.*,
+            ROUND(ST_Distance(m.start_geom::geography, m.end_geom::geography))::int
+                AS distance_m,
+            ps.spot AS start_spot,
+            pe.spot AS end_spot
+        FROM bike_movement_batch m
+        LEFT JOIN place ps ON ps.place_uid = m.start_place_uid
+        LEFT JOIN place pe ON pe.place_uid = m.end_place_uid
+    )
+    INSERT INTO bike_movement (
+        bike_id,
+        start_snapshot_id,
+        start_fetched_at,
+        end_snapshot_id,
+        end_fetched_at,
+        start_place_uid,
+        end_place_uid,
+        start_geom,
+        end_geom,
+        distance_m,
+        duration_seconds,
+        is_station_to_station,
+        confidence,
+        movement_reason
+    )
+    SELECT
+        bike_id,
+        start_snapshot_id,
+        start_fetched_at,
+        end_snapshot_id,
+        end_fetched_at,
+        start_place_uid,
+        end_place_uid,
+        start_geom,
+        end_geom,
+        distance_m,
+        GREATEST(EXTRACT(EPOCH FROM end_fetched_at - start_fetched_at)::int, 0),
+        start_spot IS TRUE AND end_spot IS TRUE,
+        CASE
+            WHEN start_spot IS TRUE AND end_spot IS TRUE THEN 100
+            WHEN start_place_uid <> end_place_uid THEN 75
+            ELSE 60
+        END,
+        CASE
+            WHEN start_spot IS TRUE
+             AND end_spot IS TRUE
+             AND start_place_uid IS DISTINCT FROM end_place_uid
+            THEN 'station_change'
+            ELSE 'coordinate_change'
+        END
+    FROM pairs
+    WHERE distance_m >= %s
+    ON CONFLICT DO NOTHING
+    RETURNING end_snapshot_id
+"""
+# The batch statements below select the batch's movements and sightings by snapshot id; the
+# fetched_at range only lets the planner prune monthly partitions.
+UPSERT_BATCH_ROUTE_STATS_SQL = """
+    INSERT INTO route_stats (
+        start_place_uid, end_place_uid, bucket_start, movements, distance_m_sum,
+        duration_seconds_sum
+    )
+    SELECT
+        start_place_uid,
+        end_place_uid,
+        date_trunc('hour', end_fetched_at, 'UTC'),
+        COUNT(*),
+        COALESCE(SUM(distance_m), 0),
+        COALESCE(SUM(duration_seconds), 0)
+    FROM bike_movement
+    WHERE end_snapshot_id = ANY(%(snapshot_ids)s)
+      AND end_fetched_at BETWEEN %(start)s AND %(end)s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (start_place_uid, end_place_uid, bucket_start) DO UPDATE SET
+        movements = route_stats.movements + EXCLUDED.movements,
+        distance_m_sum = route_stats.distance_m_sum + EXCLUDED.distance_m_sum,
+        duration_seconds_sum = route_stats.duration_seconds_sum + EXCLUDED.duration_seconds_sum
+"""
+# A stay closed by a movement started when the bike's previous movement in the batch ended,
+# or, for its first one, at the arrival bike_last_status recorded before the batch.
+CLOSE_BATCH_DWELLS_SQL = """
+    WITH moved AS (
+        SELECT
+            bike_id,
+            start_place_uid,
+            start_geom,
+            start_fetched_at,
+            LAG(end_fetched_at) OVER (
+                PARTITION BY bike_id
+                ORDER BY end_fetched_at, end_snapshot_id
+            ) AS arrived_at
+        FROM bike_movement
+        WHERE end_snapshot_id = ANY(%(snapshot_ids)s)
+          AND end_fetched_at BETWEEN %(start)s AND %(end)s
+    ),
+    closed AS (
+        INSERT INTO bike_dwell (
+            bike_number, place_uid, geom, dwell_start, dwell_end, seconds
         )
         SELECT
-            bike_number, snapshot_id, fetched_at, place_uid, geom, active, state,
-            pedelec_battery, battery_pack_pct, battery_range_km
-        FROM bike_status
-        WHERE snapshot_id = %s AND fetched_at = %s
-        ON CONFLICT (bike_number) DO UPDATE SET
-            snapshot_id = EXCLUDED.snapshot_id,
-            fetched_at = EXCLUDED.fetched_at,
-            place_uid = EXCLUDED.place_uid,
-            geom = EXCLUDED.geom,
-            active = EXCLUDED.active,
-            state = EXCLUDED.state,
-            pedelec_battery = EXCLUDED.pedelec_battery,
-            battery_pack_pct = EXCLUDED.battery_pack_pct,
-            battery_range_km = EXCLUDED.battery_range_km
-        WHERE bike_last_status.fetched_at < EXCLUDED.fetched_at
-        """,
-        (snapshot_id, fetched_at),
+            b.bike_number,
+            m.start_place_uid,
+            m.start_geom,
+            COALESCE(m.arrived_at, bls.dwell_started_at),
+            m.start_fetched_at,
+            GREATEST(
+                EXTRACT(
+                    EPOCH FROM m.start_fetched_at - COALESCE(m.arrived_at, bls.dwell_started_at)
+                )::int,
+                0
+            )
+        FROM moved m
+        JOIN bike b ON b.bike_id = m.bike_id
+        LEFT JOIN bike_last_status bls ON bls.bike_id = m.bike_id
+        WHERE COALESCE(m.arrived_at, bls.dwell_started_at) IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING place_uid, dwell_end, seconds
+    ),
+    histogram AS (
+        INSERT INTO place_dwell_histogram (
+            place_uid, bucket_day, lower_bound_s, dwells, seconds_sum
+        )
+        SELECT
+            place_uid,
+            (dwell_end AT TIME ZONE 'UTC')::date,
+            (%(bounds)s::int[])[width_bucket(seconds, %(bounds)s::int[])],
+            COUNT(*),
+            SUM(seconds)
+        FROM closed
+        WHERE place_uid IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (place_uid, bucket_day, lower_bound_s) DO UPDATE SET
+            dwells = place_dwell_histogram.dwells + EXCLUDED.dwells,
+            seconds_sum = place_dwell_histogram.seconds_sum + EXCLUDED.seconds_sum
     )
+    SELECT COUNT(*) FROM closed
+"""
+# One row per bike and day for the whole batch; an existing day gets every arrival but the
+# departure point, which it already ends with.
+APPEND_BATCH_TRAJECTORIES_SQL = """
+    WITH moved AS (
+        SELECT
+            bike_id,
+            (end_fetched_at AT TIME ZONE 'UTC')::date AS day,
+            array_agg(start_geom ORDER BY end_fetched_at, end_snapshot_id) AS start_geoms,
+            array_agg(end_geom ORDER BY end_fetched_at, end_snapshot_id) AS end_geoms,
+            array_agg(start_fetched_at ORDER BY end_fetched_at, end_snapshot_id)
+                AS start_times,
+            array_agg(end_fetched_at ORDER BY end_fetched_at, end_snapshot_id) AS end_times,
+            array_agg(start_place_uid ORDER BY end_fetched_at, end_snapshot_id)
+                AS start_places,
+            array_agg(end_place_uid ORDER BY end_fetched_at, end_snapshot_id) AS end_places
+        FROM bike_movement
+        WHERE end_snapshot_id = ANY(%(snapshot_ids)s)
+          AND end_fetched_at BETWEEN %(start)s AND %(end)s
+          AND start_geom IS NOT NULL
+          AND end_geom IS NOT NULL
+        GROUP BY 1, 2
+    )
+    INSERT INTO bike_trajectory (bike_number, day, path, point_times, place_uids)
+    SELECT
+        b.bike_number,
+        m.day,
+        ST_MakeLine(m.start_geoms[1:1] || m.end_geoms),
+        m.start_times[1:1] || m.end_times,
+        m.start_places[1:1] || m.end_places
+    FROM moved m
+    JOIN bike b ON b.bike_id = m.bike_id
+    ON CONFLICT (bike_number, day) DO UPDATE SET
+        path = ST_MakeLine(
+            ARRAY(SELECT p.geom FROM ST_DumpPoints(bike_trajectory.path) p ORDER BY p.path)
+            || ARRAY(
+                SELECT p.geom
+                FROM ST_DumpPoints(EXCLUDED.path) p
+                WHERE p.path[1] > 1
+                ORDER BY p.path
+            )
+        ),
+        point_times = bike_trajectory.point_times || EXCLUDED.point_times[2:],
+        place_uids = bike_trajectory.place_uids || EXCLUDED.place_uids[2:]
+"""
+UPDATE_BATCH_LAST_STATUS_SQL = """
+    INSERT INTO bike_last_status (
+        bike_id, snapshot_id, fetched_at, place_uid, geom, active, state,
+        pedelec_battery, battery_pack_pct, battery_range_km, dwell_started_at
+    )
+    SELECT DISTINCT ON (bs.bike_id)
+        bs.bike_id, bs.snapshot_id, bs.fetched_at, bs.place_uid, bs.geom, bs.active,
+        bs.state, bs.pedelec_battery, bs.battery_pack_pct, bs.battery_range_km,
+        (
+            SELECT MAX(bm.end_fetched_at)
+            FROM bike_movement bm
+            WHERE bm.bike_id = bs.bike_id
+              AND bm.end_snapshot_id = ANY(%(snapshot_ids)s)
+              AND bm.end_fetched_at BETWEEN %(start)s AND %(end)s
+        )
+    FROM bike_status bs
+    WHERE bs.snapshot_id = ANY(%(snapshot_ids)s)
+      AND bs.fetched_at BETWEEN %(start)s AND %(end)s
+    ORDER BY bs.bike_id, bs.fetched_at DESC, bs.snapshot_id DESC
+    ON CONFLICT (bike_id) DO UPDATE SET
+        snapshot_id = EXCLUDED.snapshot_id,
+        fetched_at = EXCLUDED.fetched_at,
+        place_uid = EXCLUDED.place_uid,
+        geom = EXCLUDED.geom,
+        active = EXCLUDED.active,
+        state = EXCLUDED.state,
+        pedelec_battery = EXCLUDED.pedelec_battery,
+        battery_pack_pct = EXCLUDED.battery_pack_pct,
+        battery_range_km = EXCLUDED.battery_range_km,
+        dwell_started_at = COALESCE(
+            EXCLUDED.dwell_started_at,
+            bike_last_status.dwell_started_at
+        )
+    WHERE bike_last_status.fetched_at < EXCLUDED.fetched_at
+"""
+
+
+def movement_pairs(
+    previous: dict[int, tuple], sightings: list[tuple], min_distance_m: float
+) -> list[tuple]:
+    """Pair each bike_status id row with the bike's previous sighting, in fetch order.
+
+    `previous` maps bike_id to (snapshot_id, fetched_at, place_uid, lon, lat) as
+    bike_last_status holds it and is advanced like the per-snapshot upsert would. Pairs
+    without both positions, or whose position did not change while a minimum distance is
+    set, cannot become movements and are left out.
+    """
+    pairs = []
+    for snapshot_id, fetched_at, bike_id, place_uid, *_status, lon, lat in sightings:
+        last = previous.get(bike_id)
+        if last is not None:
+            start_snapshot_id, start_fetched_at, start_place_uid, start_lon, start_lat = last
+            positioned = None not in (lon, lat, start_lon, start_lat)
+            if positioned and (min_distance_m <= 0 or (lon, lat) != (start_lon, start_lat)):
+                pairs.append(
+                    (
+                        bike_id,
+                        start_snapshot_id,
+                        start_fetched_at,
+                        snapshot_id,
+                        fetched_at,
+                        start_place_uid,
+                        place_uid,
+                        _ewkt_point(start_lon, start_lat),
+                        _ewkt_point(lon, lat),
+                    )
+                )
+        if last is None or last[1] < fetched_at:
+            previous[bike_id] = (snapshot_id, fetched_at, place_uid, lon, lat)
+    return pairs
+
+
+def apply_batch_movements(
+    cur: psycopg.Cursor,
+    sightings: list[tuple],
+    min_distance_m: float,
+    timings: StageTimings,
+) -> dict[int, int]:
+    """Detect and store the movements of batched snapshots; returns movements per snapshot.
+
+    `sightings` are the bike_status id rows of the batch, oldest snapshot first.
+    """
+    if not sightings:
+        return {}
+    window = {
+        "snapshot_ids": sorted({row[0] for row in sightings}),
+        "start": min(row[1] for row in sightings),
+        "end": max(row[1] for row in sightings),
+    }
+    movement_started = time.perf_counter()
+    cur.execute(LAST_BIKE_POSITIONS_SQL, (sorted({row[2] for row in sightings}),))
+    previous = {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+    pairs = movement_pairs(previous, sightings, min_distance_m)
+    movements: dict[int, int] = {}
+    if pairs:
+        cur.execute(CREATE_MOVEMENT_BATCH_SQL)
+        copy_rows(cur, "bike_movement_batch", MOVEMENT_BATCH_COLUMNS, pairs)
+        cur.execute(INSERT_BATCH_MOVEMENTS_SQL, (min_distance_m,))
+        for (end_snapshot_id,) in cur.fetchall():
+            movements[end_snapshot_id] = movements.get(end_snapshot_id, 0) + 1
+        # ON COMMIT DROP only covers rollbacks; a transaction may apply several batches.
+        cur.execute(DROP_MOVEMENT_BATCH_SQL)
+    timings.record("bike_movement", time.perf_counter() - movement_started, sum(movements.values()))
+    if movements:
+        bounds = list(DWELL_HISTOGRAM_BOUNDS_S)
+        with timings.stage("movement_rollups"):
+            cur.execute(UPSERT_BATCH_ROUTE_STATS_SQL, window)
+            cur.execute(CLOSE_BATCH_DWELLS_SQL, {**window, "bounds": bounds})
+            cur.execute(APPEND_BATCH_TRAJECTORIES_SQL, window)
+    with timings.stage("update_bike_last_status"):
+        cur.execute(UPDATE_BATCH_LAST_STATUS_SQL, window)
+    return movements
 
 
 def backfill_bike_movements(cur: psycopg.Cursor, min_distance_m: float) -> int:
+    # Movements still keyed by bike_number (see `migrate-bike-ids`) are outside the bike_id
+    # unique index, so ON CONFLICT alone would insert them a second time.
     cur.execute(
         """
         WITH ordered AS (
             SELECT
+                bs.bike_id,
                 bs.bike_number,
                 bs.snapshot_id AS end_snapshot_id,
                 bs.fetched_at AS end_fetched_at,
@@ -493,9 +1308,9 @@ def backfill_bike_movements(cur: psycopg.Cursor, min_distance_m: float) -> int:
                 LAG(bs.fetched_at) OVER sighting AS start_fetched_at,
                 LAG(bs.place_uid) OVER sighting AS start_place_uid,
                 LAG(bs.geom) OVER sighting AS start_geom
-            FROM bike_status bs
+            FROM v_bike_status bs
             WINDOW sighting AS (
-                PARTITION BY bs.bike_number
+                PARTITION BY bs.bike_id
                 ORDER BY bs.fetched_at, bs.snapshot_id
             )
         ),
@@ -515,7 +1330,7 @@ def backfill_bike_movements(cur: psycopg.Cursor, min_distance_m: float) -> int:
               AND o.end_geom IS NOT NULL
         )
         INSERT INTO bike_movement (
-            bike_number,
+            bike_id,
             start_snapshot_id,
             start_fetched_at,
             end_snapshot_id,
@@ -531,7 +1346,7 @@ def backfill_bike_movements(cur: psycopg.Cursor, min_distance_m: float) -> int:
             movement_reason
         )
         SELECT
-            bike_number,
+            bike_id,
             start_snapshot_id,
             start_fetched_at,
             end_snapshot_id,
@@ -557,6 +1372,14 @@ def backfill_bike_movements(cur: psycopg.Cursor, min_distance_m: float) -> int:
             END
         FROM pairs
         WHERE distance_m >= %s
+          AND NOT EXISTS (
+              SELECT 1
+              FROM bike_movement m
+              WHERE m.bike_id IS NULL
+                AND m.bike_number = pairs.bike_number
+                AND m.start_snapshot_id = pairs.start_snapshot_id
+                AND m.end_snapshot_id = pairs.end_snapshot_id
+          )
         ON CONFLICT DO NOTHING
         """,
         (min_distance_m,),
@@ -682,106 +1505,402 @@ def refresh_vehicle_type_metadata(conn: psycopg.Connection, config: AppConfig) -
             raise
 
 
-def ingest_once(conn: psycopg.Connection, config: AppConfig) -> dict:
+def build_bike_rows(
+    places: list[dict], snapshot_id: int, fetched_at: datetime
+) -> tuple[list[tuple], list[tuple], set[str]]:
+    """Bike upsert rows, bike_status rows and bike type ids for the bikes of one city."""
+    bikes = []
+    bike_status_rows = []
+    bike_type_ids: set[str] = set()
+    for place in places:
+        for bike in place.get("bike_list") or []:
+            bike_number = bike.get("number")
+            if not bike_number:
+                continue
+            bike_type_id = str(bike.get("bike_type")) if bike.get("bike_type") is not None else None
+            if bike_type_id:
+                bike_type_ids.add(bike_type_id)
+            bikes.append(
+                (
+                    bike_number,
+                    bike.get("boardcomputer"),
+                    bike_type_id,
+                    bike.get("electric_lock"),
+                    bike.get("lock_types"),
+                    fetched_at,
+                    fetched_at,
+                )
+            )
+            battery_pack = bike.get("battery_pack") or {}
+            bike_status_rows.append(
+                (
+                    snapshot_id,
+                    fetched_at,
+                    bike_number,
+                    place.get("uid") if place.get("spot") is True else None,
+                    bike.get("active"),
+                    bike.get("state"),
+                    bike.get("pedelec_battery"),
+                    battery_pack.get("percentage"),
+                    battery_pack.get("estimated_range_km"),
+                    place.get("lng"),
+                    place.get("lat"),
+                )
+            )
+    return bikes, bike_status_rows, bike_type_ids
+
+
+@dataclass(frozen=True)
+class FetchedFeed:
+    fetched_at: datetime
+    payload: str
+    updated_at: datetime | None = None
+    fetch_s: float = 0.0
+
+
+# Called with the ingest cursor, snapshot id and fetch time to sample query plans.
+PlanHook = Callable[[psycopg.Cursor, int, datetime], None]
+
+
+def fetch_live_feed(config: AppConfig) -> FetchedFeed:
     fetched_at = utc_now()
-    live_data = fetch_json(LIVE_BASE_URL, {"domains": config.domain})
+    started = time.perf_counter()
+    payload, updated_at = fetch_feed(LIVE_BASE_URL, {"domains": config.domain})
+    return FetchedFeed(fetched_at, payload, updated_at, time.perf_counter() - started)
+
+
+def live_country(live_data: dict) -> dict:
     country = (live_data.get("countries") or [None])[0]
     if not country:
         raise RuntimeError("No country data returned from live API")
+    return country
+
+
+def ingest_once(
+    conn: psycopg.Connection,
+    config: AppConfig,
+    feed: FetchedFeed | None = None,
+    refresh_metadata: bool = True,
+    explain_plans: PlanHook | None = None,
+) -> dict:
+    """Fetch the live feed (unless `feed` was fetched already) and store it as one snapshot.
+
+    Zone and vehicle type metadata are refreshed afterwards unless `refresh_metadata` is
+    false, which the collector passes while the maintenance scheduler refreshes them.
+    `explain_plans` is called inside the transaction before movements are detected.
+    """
+    timings = StageTimings()
+    try:
+        if feed is None:
+            feed = fetch_live_feed(config)
+        timings.record("http", feed.fetch_s)
+        result = _ingest_snapshot(conn, config, feed, timings, refresh_metadata, explain_plans)
+    finally:
+        timings.observe()
+    result["stages"] = timings.summary()
+    return result
 
+
+def ingest_backlog(
+    conn: psycopg.Connection,
+    config: AppConfig,
+    snapshots: list[tuple[datetime, dict]],
+    timings: StageTimings | None = None,
+    explain_plans: PlanHook | None = None,
+) -> list[dict]:
+    """Store already decoded feeds, oldest first, in a single transaction.
+
+    Status rows go in with COPY. Movements are detected once for the whole batch by
+    `apply_batch_movements`, after every snapshot is written. Skips metrics and metadata
+    refreshes; see `ingest_batch` for polls that need them. `explain_plans` samples the
+    per-snapshot statements for the newest snapshot, before the batch's movements are applied.
+    """
+    timings = timings or StageTimings()
+    stored = []
+    try:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                sightings: list[tuple] = []
+                for fetched_at, live_data in snapshots:
+                    entry = _store_snapshot(
+                        cur, config, timings, fetched_at, live_data, sightings=sightings
+                    )
+                    if entry["gap"]:
+                        _log_snapshot_gap(config, entry["gap"])
+                    _last_fetched_at[config.domain] = fetched_at
+                    stored.append(entry)
+                if explain_plans is not None and stored:
+                    with timings.stage("query_plans"):
+                        explain_plans(cur, stored[-1]["snapshot_id"], snapshots[-1][0])
+                movements = apply_batch_movements(
+                    cur, sightings, config.movement_min_distance_m, timings
+                )
+                for entry in stored:
+                    entry["movements"] = movements.get(entry["snapshot_id"], 0)
+                commit_started = time.perf_counter()
+        timings.record("commit", time.perf_counter() - commit_started)
+    except BaseException:
+        # The in-memory time was advanced inside the rolled back transaction.
+        _last_fetched_at.pop(config.domain, None)
+        _forget_uncommitted(config.domain)
+        raise
+    return stored
+
+
+def ingest_batch(
+    conn: psycopg.Connection,
+    config: AppConfig,
+    feeds: list[tuple[FetchedFeed, dict]],
+    refresh_metadata: bool = True,
+    explain_plans: PlanHook | None = None,
+) -> dict:
+    """Store buffered polls (feed plus decoded data) in one transaction.
+
+    Returns the same summary as `ingest_once`, for the newest snapshot, with row counts
+    summed over the batch.
+    """
+    timings = StageTimings()
+    try:
+        for feed, _live_data in feeds:
+            timings.record("http", feed.fetch_s)
+        stored = ingest_backlog(
+            conn,
+            config,
+            [(feed.fetched_at, live_data) for feed, live_data in feeds],
+            timings,
+            explain_plans,
+        )
+        for (feed, _live_data), entry in zip(feeds, stored, strict=True):
+            _observe_stored(config, feed, entry)
+        if refresh_metadata:
+            _refresh_metadata(conn, config, timings)
+    finally:
+        timings.observe()
+    return {
+        "snapshot_id": stored[-1]["snapshot_id"],
+        "fetched_at": feeds[-1][0].fetched_at,
+        "snapshots": len(stored),
+        "cities": stored[-1]["cities"],
+        "places": sum(entry["places"] for entry in stored),
+        "bikes": sum(entry["bikes"] for entry in stored),
+        "movements": sum(entry["movements"] for entry in stored),
+        "stages": timings.summary(),
+    }
+
+
+def _forget_uncommitted(domain: str) -> None:
+    # Written station values and new vehicle type ordinals or bike ids may have been rolled
+    # back.
+    _written_place_status.pop(domain, None)
+    _vehicle_type_ordinals.clear()
+    _bike_ids.clear()
+
+
+def _log_snapshot_gap(config: AppConfig, gap_info: dict) -> None:
+    log_event(
+        "warn",
+        "ingest",
+        "Snapshot gap detected",
+        event="snapshot_gap",
+        config=config,
+        extra=gap_info,
+    )
+
+
+def _refresh_metadata(conn: psycopg.Connection, config: AppConfig, timings: StageTimings) -> None:
+    with timings.stage("zone_metadata"):
+        refresh_zone_metadata(conn, config)
+    with timings.stage("vehicle_type_metadata"):
+        refresh_vehicle_type_metadata(conn, config)
+
+
+def _ingest_snapshot(
+    conn: psycopg.Connection,
+    config: AppConfig,
+    feed: FetchedFeed,
+    timings: StageTimings,
+    refresh_metadata: bool = True,
+    explain_plans: PlanHook | None = None,
+) -> dict:
+    with timings.stage("json_decode"):
+        live_data = json.loads(feed.payload)
+
+    try:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                stored = _store_snapshot(
+                    cur, config, timings, feed.fetched_at, live_data, explain_plans=explain_plans
+                )
+                commit_started = time.perf_counter()
+    except BaseException:
+        _forget_uncommitted(config.domain)
+        raise
+    timings.record("commit", time.perf_counter() - commit_started)
+    _last_fetched_at[config.domain] = feed.fetched_at
+    if stored["gap"]:
+        _log_snapshot_gap(config, stored["gap"])
+    _observe_stored(config, feed, stored)
+
+    if refresh_metadata:
+        _refresh_metadata(conn, config, timings)
+    return {
+        "snapshot_id": stored["snapshot_id"],
+        "fetched_at": feed.fetched_at,
+        "cities": stored["cities"],
+        "places": stored["places"],
+        "bikes": stored["bikes"],
+        "movements": stored["movements"],
+    }
+
+
+def _observe_stored(config: AppConfig, feed: FetchedFeed, stored: dict) -> None:
+    """Publish the metrics of a committed snapshot."""
+    observe_snapshot(
+        config.domain,
+        feed.fetched_at,
+        stored["city_counts"],
+        stored["movements"],
+        feed.updated_at,
+        stored["gap"]["gap_seconds"] if stored["gap"] else None,
+    )
+    mark_place_status_rows(
+        config.domain,
+        stored["place_status_rows"],
+        stored["places"] - stored["place_status_rows"],
+        stored["keyframe"],
+    )
+
+
+def _detect_movements(
+    cur: psycopg.Cursor,
+    config: AppConfig,
+    timings: StageTimings,
+    snapshot_id: int,
+    fetched_at: datetime,
+    explain_plans: PlanHook | None,
+) -> int:
+    if explain_plans is not None:
+        # Before the movements and last status are written, so the sample sees what they do.
+        with timings.stage("query_plans"):
+            explain_plans(cur, snapshot_id, fetched_at)
+    movement_started = time.perf_counter()
+    movement_candidates = insert_bike_movements(
+        cur,
+        snapshot_id,
+        fetched_at,
+        config.movement_min_distance_m,
+    )
+    timings.record("bike_movement", time.perf_counter() - movement_started, movement_candidates)
+    if movement_candidates:
+        with timings.stage("movement_rollups"):
+            upsert_route_stats(cur, snapshot_id, fetched_at)
+            close_bike_dwells(cur, snapshot_id, fetched_at)
+            append_bike_trajectories(cur, snapshot_id, fetched_at)
+    with timings.stage("update_bike_last_status"):
+        update_bike_last_status(cur, snapshot_id, fetched_at)
+    return movement_candidates
+
+
+def _store_snapshot(
+    cur: psycopg.Cursor,
+    config: AppConfig,
+    timings: StageTimings,
+    fetched_at: datetime,
+    live_data: dict,
+    sightings: list[tuple] | None = None,
+    explain_plans: PlanHook | None = None,
+) -> dict:
+    """Write one snapshot inside the caller's transaction.
+
+    With a `sightings` list (batched ingest) status rows go in with COPY and the bike_status
+    id rows are appended to it instead of detecting movements here; the caller passes them to
+    `apply_batch_movements` once the batch is written.
+    """
+    country = live_country(live_data)
+    bulk = sightings is not None
+    write_place_status = copy_place_status if bulk else insert_place_status
+    write_bike_status = copy_bike_status if bulk else insert_bike_status
     cities = country.get("cities") or []
     raw_json = live_data if config.store_raw_json else None
+    stations_by_city = [
+        [place for place in city.get("places") or [] if place.get("spot") is True]
+        for city in cities
+    ]
+    changed_stations, keyframe = diff_place_status(
+        config, fetched_at, [station for stations in stations_by_city for station in stations]
+    )
 
-    with conn.transaction():
-        with conn.cursor() as cur:
-            ensure_partitions(cur, fetched_at)
-            upsert_country(cur, country)
-            upsert_cities(cur, country.get("domain") or config.domain, cities)
-            gap_info = record_snapshot_gap(cur, fetched_at, config.domain, config.poll_interval)
-            if gap_info:
-                log_event(
-                    "warn",
-                    "ingest",
-                    "Snapshot gap detected",
-                    event="snapshot_gap",
-                    config=config,
-                    extra=gap_info,
-                )
-            snapshot_id = insert_snapshot(cur, fetched_at, config.domain, raw_json)
-
-            all_bike_type_ids: set[str] = set()
-            all_bikes = []
-            bike_status_rows = []
-            place_count = 0
-            bike_count = 0
-            movement_candidates = 0
-
-            for city in cities:
-                insert_city_status(cur, snapshot_id, fetched_at, city)
-                places = city.get("places") or []
-                stations = [place for place in places if place.get("spot") is True]
-                upsert_places(cur, city.get("uid"), stations)
-                insert_place_status(cur, snapshot_id, fetched_at, stations)
-                place_count += len(stations)
-                for place in places:
-                    for bike in place.get("bike_list") or []:
-                        bike_number = bike.get("number")
-                        if not bike_number:
-                            continue
-                        bike_type_id = (
-                            str(bike.get("bike_type"))
-                            if bike.get("bike_type") is not None
-                            else None
-                        )
-                        if bike_type_id:
-                            all_bike_type_ids.add(bike_type_id)
-                        all_bikes.append(
-                            (
-                                bike_number,
-                                bike.get("boardcomputer"),
-                                bike_type_id,
-                                bike.get("electric_lock"),
-                                bike.get("lock_types"),
-                                fetched_at,
-                                fetched_at,
-                            )
-                        )
-                        battery_pack = bike.get("battery_pack") or {}
-                        bike_status_rows.append(
-                            (
-                                snapshot_id,
-                                fetched_at,
-                                bike_number,
-                                place.get("uid") if place.get("spot") is True else None,
-                                bike.get("active"),
-                                bike.get("state"),
-                                bike.get("pedelec_battery"),
-                                battery_pack.get("percentage"),
-                                battery_pack.get("estimated_range_km"),
-                                place.get("lng"),
-                                place.get("lat"),
-                            )
-                        )
-                        bike_count += 1
-
-            upsert_vehicle_types(cur, all_bike_type_ids)
-            upsert_bikes(cur, all_bikes)
-            insert_bike_status(cur, snapshot_id, bike_status_rows)
-            movement_candidates = insert_bike_movements(
-                cur,
-                snapshot_id,
-                fetched_at,
-                config.movement_min_distance_m,
-            )
-            update_bike_last_status(cur, snapshot_id, fetched_at)
+    with timings.stage("snapshot"):
+        ensure_partitions(cur, fetched_at)
+        upsert_country(cur, country)
+        upsert_cities(cur, country.get("domain") or config.domain, cities)
+        ordinals = vehicle_type_ordinals(
+            cur,
+            bike_type_ids(cities)
+            | bike_type_ids([station for stations in stations_by_city for station in stations]),
+        )
+        if config.domain not in _last_fetched_at:
+            _last_fetched_at[config.domain] = latest_snapshot_at(cur, config.domain)
+        gap_info = record_snapshot_gap(
+            cur,
+            fetched_at,
+            config.domain,
+            config.poll_interval,
+            _last_fetched_at[config.domain],
+        )
+        snapshot_id = insert_snapshot(cur, fetched_at, config.domain, raw_json, keyframe)
+
+    all_bike_type_ids: set[str] = set()
+    all_bikes = []
+    bike_status_rows = []
+    place_count = 0
+    place_status_count = 0
+    bike_count = 0
+    movement_candidates = 0
+    city_counts: dict[object, tuple[int, int]] = {}
 
-    refresh_zone_metadata(conn, config)
-    refresh_vehicle_type_metadata(conn, config)
+    for city, stations in zip(cities, stations_by_city, strict=True):
+        with timings.stage("city_status", rows=1):
+            insert_city_status(cur, snapshot_id, fetched_at, city, ordinals)
+        places = city.get("places") or []
+        with timings.stage("upsert_places", rows=len(stations)):
+            upsert_places(cur, city.get("uid"), stations)
+        changed = [station for station in stations if station.get("uid") in changed_stations]
+        with timings.stage("insert_place_status", rows=len(changed)):
+            write_place_status(cur, snapshot_id, fetched_at, changed, ordinals)
+        place_count += len(stations)
+        place_status_count += len(changed)
+        bike_rows_started = time.perf_counter()
+        city_bikes, city_bike_status_rows, city_bike_type_ids = build_bike_rows(
+            places, snapshot_id, fetched_at
+        )
+        all_bikes.extend(city_bikes)
+        bike_status_rows.extend(city_bike_status_rows)
+        all_bike_type_ids.update(city_bike_type_ids)
+        bike_count += len(city_bikes)
+        city_counts[city.get("uid")] = (len(stations), len(city_bikes))
+        timings.record("build_bike_rows", time.perf_counter() - bike_rows_started, len(city_bikes))
+
+    with timings.stage("upsert_bikes", rows=len(all_bikes)):
+        upsert_vehicle_types(cur, all_bike_type_ids)
+        upsert_bikes(cur, all_bikes)
+        ids = bike_ids(cur, {bike[0] for bike in all_bikes})
+    with timings.stage("insert_bike_status", rows=len(bike_status_rows)):
+        write_bike_status(cur, snapshot_id, bike_status_rows, ids)
+    if sightings is not None:
+        sightings.extend(bike_status_id_rows(bike_status_rows, ids))
+    else:
+        movement_candidates = _detect_movements(
+            cur, config, timings, snapshot_id, fetched_at, explain_plans
+        )
     return {
         "snapshot_id": snapshot_id,
-        "fetched_at": fetched_at,
+        "gap": gap_info,
         "cities": len(cities),
         "places": place_count,
         "bikes": bike_count,
         "movements": movement_candidates,
+        "city_counts": city_counts,
+        "place_status_rows": place_status_count,
+        "keyframe": keyframe,
     }
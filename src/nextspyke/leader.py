@@ -0,0 +1,68 @@
+import psycopg
+
+from nextspyke.config import AppConfig
+from nextspyke.ingest import forget_last_snapshots
+from nextspyke.logging import log_event
+from nextspyke.metrics import mark_leadership
+
+LEADER_LOCK_PREFIX = "nextspyke.ingest"
+
+TRY_LEADER_LOCK_SQL = "SELECT pg_try_advisory_lock(hashtextextended(%s, 0))"
+
+
+class LeaderElection:
+    """Lets one collector per domain ingest while other replicas wait on standby.
+
+    The leader holds a session-level advisory lock on the same connection it ingests with,
+    so the lock goes away together with that session: a crashed or partitioned leader can
+    neither keep the lock nor write through a new connection without taking it again.
+    Standbys keep their connection open and try the lock once per poll.
+    """
+
+    def __init__(self, config: AppConfig) -> None:
+        self.config = config
+        self.lock_name = f"{LEADER_LOCK_PREFIX}:{config.domain}"
+        self._lock_conn: psycopg.Connection | None = None
+        self._leader: bool | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self._leader)
+
+    @property
+    def may_ingest(self) -> bool:
+        """Whether this replica was allowed to ingest the last time it could tell."""
+        return not self.config.leader_election_enabled or self.is_leader
+
+    def ensure(self, conn: psycopg.Connection) -> bool:
+        """Return whether `conn` may ingest, taking the lock if it is free."""
+        if not self.config.leader_election_enabled:
+            return True
+        if self._lock_conn is conn and not conn.closed:
+            return True
+
+        row = conn.execute(TRY_LEADER_LOCK_SQL, (self.lock_name,)).fetchone()
+        # The lock is session-level and survives the commit; the commit only ends the
+        # implicit transaction so ingest starts from a clean connection.
+        conn.commit()
+        leader = bool(row[0])
+        self._lock_conn = conn if leader else None
+        self._set_leader(leader)
+        return leader
+
+    def _set_leader(self, leader: bool) -> None:
+        changed = self._leader is not None and self._leader != leader
+        if leader and not self._leader:
+            # Another replica may have ingested while this one was on standby.
+            forget_last_snapshots()
+        if self._leader != leader:
+            log_event(
+                "info" if leader else "warn",
+                "app.leader",
+                "Ingest leadership acquired" if leader else "Running as standby",
+                event="leader_acquired" if leader else "leader_standby",
+                config=self.config,
+                extra={"lock": self.lock_name, "changed": changed},
+            )
+        mark_leadership(self.config.domain, leader, changed)
+        self._leader = leader
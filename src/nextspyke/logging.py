@@ -1,14 +1,32 @@
+import atexit
 import json
+import queue
 import socket
 import sys
+import time
 import traceback
 import uuid
 from datetime import datetime, timezone
+from threading import Lock, Thread
+
+from prometheus_client import Counter
 
 from nextspyke.config import AppConfig
 
 RUN_ID = str(uuid.uuid4())
 INSTANCE_ID = socket.gethostname()
+LIFECYCLE_EVENTS = frozenset(
+    {"startup_begin", "startup_success", "shutting_down", "shutdown_complete", "crashed"}
+)
+LOG_BATCH_SIZE = 512
+DUPLICATE_KEYS_MAX = 1000
+
+LOG_RECORDS_DROPPED_TOTAL = Counter(
+    "app_log_records_dropped_total",
+    "Log records not written, by reason (queue_full, duplicate, write_failed)",
+    ["reason"],
+)
+_STOP = object()
 
 
 def utc_now() -> datetime:
@@ -25,16 +43,168 @@ def _json_default(value: object) -> str:
     return str(value)
 
 
-def log_event(
-    level: str,
-    logger: str,
-    msg: str,
-    *,
-    event: str | None = None,
-    config: AppConfig | None = None,
-    extra: dict | None = None,
-    exc: BaseException | None = None,
-) -> None:
+def _encode(record: dict, exc: BaseException | None) -> str:
+    if exc:
+        stack = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        record["stack"] = stack.replace("\n", "\\n")
+    return json.dumps(record, separators=(",", ":"), default=_json_default) + "\n"
+
+
+class BufferedLogWriter:
+    """Encodes and writes log records on a background thread.
+
+    Callers only enqueue; when the bounded queue is full the record is dropped and counted
+    instead of blocking. Lines are written in batches and flushed once the queue is idle or
+    `flush_interval_s` has passed. A failed write is reported on stderr and the thread keeps
+    going; should it still die, records are written on the caller's thread instead.
+    """
+
+    def __init__(
+        self, max_queue: int, flush_interval_s: float, config: AppConfig | None = None
+    ) -> None:
+        self.flush_interval_s = flush_interval_s
+        self.config = config
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = Lock()
+        self._dropped = 0
+        self._thread = Thread(target=self._run, name="log-writer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, record: dict, exc: BaseException | None) -> None:
+        if self._thread.ident is not None and not self._thread.is_alive():
+            # The writer thread has exited; nothing would drain the queue any more.
+            _write_now(record, exc)
+            return
+        try:
+            self._queue.put_nowait((record, exc))
+        except queue.Full:
+            LOG_RECORDS_DROPPED_TOTAL.labels(reason="queue_full").inc()
+            with self._lock:
+                self._dropped += 1
+
+    def close(self, timeout_s: float) -> None:
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout_s)
+        except queue.Full:
+            return
+        self._thread.join(timeout_s)
+
+    def _take_dropped(self) -> int:
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+        return dropped
+
+    def _next_batch(self) -> list:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval_s))
+            while len(batch) < LOG_BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        dirty = False
+        stopping = False
+        while not stopping:
+            batch = self._next_batch()
+            stopping = _STOP in batch
+            records = [item for item in batch if item is not _STOP]
+            try:
+                lines = [_encode(record, exc) for record, exc in records]
+                dropped = self._take_dropped()
+                if dropped:
+                    record = _base_record(
+                        "warn", "logging", "Log records dropped", "log_records_dropped", self.config
+                    )
+                    record["dropped"] = dropped
+                    lines.append(_encode(record, None))
+                if lines:
+                    sys.stdout.write("".join(lines))
+                    dirty = True
+                now = time.monotonic()
+                idle = self._queue.empty()
+                if dirty and (stopping or idle or now - last_flush >= self.flush_interval_s):
+                    sys.stdout.flush()
+                    last_flush = now
+                    dirty = False
+            except Exception as exc:
+                # Lines buffered from earlier batches may be lost too; only this batch is counted.
+                dirty = False
+                self._report_failure(exc, len(records))
+
+    def _report_failure(self, exc: Exception, lost: int) -> None:
+        LOG_RECORDS_DROPPED_TOTAL.labels(reason="write_failed").inc(lost)
+        record = _base_record(
+            "error", "logging", "Log write failed", "log_write_failed", self.config
+        )
+        record.update({"error": str(exc), "exception_type": exc.__class__.__name__, "lost": lost})
+        try:
+            sys.stderr.write(_encode(record, None))
+            sys.stderr.flush()
+        except Exception:
+            pass
+
+
+class DuplicateFilter:
+    """Lets the first of identical warn/error records through per window and counts the rest."""
+
+    def __init__(self, window_s: float) -> None:
+        self.window_s = window_s
+        self._seen: dict[tuple, list] = {}
+        self._lock = Lock()
+
+    def check(self, key: tuple, now: float) -> int | None:
+        """None to suppress the record, otherwise how many duplicates were suppressed before it."""
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window_s:
+                entry[1] += 1
+                return None
+            if entry is None and len(self._seen) >= DUPLICATE_KEYS_MAX:
+                self._seen = {
+                    seen: value
+                    for seen, value in self._seen.items()
+                    if now - value[0] < self.window_s
+                }
+            self._seen[key] = [now, 0]
+            return entry[1] if entry else 0
+
+
+_writer: BufferedLogWriter | None = None
+_duplicates: DuplicateFilter | None = None
+
+
+def configure_logging(config: AppConfig) -> None:
+    global _writer, _duplicates
+    _duplicates = (
+        DuplicateFilter(config.log_duplicate_window_s)
+        if config.log_duplicate_window_s > 0
+        else None
+    )
+    if config.log_async and _writer is None:
+        _writer = BufferedLogWriter(config.log_queue_size, config.log_flush_interval_s, config)
+        _writer.start()
+        atexit.register(flush_logs)
+
+
+def flush_logs(timeout_s: float = 5.0) -> None:
+    """Write out everything still queued and return to synchronous logging."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close(timeout_s)
+
+
+def _base_record(
+    level: str, logger: str, msg: str, event: str | None, config: AppConfig | None
+) -> dict:
     record = {
         "ts": iso_ts(utc_now()),
         "level": level,
@@ -47,13 +217,31 @@ def log_event(
     }
     if event:
         record["event"] = event
-    if config and event in {
-        "startup_begin",
-        "startup_success",
-        "shutting_down",
-        "shutdown_complete",
-        "crashed",
-    }:
+    return record
+
+
+def log_event(
+    level: str,
+    logger: str,
+    msg: str,
+    *,
+    event: str | None = None,
+    config: AppConfig | None = None,
+    extra: dict | None = None,
+    exc: BaseException | None = None,
+) -> None:
+    suppressed = 0
+    duplicates = _duplicates
+    if duplicates is not None and level in ("warn", "error") and event not in LIFECYCLE_EVENTS:
+        # String fields identify the failing thing (source, path); numbers only measure it.
+        labels = tuple(sorted((k, v) for k, v in (extra or {}).items() if isinstance(v, str)))
+        key = (level, logger, event, msg, labels, repr(exc) if exc else None)
+        suppressed = duplicates.check(key, time.monotonic())
+        if suppressed is None:
+            LOG_RECORDS_DROPPED_TOTAL.labels(reason="duplicate").inc()
+            return
+    record = _base_record(level, logger, msg, event, config)
+    if config and event in LIFECYCLE_EVENTS:
         record.update(
             {
                 "version": config.version,
@@ -64,12 +252,21 @@ def log_event(
         )
     if extra:
         record.update(extra)
+    if suppressed:
+        record["suppressed_duplicates"] = suppressed
     if level == "error":
         record["error"] = msg
     if exc:
         record["error"] = str(exc) or msg
         record["exception_type"] = exc.__class__.__name__
-        stack = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-        record["stack"] = stack.replace("\n", "\\n")
-    sys.stdout.write(json.dumps(record, separators=(",", ":"), default=_json_default) + "\n")
+    writer = _writer
+    if writer is not None:
+        # The traceback is formatted on the writer thread, off the ingest path.
+        writer.submit(record, exc)
+        return
+    _write_now(record, exc)
+
+
+def _write_now(record: dict, exc: BaseException | None) -> None:
+    sys.stdout.write(_encode(record, exc))
     sys.stdout.flush()
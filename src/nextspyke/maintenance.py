@@ -0,0 +1,472 @@
+from datetime import datetime, timedelta
+
+import psycopg
+from psycopg import sql
+
+from nextspyke.config import AppConfig
+from nextspyke.db import (
+    drop_partition,
+    ensure_partitions,
+    hour_floor,
+    list_month_partitions,
+    month_bounds,
+)
+from nextspyke.indexes import MIGRATION_LOCK_TIMEOUT, build_bike_id_indexes, partition_names
+from nextspyke.logging import utc_now
+
+PLACE_STATUS_TIERS = (
+    ("place_status_5m", timedelta(minutes=5)),
+    ("place_status_1h", timedelta(hours=1)),
+)
+PLACE_STATUS_ROLLUP_CHUNK = timedelta(days=1)
+PLACE_STATUS_ROLLED_UNTIL = "place_status_rolled_until"
+PLACE_STATUS_RAW_FROM = "place_status_raw_from"
+BIKE_TYPE_TABLES = ("city_status", "place_status")
+BIKE_TYPE_MIGRATION_CHUNK = timedelta(days=1)
+# Time column and bike_number indexes made redundant by bike_id, per history table.
+BIKE_ID_TABLES = {
+    "bike_status": ("fetched_at", ("idx_bike_status_bike_time",)),
+    "bike_movement": (
+        "end_fetched_at",
+        ("idx_bike_movement_bike_time", "idx_bike_movement_unique"),
+    ),
+}
+BIKE_ID_MIGRATION_CHUNK = timedelta(days=1)
+# Whether bike_status still has the bike_number primary key and bike_last_status still has
+# its bike_number column. The collector leaves bike_number NULL and cannot write until
+# `convert_bike_id_keys` removed both.
+BIKE_NUMBER_KEYS_SQL = """
+    SELECT
+        EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = 'bike_status'::regclass AND conname = 'bike_status_pkey'
+        ),
+        EXISTS (
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = 'bike_last_status'::regclass
+              AND attname = 'bike_number'
+              AND NOT attisdropped
+        )
+"""
+CONSTRAINT_STATE_SQL = """
+    SELECT convalidated FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s
+"""
+# Partitions the collector appends to; autovacuum reaches them late because they never see
+# updates or deletes.
+FRESH_PARTITION_TABLES = ("snapshot", "city_status", "place_status", "bike_status")
+
+
+def get_maintenance_state(cur: psycopg.Cursor, name: str) -> datetime | None:
+    cur.execute("SELECT value FROM maintenance_state WHERE name = %s", (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def set_maintenance_state(cur: psycopg.Cursor, name: str, value: datetime) -> None:
+    cur.execute(
+        """
+        INSERT INTO maintenance_state (name, value, updated_at)
+        VALUES (%s, %s, NOW())
+        ON CONFLICT (name) DO UPDATE SET
+            value = EXCLUDED.value,
+            updated_at = EXCLUDED.updated_at
+        """,
+        (name, value),
+    )
+
+
+def rollup_place_status(
+    cur: psycopg.Cursor,
+    table: str,
+    bucket: timedelta,
+    start: datetime,
+    end: datetime,
+) -> int:
+    cur.execute(
+        sql.SQL(
+            """
+            INSERT INTO {table} (
+                place_uid, bucket_start, samples,
+                bikes_min, bikes_max, bikes_avg, bikes_last,
+                free_racks_min, free_racks_max, free_racks_avg, free_racks_last,
+                bikes_available_to_rent_min, bikes_available_to_rent_max,
+                bikes_available_to_rent_avg, bikes_available_to_rent_last
+            )
+            SELECT
+                place_uid,
+                date_bin(%s, fetched_at, TIMESTAMPTZ '2001-01-01 00:00:00+00'),
+                COUNT(*),
+                MIN(bikes), MAX(bikes), AVG(bikes),
+                (array_agg(bikes ORDER BY fetched_at DESC))[1],
+                MIN(free_racks), MAX(free_racks), AVG(free_racks),
+                (array_agg(free_racks ORDER BY fetched_at DESC))[1],
+                MIN(bikes_available_to_rent), MAX(bikes_available_to_rent),
+                AVG(bikes_available_to_rent),
+                (array_agg(bikes_available_to_rent ORDER BY fetched_at DESC))[1]
+            FROM place_status_filled(%s, %s)
+            GROUP BY 1, 2
+            ON CONFLICT (place_uid, bucket_start) DO UPDATE SET
+                samples = EXCLUDED.samples,
+                bikes_min = EXCLUDED.bikes_min,
+                bikes_max = EXCLUDED.bikes_max,
+                bikes_avg = EXCLUDED.bikes_avg,
+                bikes_last = EXCLUDED.bikes_last,
+                free_racks_min = EXCLUDED.free_racks_min,
+                free_racks_max = EXCLUDED.free_racks_max,
+                free_racks_avg = EXCLUDED.free_racks_avg,
+                free_racks_last = EXCLUDED.free_racks_last,
+                bikes_available_to_rent_min = EXCLUDED.bikes_available_to_rent_min,
+                bikes_available_to_rent_max = EXCLUDED.bikes_available_to_rent_max,
+                bikes_available_to_rent_avg = EXCLUDED.bikes_available_to_rent_avg,
+                bikes_available_to_rent_last = EXCLUDED.bikes_available_to_rent_last
+            """
+        ).format(table=sql.Identifier(table)),
+        (bucket, start, end),
+    )
+    return cur.rowcount or 0
+
+
+def ensure_upcoming_partitions(conn: psycopg.Connection) -> dict:
+    """Create this month's and next month's partitions before the collector needs them."""
+    current_start, current_end = month_bounds(utc_now())
+    with conn.transaction():
+        with conn.cursor() as cur:
+            ensure_partitions(cur, current_start)
+            ensure_partitions(cur, current_end)
+    return {"months": [current_start, current_end]}
+
+
+def vacuum_fresh_partitions(conn: psycopg.Connection) -> dict:
+    """VACUUM (ANALYZE) the current month partitions.
+
+    Keeps planner statistics current for the month being written and sets the visibility map,
+    so covering and BRIN index scans can skip the heap. A month whose partition the collector
+    has not created yet is skipped.
+    """
+    start, _end = month_bounds(utc_now())
+    with conn.cursor() as cur:
+        partitions = [
+            name
+            for table in FRESH_PARTITION_TABLES
+            for name, partition_start, _partition_end in list_month_partitions(cur, table)
+            if partition_start == start
+        ]
+    conn.commit()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for partition in partitions:
+            conn.execute(
+                sql.SQL("VACUUM (ANALYZE) {partition}").format(partition=sql.Identifier(partition))
+            )
+    finally:
+        conn.autocommit = autocommit
+    return {"partitions": partitions}
+
+
+def run_place_status_maintenance(
+    conn: psycopg.Connection, config: AppConfig, drop_expired: bool = True
+) -> dict:
+    now = utc_now()
+    with conn.cursor() as cur:
+        rolled_until = get_maintenance_state(cur, PLACE_STATUS_ROLLED_UNTIL)
+        if rolled_until is None:
+            cur.execute("SELECT MIN(fetched_at) FROM snapshot")
+            row = cur.fetchone()
+            rolled_until = hour_floor(row[0]) if row and row[0] else None
+    conn.commit()
+
+    rolled_rows = 0
+    # Only complete hours are rolled up; the collector is still writing the current one.
+    end = hour_floor(now)
+    chunk_start = rolled_until or end
+    while chunk_start < end:
+        chunk_end = min(chunk_start + PLACE_STATUS_ROLLUP_CHUNK, end)
+        with conn.transaction():
+            with conn.cursor() as cur:
+                for table, bucket in PLACE_STATUS_TIERS:
+                    rolled_rows += rollup_place_status(cur, table, bucket, chunk_start, chunk_end)
+                set_maintenance_state(cur, PLACE_STATUS_ROLLED_UNTIL, chunk_end)
+        chunk_start = chunk_end
+        rolled_until = chunk_end
+
+    dropped_partitions = []
+    if drop_expired and rolled_until:
+        dropped_partitions = drop_expired_place_status(conn, config, rolled_until)
+
+    return {
+        "rolled_rows": rolled_rows,
+        "rolled_until": rolled_until,
+        "dropped_partitions": dropped_partitions,
+    }
+
+
+def drop_expired_place_status(
+    conn: psycopg.Connection, config: AppConfig, rolled_until: datetime | None = None
+) -> list[str]:
+    """Drop raw place_status months past PLACE_STATUS_RAW_RETENTION_DAYS that are rolled up.
+
+    Detaching a partition locks place_status exclusively, so the collector waits for it.
+    """
+    if config.place_status_raw_retention_days <= 0:
+        return []
+    if rolled_until is None:
+        with conn.cursor() as cur:
+            rolled_until = get_maintenance_state(cur, PLACE_STATUS_ROLLED_UNTIL)
+        conn.commit()
+        if rolled_until is None:
+            return []
+
+    cutoff = min(utc_now() - timedelta(days=config.place_status_raw_retention_days), rolled_until)
+    dropped_partitions = []
+    with conn.transaction():
+        with conn.cursor() as cur:
+            for partition, _start, partition_end in list_month_partitions(cur, "place_status"):
+                if partition_end > cutoff:
+                    continue
+                drop_partition(cur, "place_status", partition)
+                set_maintenance_state(cur, PLACE_STATUS_RAW_FROM, partition_end)
+                dropped_partitions.append(partition)
+    return dropped_partitions
+
+
+def migrate_bike_type_chunk(cur: psycopg.Cursor, table: str, start: datetime, end: datetime) -> int:
+    """Move bike_types JSONB of one time range into bike_type_counts and empty the JSONB."""
+    cur.execute(
+        sql.SQL(
+            """
+            INSERT INTO vehicle_type (vehicle_type_id)
+            SELECT DISTINCT jsonb_object_keys(bike_types)
+            FROM {table}
+            WHERE fetched_at >= %s AND fetched_at < %s AND bike_types IS NOT NULL
+            ON CONFLICT DO NOTHING
+            """
+        ).format(table=sql.Identifier(table)),
+        (start, end),
+    )
+    cur.execute(
+        sql.SQL(
+            """
+            UPDATE {table}
+            SET bike_type_counts = COALESCE(
+                    bike_type_counts, bike_type_counts_from_json(bike_types)
+                ),
+                bike_types = NULL
+            WHERE fetched_at >= %s AND fetched_at < %s AND bike_types IS NOT NULL
+            """
+        ).format(table=sql.Identifier(table)),
+        (start, end),
+    )
+    return max(cur.rowcount, 0)
+
+
+def migrate_bike_types(
+    conn: psycopg.Connection, chunk: timedelta = BIKE_TYPE_MIGRATION_CHUNK
+) -> dict:
+    """Convert city_status/place_status rows written before bike_type_counts existed.
+
+    Every month partition is converted one chunk per transaction, so the collector keeps
+    running and an interrupted run simply starts over; converted rows are skipped.
+    """
+    with conn.cursor() as cur:
+        partitions = [
+            (table, start, end)
+            for table in BIKE_TYPE_TABLES
+            for _partition, start, end in list_month_partitions(cur, table)
+        ]
+    conn.commit()
+
+    rows = dict.fromkeys(BIKE_TYPE_TABLES, 0)
+    for table, start, end in partitions:
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + chunk, end)
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    rows[table] += migrate_bike_type_chunk(cur, table, chunk_start, chunk_end)
+            chunk_start = chunk_end
+    return {"partitions": len(partitions), "rows": rows}
+
+
+def migrate_bike_id_chunk(cur: psycopg.Cursor, table: str, start: datetime, end: datetime) -> int:
+    """Replace bike_number by bike_id in the rows of one time range."""
+    time_column, _indexes = BIKE_ID_TABLES[table]
+    cur.execute(
+        sql.SQL(
+            """
+            UPDATE {table} t
+            SET bike_id = b.bike_id, bike_number = NULL
+            FROM bike b
+            WHERE t.bike_id IS NULL
+              AND t.{time_column} >= %s
+              AND t.{time_column} < %s
+              AND b.bike_number = t.bike_number
+            """
+        ).format(table=sql.Identifier(table), time_column=sql.Identifier(time_column)),
+        (start, end),
+    )
+    return max(cur.rowcount, 0)
+
+
+def require_bike_id_keys(conn: psycopg.Connection) -> None:
+    """Refuse to collect into a database whose keys still need a bike_number."""
+    with conn.cursor() as cur:
+        cur.execute(BIKE_NUMBER_KEYS_SQL)
+        pending = any(cur.fetchone())
+    conn.commit()
+    if pending:
+        raise RuntimeError(
+            "bike_status and bike_last_status are still keyed by bike_number; "
+            "run `python -m nextspyke.app migrate-bike-ids` first"
+        )
+
+
+def convert_bike_id_keys(conn: psycopg.Connection) -> bool:
+    """Take bike_number out of the bike_status key and key bike_last_status by bike_id.
+
+    Dropping the primary key and NOT NULL only changes the catalog, and bike_last_status
+    holds one row per bike, so this is a single short transaction. It gives up after
+    MIGRATION_LOCK_TIMEOUT instead of waiting for a long-running reader. Returns whether
+    anything was left to convert.
+    """
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('lock_timeout', %s, true)", (MIGRATION_LOCK_TIMEOUT,))
+            cur.execute(BIKE_NUMBER_KEYS_SQL)
+            status_key, last_status_number = cur.fetchone()
+            if status_key:
+                cur.execute("ALTER TABLE bike_status DROP CONSTRAINT bike_status_pkey")
+                cur.execute("ALTER TABLE bike_status ALTER COLUMN bike_number DROP NOT NULL")
+            if last_status_number:
+                cur.execute(
+                    """
+                    UPDATE bike_last_status bls
+                    SET bike_id = b.bike_id
+                    FROM bike b
+                    WHERE b.bike_number = bls.bike_number
+                    """
+                )
+                cur.execute("ALTER TABLE bike_last_status DROP COLUMN bike_number")
+                cur.execute("ALTER TABLE bike_last_status ADD PRIMARY KEY (bike_id)")
+                cur.execute(
+                    "ALTER TABLE bike_last_status ADD CONSTRAINT bike_last_status_bike_id_fkey "
+                    "FOREIGN KEY (bike_id) REFERENCES bike(bike_id)"
+                )
+    return bool(status_key or last_status_number)
+
+
+def add_bike_id_foreign_keys(conn: psycopg.Connection) -> list[str]:
+    """Add the bike_id foreign keys of bike_movement and bike_status and return the new ones.
+
+    Each key is added NOT VALID, which only needs a short lock, and validated in a separate
+    transaction, which scans the table while the collector keeps writing. Postgres cannot
+    add a NOT VALID foreign key to a partitioned table, so every bike_status partition gets
+    its own; the key added to the parent last adopts them without another scan.
+    """
+    with conn.cursor() as cur:
+        keys = [("bike_movement", "bike_movement_bike_id_fkey")]
+        parent_valid = _constraint_state(cur, "bike_status", "bike_status_bike_id_fkey")
+        if parent_valid is None:
+            keys += [
+                (partition, f"{partition}_bike_id_fkey")
+                for partition in partition_names(cur, "bike_status")
+            ]
+        valid = {name: _constraint_state(cur, table, name) for table, name in keys}
+    conn.commit()
+
+    added = []
+    for table, name in keys:
+        if valid[name] is None:
+            _alter_with_lock_timeout(
+                conn,
+                sql.SQL(
+                    "ALTER TABLE {table} ADD CONSTRAINT {name} "
+                    "FOREIGN KEY (bike_id) REFERENCES bike(bike_id) NOT VALID"
+                ).format(table=sql.Identifier(table), name=sql.Identifier(name)),
+            )
+            added.append(name)
+        if not valid[name]:
+            with conn.transaction():
+                conn.execute(
+                    sql.SQL("ALTER TABLE {table} VALIDATE CONSTRAINT {name}").format(
+                        table=sql.Identifier(table), name=sql.Identifier(name)
+                    )
+                )
+    if parent_valid is None:
+        _alter_with_lock_timeout(
+            conn,
+            sql.SQL(
+                "ALTER TABLE bike_status ADD CONSTRAINT bike_status_bike_id_fkey "
+                "FOREIGN KEY (bike_id) REFERENCES bike(bike_id)"
+            ),
+        )
+        added.append("bike_status_bike_id_fkey")
+    return added
+
+
+def _constraint_state(cur: psycopg.Cursor, table: str, name: str) -> bool | None:
+    """Whether the constraint is validated, or None if it does not exist."""
+    cur.execute(CONSTRAINT_STATE_SQL, (table, name))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _alter_with_lock_timeout(conn: psycopg.Connection, statement: sql.Composable) -> None:
+    with conn.transaction():
+        conn.execute("SELECT set_config('lock_timeout', %s, true)", (MIGRATION_LOCK_TIMEOUT,))
+        conn.execute(statement)
+
+
+def migrate_bike_ids(conn: psycopg.Connection, chunk: timedelta = BIKE_ID_MIGRATION_CHUNK) -> dict:
+    """Move bike_status/bike_movement written before bike_id existed over to bike_id.
+
+    Expects `convert_bike_id_keys` to have run. Builds the bike_id indexes concurrently,
+    then rewrites the rows like `migrate_bike_types`, one chunk per transaction, oldest
+    first. Once a table has no bike_number rows left, its bike_number indexes are dropped.
+    The bike_id foreign keys come last. The collector keeps writing throughout, and an
+    interrupted run picks up where it stopped.
+    """
+    built = build_bike_id_indexes(conn)
+    rows = dict.fromkeys(BIKE_ID_TABLES, 0)
+    completed = []
+    for table, (time_column, indexes) in BIKE_ID_TABLES.items():
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(
+                    "SELECT MIN({time_column}), MAX({time_column}) FROM {table} "
+                    "WHERE bike_id IS NULL"
+                ).format(table=sql.Identifier(table), time_column=sql.Identifier(time_column)),
+            )
+            first_at, last_at = cur.fetchone()
+        conn.commit()
+
+        chunk_start = first_at
+        while chunk_start is not None and chunk_start <= last_at:
+            chunk_end = chunk_start + chunk
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    rows[table] += migrate_bike_id_chunk(cur, table, chunk_start, chunk_end)
+            chunk_start = chunk_end
+
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL("SELECT 1 FROM {table} WHERE bike_id IS NULL LIMIT 1").format(
+                        table=sql.Identifier(table)
+                    )
+                )
+                if cur.fetchone() is None:
+                    for index in indexes:
+                        cur.execute(
+                            sql.SQL("DROP INDEX IF EXISTS {index}").format(
+                                index=sql.Identifier(index)
+                            )
+                        )
+                    completed.append(table)
+    foreign_keys = add_bike_id_foreign_keys(conn)
+    return {
+        "built_indexes": built,
+        "rows": rows,
+        "completed_tables": completed,
+        "foreign_keys": foreign_keys,
+    }
@@ -1,4 +1,6 @@
 import time
+from contextlib import contextmanager
+from datetime import datetime
 from threading import Thread
 from urllib.error import URLError
 
@@ -25,10 +27,227 @@ APP_ITERATION_FAILURE_REASONS_TOTAL = Counter(
 APP_ITERATION_DURATION = Histogram(
     "app_iteration_duration_seconds", "Ingest iteration duration seconds"
 )
+APP_INGEST_STAGE_DURATION = Histogram(
+    "app_ingest_stage_duration_seconds",
+    "Time spent per ingest stage and iteration",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+APP_INGEST_STAGE_ROWS_TOTAL = Counter(
+    "app_ingest_stage_rows_total",
+    "Rows handled per ingest stage",
+    ["stage"],
+)
+# Cities beyond this many distinct labels share the "other" label, so a feed that suddenly
+# lists hundreds of cities cannot blow up the number of series.
+CITY_LABEL_LIMIT = 50
+OTHER_CITY_LABEL = "other"
+
+APP_SNAPSHOT_AGE = Gauge(
+    "app_snapshot_age_seconds",
+    "Seconds since the last committed snapshot was fetched",
+    ["domain"],
+)
+APP_CITY_LAST_SNAPSHOT_TS = Gauge(
+    "app_city_last_snapshot_timestamp_seconds",
+    "Unix timestamp of the last committed snapshot that listed the city",
+    ["domain", "city"],
+)
+APP_SNAPSHOT_BIKES = Gauge(
+    "app_snapshot_bikes",
+    "Bikes listed in the last committed snapshot",
+    ["domain", "city"],
+)
+APP_SNAPSHOT_STATIONS = Gauge(
+    "app_snapshot_stations",
+    "Stations listed in the last committed snapshot",
+    ["domain", "city"],
+)
+APP_SNAPSHOT_MOVEMENTS = Histogram(
+    "app_snapshot_movements",
+    "Bike movements detected per snapshot",
+    ["domain"],
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+APP_FEED_LAG = Histogram(
+    "app_feed_lag_seconds",
+    "Time between the feed's Last-Modified header and the fetch",
+    ["domain"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+APP_SNAPSHOT_GAP = Histogram(
+    "app_snapshot_gap_seconds",
+    "Length of detected gaps between consecutive snapshots",
+    ["domain"],
+    buckets=(60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400),
+)
+APP_LEADER = Gauge(
+    "app_leader",
+    "1 while this replica holds the ingest leader lock for its domain, 0 on standby",
+    ["domain"],
+)
+APP_LEADER_CHANGES_TOTAL = Counter(
+    "app_leader_changes_total",
+    "Times this replica gained or lost ingest leadership",
+    ["domain"],
+)
+APP_SPOOL_SNAPSHOTS = Gauge(
+    "app_spool_snapshots", "Fetched feeds waiting in the local spool for the database"
+)
+APP_SPOOL_BYTES = Gauge("app_spool_bytes", "Size of the local spool on disk")
+APP_SPOOL_OLDEST_AGE = Gauge(
+    "app_spool_oldest_age_seconds", "Age of the oldest feed in the local spool, 0 when empty"
+)
+APP_SPOOL_DRAINED_TOTAL = Counter(
+    "app_spool_drained_total", "Spooled feeds stored after the database came back"
+)
+APP_SPOOL_DRAIN_RATE = Gauge(
+    "app_spool_drain_rate_snapshots_per_second", "Throughput of the last spool drain"
+)
+APP_SPOOL_DROPPED_TOTAL = Counter(
+    "app_spool_dropped_total", "Spooled feeds dropped without being stored", ["reason"]
+)
+APP_PLACE_STATUS_ROWS_WRITTEN_TOTAL = Counter(
+    "app_place_status_rows_written_total",
+    "Station status rows written to place_status",
+    ["domain"],
+)
+APP_PLACE_STATUS_ROWS_SKIPPED_TOTAL = Counter(
+    "app_place_status_rows_skipped_total",
+    "Station status rows not written because nothing changed since the last write",
+    ["domain"],
+)
+APP_PLACE_STATUS_KEYFRAMES_TOTAL = Counter(
+    "app_place_status_keyframes_total",
+    "Snapshots that wrote every station status row",
+    ["domain"],
+)
+APP_MAINTENANCE_JOB_RUNS_TOTAL = Counter(
+    "app_maintenance_job_runs_total",
+    "Scheduled maintenance job runs by outcome (success, timeout, lock_timeout, failure)",
+    ["job", "outcome"],
+)
+APP_MAINTENANCE_JOB_DURATION = Histogram(
+    "app_maintenance_job_duration_seconds",
+    "Duration of scheduled maintenance job runs",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+APP_MAINTENANCE_JOB_LAST_SUCCESS_TS = Gauge(
+    "app_maintenance_job_last_success_timestamp_seconds",
+    "Unix timestamp when the maintenance job last succeeded",
+    ["job"],
+)
+APP_MAINTENANCE_YIELDS_TOTAL = Counter(
+    "app_maintenance_yields_total",
+    "Times a due maintenance job waited for a running ingest",
+    ["job"],
+)
 
 _metrics_started = False
 
 
+class StageTimings:
+    """Per-iteration stage timer; stages entered repeatedly (e.g. per city) are summed."""
+
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = {}
+        self.rows: dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float, rows: int | None = None) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        if rows is not None:
+            self.rows[stage] = self.rows.get(stage, 0) + rows
+
+    @contextmanager
+    def stage(self, stage: str, rows: int | None = None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, rows)
+
+    def observe(self) -> None:
+        for stage, seconds in self.seconds.items():
+            APP_INGEST_STAGE_DURATION.labels(stage=stage).observe(seconds)
+        for stage, rows in self.rows.items():
+            APP_INGEST_STAGE_ROWS_TOTAL.labels(stage=stage).inc(rows)
+
+    def summary(self) -> dict:
+        summary = {}
+        for stage, seconds in self.seconds.items():
+            entry: dict = {"ms": round(seconds * 1000, 1)}
+            if stage in self.rows:
+                entry["rows"] = self.rows[stage]
+            summary[stage] = entry
+        return summary
+
+
+class SnapshotMetrics:
+    """Per-domain and per-city freshness metrics, fed from what ingest already computed."""
+
+    def __init__(self, city_limit: int = CITY_LABEL_LIMIT) -> None:
+        self.city_limit = city_limit
+        self._cities: set[str] = set()
+        self._fetched_at: dict[str, float] = {}
+
+    def city_label(self, city_uid: object) -> str:
+        label = str(city_uid)
+        if label in self._cities:
+            return label
+        if len(self._cities) < self.city_limit:
+            self._cities.add(label)
+            return label
+        return OTHER_CITY_LABEL
+
+    def observe(
+        self,
+        domain: str,
+        fetched_at: datetime,
+        cities: dict[object, tuple[int, int]],
+        movements: int,
+        feed_updated_at: datetime | None = None,
+        gap_seconds: int | None = None,
+    ) -> None:
+        """Record a committed snapshot; `cities` maps city uid to (stations, bikes)."""
+        if domain not in self._fetched_at:
+            APP_SNAPSHOT_AGE.labels(domain=domain).set_function(
+                lambda: time.time() - self._fetched_at[domain]
+            )
+        self._fetched_at[domain] = fetched_at.timestamp()
+
+        totals: dict[str, tuple[int, int]] = {}
+        for city_uid, (stations, bikes) in cities.items():
+            label = self.city_label(city_uid)
+            prev_stations, prev_bikes = totals.get(label, (0, 0))
+            totals[label] = (prev_stations + stations, prev_bikes + bikes)
+        for label, (stations, bikes) in totals.items():
+            APP_CITY_LAST_SNAPSHOT_TS.labels(domain=domain, city=label).set(fetched_at.timestamp())
+            APP_SNAPSHOT_STATIONS.labels(domain=domain, city=label).set(stations)
+            APP_SNAPSHOT_BIKES.labels(domain=domain, city=label).set(bikes)
+
+        APP_SNAPSHOT_MOVEMENTS.labels(domain=domain).observe(movements)
+        if feed_updated_at is not None:
+            lag_s = (fetched_at - feed_updated_at).total_seconds()
+            APP_FEED_LAG.labels(domain=domain).observe(max(lag_s, 0.0))
+        if gap_seconds is not None:
+            APP_SNAPSHOT_GAP.labels(domain=domain).observe(gap_seconds)
+
+
+_snapshot_metrics = SnapshotMetrics()
+
+
+def observe_snapshot(
+    domain: str,
+    fetched_at: datetime,
+    cities: dict[object, tuple[int, int]],
+    movements: int,
+    feed_updated_at: datetime | None = None,
+    gap_seconds: int | None = None,
+) -> None:
+    _snapshot_metrics.observe(domain, fetched_at, cities, movements, feed_updated_at, gap_seconds)
+
+
 def init_metrics(config: AppConfig) -> None:
     APP_BUILD_INFO.labels(
         version=config.version,
@@ -65,6 +284,44 @@ def mark_iteration_failure(duration_s: float, reason: str) -> None:
     APP_LAST_ITERATION_TS.set(time.time())
 
 
+def mark_leadership(domain: str, leader: bool, changed: bool) -> None:
+    APP_LEADER.labels(domain=domain).set(1 if leader else 0)
+    if changed:
+        APP_LEADER_CHANGES_TOTAL.labels(domain=domain).inc()
+
+
+def observe_spool(snapshots: int, size_bytes: int) -> None:
+    APP_SPOOL_SNAPSHOTS.set(snapshots)
+    APP_SPOOL_BYTES.set(size_bytes)
+
+
+def mark_spool_drained(snapshots: int, duration_s: float) -> None:
+    APP_SPOOL_DRAINED_TOTAL.inc(snapshots)
+    APP_SPOOL_DRAIN_RATE.set(snapshots / duration_s if duration_s > 0 else 0.0)
+
+
+def mark_spool_dropped(reason: str, snapshots: int = 1) -> None:
+    APP_SPOOL_DROPPED_TOTAL.labels(reason=reason).inc(snapshots)
+
+
+def mark_place_status_rows(domain: str, written: int, skipped: int, keyframe: bool) -> None:
+    APP_PLACE_STATUS_ROWS_WRITTEN_TOTAL.labels(domain=domain).inc(written)
+    APP_PLACE_STATUS_ROWS_SKIPPED_TOTAL.labels(domain=domain).inc(skipped)
+    if keyframe:
+        APP_PLACE_STATUS_KEYFRAMES_TOTAL.labels(domain=domain).inc()
+
+
+def mark_maintenance_job(job: str, outcome: str, duration_s: float) -> None:
+    APP_MAINTENANCE_JOB_RUNS_TOTAL.labels(job=job, outcome=outcome).inc()
+    APP_MAINTENANCE_JOB_DURATION.labels(job=job).observe(duration_s)
+    if outcome == "success":
+        APP_MAINTENANCE_JOB_LAST_SUCCESS_TS.labels(job=job).set(time.time())
+
+
+def mark_maintenance_yield(job: str) -> None:
+    APP_MAINTENANCE_YIELDS_TOTAL.labels(job=job).inc()
+
+
 def mark_shutdown() -> None:
     APP_UP.set(0)
 
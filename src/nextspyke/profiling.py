@@ -0,0 +1,75 @@
+import cProfile
+from pathlib import Path
+
+from nextspyke.config import AppConfig
+from nextspyke.logging import RUN_ID, log_event, utc_now
+
+
+class IterationProfiler:
+    """Profiles ingest iterations and keeps the profiles of slow ones.
+
+    Iterations normally run without a profiler. With PROFILE_SLOW_ITERATION_SECONDS set, an
+    iteration that takes at least that long arms it for the next one, whose profile is kept
+    if that one is slow too. `request()` (SIGUSR1) profiles the next iteration and keeps it
+    regardless of its duration.
+    """
+
+    def __init__(self, config: AppConfig) -> None:
+        self.config = config
+        self.threshold_s = config.profile_slow_iteration_s
+        self.directory = Path(config.profile_dir)
+        self.keep = config.profile_keep
+        self._requested = False
+        self._armed = False
+
+    def request(self, _signum=None, _frame=None) -> None:
+        self._requested = True
+
+    def start(self) -> cProfile.Profile | None:
+        if not self._armed and not self._requested:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(
+        self,
+        profile: cProfile.Profile | None,
+        duration_s: float,
+        snapshot_id: int | None,
+    ) -> Path | None:
+        slow = self.threshold_s > 0 and duration_s >= self.threshold_s
+        self._armed = slow
+        if profile is None:
+            return None
+        profile.disable()
+        requested = self._requested
+        self._requested = False
+        if not requested and not slow:
+            return None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = utc_now().strftime("%Y%m%dT%H%M%SZ")
+        path = self.directory / f"{stamp}_{RUN_ID}_{snapshot_id or 'failed'}.prof"
+        profile.dump_stats(path)
+        self._rotate()
+        log_event(
+            "warn",
+            "app.profiling",
+            "Slow iteration profiled",
+            event="slow_iteration_profiled",
+            config=self.config,
+            extra={
+                "snapshot_id": snapshot_id,
+                "duration_ms": int(duration_s * 1000),
+                "threshold_ms": int(self.threshold_s * 1000),
+                "requested": requested,
+                "profile_path": str(path),
+            },
+        )
+        return path
+
+    def _rotate(self) -> None:
+        profiles = sorted(self.directory.glob("*.prof"))
+        for stale in profiles[: max(0, len(profiles) - self.keep)]:
+            stale.unlink(missing_ok=True)
@@ -0,0 +1,355 @@
+import json
+import queue
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Semaphore, Thread
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import psycopg
+
+from nextspyke.config import AppConfig
+from nextspyke.db import build_query_dsn
+from nextspyke.logging import iso_ts, log_event, utc_now
+
+QUERY_STATEMENT_TIMEOUT_MS = 5000
+DEFAULT_WINDOW = timedelta(hours=24)
+MAX_LIMIT = 500
+CACHE_MAX_ENTRIES = 1024
+
+SUMMARY_SQL = """
+    SELECT
+        s.snapshot_id,
+        s.fetched_at,
+        COUNT(ps.place_uid) AS places,
+        COALESCE(SUM(ps.bikes), 0) AS bikes_at_places,
+        COALESCE(SUM(ps.bikes_available_to_rent), 0) AS bikes_available_to_rent,
+        (
+            SELECT COUNT(*)
+            FROM bike_last_status bls
+            WHERE bls.fetched_at = s.fetched_at
+        ) AS bikes_seen
+    FROM (
+        SELECT snapshot_id, fetched_at
+        FROM snapshot
+        WHERE domain = %s
+        ORDER BY fetched_at DESC
+        LIMIT 1
+    ) s
+    LEFT JOIN LATERAL place_status_filled(
+        s.fetched_at, s.fetched_at + INTERVAL '1 microsecond', %s
+    ) ps ON ps.snapshot_id = s.snapshot_id
+    GROUP BY s.snapshot_id, s.fetched_at
+"""
+
+HOTSPOTS_SQL = """
+    SELECT
+        rs.end_place_uid AS place_uid,
+        p.name,
+        ST_Y(p.geom) AS lat,
+        ST_X(p.geom) AS lon,
+        SUM(rs.movements) AS arrivals
+    FROM route_stats rs
+    JOIN place p ON p.place_uid = rs.end_place_uid
+    WHERE rs.bucket_start >= %s AND rs.bucket_start < %s
+    GROUP BY rs.end_place_uid, p.name, p.geom
+    ORDER BY arrivals DESC
+    LIMIT %s
+"""
+
+ROUTES_SQL = """
+    SELECT
+        rs.start_place_uid,
+        ps.name AS start_name,
+        rs.end_place_uid,
+        pe.name AS end_name,
+        SUM(rs.movements) AS trips,
+        SUM(rs.distance_m_sum)::double precision / SUM(rs.movements) AS avg_distance_m
+    FROM route_stats rs
+    LEFT JOIN place ps ON ps.place_uid = rs.start_place_uid
+    LEFT JOIN place pe ON pe.place_uid = rs.end_place_uid
+    WHERE rs.bucket_start >= %s AND rs.bucket_start < %s
+    GROUP BY rs.start_place_uid, ps.name, rs.end_place_uid, pe.name
+    ORDER BY trips DESC
+    LIMIT %s
+"""
+
+STATION_SERIES_SQL = """
+    SELECT
+        bucket_start,
+        samples,
+        bikes_min,
+        bikes_max,
+        bikes_avg,
+        bikes_last,
+        bikes_available_to_rent_last
+    FROM place_status_series(%s, %s)
+    WHERE place_uid = %s
+    ORDER BY bucket_start
+"""
+
+BIKE_PATH_SQL = """
+    SELECT seq, point_time, place_uid, ST_Y(geom) AS lat, ST_X(geom) AS lon
+    FROM bike_path(%s, %s, %s)
+    ORDER BY seq
+"""
+
+STATION_SERIES_PATH = re.compile(r"^/stations/(\d+)/series$")
+BIKE_PATH_PATH = re.compile(r"^/bikes/([^/]+)/path$")
+
+
+class QueryError(ValueError):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    """In-memory LRU response cache, cleared whenever a new snapshot is committed.
+
+    Every clear starts a new generation. A response computed while the cache was cleared
+    carries the generation it started in and is not stored, so it cannot outlive the clear.
+    Beyond `max_entries` the least recently used response is dropped.
+    """
+
+    def __init__(self, ttl_s: float, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[float, bytes]] = OrderedDict()
+        self._generation = 0
+        self._lock = Lock()
+
+    @property
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, body = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    def set(self, key: Hashable, body: bytes, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_s, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class ReadOnlyPool:
+    """Bounded pool of autocommit connections that reject writes on the server side."""
+
+    def __init__(self, dsn: str, size: int) -> None:
+        self._dsn = dsn
+        self._idle: queue.LifoQueue[psycopg.Connection] = queue.LifoQueue()
+        self._slots = Semaphore(size)
+
+    def _connect(self) -> psycopg.Connection:
+        return psycopg.connect(
+            self._dsn,
+            connect_timeout=5,
+            autocommit=True,
+            options=(
+                "-c default_transaction_read_only=on "
+                f"-c statement_timeout={QUERY_STATEMENT_TIMEOUT_MS}"
+            ),
+        )
+
+    @contextmanager
+    def connection(self) -> Iterator[psycopg.Connection]:
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            except (psycopg.OperationalError, psycopg.InterfaceError):
+                conn.close()
+                raise
+            finally:
+                if not conn.closed:
+                    self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _parse_ts(params: dict[str, list[str]], name: str) -> datetime | None:
+    values = params.get(name)
+    if not values:
+        return None
+    try:
+        # An unescaped "+" in the UTC offset arrives as a space.
+        value = datetime.fromisoformat(values[0].replace(" ", "+"))
+    except ValueError as exc:
+        raise QueryError(400, f"invalid {name} timestamp") from exc
+    if value.tzinfo is None:
+        raise QueryError(400, f"{name} timestamp needs a UTC offset")
+    return value
+
+
+def _parse_int(params: dict[str, list[str]], name: str, default: int, maximum: int) -> int:
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError as exc:
+        raise QueryError(400, f"invalid {name}") from exc
+    if value < 1 or value > maximum:
+        raise QueryError(400, f"{name} must be between 1 and {maximum}")
+    return value
+
+
+def _time_range(
+    params: dict[str, list[str]],
+) -> tuple[tuple[datetime | None, datetime | None], datetime, datetime]:
+    """The from/to parameters as given (None when left open) and the range they select."""
+    requested = (_parse_ts(params, "from"), _parse_ts(params, "to"))
+    end = requested[1] or utc_now()
+    start = requested[0] or end - DEFAULT_WINDOW
+    if start >= end:
+        raise QueryError(400, "from must be before to")
+    return requested, start, end
+
+
+def _json_value(value: object) -> object:
+    if isinstance(value, datetime):
+        return iso_ts(value)
+    return str(value)
+
+
+class QueryApi:
+    def __init__(self, config: AppConfig, pool: ReadOnlyPool, cache: ResponseCache) -> None:
+        self.config = config
+        self.pool = pool
+        self.cache = cache
+
+    def _fetch(self, query: str, params: tuple) -> list[dict]:
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                columns = [column.name for column in cur.description]
+                return [dict(zip(columns, row, strict=True)) for row in cur.fetchall()]
+
+    def _route(self, path: str, params: dict[str, list[str]]) -> tuple[tuple, str, tuple]:
+        """Resolve a request to its cache key, query and query parameters.
+
+        The key holds the route and the parsed parameters it reads, so parameter order,
+        spelling and unknown parameters do not add cache entries.
+        """
+        if path == "/summary":
+            return (path,), SUMMARY_SQL, (self.config.domain, self.config.domain)
+        if path in ("/hotspots", "/routes"):
+            requested, start, end = _time_range(params)
+            limit = _parse_int(params, "limit", 20, MAX_LIMIT)
+            query = HOTSPOTS_SQL if path == "/hotspots" else ROUTES_SQL
+            return (path, *requested, limit), query, (start, end, limit)
+        match = STATION_SERIES_PATH.match(path)
+        if match:
+            requested, start, end = _time_range(params)
+            place_uid = int(match.group(1))
+            key = ("/stations/series", place_uid, *requested)
+            return key, STATION_SERIES_SQL, (start, end, place_uid)
+        match = BIKE_PATH_PATH.match(path)
+        if match:
+            requested, start, end = _time_range(params)
+            bike_number = unquote(match.group(1))
+            key = ("/bikes/path", bike_number, *requested)
+            return key, BIKE_PATH_SQL, (bike_number, start, end)
+        raise QueryError(404, "not found")
+
+    def handle(self, target: str) -> tuple[int, bytes]:
+        parts = urlsplit(target)
+        try:
+            key, query, query_params = self._route(parts.path, parse_qs(parts.query))
+        except QueryError as exc:
+            return exc.status, json.dumps({"error": str(exc)}).encode("utf-8")
+        body = self.cache.get(key)
+        if body is not None:
+            return 200, body
+        generation = self.cache.generation
+        try:
+            rows = self._fetch(query, query_params)
+        except psycopg.Error as exc:
+            log_event(
+                "error",
+                "query_api",
+                "Query API request failed",
+                event="query_api_failed",
+                config=self.config,
+                extra={"path": parts.path},
+                exc=exc,
+            )
+            return 503, json.dumps({"error": "database unavailable"}).encode("utf-8")
+        # The summary is a single row, every other route a list.
+        data = (rows[0] if rows else None) if key == ("/summary",) else rows
+        body = json.dumps({"data": data}, default=_json_value, separators=(",", ":")).encode(
+            "utf-8"
+        )
+        self.cache.set(key, body, generation)
+        return 200, body
+
+
+class QueryApiHandler(BaseHTTPRequestHandler):
+    server_version = "nextspyke-query"
+
+    def do_GET(self) -> None:
+        status, body = self.server.api.handle(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Requests are not logged; failures are reported through log_event.
+        return None
+
+
+_cache: ResponseCache | None = None
+
+
+def invalidate_query_cache() -> None:
+    if _cache is not None:
+        _cache.clear()
+
+
+def start_query_api(config: AppConfig) -> ThreadingHTTPServer | None:
+    global _cache
+    if not config.query_api_enabled or _cache is not None:
+        return None
+    _cache = ResponseCache(ttl_s=config.poll_interval)
+    pool = ReadOnlyPool(build_query_dsn(), config.query_api_pool_size)
+    server = ThreadingHTTPServer(("", config.query_api_port), QueryApiHandler)
+    server.daemon_threads = True
+    server.api = QueryApi(config, pool, _cache)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
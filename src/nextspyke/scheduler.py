@@ -0,0 +1,247 @@
+import random
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Event, Thread
+
+import psycopg
+
+from nextspyke.config import AppConfig
+from nextspyke.db import build_dsn
+from nextspyke.indexes import build_closed_partition_indexes
+from nextspyke.ingest import refresh_vehicle_type_metadata, refresh_zone_metadata
+from nextspyke.logging import log_event
+from nextspyke.maintenance import (
+    drop_expired_place_status,
+    ensure_upcoming_partitions,
+    run_place_status_maintenance,
+    vacuum_fresh_partitions,
+)
+from nextspyke.metrics import mark_maintenance_job, mark_maintenance_yield
+
+# Each run is scheduled up to this fraction of its interval early or late, so replicas
+# started together and jobs with the same interval drift apart.
+MAINTENANCE_JITTER = 0.1
+# Maintenance gives up on a lock after this long instead of queueing ahead of the next ingest.
+MAINTENANCE_LOCK_TIMEOUT_MS = 1000
+# How often a due job checks whether the running ingest has finished.
+MAINTENANCE_IDLE_POLL_S = 0.5
+MAINTENANCE_STOP_TIMEOUT_S = 5.0
+
+
+@dataclass(frozen=True)
+class MaintenanceJob:
+    name: str
+    run: Callable[[psycopg.Connection, AppConfig], object]
+    # Seconds between runs; None uses REFRESH_MV_INTERVAL_SECONDS.
+    interval_s: int | None = None
+    # statement_timeout in seconds; None uses REFRESH_MV_TIMEOUT_SECONDS, 0 disables it.
+    timeout_s: int | None = None
+    # Takes exclusive locks on tables the collector writes: wait for the next ingest to commit
+    # and run in the gap before the following poll.
+    after_ingest: bool = False
+
+
+def _refresh_metadata(conn: psycopg.Connection, config: AppConfig) -> None:
+    refresh_zone_metadata(conn, config)
+    refresh_vehicle_type_metadata(conn, config)
+
+
+def _roll_up_place_status(conn: psycopg.Connection, config: AppConfig) -> None:
+    run_place_status_maintenance(conn, config, drop_expired=False)
+
+
+MAINTENANCE_JOBS = (
+    MaintenanceJob(
+        "partitions",
+        lambda conn, _config: ensure_upcoming_partitions(conn),
+        3600,
+        after_ingest=True,
+    ),
+    MaintenanceJob("metadata", _refresh_metadata),
+    MaintenanceJob("place_status_rollups", _roll_up_place_status),
+    MaintenanceJob("place_status_retention", drop_expired_place_status, 3600, after_ingest=True),
+    MaintenanceJob(
+        "vacuum_fresh_partitions", lambda conn, _config: vacuum_fresh_partitions(conn), 3600, 0
+    ),
+    MaintenanceJob(
+        "closed_partition_indexes",
+        lambda conn, _config: build_closed_partition_indexes(conn),
+        3600,
+        0,
+    ),
+)
+
+
+class MaintenanceScheduler:
+    """Runs periodic upkeep on its own thread and database connection.
+
+    Jobs run one at a time, each under its own statement_timeout and a short lock_timeout. A
+    job that comes due while the collector is storing a snapshot waits for it to finish; an
+    after_ingest job waits for the next snapshot to be committed. A job that has started is
+    not interrupted, and an ingest that needs a lock the job holds waits for it. Failed jobs
+    are logged, counted and tried again at their next interval.
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        jobs: tuple[MaintenanceJob, ...] = MAINTENANCE_JOBS,
+        may_run: Callable[[], bool] = lambda: True,
+    ) -> None:
+        self.config = config
+        self.jobs = jobs
+        self.may_run = may_run
+        self._conn: psycopg.Connection | None = None
+        self._thread: Thread | None = None
+        self._stop = Event()
+        self._ingest_idle = Event()
+        self._ingest_idle.set()
+        self._ingest_committed = Event()
+        now = time.monotonic()
+        self._next_run = {
+            job.name: now + random.uniform(0, MAINTENANCE_JITTER * self.interval(job))
+            for job in jobs
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.refresh_mv_interval > 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def interval(self, job: MaintenanceJob) -> int:
+        return job.interval_s if job.interval_s is not None else self.config.refresh_mv_interval
+
+    def timeout(self, job: MaintenanceJob) -> int:
+        return job.timeout_s if job.timeout_s is not None else self.config.refresh_mv_timeout
+
+    @contextmanager
+    def ingesting(self) -> Iterator[None]:
+        """Mark an ingest as running; due jobs wait until it is done."""
+        self._ingest_idle.clear()
+        try:
+            yield
+        finally:
+            self._ingest_idle.set()
+        self._ingest_committed.set()
+
+    def start(self) -> None:
+        if not self.enabled or self.running:
+            return
+        self._thread = Thread(target=self._loop, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = MAINTENANCE_STOP_TIMEOUT_S) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+            if self._thread.is_alive():
+                # A job is still running; the daemon thread ends with the process.
+                return
+        self._close()
+
+    def run_pending(self) -> list[str]:
+        """Run the jobs that are due and return their names."""
+        ran = []
+        for job in self.jobs:
+            if self._stop.is_set() or time.monotonic() < self._next_run[job.name]:
+                continue
+            wait = self._wait_for_commit if job.after_ingest else self._wait_for_ingest
+            if not wait(job):
+                break
+            if self.may_run():
+                self.run_job(job)
+                ran.append(job.name)
+            interval = self.interval(job)
+            jitter = random.uniform(-MAINTENANCE_JITTER, MAINTENANCE_JITTER) * interval
+            self._next_run[job.name] = time.monotonic() + interval + jitter
+        return ran
+
+    def run_job(self, job: MaintenanceJob) -> bool:
+        started = time.perf_counter()
+        outcome = "success"
+        exc = None
+        try:
+            conn = self._connection()
+            conn.execute(
+                "SELECT set_config('statement_timeout', %s, false)",
+                (f"{self.timeout(job) * 1000}ms",),
+            )
+            conn.commit()
+            job.run(conn, self.config)
+        except psycopg.errors.LockNotAvailable as lock_exc:
+            outcome, exc = "lock_timeout", lock_exc
+        except psycopg.errors.QueryCanceled as cancel_exc:
+            outcome, exc = "timeout", cancel_exc
+        except Exception as job_exc:
+            outcome, exc = "failure", job_exc
+        duration_s = time.perf_counter() - started
+        mark_maintenance_job(job.name, outcome, duration_s)
+        extra = {"job": job.name, "outcome": outcome, "duration_ms": int(duration_s * 1000)}
+        if exc is None:
+            log_event(
+                "info",
+                "app.maintenance",
+                "Maintenance job completed",
+                event="maintenance_job_complete",
+                config=self.config,
+                extra=extra,
+            )
+            return True
+        log_event(
+            "warn" if outcome == "lock_timeout" else "error",
+            "app.maintenance",
+            "Maintenance job failed",
+            event="maintenance_job_failed",
+            config=self.config,
+            extra=extra,
+            exc=exc,
+        )
+        # A fresh session next time rather than guessing what state this one is in.
+        self._close()
+        return False
+
+    def seconds_until_due(self) -> float:
+        return max(0.0, min(self._next_run.values(), default=0.0) - time.monotonic())
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(self.seconds_until_due())
+
+    def _wait_for_ingest(self, job: MaintenanceJob) -> bool:
+        if self._ingest_idle.is_set():
+            return True
+        mark_maintenance_yield(job.name)
+        while not self._ingest_idle.wait(MAINTENANCE_IDLE_POLL_S):
+            if self._stop.is_set():
+                return False
+        return not self._stop.is_set()
+
+    def _wait_for_commit(self, job: MaintenanceJob) -> bool:
+        self._ingest_committed.clear()
+        mark_maintenance_yield(job.name)
+        while not self._ingest_committed.wait(MAINTENANCE_IDLE_POLL_S):
+            if self._stop.is_set():
+                return False
+        return not self._stop.is_set()
+
+    def _connection(self) -> psycopg.Connection:
+        if self._conn is None or self._conn.closed:
+            conn = psycopg.connect(build_dsn(), connect_timeout=5)
+            conn.execute(
+                "SELECT set_config('lock_timeout', %s, false)",
+                (f"{MAINTENANCE_LOCK_TIMEOUT_MS}ms",),
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.closed:
+            conn.close()
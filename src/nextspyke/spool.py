@@ -0,0 +1,213 @@
+import gzip
+import json
+import os
+import time
+from bisect import insort
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg
+
+from nextspyke.config import AppConfig
+from nextspyke.ingest import FetchedFeed, ingest_backlog, live_country
+from nextspyke.logging import log_event, utc_now
+from nextspyke.metrics import (
+    APP_SPOOL_OLDEST_AGE,
+    mark_spool_drained,
+    mark_spool_dropped,
+    observe_spool,
+)
+
+SPOOL_SUFFIX = ".json.gz"
+SPOOL_NAME_FORMAT = "%Y%m%dT%H%M%S.%fZ"
+# Spooled feeds stored per transaction while draining.
+SPOOL_DRAIN_BATCH = 20
+
+
+class SnapshotSpool:
+    """Bounded on-disk queue of live feeds fetched while the database was unreachable.
+
+    Each feed is one gzip file named after its fetch time, so name order is queue order and
+    the spool survives restarts. Once the spool outgrows SPOOL_MAX_MB the oldest feeds are
+    dropped; the hole they leave is recorded as a snapshot gap like any other outage.
+    """
+
+    def __init__(self, directory: Path | str, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: list[tuple[Path, int]] = []
+        self._bytes = 0
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for partial in self.directory.glob(f"*{SPOOL_SUFFIX}.tmp"):
+            partial.unlink(missing_ok=True)
+        for path in sorted(self.directory.glob(f"*{SPOOL_SUFFIX}")):
+            self._entries.append((path, path.stat().st_size))
+            self._bytes += self._entries[-1][1]
+        APP_SPOOL_OLDEST_AGE.set_function(self.oldest_age_seconds)
+        self._observe()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def oldest_age_seconds(self) -> float:
+        if not self._entries:
+            return 0.0
+        oldest = _spooled_at(self._entries[0][0])
+        return max(0.0, (utc_now() - oldest).total_seconds())
+
+    def append(self, feed: FetchedFeed) -> int:
+        """Spool `feed` and return how many old feeds were dropped to make room."""
+        stamp = feed.fetched_at.astimezone(timezone.utc).strftime(SPOOL_NAME_FORMAT)
+        path = self.directory / f"{stamp}{SPOOL_SUFFIX}"
+        partial = path.with_name(f"{path.name}.tmp")
+        partial.write_bytes(gzip.compress(feed.payload.encode("utf-8"), compresslevel=6))
+        os.replace(partial, path)
+        size = path.stat().st_size
+        insort(self._entries, (path, size))
+        self._bytes += size
+
+        dropped = 0
+        while len(self._entries) > 1 and self._bytes > self.max_bytes:
+            oldest, oldest_size = self._entries.pop(0)
+            oldest.unlink(missing_ok=True)
+            self._bytes -= oldest_size
+            dropped += 1
+        if dropped:
+            mark_spool_dropped("full", dropped)
+        self._observe()
+        return dropped
+
+    def peek(self, limit: int) -> list[Path]:
+        return [path for path, _size in self._entries[:limit]]
+
+    def load(self, path: Path) -> FetchedFeed:
+        payload = gzip.decompress(path.read_bytes()).decode("utf-8")
+        return FetchedFeed(_spooled_at(path), payload)
+
+    def remove(self, paths: list[Path]) -> None:
+        removed = set(paths)
+        for path, size in self._entries:
+            if path in removed:
+                path.unlink(missing_ok=True)
+                self._bytes -= size
+        self._entries = [entry for entry in self._entries if entry[0] not in removed]
+        self._observe()
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self.remove(self.peek(count))
+        return count
+
+    def _observe(self) -> None:
+        observe_spool(len(self._entries), self._bytes)
+
+
+class SnapshotBuffer:
+    """Polls held in memory and stored together once BATCH_SNAPSHOTS are collected or the
+    oldest one is BATCH_MAX_DELAY_SECONDS old.
+
+    Feeds are decoded when they are added, so a malformed feed fails its own poll instead
+    of the whole batch.
+    """
+
+    def __init__(self, max_snapshots: int, max_delay_s: float) -> None:
+        self.max_snapshots = max_snapshots
+        self.max_delay_s = max_delay_s
+        self._entries: list[tuple[FetchedFeed, dict]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_snapshots > 1
+
+    @property
+    def entries(self) -> list[tuple[FetchedFeed, dict]]:
+        return list(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, feed: FetchedFeed) -> None:
+        live_data = json.loads(feed.payload)
+        live_country(live_data)
+        self._entries.append((feed, live_data))
+
+    def due(self, now: datetime) -> bool:
+        if not self._entries:
+            return False
+        if len(self._entries) >= self.max_snapshots:
+            return True
+        return (now - self._entries[0][0].fetched_at).total_seconds() >= self.max_delay_s
+
+    def take(self) -> list[FetchedFeed]:
+        feeds = [feed for feed, _live_data in self._entries]
+        self._entries = []
+        return feeds
+
+
+def _spooled_at(path: Path) -> datetime:
+    stamp = path.name.removesuffix(SPOOL_SUFFIX)
+    return datetime.strptime(stamp, SPOOL_NAME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def drain_spool(
+    conn: psycopg.Connection,
+    config: AppConfig,
+    spool: SnapshotSpool,
+    batch_size: int = SPOOL_DRAIN_BATCH,
+) -> dict:
+    """Store spooled feeds oldest first, `batch_size` snapshots per transaction.
+
+    Feeds are removed from the spool once their batch is committed, so a drain interrupted
+    by another outage resumes where it stopped. Unreadable files are dropped with a warning
+    instead of blocking the queue.
+    """
+    started = time.perf_counter()
+    drained = 0
+    batches = 0
+    dropped = 0
+    while len(spool):
+        paths = spool.peek(batch_size)
+        snapshots = []
+        for path in paths:
+            try:
+                feed = spool.load(path)
+                live_data = json.loads(feed.payload)
+                live_country(live_data)
+            except (OSError, EOFError, ValueError, RuntimeError) as exc:
+                dropped += 1
+                log_event(
+                    "warn",
+                    "spool",
+                    "Dropping unreadable spooled feed",
+                    event="spool_entry_dropped",
+                    config=config,
+                    extra={"path": str(path)},
+                    exc=exc,
+                )
+                continue
+            snapshots.append((feed.fetched_at, live_data))
+        if snapshots:
+            ingest_backlog(conn, config, snapshots)
+        spool.remove(paths)
+        drained += len(snapshots)
+        batches += 1
+    if dropped:
+        mark_spool_dropped("unreadable", dropped)
+    duration_s = time.perf_counter() - started
+    mark_spool_drained(drained, duration_s)
+    return {
+        "snapshots": drained,
+        "batches": batches,
+        "dropped": dropped,
+        "duration_ms": int(duration_s * 1000),
+    }
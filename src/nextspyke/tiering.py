@@ -0,0 +1,397 @@
+import hashlib
+import os
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import psycopg
+from psycopg import sql
+
+from nextspyke.config import AppConfig
+from nextspyke.db import drop_partition, list_month_partitions
+from nextspyke.export import ParquetSink, load_pyarrow
+from nextspyke.logging import utc_now
+from nextspyke.maintenance import (
+    PLACE_STATUS_RAW_FROM,
+    PLACE_STATUS_ROLLED_UNTIL,
+    get_maintenance_state,
+    set_maintenance_state,
+)
+
+TIER_BATCH_ROWS = 50_000
+
+# Where forward-filling place_status for a range has to start: the latest keyframe at or
+# before the range of every domain with snapshots in it, as in place_status_filled.
+PLACE_STATUS_FILL_FROM_SQL = """
+    SELECT COALESCE(MIN(k.fetched_at), %(start)s)
+    FROM (
+        SELECT DISTINCT domain
+        FROM snapshot
+        WHERE fetched_at >= %(start)s AND fetched_at < %(end)s
+    ) d
+    CROSS JOIN LATERAL (
+        SELECT s.fetched_at
+        FROM snapshot s
+        WHERE s.domain = d.domain AND s.place_status_keyframe AND s.fetched_at <= %(start)s
+        ORDER BY s.fetched_at DESC
+        LIMIT 1
+    ) k
+"""
+FILL_SNAPSHOTS_SQL = """
+    SELECT snapshot_id, fetched_at, domain, place_status_keyframe
+    FROM snapshot
+    WHERE fetched_at >= %s AND fetched_at < %s
+    ORDER BY fetched_at, snapshot_id
+"""
+
+
+class TieringError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class ColdTable:
+    name: str
+    # (column, Arrow kind) in select order; fetched_at drives range reads and file order.
+    columns: tuple[tuple[str, str], ...]
+    select: str
+    # Plain columns that range reads may filter on with equality.
+    filter_columns: frozenset[str]
+    # Relation range reads query for rows still in the database; `select` must work on it too.
+    source: str
+
+
+COLD_TABLES = {
+    "bike_status": ColdTable(
+        name="bike_status",
+        columns=(
+            ("fetched_at", "timestamp"),
+            ("snapshot_id", "int64"),
+            ("bike_number", "dictionary"),
+            ("place_uid", "int32"),
+            ("active", "bool_"),
+            ("state", "string"),
+            ("pedelec_battery", "int32"),
+            ("battery_pack_pct", "int32"),
+            ("battery_range_km", "float64"),
+            ("lat", "float64"),
+            ("lon", "float64"),
+        ),
+        select="""
+            fetched_at, snapshot_id, COALESCE(bike_number, bike_number_of(bike_id)), place_uid,
+            active, state, pedelec_battery, battery_pack_pct, battery_range_km, ST_Y(geom),
+            ST_X(geom)
+        """,
+        filter_columns=frozenset({"snapshot_id", "bike_number", "place_uid"}),
+        source="v_bike_status",
+    ),
+    "place_status": ColdTable(
+        name="place_status",
+        columns=(
+            ("fetched_at", "timestamp"),
+            ("snapshot_id", "int64"),
+            ("place_uid", "int32"),
+            ("booked_bikes", "int32"),
+            ("bikes", "int32"),
+            ("bikes_available_to_rent", "int32"),
+            ("bike_racks", "int32"),
+            ("free_racks", "int32"),
+            ("special_racks", "int32"),
+            ("free_special_racks", "int32"),
+            ("bike_types", "string"),
+        ),
+        select="""
+            fetched_at, snapshot_id, place_uid, booked_bikes, bikes, bikes_available_to_rent,
+            bike_racks, free_racks, special_racks, free_special_racks,
+            COALESCE(bike_types, bike_types_json(bike_type_counts))::text
+        """,
+        filter_columns=frozenset({"snapshot_id", "place_uid"}),
+        source="place_status",
+    ),
+}
+
+
+def _digest_value(value: object) -> object:
+    # Timestamps come back from Parquet with a different tzinfo object; compare the instant.
+    return value.timestamp() if isinstance(value, datetime) else value
+
+
+def update_row_digest(digest, rows: Iterable[tuple]) -> int:
+    count = 0
+    for row in rows:
+        digest.update(repr(tuple(_digest_value(value) for value in row)).encode("utf-8"))
+        count += 1
+    return count
+
+
+def read_cold_file(path: Path) -> Iterator[tuple]:
+    _pa, pq = load_pyarrow()
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=TIER_BATCH_ROWS):
+        columns = [column.to_pylist() for column in batch.columns]
+        yield from zip(*columns, strict=True)
+
+
+def verify_cold_file(path: Path, rows: int, checksum: str) -> None:
+    digest = hashlib.sha256()
+    file_rows = update_row_digest(digest, read_cold_file(path))
+    if file_rows != rows:
+        raise TieringError(f"{path} has {file_rows} rows, expected {rows}")
+    if digest.hexdigest() != checksum:
+        raise TieringError(f"{path} checksum does not match the partition")
+
+
+def fsync_file(path: Path) -> None:
+    """Flush a file and the directory entry it was renamed into to disk."""
+    with path.open("rb") as file:
+        os.fsync(file.fileno())
+    if os.name == "nt":
+        # Windows cannot open a directory; NTFS journals the rename itself.
+        return
+    directory = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def tier_partition(
+    conn: psycopg.Connection,
+    table: ColdTable,
+    partition: str,
+    partition_start: datetime,
+    partition_end: datetime,
+    cold_dir: Path,
+    sink_factory: Callable[[Path, tuple], ParquetSink] = ParquetSink,
+    verify: Callable[[Path, int, str], None] = verify_cold_file,
+) -> dict:
+    """Copy one partition to a Parquet file, verify it, record it and drop the partition.
+
+    Everything happens in one repeatable-read transaction: the row count, the copy and the
+    drop see the same rows, and a failed verification leaves the partition untouched.
+    """
+    relative_path = Path(table.name) / f"{partition}.parquet"
+    path = cold_dir / relative_path
+    with conn.transaction():
+        conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT COUNT(*) FROM {partition}").format(
+                    partition=sql.Identifier(partition)
+                )
+            )
+            expected_rows = cur.fetchone()[0]
+
+        digest = hashlib.sha256()
+        rows = 0
+        sink = sink_factory(path, table.columns)
+        try:
+            with conn.cursor(name=f"tier_{partition}") as cur:
+                cur.execute(
+                    sql.SQL("SELECT {select} FROM {partition} ORDER BY fetched_at").format(
+                        select=sql.SQL(table.select),
+                        partition=sql.Identifier(partition),
+                    )
+                )
+                while batch := cur.fetchmany(TIER_BATCH_ROWS):
+                    sink.write(batch)
+                    rows += update_row_digest(digest, batch)
+        except BaseException:
+            sink.abort()
+            raise
+        sink.close()
+        # The partition is dropped once this transaction commits; the file must outlive a crash.
+        fsync_file(path)
+
+        checksum = digest.hexdigest()
+        try:
+            if rows != expected_rows:
+                raise TieringError(f"read {rows} rows from {partition}, expected {expected_rows}")
+            verify(path, rows, checksum)
+        except TieringError:
+            path.unlink(missing_ok=True)
+            raise
+
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO cold_partition (
+                    partition_name, table_name, range_start, range_end, path, row_count, checksum
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (partition_name) DO UPDATE SET
+                    path = EXCLUDED.path,
+                    row_count = EXCLUDED.row_count,
+                    checksum = EXCLUDED.checksum,
+                    created_at = NOW()
+                """,
+                (
+                    partition,
+                    table.name,
+                    partition_start,
+                    partition_end,
+                    relative_path.as_posix(),
+                    rows,
+                    checksum,
+                ),
+            )
+            if table.name == "place_status":
+                # place_status_series only reads raw rows from this point on.
+                set_maintenance_state(cur, PLACE_STATUS_RAW_FROM, partition_end)
+            drop_partition(cur, table.name, partition)
+    return {"partition": partition, "rows": rows, "path": relative_path.as_posix()}
+
+
+def tier_cold_partitions(conn: psycopg.Connection, config: AppConfig) -> list[dict]:
+    """Tier every bike_status/place_status partition older than COLD_TIER_AFTER_DAYS."""
+    if config.cold_tier_after_days <= 0:
+        return []
+    cutoff = utc_now() - timedelta(days=config.cold_tier_after_days)
+    with conn.cursor() as cur:
+        # Raw place_status may only go once its rollups exist.
+        rolled_until = get_maintenance_state(cur, PLACE_STATUS_ROLLED_UNTIL)
+        candidates = []
+        for table in COLD_TABLES.values():
+            limit = cutoff
+            if table.name == "place_status":
+                limit = min(cutoff, rolled_until) if rolled_until else None
+            for partition, start, end in list_month_partitions(cur, table.name):
+                if limit is not None and end <= limit:
+                    candidates.append((table, partition, start, end))
+    conn.commit()
+
+    cold_dir = Path(config.cold_storage_dir)
+    return [
+        tier_partition(conn, table, partition, start, end, cold_dir)
+        for table, partition, start, end in candidates
+    ]
+
+
+class HistoryReader:
+    """Range reads over bike_status/place_status that span live partitions and cold files.
+
+    Rows come back as dicts ordered by fetched_at; cold files are always older than the
+    partitions still in the database, so they are read first. place_status comes back with
+    one row per snapshot and station, like place_status_filled, also for snapshots that only
+    wrote the stations that changed.
+    """
+
+    def __init__(
+        self,
+        conn: psycopg.Connection,
+        cold_dir: Path | str,
+        read_file: Callable[[Path, ColdTable, datetime, datetime, dict], Iterator[dict]]
+        | None = None,
+    ) -> None:
+        self.conn = conn
+        self.cold_dir = Path(cold_dir)
+        self.read_file = read_file or read_cold_range
+
+    def rows(
+        self, table_name: str, start: datetime, end: datetime, **equals: object
+    ) -> Iterator[dict]:
+        table = COLD_TABLES[table_name]
+        unknown = set(equals) - table.filter_columns
+        if unknown:
+            raise ValueError(f"cannot filter {table_name} on {', '.join(sorted(unknown))}")
+        if table.name == "place_status":
+            return self._filled_place_status(table, start, end, equals)
+        return self._written_rows(table, start, end, equals)
+
+    def _filled_place_status(
+        self, table: ColdTable, start: datetime, end: datetime, equals: dict
+    ) -> Iterator[dict]:
+        # A station's row may have been written at the keyframe before the range, and a
+        # snapshot_id filter only applies once the rows are carried forward.
+        equals = dict(equals)
+        snapshot_id = equals.pop("snapshot_id", None)
+        with self.conn.cursor() as cur:
+            cur.execute(PLACE_STATUS_FILL_FROM_SQL, {"start": start, "end": end})
+            fill_from = cur.fetchone()[0]
+            cur.execute(FILL_SNAPSHOTS_SQL, (fill_from, end))
+            snapshots = cur.fetchall()
+        written = self._written_rows(table, fill_from, end, equals)
+        for row in fill_place_status(snapshots, written, start):
+            if snapshot_id is None or row["snapshot_id"] == snapshot_id:
+                yield row
+
+    def _written_rows(
+        self, table: ColdTable, start: datetime, end: datetime, equals: dict
+    ) -> Iterator[dict]:
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT path
+                FROM cold_partition
+                WHERE table_name = %s AND range_end > %s AND range_start < %s
+                ORDER BY range_start
+                """,
+                (table.name, start, end),
+            )
+            cold_paths = [row[0] for row in cur.fetchall()]
+        for cold_path in cold_paths:
+            yield from self.read_file(self.cold_dir / cold_path, table, start, end, equals)
+
+        filters = sql.SQL("").join(
+            sql.SQL(" AND {} = %s").format(sql.Identifier(column)) for column in equals
+        )
+        query = sql.SQL(
+            "SELECT {select} FROM {table} WHERE fetched_at >= %s AND fetched_at < %s{filters} "
+            "ORDER BY fetched_at"
+        ).format(
+            select=sql.SQL(table.select),
+            table=sql.Identifier(table.source),
+            filters=filters,
+        )
+        names = [name for name, _kind in table.columns]
+        with self.conn.cursor(name="history_reader") as cur:
+            cur.itersize = TIER_BATCH_ROWS
+            cur.execute(query, (start, end, *equals.values()))
+            for row in cur:
+                yield dict(zip(names, row, strict=True))
+
+
+def fill_place_status(
+    snapshots: Iterable[tuple], written: Iterable[dict], start: datetime
+) -> Iterator[dict]:
+    """Carry place_status rows forward to every snapshot, like place_status_filled.
+
+    `snapshots` are (snapshot_id, fetched_at, domain, keyframe) in time order, `written` the
+    stored rows in time order from the same point on. A station keeps its last written row
+    until it is written again or its domain's next keyframe starts over. Only snapshots from
+    `start` on produce rows, ordered by place_uid within a snapshot.
+    """
+    written = iter(written)
+    pending = next(written, None)
+    by_snapshot: dict[int, list[dict]] = {}
+    current: dict[str, dict[int, dict]] = {}
+    for snapshot_id, fetched_at, domain, keyframe in snapshots:
+        while pending is not None and pending["fetched_at"] <= fetched_at:
+            by_snapshot.setdefault(pending["snapshot_id"], []).append(pending)
+            pending = next(written, None)
+        if keyframe or domain not in current:
+            current[domain] = {}
+        places = current[domain]
+        for row in by_snapshot.pop(snapshot_id, ()):
+            places[row["place_uid"]] = row
+        if fetched_at < start:
+            continue
+        for place_uid in sorted(places):
+            yield {**places[place_uid], "snapshot_id": snapshot_id, "fetched_at": fetched_at}
+
+
+def read_cold_range(
+    path: Path, table: ColdTable, start: datetime, end: datetime, equals: dict
+) -> Iterator[dict]:
+    _pa, pq = load_pyarrow()
+    import pyarrow.dataset as ds
+
+    filters = [("fetched_at", ">=", start), ("fetched_at", "<", end)]
+    filters.extend((column, "=", value) for column, value in equals.items())
+    # Scan batch by batch so a month of matches never sits in memory as one table; the
+    # filter still prunes row groups by their statistics before anything is decoded.
+    batches = ds.dataset(path, format="parquet").to_batches(
+        filter=pq.filters_to_expression(filters), batch_size=TIER_BATCH_ROWS
+    )
+    for batch in batches:
+        yield from batch.to_pylist()
@@ -114,6 +114,15 @@ class TestApp(unittest.TestCase):
         with EnvGuard(DATABASE_URL="postgresql://u:p@h:5432/db"):
             self.assertEqual(db.build_dsn(), "postgresql://u:p@h:5432/db")
 
+    def test_build_query_dsn_prefers_replica_url(self):
+        with EnvGuard(
+            DATABASE_URL="postgresql://u:p@primary:5432/db",
+            QUERY_DATABASE_URL="postgresql://u:p@replica:5432/db",
+        ):
+            self.assertEqual(db.build_query_dsn(), "postgresql://u:p@replica:5432/db")
+        with EnvGuard(DATABASE_URL="postgresql://u:p@primary:5432/db", QUERY_DATABASE_URL=None):
+            self.assertEqual(db.build_query_dsn(), "postgresql://u:p@primary:5432/db")
+
     def test_build_dsn_parts(self):
         with EnvGuard(
             DATABASE_URL=None,
@@ -137,6 +146,11 @@ class TestApp(unittest.TestCase):
         self.assertEqual(loaded.refresh_mv_timeout, 12)
         self.assertEqual(loaded.movement_min_distance_m, 60)
 
+    def test_load_config_place_status_retention_is_not_negative(self):
+        with EnvGuard(PLACE_STATUS_RAW_RETENTION_DAYS="-5"):
+            loaded = config.load_config()
+        self.assertEqual(loaded.place_status_raw_retention_days, 0)
+
     def test_fetch_json(self):
         payload = {"ok": True, "value": 3}
         response = DummyResponse(json.dumps(payload).encode("utf-8"))
@@ -167,11 +181,10 @@ class TestApp(unittest.TestCase):
             ]
         }
 
-        def fake_fetch_json(url, params=None):
-            if url == ingest.LIVE_BASE_URL:
-                self.assertEqual(params, {"domains": "fg"})
-                return live_payload
-            raise RuntimeError("optional endpoint failed")
+        def fake_fetch_feed(url, params=None):
+            self.assertEqual(url, ingest.LIVE_BASE_URL)
+            self.assertEqual(params, {"domains": "fg"})
+            return json.dumps(live_payload), None
 
         patched_helpers = (
             "ensure_partitions",
@@ -188,20 +201,33 @@ class TestApp(unittest.TestCase):
         with ExitStack() as stack:
             for helper in patched_helpers:
                 stack.enter_context(patch(f"nextspyke.ingest.{helper}"))
-            stack.enter_context(patch("nextspyke.ingest.fetch_json", side_effect=fake_fetch_json))
+            stack.enter_context(patch("nextspyke.ingest.fetch_feed", side_effect=fake_fetch_feed))
+            stack.enter_context(
+                patch(
+                    "nextspyke.ingest.fetch_json",
+                    side_effect=RuntimeError("optional endpoint failed"),
+                )
+            )
+            stack.enter_context(patch.dict(ingest._last_fetched_at, clear=True))
+            latest_snapshot_at = stack.enter_context(
+                patch("nextspyke.ingest.latest_snapshot_at", return_value=None)
+            )
             stack.enter_context(patch("nextspyke.ingest.record_snapshot_gap", return_value=None))
             stack.enter_context(patch("nextspyke.ingest.insert_snapshot", return_value=42))
             stack.enter_context(patch("nextspyke.ingest.insert_bike_movements", return_value=0))
             log_event = stack.enter_context(patch("nextspyke.ingest.log_event"))
 
             result = ingest.ingest_once(DummyConn(), sample_config())
+            # The last snapshot time is read once, then kept in memory.
+            ingest.ingest_once(DummyConn(), sample_config())
+            latest_snapshot_at.assert_called_once()
 
         self.assertEqual(result["snapshot_id"], 42)
         self.assertEqual(result["cities"], 1)
         self.assertEqual(result["places"], 0)
         self.assertEqual(result["bikes"], 0)
         self.assertEqual(result["movements"], 0)
-        self.assertEqual(log_event.call_count, 2)
+        self.assertEqual(log_event.call_count, 4)
         for call in log_event.call_args_list:
             self.assertEqual(call.kwargs["event"], "optional_ingest_failed")
 
@@ -231,6 +257,58 @@ class TestApp(unittest.TestCase):
         self.assertEqual(params, (12.5,))
         self.assertEqual(count, 3)
 
+    def test_route_stats_upsert_accumulates_snapshot_movements(self):
+        cur = Mock()
+        fetched_at = datetime.now(timezone.utc)
+
+        ingest.upsert_route_stats(cur, 42, fetched_at)
+
+        query, params = cur.execute.call_args.args
+        self.assertIn("date_trunc('hour', end_fetched_at, 'UTC')", query)
+        self.assertIn("movements = route_stats.movements + EXCLUDED.movements", query)
+        self.assertEqual(params, (42, fetched_at))
+
+    def test_route_stats_backfill_replaces_window(self):
+        cur = Mock()
+        cur.rowcount = 5
+        start = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        end = datetime(2026, 6, 2, tzinfo=timezone.utc)
+
+        count = ingest.backfill_route_stats(cur, start, end)
+
+        delete_call, insert_call = cur.execute.call_args_list
+        self.assertIn("DELETE FROM route_stats", delete_call.args[0])
+        self.assertEqual(delete_call.args[1], (start, end))
+        self.assertIn("GROUP BY 1, 2, 3", insert_call.args[0])
+        self.assertEqual(insert_call.args[1], (start, end))
+        self.assertEqual(count, 5)
+
+    def test_append_bike_trajectories_extends_day_rows(self):
+        cur = Mock()
+        fetched_at = datetime.now(timezone.utc)
+
+        ingest.append_bike_trajectories(cur, 42, fetched_at)
+
+        query, params = cur.execute.call_args.args
+        self.assertIn("ON CONFLICT (bike_number, day) DO UPDATE", query)
+        self.assertIn("ST_AddPoint(bike_trajectory.path, ST_EndPoint(EXCLUDED.path))", query)
+        self.assertEqual(params, (42, fetched_at))
+
+    def test_trajectory_backfill_replaces_days(self):
+        cur = Mock()
+        cur.rowcount = 2
+        start = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        end = datetime(2026, 6, 2, tzinfo=timezone.utc)
+
+        count = ingest.backfill_bike_trajectories(cur, start, end)
+
+        delete_call, insert_call = cur.execute.call_args_list
+        self.assertIn("DELETE FROM bike_trajectory", delete_call.args[0])
+        self.assertEqual(delete_call.args[1], (start, end))
+        self.assertIn("array_agg(end_geom ORDER BY end_fetched_at)", insert_call.args[0])
+        self.assertEqual(insert_call.args[1], (start, end))
+        self.assertEqual(count, 2)
+
     def test_update_bike_last_status_is_monotonic(self):
         cur = Mock()
         fetched_at = datetime.now(timezone.utc)
@@ -238,10 +316,29 @@ class TestApp(unittest.TestCase):
         ingest.update_bike_last_status(cur, 42, fetched_at)
 
         query, params = cur.execute.call_args.args
-        self.assertIn("ON CONFLICT (bike_number) DO UPDATE", query)
+        self.assertIn("ON CONFLICT (bike_id) DO UPDATE", query)
         self.assertIn("bike_last_status.fetched_at < EXCLUDED.fetched_at", query)
+        self.assertIn("bike_last_status.dwell_started_at", query)
         self.assertEqual(params, (42, fetched_at))
 
+    def test_close_bike_dwells_records_completed_stays(self):
+        cur = Mock()
+        cur.fetchone.return_value = (3,)
+        fetched_at = datetime.now(timezone.utc)
+
+        closed = ingest.close_bike_dwells(cur, 42, fetched_at)
+
+        query, params = cur.execute.call_args.args
+        self.assertIn("INSERT INTO bike_dwell", query)
+        self.assertIn("bls.dwell_started_at IS NOT NULL", query)
+        self.assertIn("INSERT INTO place_dwell_histogram", query)
+        self.assertEqual(params[:2], (42, fetched_at))
+        self.assertEqual(params[2], list(ingest.DWELL_HISTOGRAM_BOUNDS_S))
+        self.assertEqual(closed, 3)
+
+        cur.fetchone.return_value = None
+        self.assertEqual(ingest.close_bike_dwells(cur, 43, fetched_at), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
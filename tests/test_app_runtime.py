@@ -1,13 +1,19 @@
 import sys
+import tempfile
 import unittest
+from dataclasses import replace
+from datetime import timedelta
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import ANY, Mock, patch
+
+import psycopg
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
 from nextspyke import app
 from nextspyke.config import AppConfig
+from nextspyke.ingest import FetchedFeed
 
 
 def sample_config() -> AppConfig:
@@ -49,6 +55,7 @@ class TestAppRuntime(unittest.TestCase):
     def setUp(self):
         app._shutdown_requested = False
         app._shutdown_reason = "signal"
+        self.enterContext(patch("nextspyke.app.require_bike_id_keys"))
 
     def test_main_run_once_success(self):
         dummy_conn = DummyConn()
@@ -59,6 +66,7 @@ class TestAppRuntime(unittest.TestCase):
             "places": 2,
             "bikes": 3,
             "movements": 4,
+            "stages": {},
         }
         with patch.object(sys, "argv", ["app"]):
             with patch("nextspyke.app.env_bool", return_value=True):
@@ -91,6 +99,50 @@ class TestAppRuntime(unittest.TestCase):
         self.assertTrue(dummy_conn.closed)
         self.assertTrue(mark_shutdown.called)
 
+    def test_main_passes_iterations_to_profiler_and_query_stats(self):
+        dummy_conn = DummyConn()
+        ingest_result = {
+            "snapshot_id": 5,
+            "fetched_at": app.utc_now(),
+            "cities": 1,
+            "places": 2,
+            "bikes": 3,
+            "movements": 4,
+            "stages": {},
+        }
+        # Platforms without SIGUSR1 only lose the on-demand trigger.
+        signal_module = Mock(spec=["signal", "SIGINT", "SIGTERM"])
+        with patch.object(sys, "argv", ["app"]):
+            with patch("nextspyke.app.env_bool", return_value=True):
+                with patch("nextspyke.app.load_config", return_value=sample_config()):
+                    with patch("nextspyke.app._connect_and_init_db", return_value=dummy_conn):
+                        with patch(
+                            "nextspyke.app.ingest_once", return_value=ingest_result
+                        ) as ingest_once:
+                            with patch("nextspyke.app.log_event"):
+                                with patch("nextspyke.app.init_metrics"):
+                                    with patch("nextspyke.app.start_metrics_server"):
+                                        with patch("nextspyke.app.signal", signal_module):
+                                            with patch(
+                                                "nextspyke.app.IterationProfiler"
+                                            ) as profiler_cls:
+                                                with patch(
+                                                    "nextspyke.app.QueryStatsSampler"
+                                                ) as sampler_cls:
+                                                    with patch(
+                                                        "nextspyke.app.flush_logs"
+                                                    ) as flush_logs:
+                                                        app.main()
+        profiler = profiler_cls.return_value
+        self.assertEqual(signal_module.signal.call_count, 2)
+        profiler.start.assert_called_once_with()
+        profiler.finish.assert_called_once_with(profiler.start.return_value, ANY, 5)
+        sampler = sampler_cls.return_value
+        sampler.start.assert_called_once_with()
+        self.assertIs(ingest_once.call_args.kwargs["explain_plans"], sampler.start.return_value)
+        sampler.finish.assert_called_once_with(dummy_conn)
+        flush_logs.assert_called_once_with()
+
     def test_main_run_once_failure(self):
         dummy_conn = DummyConn()
         with patch.object(sys, "argv", ["app"]):
@@ -130,6 +182,7 @@ class TestAppRuntime(unittest.TestCase):
             "places": 2,
             "bikes": 3,
             "movements": 4,
+            "stages": {},
         }
         sleep_calls = 0
 
@@ -169,6 +222,234 @@ class TestAppRuntime(unittest.TestCase):
         mark_success.assert_called_once()
         self.assertTrue(dummy_conn.closed)
 
+    def run_main_with_leadership(self, leadership, run_once, sleeps_before_stop=2):
+        sleep_calls = 0
+
+        def stop_after_sleeps(_seconds):
+            nonlocal sleep_calls
+            sleep_calls += 1
+            if sleep_calls == sleeps_before_stop:
+                app._shutdown_requested = True
+
+        ingest_result = {
+            "snapshot_id": 3,
+            "fetched_at": app.utc_now(),
+            "cities": 1,
+            "places": 2,
+            "bikes": 3,
+            "movements": 4,
+            "stages": {},
+        }
+        self.enterContext(patch.object(sys, "argv", ["app"]))
+        self.enterContext(patch("nextspyke.app.env_bool", return_value=run_once))
+        self.enterContext(patch("nextspyke.app.load_config", return_value=sample_config()))
+        self.enterContext(patch("nextspyke.app.psycopg.connect", return_value=DummyConn()))
+        self.enterContext(patch("nextspyke.app.init_db"))
+        self.enterContext(patch("nextspyke.app.log_event"))
+        self.enterContext(patch("nextspyke.app.init_metrics"))
+        self.enterContext(patch("nextspyke.app.start_metrics_server"))
+        self.enterContext(patch("nextspyke.app.mark_iteration_success"))
+        self.enterContext(patch("nextspyke.app.mark_shutdown"))
+        self.enterContext(patch("nextspyke.app.time.sleep", side_effect=stop_after_sleeps))
+        leader = self.enterContext(patch("nextspyke.app.LeaderElection")).return_value
+        leader.ensure.side_effect = leadership
+        ingest_once = self.enterContext(
+            patch("nextspyke.app.ingest_once", return_value=ingest_result)
+        )
+        app.main()
+        return ingest_once, leader
+
+    def test_main_standby_waits_and_ingests_after_takeover(self):
+        ingest_once, leader = self.run_main_with_leadership([False, True], run_once=False)
+        self.assertEqual(leader.ensure.call_count, 2)
+        ingest_once.assert_called_once()
+
+    def test_main_run_once_on_standby_does_not_ingest(self):
+        ingest_once, leader = self.run_main_with_leadership([False], run_once=True)
+        leader.ensure.assert_called_once()
+        ingest_once.assert_not_called()
+
+    def run_main_with_spool(self, ingest_effects, leadership=(True, True), sleeps_before_stop=2):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        config = replace(sample_config(), spool_dir=directory, spool_max_mb=1)
+        fetched_at = app.utc_now()
+        payload = '{"countries": [{"domain": "fg", "cities": []}]}'
+        feeds = [
+            FetchedFeed(fetched_at + timedelta(minutes=minute), payload) for minute in range(3)
+        ]
+        sleep_calls = 0
+
+        def stop_after_sleeps(_seconds):
+            nonlocal sleep_calls
+            sleep_calls += 1
+            if sleep_calls == sleeps_before_stop:
+                app._shutdown_requested = True
+
+        self.enterContext(patch.object(sys, "argv", ["app"]))
+        self.enterContext(patch("nextspyke.app.env_bool", return_value=False))
+        self.enterContext(patch("nextspyke.app.load_config", return_value=config))
+        self.enterContext(
+            patch("nextspyke.app.psycopg.connect", side_effect=lambda *_a, **_k: DummyConn())
+        )
+        self.enterContext(patch("nextspyke.app.init_db"))
+        self.enterContext(patch("nextspyke.app.init_metrics"))
+        self.enterContext(patch("nextspyke.app.start_metrics_server"))
+        self.enterContext(patch("nextspyke.app.mark_iteration_success"))
+        self.enterContext(patch("nextspyke.app.mark_iteration_failure"))
+        self.enterContext(patch("nextspyke.app.mark_shutdown"))
+        self.enterContext(patch("nextspyke.app.time.sleep", side_effect=stop_after_sleeps))
+        self.enterContext(patch("nextspyke.app.fetch_live_feed", side_effect=feeds))
+        leader = self.enterContext(patch("nextspyke.app.LeaderElection")).return_value
+        leader.may_ingest = True
+        leader.ensure.side_effect = leadership
+        log_event = self.enterContext(patch("nextspyke.app.log_event"))
+        ingest_once = self.enterContext(
+            patch("nextspyke.app.ingest_once", side_effect=ingest_effects)
+        )
+        backlog = self.enterContext(patch("nextspyke.spool.ingest_backlog"))
+        app.main()
+        events = [call.kwargs.get("event") for call in log_event.call_args_list]
+        return feeds, ingest_once, backlog, events
+
+    def test_main_spools_feed_while_database_is_down_and_drains_it(self):
+        ingest_result = {
+            "snapshot_id": 5,
+            "fetched_at": app.utc_now(),
+            "cities": 1,
+            "places": 2,
+            "bikes": 3,
+            "movements": 4,
+            "stages": {},
+        }
+        feeds, ingest_once, backlog, events = self.run_main_with_spool(
+            [psycopg.OperationalError("db down"), ingest_result]
+        )
+        self.assertIn("feed_spooled", events)
+        self.assertIn("spool_drained", events)
+        self.assertIs(ingest_once.call_args_list[0].args[2], feeds[0])
+        self.assertIs(ingest_once.call_args_list[1].args[2], feeds[1])
+        self.assertEqual(backlog.call_args.args[2][0][0], feeds[0].fetched_at)
+
+    def test_main_does_not_spool_other_failures(self):
+        _feeds, _ingest_once, backlog, events = self.run_main_with_spool(
+            [RuntimeError("bad feed"), RuntimeError("bad feed")]
+        )
+        self.assertNotIn("feed_spooled", events)
+        backlog.assert_not_called()
+
+    def test_main_discards_spool_on_standby(self):
+        _feeds, ingest_once, backlog, events = self.run_main_with_spool(
+            [psycopg.OperationalError("db down")], leadership=[True, False]
+        )
+        self.assertIn("spool_discarded", events)
+        ingest_once.assert_called_once()
+        backlog.assert_not_called()
+
+    def run_main_with_batch(self, ingest_effects, sleeps_before_stop, **overrides):
+        config = replace(sample_config(), batch_snapshots=2, **overrides)
+        fetched_at = app.utc_now()
+        payload = '{"countries": [{"domain": "fg", "cities": []}]}'
+        feeds = [
+            FetchedFeed(fetched_at + timedelta(seconds=second), payload) for second in range(4)
+        ]
+        sleep_calls = 0
+
+        def stop_after_sleeps(_seconds):
+            nonlocal sleep_calls
+            sleep_calls += 1
+            if sleep_calls == sleeps_before_stop:
+                app._shutdown_requested = True
+
+        self.enterContext(patch.object(sys, "argv", ["app"]))
+        self.enterContext(patch("nextspyke.app.env_bool", return_value=False))
+        self.enterContext(patch("nextspyke.app.load_config", return_value=config))
+        self.enterContext(
+            patch("nextspyke.app.psycopg.connect", side_effect=lambda *_a, **_k: DummyConn())
+        )
+        self.enterContext(patch("nextspyke.app.init_db"))
+        self.enterContext(patch("nextspyke.app.init_metrics"))
+        self.enterContext(patch("nextspyke.app.start_metrics_server"))
+        self.enterContext(patch("nextspyke.app.mark_iteration_success"))
+        self.enterContext(patch("nextspyke.app.mark_iteration_failure"))
+        self.enterContext(patch("nextspyke.app.mark_shutdown"))
+        self.enterContext(patch("nextspyke.app.time.sleep", side_effect=stop_after_sleeps))
+        self.enterContext(patch("nextspyke.app.fetch_live_feed", side_effect=feeds))
+        self.enterContext(patch("nextspyke.app.LeaderElection")).return_value.may_ingest = True
+        log_event = self.enterContext(patch("nextspyke.app.log_event"))
+        ingest_once = self.enterContext(patch("nextspyke.app.ingest_once"))
+        ingest_batch = self.enterContext(
+            patch("nextspyke.app.ingest_batch", side_effect=ingest_effects)
+        )
+        app.main()
+        ingest_once.assert_not_called()
+        events = [call.kwargs.get("event") for call in log_event.call_args_list]
+        return feeds, ingest_batch, events
+
+    def batch_result(self, snapshots: int) -> dict:
+        return {
+            "snapshot_id": 5,
+            "fetched_at": app.utc_now(),
+            "snapshots": snapshots,
+            "cities": 1,
+            "places": 2,
+            "bikes": 3,
+            "movements": 4,
+            "stages": {},
+        }
+
+    def test_main_stores_buffered_polls_together(self):
+        feeds, ingest_batch, events = self.run_main_with_batch([self.batch_result(2)], 2)
+        ingest_batch.assert_called_once()
+        batched = [feed for feed, _live_data in ingest_batch.call_args.args[2]]
+        self.assertEqual(batched, feeds[:2])
+        self.assertEqual(events.count("ingest_success"), 1)
+        self.assertNotIn("batch_flushed", events)
+
+    def test_main_flushes_partial_batch_on_shutdown(self):
+        feeds, ingest_batch, events = self.run_main_with_batch([self.batch_result(1)], 1)
+        batched = [feed for feed, _live_data in ingest_batch.call_args.args[2]]
+        self.assertEqual(batched, feeds[:1])
+        self.assertIn("batch_flushed", events)
+
+    def test_main_spools_batch_that_cannot_be_flushed(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        _feeds, _ingest_batch, events = self.run_main_with_batch(
+            [psycopg.OperationalError("db down")], 1, spool_dir=directory, spool_max_mb=1
+        )
+        self.assertIn("batch_flush_failed", events)
+        self.assertIn("feed_spooled", events)
+
+    def test_main_drops_due_batch_on_other_failures(self):
+        _feeds, _ingest_batch, events = self.run_main_with_batch([RuntimeError("bad")], 2)
+        self.assertIn("ingest_failed", events)
+        self.assertIn("snapshots_dropped", events)
+        self.assertNotIn("batch_flushed", events)
+
+    def test_main_runs_maintenance_scheduler_next_to_ingest(self):
+        scheduler_cls = self.enterContext(patch("nextspyke.app.MaintenanceScheduler"))
+        scheduler = scheduler_cls.return_value
+        scheduler.running = True
+        _feeds, ingest_batch, _events = self.run_main_with_batch([self.batch_result(2)], 2)
+        scheduler.start.assert_called_once_with()
+        scheduler.stop.assert_called_once_with()
+        scheduler.ingesting.assert_called_once_with()
+        self.assertFalse(ingest_batch.call_args.kwargs["refresh_metadata"])
+        self.assertTrue(scheduler_cls.call_args.kwargs["may_run"]())
+
+    def test_shutdown_flush_reconnects_closed_connection(self):
+        batch = app.SnapshotBuffer(5, 60)
+        batch.add(FetchedFeed(app.utc_now(), '{"countries": [{"domain": "fg", "cities": []}]}'))
+        fresh = DummyConn()
+        self.enterContext(patch("nextspyke.app.log_event"))
+        with (
+            patch("nextspyke.app._connect_and_init_db", return_value=fresh),
+            patch("nextspyke.app.ingest_batch", return_value=self.batch_result(1)) as ingest_batch,
+        ):
+            conn = app._flush_batch_on_shutdown(None, sample_config(), batch, Mock())
+        self.assertIs(conn, fresh)
+        self.assertIs(ingest_batch.call_args.args[0], fresh)
+        self.assertEqual(len(batch), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
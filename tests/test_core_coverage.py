@@ -3,17 +3,18 @@ import runpy
 import signal
 import sys
 import unittest
+from dataclasses import replace
 from datetime import datetime, timedelta, timezone
 from io import StringIO
 from pathlib import Path
-from unittest.mock import ANY, Mock, patch
+from unittest.mock import ANY, DEFAULT, Mock, patch
 
 import psycopg
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
-from nextspyke import app, config, db, health, ingest, metrics
+from nextspyke import app, config, db, health, ingest, maintenance, metrics
 from nextspyke import logging as app_logging
 from nextspyke.config import AppConfig
 
@@ -188,7 +189,10 @@ class TestDbCoverage(unittest.TestCase):
         )
         self.assertIn("ST_SnapToGrid", panels[14]["targets"][0]["rawSql"])
         self.assertEqual(panels[15]["gridPos"]["w"], 24)
-        self.assertIn("distance_m >= 60", panels[15]["targets"][0]["rawSql"])
+        for target in panels[15]["targets"]:
+            self.assertIn("bike_path(${bike_number:sqlstring}", target["rawSql"])
+        self.assertIn("${bike_number:sqlstring}", panels[16]["targets"][0]["rawSql"])
+        self.assertIn("distance_m >= 60", panels[16]["targets"][0]["rawSql"])
 
         datasource_config = Path(
             "observability/grafana/provisioning/datasources/datasource.yml"
@@ -220,7 +224,10 @@ class TestDbCoverage(unittest.TestCase):
         conn.cursor.return_value = cursor_ctx
         with patch("nextspyke.db.load_schema_sql", return_value="select 1;"):
             db.init_db(conn)
-        cursor.execute.assert_called_once_with("select 1;")
+        self.assertEqual(
+            [call.args[0] for call in cursor.execute.call_args_list],
+            [db.INIT_DB_LOCK_SQL, "select 1;"],
+        )
         conn.commit.assert_called_once_with()
 
     def test_month_bounds_handles_both_month_paths(self):
@@ -229,6 +236,13 @@ class TestDbCoverage(unittest.TestCase):
         start_dec, end_dec = db.month_bounds(datetime(2026, 12, 15, tzinfo=timezone.utc))
         self.assertEqual((start_dec.year, end_dec.year, end_dec.month), (2026, 2027, 1))
 
+    def test_hour_floor_uses_utc_hours(self):
+        kolkata = timezone(timedelta(hours=5, minutes=30))
+        self.assertEqual(
+            db.hour_floor(datetime(2026, 6, 15, 12, 10, tzinfo=kolkata)),
+            datetime(2026, 6, 15, 6, 0, tzinfo=timezone.utc),
+        )
+
     def test_ensure_month_partition_executes_sql(self):
         cur = Mock()
         db.ensure_month_partition(cur, "snapshot", datetime(2026, 6, 15, tzinfo=timezone.utc))
@@ -240,6 +254,392 @@ class TestDbCoverage(unittest.TestCase):
             db.ensure_partitions(cur, datetime(2026, 6, 15, tzinfo=timezone.utc))
         self.assertEqual(ensure_month_partition.call_count, 4)
 
+    def test_list_month_partitions_sorts_and_skips_non_monthly(self):
+        cur = Mock()
+        cur.fetchall.return_value = [
+            ("place_status_202607",),
+            ("place_status_default",),
+            ("place_status_202512",),
+        ]
+        partitions = db.list_month_partitions(cur, "place_status")
+        self.assertEqual(
+            partitions,
+            [
+                (
+                    "place_status_202512",
+                    datetime(2025, 12, 1, tzinfo=timezone.utc),
+                    datetime(2026, 1, 1, tzinfo=timezone.utc),
+                ),
+                (
+                    "place_status_202607",
+                    datetime(2026, 7, 1, tzinfo=timezone.utc),
+                    datetime(2026, 8, 1, tzinfo=timezone.utc),
+                ),
+            ],
+        )
+        self.assertEqual(cur.execute.call_args.args[1], ("place_status",))
+
+    def test_drop_partition_detaches_before_drop(self):
+        cur = Mock()
+        db.drop_partition(cur, "place_status", "place_status_202512")
+        self.assertEqual(cur.execute.call_count, 2)
+
+
+class TestMaintenanceCoverage(unittest.TestCase):
+    def test_maintenance_state_roundtrip(self):
+        cur = Mock()
+        value = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        cur.fetchone.return_value = (value,)
+        self.assertEqual(maintenance.get_maintenance_state(cur, "x"), value)
+        cur.fetchone.return_value = None
+        self.assertIsNone(maintenance.get_maintenance_state(cur, "x"))
+        maintenance.set_maintenance_state(cur, "x", value)
+        self.assertIn("ON CONFLICT (name)", cur.execute.call_args.args[0])
+        self.assertEqual(cur.execute.call_args.args[1], ("x", value))
+
+    def test_rollup_place_status_bins_window(self):
+        cur = Mock()
+        cur.rowcount = 7
+        start = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        end = datetime(2026, 6, 2, tzinfo=timezone.utc)
+        rows = maintenance.rollup_place_status(
+            cur, "place_status_5m", timedelta(minutes=5), start, end
+        )
+        self.assertEqual(rows, 7)
+        self.assertEqual(cur.execute.call_args.args[1], (timedelta(minutes=5), start, end))
+        cur.rowcount = -1
+        self.assertEqual(
+            maintenance.rollup_place_status(cur, "place_status_1h", timedelta(hours=1), start, end),
+            -1,
+        )
+
+    def test_run_place_status_maintenance_starts_at_first_snapshot(self):
+        cur = Mock()
+        cur.fetchone.side_effect = [None, (datetime(2026, 6, 1, 22, 40, tzinfo=timezone.utc),)]
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        now = datetime(2026, 6, 3, 10, 30, tzinfo=timezone.utc)
+        with patch("nextspyke.maintenance.utc_now", return_value=now):
+            with patch("nextspyke.maintenance.rollup_place_status", return_value=3) as rollup:
+                with patch("nextspyke.maintenance.set_maintenance_state") as set_state:
+                    with patch("nextspyke.maintenance.list_month_partitions") as partitions:
+                        result = maintenance.run_place_status_maintenance(conn, sample_config())
+        self.assertEqual(rollup.call_count, 4)
+        self.assertEqual(
+            rollup.call_args_list[0].args[1:],
+            (
+                "place_status_5m",
+                timedelta(minutes=5),
+                datetime(2026, 6, 1, 22, tzinfo=timezone.utc),
+                datetime(2026, 6, 2, 22, tzinfo=timezone.utc),
+            ),
+        )
+        self.assertEqual(
+            set_state.call_args.args[1:],
+            ("place_status_rolled_until", datetime(2026, 6, 3, 10, tzinfo=timezone.utc)),
+        )
+        partitions.assert_not_called()
+        self.assertEqual(result["rolled_rows"], 12)
+        self.assertEqual(result["rolled_until"], datetime(2026, 6, 3, 10, tzinfo=timezone.utc))
+        self.assertEqual(result["dropped_partitions"], [])
+
+    def test_run_place_status_maintenance_without_snapshots(self):
+        cur = Mock()
+        cur.fetchone.side_effect = [None, (None,)]
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        cfg = replace(sample_config(), place_status_raw_retention_days=30)
+        with patch("nextspyke.maintenance.rollup_place_status") as rollup:
+            with patch("nextspyke.maintenance.list_month_partitions") as partitions:
+                result = maintenance.run_place_status_maintenance(conn, cfg)
+        rollup.assert_not_called()
+        partitions.assert_not_called()
+        self.assertIsNone(result["rolled_until"])
+
+    def test_run_place_status_maintenance_drops_rolled_up_partitions(self):
+        rolled_until = datetime(2026, 6, 3, 10, tzinfo=timezone.utc)
+        cur = Mock()
+        cur.fetchone.return_value = (rolled_until,)
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        cfg = replace(sample_config(), place_status_raw_retention_days=30)
+        partitions = [
+            (
+                "place_status_202603",
+                datetime(2026, 3, 1, tzinfo=timezone.utc),
+                datetime(2026, 4, 1, tzinfo=timezone.utc),
+            ),
+            (
+                "place_status_202604",
+                datetime(2026, 4, 1, tzinfo=timezone.utc),
+                datetime(2026, 5, 1, tzinfo=timezone.utc),
+            ),
+            (
+                "place_status_202605",
+                datetime(2026, 5, 1, tzinfo=timezone.utc),
+                datetime(2026, 6, 1, tzinfo=timezone.utc),
+            ),
+        ]
+        with patch(
+            "nextspyke.maintenance.utc_now",
+            return_value=datetime(2026, 6, 3, 10, 30, tzinfo=timezone.utc),
+        ):
+            with patch("nextspyke.maintenance.rollup_place_status") as rollup:
+                with patch("nextspyke.maintenance.list_month_partitions", return_value=partitions):
+                    with patch("nextspyke.maintenance.drop_partition") as drop:
+                        with patch("nextspyke.maintenance.set_maintenance_state") as set_state:
+                            result = maintenance.run_place_status_maintenance(conn, cfg)
+        rollup.assert_not_called()
+        self.assertEqual(
+            [call.args[2] for call in drop.call_args_list],
+            ["place_status_202603", "place_status_202604"],
+        )
+        self.assertEqual(
+            set_state.call_args.args[1:],
+            ("place_status_raw_from", datetime(2026, 5, 1, tzinfo=timezone.utc)),
+        )
+        self.assertEqual(
+            result["dropped_partitions"], ["place_status_202603", "place_status_202604"]
+        )
+
+    def test_drop_expired_place_status_reads_rolled_until(self):
+        cur = Mock()
+        cur.fetchone.return_value = (datetime(2026, 6, 3, 10, tzinfo=timezone.utc),)
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        cfg = replace(sample_config(), place_status_raw_retention_days=30)
+        partitions = [
+            (
+                "place_status_202604",
+                datetime(2026, 4, 1, tzinfo=timezone.utc),
+                datetime(2026, 5, 1, tzinfo=timezone.utc),
+            )
+        ]
+        with patch(
+            "nextspyke.maintenance.utc_now",
+            return_value=datetime(2026, 6, 3, 10, 30, tzinfo=timezone.utc),
+        ):
+            with patch("nextspyke.maintenance.list_month_partitions", return_value=partitions):
+                with patch("nextspyke.maintenance.drop_partition") as drop:
+                    with patch("nextspyke.maintenance.set_maintenance_state"):
+                        dropped = maintenance.drop_expired_place_status(conn, cfg)
+        conn.commit.assert_called_once()
+        drop.assert_called_once()
+        self.assertEqual(dropped, ["place_status_202604"])
+
+    def test_drop_expired_place_status_needs_retention_and_rollups(self):
+        cur = Mock()
+        cur.fetchone.return_value = None
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        cfg = replace(sample_config(), place_status_raw_retention_days=30)
+        with patch("nextspyke.maintenance.list_month_partitions") as partitions:
+            self.assertEqual(maintenance.drop_expired_place_status(conn, sample_config()), [])
+            self.assertEqual(maintenance.drop_expired_place_status(conn, cfg), [])
+        partitions.assert_not_called()
+
+    def test_ensure_upcoming_partitions_creates_current_and_next_month(self):
+        conn = ConnectionWithCursor(Mock())
+        with patch(
+            "nextspyke.maintenance.utc_now",
+            return_value=datetime(2026, 12, 20, tzinfo=timezone.utc),
+        ):
+            with patch("nextspyke.maintenance.ensure_partitions") as ensure:
+                maintenance.ensure_upcoming_partitions(conn)
+        self.assertEqual(
+            [call.args[1] for call in ensure.call_args_list],
+            [datetime(2026, 12, 1, tzinfo=timezone.utc), datetime(2027, 1, 1, tzinfo=timezone.utc)],
+        )
+
+    def test_vacuum_fresh_partitions_runs_outside_transaction(self):
+        conn = ConnectionWithCursor(Mock())
+        conn.commit = Mock()
+        conn.autocommit = False
+        autocommit = []
+        conn.execute = Mock(side_effect=lambda _query: autocommit.append(conn.autocommit))
+        may = (datetime(2026, 5, 1, tzinfo=timezone.utc), datetime(2026, 6, 1, tzinfo=timezone.utc))
+        june = (
+            datetime(2026, 6, 1, tzinfo=timezone.utc),
+            datetime(2026, 7, 1, tzinfo=timezone.utc),
+        )
+
+        def list_partitions(_cur, table):
+            # The collector has not written place_status yet this month.
+            if table == "place_status":
+                return [("place_status_202605", *may)]
+            return [(f"{table}_202605", *may), (f"{table}_202606", *june)]
+
+        with (
+            patch(
+                "nextspyke.maintenance.utc_now",
+                return_value=datetime(2026, 6, 20, tzinfo=timezone.utc),
+            ),
+            patch("nextspyke.maintenance.list_month_partitions", side_effect=list_partitions),
+        ):
+            result = maintenance.vacuum_fresh_partitions(conn)
+        self.assertEqual(
+            result["partitions"], ["snapshot_202606", "city_status_202606", "bike_status_202606"]
+        )
+        conn.commit.assert_called_once()
+        self.assertEqual(autocommit, [True] * 3)
+        self.assertFalse(conn.autocommit)
+        self.assertEqual(
+            conn.execute.call_args_list[0].args[0].as_string(None),
+            'VACUUM (ANALYZE) "snapshot_202606"',
+        )
+
+
+class TestBikeTypeMigration(unittest.TestCase):
+    def test_migrate_bike_type_chunk_registers_types_then_converts(self):
+        cur = Mock()
+        cur.rowcount = 5
+        start = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        end = start + timedelta(days=1)
+        rows = maintenance.migrate_bike_type_chunk(cur, "place_status", start, end)
+        self.assertEqual(rows, 5)
+        statements = [call.args[0].as_string(None) for call in cur.execute.call_args_list]
+        self.assertIn("INSERT INTO vehicle_type", statements[0])
+        self.assertIn('UPDATE "place_status"', statements[1])
+        self.assertEqual(cur.execute.call_args.args[1], (start, end))
+        cur.rowcount = -1
+        self.assertEqual(maintenance.migrate_bike_type_chunk(cur, "city_status", start, end), 0)
+
+    def test_migrate_bike_types_walks_partitions_in_chunks(self):
+        june = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        july = datetime(2026, 7, 1, tzinfo=timezone.utc)
+        partitions = {
+            "city_status": [("city_status_202606", june, july)],
+            "place_status": [("place_status_202606", june, july)],
+        }
+        conn = ConnectionWithCursor(Mock())
+        conn.commit = Mock()
+        with patch(
+            "nextspyke.maintenance.list_month_partitions",
+            side_effect=lambda _cur, table: partitions[table],
+        ):
+            with patch(
+                "nextspyke.maintenance.migrate_bike_type_chunk", return_value=2
+            ) as migrate_chunk:
+                result = maintenance.migrate_bike_types(conn, timedelta(days=10))
+        self.assertEqual(result, {"partitions": 2, "rows": {"city_status": 6, "place_status": 6}})
+        windows = [call.args[1:] for call in migrate_chunk.call_args_list[:3]]
+        self.assertEqual(windows[0], ("city_status", june, june + timedelta(days=10)))
+        self.assertEqual(windows[2], ("city_status", june + timedelta(days=20), july))
+
+
+class TestBikeIdMigration(unittest.TestCase):
+    def test_migrate_bike_id_chunk_swaps_number_for_id(self):
+        cur = Mock()
+        cur.rowcount = 7
+        start = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        end = start + timedelta(days=1)
+        self.assertEqual(maintenance.migrate_bike_id_chunk(cur, "bike_movement", start, end), 7)
+        statement = cur.execute.call_args.args[0].as_string(None)
+        self.assertIn('UPDATE "bike_movement"', statement)
+        self.assertIn('"end_fetched_at" >= %s', statement)
+        self.assertIn("bike_number = NULL", statement)
+        self.assertEqual(cur.execute.call_args.args[1], (start, end))
+        cur.rowcount = -1
+        self.assertEqual(maintenance.migrate_bike_id_chunk(cur, "bike_status", start, end), 0)
+
+    def test_migrate_bike_ids_drops_number_indexes_of_finished_tables(self):
+        june = datetime(2026, 6, 1, 12, tzinfo=timezone.utc)
+        cur = Mock()
+        # bike_status: range, then no row left; bike_movement: nothing to do, one row left.
+        cur.fetchone.side_effect = [(june, june + timedelta(days=2)), None, (None, None), (1,)]
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        with (
+            patch("nextspyke.maintenance.migrate_bike_id_chunk", return_value=4) as migrate_chunk,
+            patch(
+                "nextspyke.maintenance.build_bike_id_indexes", return_value=["idx_bike_status_key"]
+            ) as build_indexes,
+            patch(
+                "nextspyke.maintenance.add_bike_id_foreign_keys",
+                side_effect=lambda _conn: migrate_chunk.assert_called(),
+            ) as add_foreign_keys,
+        ):
+            result = maintenance.migrate_bike_ids(conn)
+        build_indexes.assert_called_once_with(conn)
+        add_foreign_keys.assert_called_once_with(conn)
+        self.assertEqual(result["built_indexes"], ["idx_bike_status_key"])
+        self.assertEqual(result["rows"], {"bike_status": 12, "bike_movement": 0})
+        self.assertEqual(result["completed_tables"], ["bike_status"])
+        self.assertEqual(
+            [call.args[1:3] for call in migrate_chunk.call_args_list],
+            [("bike_status", june + timedelta(days=day)) for day in range(3)],
+        )
+        statements = [
+            call.args[0].as_string(None)
+            for call in cur.execute.call_args_list
+            if not isinstance(call.args[0], str)
+        ]
+        self.assertIn('DROP INDEX IF EXISTS "idx_bike_status_bike_time"', statements)
+        self.assertFalse(any("idx_bike_movement" in statement for statement in statements))
+
+    def test_require_bike_id_keys_refuses_number_keyed_database(self):
+        cur = Mock()
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        cur.fetchone.return_value = (False, False)
+        maintenance.require_bike_id_keys(conn)
+        cur.fetchone.return_value = (False, True)
+        with self.assertRaisesRegex(RuntimeError, "migrate-bike-ids"):
+            maintenance.require_bike_id_keys(conn)
+
+    def test_convert_bike_id_keys_only_converts_what_is_left(self):
+        cur = Mock()
+        conn = ConnectionWithCursor(cur)
+        cur.fetchone.return_value = (True, True)
+        self.assertTrue(maintenance.convert_bike_id_keys(conn))
+        statements = [call.args[0] for call in cur.execute.call_args_list]
+        self.assertEqual(cur.execute.call_args_list[0].args[1], ("5s",))
+        self.assertIn("ALTER TABLE bike_status DROP CONSTRAINT bike_status_pkey", statements)
+        self.assertIn("ALTER TABLE bike_last_status ADD PRIMARY KEY (bike_id)", statements)
+        self.assertEqual(len(statements), 8)
+
+        cur.reset_mock()
+        cur.fetchone.return_value = (False, False)
+        self.assertFalse(maintenance.convert_bike_id_keys(conn))
+        self.assertEqual(cur.execute.call_count, 2)
+
+    def test_add_bike_id_foreign_keys_validates_per_partition_before_parent(self):
+        cur = Mock()
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        conn.execute = Mock()
+        cur.fetchall.return_value = [("bike_status_202606",), ("bike_status_default",)]
+        # Parent missing; bike_movement valid, one partition without, one not validated yet.
+        cur.fetchone.side_effect = [None, (True,), None, (False,)]
+
+        added = maintenance.add_bike_id_foreign_keys(conn)
+
+        self.assertEqual(added, ["bike_status_202606_bike_id_fkey", "bike_status_bike_id_fkey"])
+        statements = [
+            query if isinstance(query, str) else query.as_string(None)
+            for query, *_params in (call.args for call in conn.execute.call_args_list)
+        ]
+        self.assertEqual(
+            statements,
+            [
+                "SELECT set_config('lock_timeout', %s, true)",
+                'ALTER TABLE "bike_status_202606" ADD CONSTRAINT "bike_status_202606_bike_id_fkey" '
+                "FOREIGN KEY (bike_id) REFERENCES bike(bike_id) NOT VALID",
+                'ALTER TABLE "bike_status_202606" '
+                'VALIDATE CONSTRAINT "bike_status_202606_bike_id_fkey"',
+                'ALTER TABLE "bike_status_default" '
+                'VALIDATE CONSTRAINT "bike_status_default_bike_id_fkey"',
+                "SELECT set_config('lock_timeout', %s, true)",
+                "ALTER TABLE bike_status ADD CONSTRAINT bike_status_bike_id_fkey "
+                "FOREIGN KEY (bike_id) REFERENCES bike(bike_id)",
+            ],
+        )
+
+        conn.execute.reset_mock()
+        cur.fetchone.side_effect = [(True,), (True,)]
+        self.assertEqual(maintenance.add_bike_id_foreign_keys(conn), [])
+        conn.execute.assert_not_called()
+
 
 class TestLoggingCoverage(unittest.TestCase):
     def test_json_default_stringifies_unknown_values(self):
@@ -303,6 +703,7 @@ class TestAppCoverage(unittest.TestCase):
     def setUp(self):
         app._shutdown_requested = False
         app._shutdown_reason = "signal"
+        self.require_bike_id_keys = self.enterContext(patch("nextspyke.app.require_bike_id_keys"))
 
     def test_connect_and_init_db_closes_connection_on_init_error(self):
         conn = ConnectionWithCursor(Mock())
@@ -392,6 +793,322 @@ class TestAppCoverage(unittest.TestCase):
         self.assertTrue(conn.closed)
         self.assertEqual(log_event.call_args.kwargs["event"], "movement_backfill_complete")
 
+    def test_run_route_stats_backfill_processes_daily_chunks(self):
+        cur = Mock()
+        cur.fetchone.return_value = (datetime(2026, 6, 1, 22, 15, tzinfo=timezone.utc),)
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        now = datetime(2026, 6, 3, 10, 30, tzinfo=timezone.utc)
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.utc_now", return_value=now):
+                with patch("nextspyke.app.backfill_route_stats", return_value=4) as backfill:
+                    with patch("nextspyke.app.log_event") as log_event:
+                        app._run_route_stats_backfill(sample_config())
+        windows = [call.args[1:] for call in backfill.call_args_list]
+        self.assertEqual(
+            windows,
+            [
+                (
+                    datetime(2026, 6, 1, 22, tzinfo=timezone.utc),
+                    datetime(2026, 6, 2, 22, tzinfo=timezone.utc),
+                ),
+                (
+                    datetime(2026, 6, 2, 22, tzinfo=timezone.utc),
+                    datetime(2026, 6, 3, 10, tzinfo=timezone.utc),
+                ),
+            ],
+        )
+        self.assertTrue(conn.closed)
+        self.assertEqual(log_event.call_args.kwargs["event"], "route_stats_backfill_complete")
+        self.assertEqual(log_event.call_args.kwargs["extra"]["route_stats_rows"], 8)
+        self.assertEqual(log_event.call_args.kwargs["extra"]["chunks"], 2)
+
+    def test_run_route_stats_backfill_without_movements(self):
+        cur = Mock()
+        cur.fetchone.return_value = (None,)
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.backfill_route_stats") as backfill:
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_route_stats_backfill(sample_config())
+        backfill.assert_not_called()
+        self.assertTrue(conn.closed)
+        self.assertEqual(log_event.call_args.kwargs["extra"]["chunks"], 0)
+
+    def test_run_trajectory_backfill_rebuilds_whole_days(self):
+        cur = Mock()
+        cur.fetchone.return_value = (datetime(2026, 6, 2, 23, 15, tzinfo=timezone.utc),)
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        now = datetime(2026, 6, 3, 10, 30, tzinfo=timezone.utc)
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.utc_now", return_value=now):
+                with patch("nextspyke.app.backfill_bike_trajectories", return_value=3) as backfill:
+                    with patch("nextspyke.app.log_event") as log_event:
+                        app._run_trajectory_backfill(sample_config())
+        windows = [call.args[1:] for call in backfill.call_args_list]
+        self.assertEqual(
+            windows,
+            [
+                (
+                    datetime(2026, 6, 2, tzinfo=timezone.utc),
+                    datetime(2026, 6, 3, tzinfo=timezone.utc),
+                ),
+                (
+                    datetime(2026, 6, 3, tzinfo=timezone.utc),
+                    datetime(2026, 6, 4, tzinfo=timezone.utc),
+                ),
+            ],
+        )
+        self.assertTrue(conn.closed)
+        self.assertEqual(log_event.call_args.kwargs["event"], "trajectory_backfill_complete")
+        self.assertEqual(log_event.call_args.kwargs["extra"]["trajectory_rows"], 6)
+
+    def test_run_trajectory_backfill_without_movements(self):
+        cur = Mock()
+        cur.fetchone.return_value = None
+        conn = ConnectionWithCursor(cur)
+        conn.commit = Mock()
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.backfill_bike_trajectories") as backfill:
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_trajectory_backfill(sample_config())
+        backfill.assert_not_called()
+        self.assertEqual(log_event.call_args.kwargs["extra"]["chunks"], 0)
+
+    def test_main_trajectory_backfill_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "backfill-trajectories"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_trajectory_backfill") as run_backfill:
+                    app.main()
+        run_backfill.assert_called_once()
+
+    def test_main_route_stats_backfill_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "backfill-route-stats"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_route_stats_backfill") as run_backfill:
+                    app.main()
+        run_backfill.assert_called_once()
+
+    def test_run_maintenance_logs_result_and_closes_connection(self):
+        conn = ConnectionWithCursor(Mock())
+        result = {
+            "rolled_rows": 12,
+            "rolled_until": datetime(2026, 6, 3, 10, tzinfo=timezone.utc),
+            "dropped_partitions": ["place_status_202604"],
+        }
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.run_place_status_maintenance", return_value=result):
+                with patch(
+                    "nextspyke.app.build_closed_partition_indexes",
+                    return_value={"closed_partition_indexes": 3, "built_indexes": ["a_geom"]},
+                ) as build_indexes:
+                    with patch("nextspyke.app.log_event") as log_event:
+                        app._run_maintenance(sample_config())
+        self.assertTrue(conn.closed)
+        build_indexes.assert_called_once_with(conn)
+        self.assertEqual(log_event.call_args.kwargs["event"], "maintenance_complete")
+        extra = log_event.call_args.kwargs["extra"]
+        self.assertEqual(extra["rolled_rows"], 12)
+        self.assertEqual(extra["rolled_until"], "2026-06-03T10:00:00.000Z")
+        self.assertEqual(extra["dropped_partitions"], ["place_status_202604"])
+        self.assertEqual(extra["built_indexes"], ["a_geom"])
+
+    def test_run_maintenance_without_history(self):
+        conn = ConnectionWithCursor(Mock())
+        result = {"rolled_rows": 0, "rolled_until": None, "dropped_partitions": []}
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.run_place_status_maintenance", return_value=result):
+                with patch(
+                    "nextspyke.app.build_closed_partition_indexes",
+                    return_value={"closed_partition_indexes": 0, "built_indexes": []},
+                ):
+                    with patch("nextspyke.app.log_event") as log_event:
+                        app._run_maintenance(sample_config())
+        self.assertIsNone(log_event.call_args.kwargs["extra"]["rolled_until"])
+
+    def test_run_gap_audit_logs_result_and_closes_connection(self):
+        conn = ConnectionWithCursor(Mock())
+        result = {"partitions": 4, "gaps": 2, "recorded_gaps": 1}
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.audit_snapshot_gaps", return_value=result) as audit:
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_gap_audit(sample_config())
+        self.assertTrue(conn.closed)
+        audit.assert_called_once_with(ANY, "fg", 60)
+        self.assertEqual(log_event.call_args.kwargs["event"], "gap_audit_complete")
+        self.assertEqual(log_event.call_args.kwargs["extra"]["recorded_gaps"], 1)
+
+    def test_main_gap_audit_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "gap-audit"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_gap_audit") as run_gap_audit:
+                    app.main()
+        run_gap_audit.assert_called_once()
+
+    def test_run_export_uses_read_only_connection_and_logs_result(self):
+        conn = ConnectionWithCursor(Mock())
+        result = {"exported_units": 2, "skipped_units": 1, "rows": 40, "files": 3}
+        argv = ["--from", "2026-06-01T00:00:00+00:00", "--to", "2026-06-03T00:00:00+00:00"]
+        with patch("nextspyke.app.psycopg.connect", return_value=conn):
+            with patch("nextspyke.app.export_history", return_value=result) as export_history:
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_export(sample_config(), argv)
+        self.assertTrue(conn.read_only)
+        self.assertTrue(conn.closed)
+        args = export_history.call_args.args
+        self.assertEqual(args[1], ["bike_status", "bike_movement"])
+        self.assertEqual(args[2], datetime(2026, 6, 1, tzinfo=timezone.utc))
+        extra = log_event.call_args.kwargs["extra"]
+        self.assertEqual(log_event.call_args.kwargs["event"], "export_complete")
+        self.assertEqual(extra["rows"], 40)
+        self.assertEqual(extra["to"], "2026-06-03T00:00:00.000Z")
+
+    def test_main_export_branch_passes_remaining_arguments(self):
+        with patch.object(sys, "argv", ["app", "export", "--from", "2026-06-01T00:00:00+00:00"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_export") as run_export:
+                    app.main()
+        self.assertEqual(run_export.call_args.args[1], ["--from", "2026-06-01T00:00:00+00:00"])
+
+    def test_run_cold_tiering_logs_result_and_closes_connection(self):
+        conn = ConnectionWithCursor(Mock())
+        tiered = [
+            {"partition": "bike_status_202606", "rows": 30, "path": "a"},
+            {"partition": "place_status_202606", "rows": 12, "path": "b"},
+        ]
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.tier_cold_partitions", return_value=tiered):
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_cold_tiering(sample_config())
+        self.assertTrue(conn.closed)
+        extra = log_event.call_args.kwargs["extra"]
+        self.assertEqual(log_event.call_args.kwargs["event"], "cold_tiering_complete")
+        self.assertEqual(extra["tiered_partitions"], ["bike_status_202606", "place_status_202606"])
+        self.assertEqual(extra["tiered_rows"], 42)
+
+    def test_main_tier_cold_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "tier-cold"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_cold_tiering") as run_cold_tiering:
+                    app.main()
+        run_cold_tiering.assert_called_once()
+
+    def test_run_bike_type_migration_logs_result_and_closes_connection(self):
+        conn = ConnectionWithCursor(Mock())
+        result = {"partitions": 3, "rows": {"city_status": 4, "place_status": 40}}
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.migrate_bike_types", return_value=result):
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_bike_type_migration(sample_config())
+        self.assertTrue(conn.closed)
+        self.assertEqual(log_event.call_args.kwargs["event"], "bike_type_migration_complete")
+        self.assertEqual(log_event.call_args.kwargs["extra"]["migrated_rows"], result["rows"])
+
+    def test_main_migrate_bike_types_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "migrate-bike-types"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_bike_type_migration") as run_migration:
+                    app.main()
+        run_migration.assert_called_once()
+
+    def test_run_bike_id_migration_logs_result_and_closes_connection(self):
+        result = {
+            "built_indexes": [],
+            "rows": {"bike_status": 90, "bike_movement": 3},
+            "completed_tables": [],
+            "foreign_keys": [],
+        }
+        for converted in (True, False):
+            with self.subTest(converted=converted):
+                conn = ConnectionWithCursor(Mock())
+                with (
+                    patch("nextspyke.app._connect_and_init_db", return_value=conn),
+                    patch("nextspyke.app.convert_bike_id_keys", return_value=converted),
+                    patch("nextspyke.app.migrate_bike_ids", return_value=result),
+                    patch("nextspyke.app.log_event") as log_event,
+                ):
+                    app._run_bike_id_migration(sample_config())
+                self.assertTrue(conn.closed)
+                self.assertEqual(
+                    [call.kwargs["event"] for call in log_event.call_args_list],
+                    ["bike_id_keys_converted"] * converted + ["bike_id_migration_complete"],
+                )
+                self.assertEqual(
+                    log_event.call_args.kwargs["extra"]["migrated_rows"], result["rows"]
+                )
+
+    def test_main_refuses_to_collect_before_bike_id_keys_are_converted(self):
+        conn = ConnectionWithCursor(Mock())
+        self.require_bike_id_keys.side_effect = RuntimeError("run migrate-bike-ids")
+        with (
+            patch.object(sys, "argv", ["app"]),
+            patch("nextspyke.app.load_config", return_value=sample_config()),
+            patch("nextspyke.app._connect_and_init_db", return_value=conn),
+            patch("nextspyke.app.log_event"),
+            patch("nextspyke.app.init_metrics"),
+            patch("nextspyke.app.start_metrics_server"),
+            patch("nextspyke.app.ingest_once") as ingest_once,
+            self.assertRaisesRegex(RuntimeError, "migrate-bike-ids"),
+        ):
+            app.main()
+        self.assertTrue(conn.closed)
+        ingest_once.assert_not_called()
+
+    def test_main_migrate_bike_ids_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "migrate-bike-ids"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_bike_id_migration") as run_migration:
+                    app.main()
+        run_migration.assert_called_once()
+
+    def test_run_index_migration_logs_result_and_closes_connection(self):
+        conn = ConnectionWithCursor(Mock())
+        result = {"built_indexes": ["bike_status_202606_geom"], "dropped_indexes": []}
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.migrate_indexes", return_value=result):
+                with patch("nextspyke.app.log_event") as log_event:
+                    app._run_index_migration(sample_config())
+        self.assertTrue(conn.closed)
+        self.assertEqual(log_event.call_args.kwargs["event"], "index_migration_complete")
+        self.assertEqual(
+            log_event.call_args.kwargs["extra"]["built_indexes"], ["bike_status_202606_geom"]
+        )
+
+    def test_main_migrate_indexes_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "migrate-indexes"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_index_migration") as run_migration:
+                    app.main()
+        run_migration.assert_called_once()
+
+    def test_run_index_report_prints_report_and_closes_connection(self):
+        conn = ConnectionWithCursor(Mock())
+        rows = [{"table": "bike_status", "index": "idx_bike_status_key"}]
+        with patch("nextspyke.app._connect_and_init_db", return_value=conn):
+            with patch("nextspyke.app.index_report", return_value=rows):
+                with patch("nextspyke.app.format_index_report", return_value=["a", "b"]) as fmt:
+                    with patch("builtins.print") as printed:
+                        app._run_index_report()
+        self.assertTrue(conn.closed)
+        fmt.assert_called_once_with(rows)
+        self.assertEqual([call.args[0] for call in printed.call_args_list], ["a", "b"])
+
+    def test_main_index_report_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "index-report"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_index_report") as run_report:
+                    app.main()
+        run_report.assert_called_once()
+
+    def test_main_maintenance_branch_runs_and_returns(self):
+        with patch.object(sys, "argv", ["app", "maintenance"]):
+            with patch("nextspyke.app.load_config", return_value=sample_config()):
+                with patch("nextspyke.app._run_maintenance") as run_maintenance:
+                    app.main()
+        run_maintenance.assert_called_once()
+
     def test_main_health_branch_exits_with_health_status(self):
         with patch.object(sys, "argv", ["app", "health"]):
             with patch("nextspyke.app.load_config", return_value=sample_config()):
@@ -416,6 +1133,7 @@ class TestAppCoverage(unittest.TestCase):
             "places": 0,
             "bikes": 0,
             "movements": 0,
+            "stages": {},
         }
         with patch.object(sys, "argv", ["app"]):
             with patch("nextspyke.app.env_bool", return_value=False):
@@ -447,6 +1165,7 @@ class TestAppCoverage(unittest.TestCase):
             "places": 0,
             "bikes": 0,
             "movements": 0,
+            "stages": {},
         }
         with patch.object(sys, "argv", ["app"]):
             with patch("nextspyke.app.env_bool", return_value=True):
@@ -466,7 +1185,9 @@ class TestAppCoverage(unittest.TestCase):
                                                 with patch("nextspyke.app.mark_shutdown"):
                                                     app.main()
         self.assertEqual(connect_and_init.call_count, 2)
-        ingest_once.assert_called_once_with(open_conn, ANY)
+        ingest_once.assert_called_once_with(
+            open_conn, ANY, None, refresh_metadata=True, explain_plans=None
+        )
 
     def test_module_main_guard_executes(self):
         ingest_result = {
@@ -476,13 +1197,17 @@ class TestAppCoverage(unittest.TestCase):
             "places": 0,
             "bikes": 0,
             "movements": 0,
+            "stages": {},
         }
         conn = ConnectionWithCursor(Mock())
         with patch.object(sys, "argv", ["app"]):
             with patch("nextspyke.config.load_config", return_value=sample_config()):
                 with patch("nextspyke.config.env_bool", return_value=True):
                     with patch("psycopg.connect", return_value=conn):
-                        with patch("nextspyke.db.init_db"):
+                        with (
+                            patch("nextspyke.db.init_db"),
+                            patch("nextspyke.maintenance.require_bike_id_keys"),
+                        ):
                             with patch("nextspyke.ingest.ingest_once", return_value=ingest_result):
                                 with patch("nextspyke.metrics.init_metrics"):
                                     with patch("nextspyke.metrics.start_metrics_server"):
@@ -497,6 +1222,20 @@ class TestAppCoverage(unittest.TestCase):
 
 
 class TestIngestCoverage(unittest.TestCase):
+    def test_fetch_feed_parses_last_modified(self):
+        response = DummyResponse(b'{"countries": []}')
+        response.headers = {"Last-Modified": "Mon, 29 Jun 2026 11:59:30 GMT"}
+        with patch("nextspyke.ingest.urlopen", return_value=response):
+            body, updated_at = ingest.fetch_feed("https://example.test/live", {"domains": "fg"})
+        self.assertEqual(body, '{"countries": []}')
+        self.assertEqual(updated_at, datetime(2026, 6, 29, 11, 59, 30, tzinfo=timezone.utc))
+
+        for headers in ({}, {"Last-Modified": "yesterday"}):
+            response = DummyResponse(b"{}")
+            response.headers = headers
+            with patch("nextspyke.ingest.urlopen", return_value=response):
+                self.assertEqual(ingest.fetch_feed("https://example.test/live"), ("{}", None))
+
     def test_fetch_json_without_params(self):
         response = DummyResponse(b'{"ok": true}')
         with patch("nextspyke.ingest.urlopen", return_value=response) as urlopen_mock:
@@ -595,11 +1334,15 @@ class TestIngestCoverage(unittest.TestCase):
     def test_insert_status_helpers_and_snapshot(self):
         cur = Mock()
         fetched_at = datetime.now(timezone.utc)
-        ingest.insert_city_status(cur, 1, fetched_at, {"uid": 9, "bike_types": {"cargo": 2}})
+        ordinals = {"cargo": 3, "ebike": 1}
+        ingest.insert_city_status(
+            cur, 1, fetched_at, {"uid": 9, "bike_types": {"cargo": 2}}, ordinals
+        )
         self.assertEqual(cur.execute.call_count, 1)
+        self.assertEqual(cur.execute.call_args.args[1][-1], [0, 0, 2])
 
         cur.reset_mock()
-        ingest.insert_place_status(cur, 1, fetched_at, [])
+        ingest.insert_place_status(cur, 1, fetched_at, [], ordinals)
         cur.executemany.assert_not_called()
         ingest.insert_place_status(
             cur,
@@ -609,17 +1352,20 @@ class TestIngestCoverage(unittest.TestCase):
                 {"uid": 2, "spot": False},
                 {"uid": 3, "spot": True, "bike_types": {"ebike": 1}},
             ],
+            ordinals,
         )
         self.assertEqual(cur.executemany.call_count, 1)
         self.assertEqual(len(cur.executemany.call_args.args[1]), 1)
+        self.assertEqual(cur.executemany.call_args.args[1][0][-1], [1])
 
         cur.reset_mock()
-        ingest.insert_bike_status(cur, 1, [])
+        ingest.insert_bike_status(cur, 1, [], {})
         cur.executemany.assert_not_called()
         ingest.insert_bike_status(
-            cur, 1, [(1, fetched_at, "100", 3, True, "ok", 88, 77, 12.5, 8.4, 49.0)]
+            cur, 1, [(1, fetched_at, "100", 3, True, "ok", 88, 77, 12.5, 8.4, 49.0)], {"100": 5}
         )
         self.assertEqual(cur.executemany.call_count, 1)
+        self.assertEqual(cur.executemany.call_args.args[1][0][2], 5)
 
         cur.reset_mock()
         cur.fetchone.return_value = [42]
@@ -632,24 +1378,98 @@ class TestIngestCoverage(unittest.TestCase):
         ingest.insert_snapshot(cur, fetched_at, "fg", {"raw": True})
         self.assertIsNotNone(cur.execute.call_args.args[1][3])
 
+    def test_build_bike_rows_keeps_station_only_for_spots(self):
+        fetched_at = datetime.now(timezone.utc)
+        places = [
+            {
+                "uid": 3,
+                "spot": True,
+                "lat": 49.0,
+                "lng": 8.4,
+                "bike_list": [
+                    {"number": "100", "bike_type": 196, "battery_pack": {"percentage": 80}},
+                    {"number": None},
+                ],
+            },
+            {"uid": 4, "spot": False, "lat": 49.1, "lng": 8.5, "bike_list": [{"number": "101"}]},
+            {"uid": 5, "spot": True},
+        ]
+        bikes, status_rows, type_ids = ingest.build_bike_rows(places, 7, fetched_at)
+        self.assertEqual([bike[0] for bike in bikes], ["100", "101"])
+        self.assertEqual(bikes[1][2], None)
+        self.assertEqual(type_ids, {"196"})
+        self.assertEqual(status_rows[0][3], 3)
+        self.assertEqual(status_rows[0][7], 80)
+        self.assertEqual(status_rows[1][3], None)
+        self.assertEqual(status_rows[1][9:], (8.5, 49.1))
+
     def test_record_snapshot_gap_all_branches(self):
         cur = Mock()
         fetched_at = datetime(2026, 6, 29, 12, 10, tzinfo=timezone.utc)
 
-        cur.fetchone.return_value = None
-        self.assertIsNone(ingest.record_snapshot_gap(cur, fetched_at, "fg", 60))
+        self.assertIsNone(ingest.record_snapshot_gap(cur, fetched_at, "fg", 60, None))
+        self.assertIsNone(
+            ingest.record_snapshot_gap(
+                cur, fetched_at, "fg", 0, fetched_at - timedelta(seconds=120)
+            )
+        )
+        self.assertIsNone(
+            ingest.record_snapshot_gap(
+                cur, fetched_at, "fg", 60, fetched_at - timedelta(seconds=80)
+            )
+        )
+        cur.execute.assert_not_called()
 
-        cur.fetchone.return_value = (fetched_at - timedelta(seconds=120),)
-        self.assertIsNone(ingest.record_snapshot_gap(cur, fetched_at, "fg", 0))
+        gap = ingest.record_snapshot_gap(
+            cur, fetched_at, "fg", 60, fetched_at - timedelta(seconds=240)
+        )
+        self.assertEqual(gap["missing_count"], 3)
+        query, params = cur.execute.call_args.args
+        self.assertIn("WHERE NOT EXISTS", query)
+        self.assertEqual(params["domain"], "fg")
+        self.assertEqual(params["gap_seconds"], 240)
 
-        cur.fetchone.return_value = (fetched_at - timedelta(seconds=80),)
-        self.assertIsNone(ingest.record_snapshot_gap(cur, fetched_at, "fg", 60))
+    def test_latest_snapshot_at(self):
+        cur = Mock()
+        fetched_at = datetime(2026, 6, 29, 12, 10, tzinfo=timezone.utc)
+        cur.fetchone.return_value = None
+        self.assertIsNone(ingest.latest_snapshot_at(cur, "fg"))
+        cur.fetchone.return_value = (fetched_at,)
+        self.assertEqual(ingest.latest_snapshot_at(cur, "fg"), fetched_at)
+        self.assertEqual(cur.execute.call_args.args[1], ("fg",))
 
-        cur.reset_mock()
-        cur.fetchone.return_value = (fetched_at - timedelta(seconds=240),)
-        gap = ingest.record_snapshot_gap(cur, fetched_at, "fg", 60)
-        self.assertEqual(gap["missing_count"], 3)
-        self.assertEqual(cur.execute.call_count, 2)
+    def test_audit_snapshot_gaps_carries_last_snapshot_across_partitions(self):
+        start = datetime(2026, 5, 31, 23, 0, tzinfo=timezone.utc)
+        cur = Mock()
+        cur.fetchall.side_effect = [
+            # May: one gap inside the partition; the month ends at 23:58.
+            [
+                (None, start, start + timedelta(minutes=58)),
+                (
+                    start + timedelta(minutes=1),
+                    start + timedelta(minutes=10),
+                    start + timedelta(minutes=58),
+                ),
+            ],
+            # June starts 12 minutes after May's last snapshot.
+            [(None, start + timedelta(minutes=70), start + timedelta(minutes=90))],
+            # July continues without a gap.
+            [(None, start + timedelta(minutes=91), start + timedelta(minutes=91))],
+        ]
+        cur.rowcount = 1
+        partitions = [
+            ("snapshot_202605", None, None),
+            ("snapshot_202606", None, None),
+            ("snapshot_202607", None, None),
+        ]
+        with patch("nextspyke.ingest.list_month_partitions", return_value=partitions):
+            result = ingest.audit_snapshot_gaps(cur, "fg", 60)
+
+        self.assertEqual(result, {"partitions": 3, "gaps": 2, "recorded_gaps": 2})
+        inserts = [call.args[1] for call in cur.execute.call_args_list[3:]]
+        self.assertEqual([gap["gap_seconds"] for gap in inserts], [540, 720])
+        self.assertEqual(inserts[1]["gap_start"], start + timedelta(minutes=58))
+        self.assertEqual(cur.execute.call_args_list[0].args[1], ("fg", timedelta(seconds=90)))
 
     def test_upsert_zone_features_and_gbfs_helpers(self):
         cur = Mock()
@@ -771,7 +1591,7 @@ class TestIngestCoverage(unittest.TestCase):
 
     def test_ingest_once_raises_without_country(self):
         conn = ConnectionWithCursor(Mock())
-        with patch("nextspyke.ingest.fetch_json", return_value={"countries": []}):
+        with patch("nextspyke.ingest.fetch_feed", return_value=('{"countries": []}', None)):
             with self.assertRaisesRegex(RuntimeError, "No country data"):
                 ingest.ingest_once(conn, sample_config())
 
@@ -821,15 +1641,26 @@ class TestIngestCoverage(unittest.TestCase):
                 }
             ]
         }
+        previous_at = fetched_at - timedelta(minutes=5)
+        self.enterContext(patch.dict(ingest._last_fetched_at, {"fg": previous_at}, clear=True))
+        self.enterContext(patch.dict(ingest._bike_ids, clear=True))
+        cur.fetchall.return_value = [("100", 1), ("101", 2)]
+        # Plans are sampled while bike_last_status still points at the previous snapshot.
+        explain_plans = Mock(side_effect=lambda *_args: self.assertFalse(update_last_status.called))
         with patch("nextspyke.ingest.utc_now", return_value=fetched_at):
-            with patch("nextspyke.ingest.fetch_json", return_value=live_data):
+            with patch(
+                "nextspyke.ingest.fetch_feed", return_value=(json.dumps(live_data), fetched_at)
+            ):
                 with patch("nextspyke.ingest.ensure_partitions") as ensure_partitions:
                     with patch("nextspyke.ingest.upsert_country") as upsert_country:
                         with patch("nextspyke.ingest.upsert_cities") as upsert_cities:
                             with patch(
                                 "nextspyke.ingest.record_snapshot_gap",
-                                return_value={"gap_start": fetched_at - timedelta(minutes=5)},
-                            ):
+                                return_value={
+                                    "gap_start": fetched_at - timedelta(minutes=5),
+                                    "gap_seconds": 300,
+                                },
+                            ) as record_gap:
                                 with patch("nextspyke.ingest.log_event") as log_event:
                                     with patch("nextspyke.ingest.insert_snapshot", return_value=9):
                                         with patch(
@@ -858,6 +1689,12 @@ class TestIngestCoverage(unittest.TestCase):
                                                                     patch(
                                                                         "nextspyke.ingest.update_bike_last_status"
                                                                     ) as update_last_status,
+                                                                    patch.multiple(
+                                                                        "nextspyke.ingest",
+                                                                        upsert_route_stats=DEFAULT,
+                                                                        close_bike_dwells=DEFAULT,
+                                                                        append_bike_trajectories=DEFAULT,
+                                                                    ) as movement_rollups,
                                                                 ):
                                                                     with patch(
                                                                         "nextspyke.ingest.refresh_zone_metadata"
@@ -870,10 +1707,19 @@ class TestIngestCoverage(unittest.TestCase):
                                                                                 sample_config(
                                                                                     store_raw_json=False
                                                                                 ),
+                                                                                explain_plans=explain_plans,
                                                                             )
         self.assertEqual(result["snapshot_id"], 9)
         self.assertEqual(result["places"], 1)
         self.assertEqual(result["bikes"], 2)
+        record_gap.assert_called_once_with(cur, fetched_at, "fg", 60, previous_at)
+        self.assertEqual(ingest._last_fetched_at, {"fg": fetched_at})
+        self.assertEqual(result["stages"]["build_bike_rows"]["rows"], 2)
+        self.assertEqual(result["stages"]["bike_movement"]["rows"], 2)
+        self.assertIn("commit", result["stages"])
+        self.assertIn("movement_rollups", result["stages"])
+        self.assertIn("query_plans", result["stages"])
+        explain_plans.assert_called_once_with(cur, 9, fetched_at)
         ensure_partitions.assert_called_once_with(cur, fetched_at)
         upsert_country.assert_called_once()
         upsert_cities.assert_called_once_with(cur, "fg", live_data["countries"][0]["cities"])
@@ -883,13 +1729,490 @@ class TestIngestCoverage(unittest.TestCase):
         upsert_vehicle_types.assert_called_once_with(cur, {"5"})
         upsert_bikes.assert_called_once()
         insert_bike_status.assert_called_once()
+        self.assertEqual(insert_bike_status.call_args.args[3], {"100": 1, "101": 2})
         update_last_status.assert_called_once_with(cur, 9, fetched_at)
+        for rollup in movement_rollups.values():
+            rollup.assert_called_once_with(cur, 9, fetched_at)
         refresh_zone_metadata.assert_called_once()
         refresh_types.assert_called_once()
         self.assertTrue(
             any(call.kwargs.get("event") == "snapshot_gap" for call in log_event.call_args_list)
         )
 
+    def test_ingest_once_uses_prefetched_feed(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        feed = ingest.FetchedFeed(fetched_at, "{}", None, 0.25)
+        with patch("nextspyke.ingest.fetch_feed") as fetch_feed:
+            with patch(
+                "nextspyke.ingest._ingest_snapshot", return_value={"snapshot_id": 3}
+            ) as ingest_snapshot:
+                result = ingest.ingest_once(Mock(), sample_config(), feed)
+        fetch_feed.assert_not_called()
+        self.assertIs(ingest_snapshot.call_args.args[2], feed)
+        self.assertEqual(result["stages"]["http"], {"ms": 250.0})
+
+    def test_ingest_backlog_stores_feeds_in_one_transaction(self):
+        first_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        second_at = first_at + timedelta(minutes=1)
+        conn = ConnectionWithCursor(Mock())
+        stored = [
+            {"snapshot_id": 4, "gap": {"gap_seconds": 600}},
+            {"snapshot_id": 5, "gap": None},
+        ]
+        self.enterContext(patch.dict(ingest._last_fetched_at, {}, clear=True))
+        explain_plans = Mock()
+        with (
+            patch("nextspyke.ingest._store_snapshot", side_effect=stored) as store,
+            patch("nextspyke.ingest.apply_batch_movements", return_value={5: 2}) as apply,
+            patch("nextspyke.ingest.log_event") as log_event,
+        ):
+            result = ingest.ingest_backlog(
+                conn,
+                sample_config(),
+                [(first_at, {"a": 1}), (second_at, {"b": 2})],
+                explain_plans=explain_plans,
+            )
+        self.assertEqual(result, stored)
+        self.assertEqual([entry["movements"] for entry in stored], [0, 2])
+        self.assertEqual([call.args[3] for call in store.call_args_list], [first_at, second_at])
+        # Every snapshot adds its sightings to one list, applied once the batch is written.
+        sightings = store.call_args_list[0].kwargs["sightings"]
+        self.assertIs(store.call_args_list[1].kwargs["sightings"], sightings)
+        apply.assert_called_once_with(conn.cursor_obj, sightings, 10, ANY)
+        # Only the newest snapshot of the batch is sampled, and an empty batch not at all.
+        explain_plans.assert_called_once_with(conn.cursor_obj, 5, second_at)
+        with patch("nextspyke.ingest.apply_batch_movements", return_value={}):
+            self.assertEqual(
+                ingest.ingest_backlog(conn, sample_config(), [], explain_plans=explain_plans), []
+            )
+        explain_plans.assert_called_once()
+        self.assertEqual(ingest._last_fetched_at, {"fg": second_at})
+        self.assertEqual(log_event.call_args.kwargs["event"], "snapshot_gap")
+
+    def test_movement_pairs_follow_each_bike_through_the_batch(self):
+        t0 = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        t1, t2, t3 = (t0 + timedelta(minutes=minute) for minute in (1, 2, 3))
+
+        def sighting(snapshot_id, fetched_at, bike_id, place_uid, lon, lat):
+            return (
+                snapshot_id,
+                fetched_at,
+                bike_id,
+                place_uid,
+                True,
+                "ok",
+                None,
+                None,
+                None,
+                lon,
+                lat,
+            )
+
+        previous = {1: (10, t0, 7, 8.4, 49.0), 3: (10, t0, None, 8.4, 49.0)}
+        sightings = [
+            sighting(11, t1, 1, 7, 8.4, 49.0),  # parked: no pair
+            sighting(11, t1, 2, 7, 8.4, 49.0),  # first sighting: no pair
+            sighting(11, t1, 3, None, None, None),  # no position: no pair
+            sighting(12, t2, 1, 8, 8.5, 49.0),
+            sighting(12, t2, 2, None, 8.41, 49.0),
+            sighting(13, t3, 1, 8, 8.5, 49.0),
+        ]
+
+        pairs = ingest.movement_pairs(previous, sightings, 10)
+
+        self.assertEqual(
+            pairs,
+            [
+                (1, 11, t1, 12, t2, 7, 8, "SRID=4326;POINT(8.4 49.0)", "SRID=4326;POINT(8.5 49.0)"),
+                (
+                    2,
+                    11,
+                    t1,
+                    12,
+                    t2,
+                    7,
+                    None,
+                    "SRID=4326;POINT(8.4 49.0)",
+                    "SRID=4326;POINT(8.41 49.0)",
+                ),
+            ],
+        )
+        self.assertEqual(previous[1], (13, t3, 8, 8.5, 49.0))
+        self.assertEqual(previous[3], (11, t1, None, None, None))
+        # Without a minimum distance every positioned pair is a candidate.
+        self.assertEqual(
+            len(ingest.movement_pairs({1: (10, t0, 7, 8.4, 49.0)}, sightings[:1], 0)), 1
+        )
+        # A replayed sighting older than bike_last_status pairs with it but does not replace it.
+        replayed = {1: (12, t2, 8, 8.5, 49.0)}
+        self.assertEqual(len(ingest.movement_pairs(replayed, sightings[:1], 10)), 1)
+        self.assertEqual(replayed[1], (12, t2, 8, 8.5, 49.0))
+
+    def test_apply_batch_movements_copies_pairs_and_applies_the_batch_once(self):
+        t0 = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        t1 = t0 + timedelta(minutes=1)
+        sightings = [
+            (11, t0, 1, 7, True, "ok", None, None, None, 8.5, 49.0),
+            (12, t1, 1, 8, True, "ok", None, None, None, 8.6, 49.0),
+            (12, t1, 2, 8, True, "ok", None, None, None, 8.6, 49.0),
+        ]
+        copy = Mock()
+        cur = Mock()
+        cur.copy.return_value.__enter__ = Mock(return_value=copy)
+        cur.copy.return_value.__exit__ = Mock(return_value=False)
+        cur.fetchall.side_effect = [
+            [(1, 10, t0 - timedelta(minutes=1), 7, 8.4, 49.0)],
+            [(11,), (12,)],
+        ]
+        timings = metrics.StageTimings()
+
+        movements = ingest.apply_batch_movements(cur, sightings, 10, timings)
+
+        self.assertEqual(movements, {11: 1, 12: 1})
+        self.assertEqual(timings.rows["bike_movement"], 2)
+        self.assertIn("movement_rollups", timings.seconds)
+        self.assertEqual(len(copy.write_row.call_args_list), 2)
+        self.assertIn('COPY "bike_movement_batch"', cur.copy.call_args.args[0].as_string(None))
+        statements = [call.args[0] for call in cur.execute.call_args_list]
+        self.assertEqual(
+            statements,
+            [
+                ingest.LAST_BIKE_POSITIONS_SQL,
+                ingest.CREATE_MOVEMENT_BATCH_SQL,
+                ingest.INSERT_BATCH_MOVEMENTS_SQL,
+                ingest.DROP_MOVEMENT_BATCH_SQL,
+                ingest.UPSERT_BATCH_ROUTE_STATS_SQL,
+                ingest.CLOSE_BATCH_DWELLS_SQL,
+                ingest.APPEND_BATCH_TRAJECTORIES_SQL,
+                ingest.UPDATE_BATCH_LAST_STATUS_SQL,
+            ],
+        )
+        self.assertEqual(cur.execute.call_args_list[0].args[1], ([1, 2],))
+        self.assertEqual(
+            cur.execute.call_args_list[-1].args[1],
+            {"snapshot_ids": [11, 12], "start": t0, "end": t1},
+        )
+        self.assertEqual(
+            cur.execute.call_args_list[5].args[1]["bounds"], list(ingest.DWELL_HISTOGRAM_BOUNDS_S)
+        )
+
+    def test_apply_batch_movements_without_moves_only_updates_last_status(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        cur = Mock()
+        cur.fetchall.return_value = []
+        self.assertEqual(ingest.apply_batch_movements(cur, [], 10, metrics.StageTimings()), {})
+        cur.execute.assert_not_called()
+
+        sightings = [(11, fetched_at, 1, 7, True, "ok", None, None, None, 8.5, 49.0)]
+        self.assertEqual(
+            ingest.apply_batch_movements(cur, sightings, 10, metrics.StageTimings()), {}
+        )
+        self.assertEqual(
+            [call.args[0] for call in cur.execute.call_args_list],
+            [ingest.LAST_BIKE_POSITIONS_SQL, ingest.UPDATE_BATCH_LAST_STATUS_SQL],
+        )
+
+    def test_ingest_backlog_forgets_last_snapshot_time_on_failure(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        self.enterContext(patch.dict(ingest._last_fetched_at, {"fg": fetched_at}, clear=True))
+        self.enterContext(patch.dict(ingest._written_place_status, {"fg": Mock()}, clear=True))
+        stored = [{"snapshot_id": 4, "gap": None}, psycopg.OperationalError("gone")]
+        with patch("nextspyke.ingest._store_snapshot", side_effect=stored):
+            with self.assertRaises(psycopg.OperationalError):
+                ingest.ingest_backlog(
+                    ConnectionWithCursor(Mock()),
+                    sample_config(),
+                    [(fetched_at + timedelta(minutes=1), {}), (fetched_at, {})],
+                )
+        self.assertEqual(ingest._last_fetched_at, {})
+        self.assertEqual(ingest._written_place_status, {})
+
+    def test_ingest_batch_stores_polls_and_reports_the_newest(self):
+        first_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        feeds = [
+            (ingest.FetchedFeed(first_at, "{}", first_at, 0.1), {"a": 1}),
+            (ingest.FetchedFeed(first_at + timedelta(seconds=15), "{}", None, 0.1), {"b": 2}),
+        ]
+        stored = [
+            {
+                "snapshot_id": 4,
+                "gap": {"gap_seconds": 600},
+                "cities": 1,
+                "places": 2,
+                "bikes": 3,
+                "movements": 1,
+                "city_counts": {21: (2, 3)},
+                "place_status_rows": 2,
+                "keyframe": True,
+            },
+            {
+                "snapshot_id": 5,
+                "gap": None,
+                "cities": 1,
+                "places": 2,
+                "bikes": 4,
+                "movements": 0,
+                "city_counts": {21: (2, 4)},
+                "place_status_rows": 0,
+                "keyframe": False,
+            },
+        ]
+        with (
+            patch("nextspyke.ingest.ingest_backlog", return_value=stored) as backlog,
+            patch("nextspyke.ingest.observe_snapshot") as observe_snapshot,
+            patch("nextspyke.ingest.mark_place_status_rows") as mark_place_status_rows,
+            patch("nextspyke.ingest.refresh_zone_metadata") as refresh_zones,
+            patch("nextspyke.ingest.refresh_vehicle_type_metadata"),
+        ):
+            result = ingest.ingest_batch(Mock(), sample_config(), feeds)
+
+        self.assertEqual(
+            backlog.call_args.args[2], [(first_at, {"a": 1}), (feeds[1][0].fetched_at, {"b": 2})]
+        )
+        self.assertEqual(result["snapshot_id"], 5)
+        self.assertEqual(result["fetched_at"], feeds[1][0].fetched_at)
+        self.assertEqual(result["snapshots"], 2)
+        self.assertEqual(result["bikes"], 7)
+        self.assertEqual(result["movements"], 1)
+        self.assertEqual(result["stages"]["http"]["ms"], 200.0)
+        self.assertEqual(observe_snapshot.call_args_list[0].args[5], 600)
+        self.assertIsNone(observe_snapshot.call_args_list[1].args[5])
+        # Published only once the batch is committed.
+        self.assertEqual(
+            [call.args for call in mark_place_status_rows.call_args_list],
+            [("fg", 2, 0, True), ("fg", 0, 2, False)],
+        )
+        refresh_zones.assert_called_once()
+
+    def test_ingest_leaves_metadata_to_the_maintenance_scheduler(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        feed = ingest.FetchedFeed(fetched_at, "{}")
+        stored = {
+            "snapshot_id": 5,
+            "gap": None,
+            "cities": 1,
+            "places": 2,
+            "bikes": 3,
+            "movements": 0,
+            "city_counts": {21: (2, 3)},
+            "place_status_rows": 2,
+            "keyframe": True,
+        }
+        self.enterContext(patch.dict(ingest._last_fetched_at, {}, clear=True))
+        with (
+            patch("nextspyke.ingest._store_snapshot", return_value=stored),
+            patch("nextspyke.ingest.ingest_backlog", return_value=[stored]),
+            patch("nextspyke.ingest.observe_snapshot"),
+            patch("nextspyke.ingest.refresh_zone_metadata") as refresh_zones,
+            patch("nextspyke.ingest.refresh_vehicle_type_metadata") as refresh_types,
+        ):
+            ingest.ingest_once(
+                ConnectionWithCursor(Mock()), sample_config(), feed, refresh_metadata=False
+            )
+            ingest.ingest_batch(Mock(), sample_config(), [(feed, {})], refresh_metadata=False)
+        refresh_zones.assert_not_called()
+        refresh_types.assert_not_called()
+
+    def test_store_snapshot_bulk_writes_status_rows_with_copy(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        place = {"uid": 7, "spot": True, "lat": 49.0, "lng": 8.4, "bike_list": [{"number": "100"}]}
+        live_data = {"countries": [{"cities": [{"uid": 21, "places": [place]}]}]}
+        sightings = [("earlier",)]
+        self.enterContext(patch.dict(ingest._last_fetched_at, {"fg": None}, clear=True))
+        with (
+            patch.multiple(
+                "nextspyke.ingest",
+                ensure_partitions=DEFAULT,
+                upsert_country=DEFAULT,
+                upsert_cities=DEFAULT,
+                insert_city_status=DEFAULT,
+                upsert_places=DEFAULT,
+                upsert_vehicle_types=DEFAULT,
+                upsert_bikes=DEFAULT,
+                update_bike_last_status=DEFAULT,
+                insert_place_status=DEFAULT,
+                insert_bike_status=DEFAULT,
+                copy_place_status=DEFAULT,
+                copy_bike_status=DEFAULT,
+            ) as writers,
+            patch("nextspyke.ingest.record_snapshot_gap", return_value=None),
+            patch("nextspyke.ingest.insert_snapshot", return_value=9),
+            patch("nextspyke.ingest.bike_ids", return_value={"100": 1}),
+            patch("nextspyke.ingest.insert_bike_movements") as insert_bike_movements,
+        ):
+            stored = ingest._store_snapshot(
+                Mock(),
+                sample_config(),
+                metrics.StageTimings(),
+                fetched_at,
+                live_data,
+                sightings=sightings,
+            )
+        writers["copy_place_status"].assert_called_once()
+        writers["copy_bike_status"].assert_called_once()
+        writers["insert_place_status"].assert_not_called()
+        writers["insert_bike_status"].assert_not_called()
+        # Movements are left to apply_batch_movements, which gets the bike_status id rows.
+        insert_bike_movements.assert_not_called()
+        writers["update_bike_last_status"].assert_not_called()
+        self.assertEqual(stored["movements"], 0)
+        self.assertEqual(
+            sightings,
+            [("earlier",), (9, fetched_at, 1, 7, None, None, None, None, None, 8.4, 49.0)],
+        )
+
+    def test_store_snapshot_writes_only_changed_stations(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        places = [{"uid": 7, "spot": True, "bikes": 2}, {"uid": 8, "spot": True, "bikes": 5}]
+        live_data = {"countries": [{"cities": [{"uid": 21, "places": places}]}]}
+        self.enterContext(patch.dict(ingest._last_fetched_at, {"fg": None}, clear=True))
+        with (
+            patch.multiple(
+                "nextspyke.ingest",
+                ensure_partitions=DEFAULT,
+                upsert_country=DEFAULT,
+                upsert_cities=DEFAULT,
+                insert_city_status=DEFAULT,
+                upsert_places=DEFAULT,
+                upsert_vehicle_types=DEFAULT,
+                upsert_bikes=DEFAULT,
+                update_bike_last_status=DEFAULT,
+                insert_place_status=DEFAULT,
+                insert_bike_status=DEFAULT,
+            ) as writers,
+            patch("nextspyke.ingest.diff_place_status", return_value=({7}, False)),
+            patch("nextspyke.ingest.record_snapshot_gap", return_value=None),
+            patch("nextspyke.ingest.insert_snapshot", return_value=9) as insert_snapshot,
+            patch("nextspyke.ingest.insert_bike_movements", return_value=0),
+        ):
+            stored = ingest._store_snapshot(
+                Mock(), sample_config(), metrics.StageTimings(), fetched_at, live_data
+            )
+        self.assertEqual(stored["places"], 2)
+        self.assertFalse(insert_snapshot.call_args.args[4])
+        self.assertEqual(writers["insert_place_status"].call_args.args[3], [places[0]])
+        self.assertEqual(writers["insert_place_status"].call_args.args[4], {})
+        self.assertEqual((stored["place_status_rows"], stored["keyframe"]), (1, False))
+
+    def test_failed_snapshot_forgets_written_station_status(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        self.enterContext(patch.dict(ingest._written_place_status, {"fg": Mock()}, clear=True))
+        self.enterContext(patch.dict(ingest._vehicle_type_ordinals, {"5": 1}, clear=True))
+        self.enterContext(patch.dict(ingest._bike_ids, {"100": 1}, clear=True))
+        with patch("nextspyke.ingest._store_snapshot", side_effect=psycopg.OperationalError("x")):
+            with self.assertRaises(psycopg.OperationalError):
+                ingest._ingest_snapshot(
+                    ConnectionWithCursor(Mock()),
+                    sample_config(),
+                    ingest.FetchedFeed(fetched_at, "{}"),
+                    metrics.StageTimings(),
+                )
+        self.assertEqual(ingest._written_place_status, {})
+        self.assertEqual(ingest._vehicle_type_ordinals, {})
+        self.assertEqual(ingest._bike_ids, {})
+
+    def test_copy_status_rows(self):
+        fetched_at = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+        copy = Mock()
+        cur = Mock()
+        cur.copy.return_value.__enter__ = Mock(return_value=copy)
+        cur.copy.return_value.__exit__ = Mock(return_value=False)
+        ingest.copy_bike_status(
+            cur,
+            9,
+            [
+                (9, fetched_at, "100", 7, True, "ok", 80, None, 1.5, 8.4, 49.0),
+                (9, fetched_at, "101", None, True, "ok", None, None, None, None, None),
+            ],
+            {"100": 1, "101": 2},
+        )
+        statement = cur.copy.call_args.args[0].as_string(None)
+        self.assertIn('COPY "bike_status"', statement)
+        self.assertIn('"geom"', statement)
+        rows = [call.args[0] for call in copy.write_row.call_args_list]
+        self.assertEqual(rows[0][9], "SRID=4326;POINT(8.4 49.0)")
+        self.assertEqual([row[2] for row in rows], [1, 2])
+        self.assertIsNone(rows[1][9])
+
+        copy.reset_mock()
+        ingest.copy_place_status(
+            cur,
+            9,
+            fetched_at,
+            [{"uid": 7, "spot": True, "bikes": 3}, {"uid": 8, "spot": False}],
+            {},
+        )
+        rows = [call.args[0] for call in copy.write_row.call_args_list]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][2:5], (7, None, 3))
+
+        cur.reset_mock()
+        ingest.copy_bike_status(cur, 9, [], {})
+        cur.copy.assert_not_called()
+
+    def test_diff_place_status_writes_changes_between_keyframes(self):
+        self.enterContext(patch.dict(ingest._written_place_status, {}, clear=True))
+        cfg = replace(sample_config(), place_status_keyframe_minutes=60)
+        start = datetime(2026, 6, 29, 12, 0, tzinfo=timezone.utc)
+
+        def diff(minute, **bikes):
+            stations = [{"uid": uid, "bikes": count} for uid, count in bikes.items()]
+            return ingest.diff_place_status(cfg, start + timedelta(minutes=minute), stations)
+
+        self.assertEqual(diff(0, a=1, b=5), ({"a", "b"}, True))
+        self.assertEqual(diff(1, a=2, b=5), ({"a"}, False))
+        self.assertEqual(diff(2, a=2, b=5, c=0), ({"c"}, False))
+        self.assertEqual(diff(3, a=2, b=5, c=0), (set(), False))
+        # A station that left the feed, a repeated time and the interval each force a keyframe.
+        self.assertEqual(diff(4, a=2, c=0), ({"a", "c"}, True))
+        self.assertEqual(diff(4, a=2, c=0), ({"a", "c"}, True))
+        self.assertEqual(diff(63, a=2, c=0), (set(), False))
+        self.assertEqual(diff(64, a=2, c=0), ({"a", "c"}, True))
+
+    def test_diff_place_status_keyframes_each_month_and_when_disabled(self):
+        self.enterContext(patch.dict(ingest._written_place_status, {}, clear=True))
+        month_end = datetime(2026, 6, 30, 23, 30, tzinfo=timezone.utc)
+        self.assertEqual(
+            ingest.next_place_status_keyframe(month_end, 60),
+            datetime(2026, 7, 1, tzinfo=timezone.utc),
+        )
+        stations = [{"uid": 7, "bikes": 1}]
+        self.assertEqual(
+            ingest.diff_place_status(sample_config(), month_end, stations), ({7}, True)
+        )
+        self.assertEqual(ingest._written_place_status, {})
+        ingest._written_place_status["fg"] = Mock()
+        ingest.forget_last_snapshots()
+        self.assertEqual(ingest._written_place_status, {})
+
+    def test_vehicle_type_ordinals_registers_unknown_types_once(self):
+        self.enterContext(patch.dict(ingest._vehicle_type_ordinals, {"5": 1}, clear=True))
+        cur = Mock()
+        cur.fetchall.return_value = [("cargo", 2)]
+        self.assertEqual(ingest.vehicle_type_ordinals(cur, {"5", "cargo"}), {"5": 1, "cargo": 2})
+        self.assertEqual(cur.execute.call_args_list[0].args[1], (["cargo"],))
+        cur.reset_mock()
+        ingest.vehicle_type_ordinals(cur, {"cargo"})
+        cur.execute.assert_not_called()
+
+    def test_bike_ids_resolves_unknown_numbers_once(self):
+        self.enterContext(patch.dict(ingest._bike_ids, {"100": 1}, clear=True))
+        cur = Mock()
+        cur.fetchall.return_value = [("101", 2)]
+        self.assertEqual(ingest.bike_ids(cur, {"100", "101"}), {"100": 1, "101": 2})
+        self.assertEqual(cur.execute.call_args.args[1], (["101"],))
+        cur.reset_mock()
+        ingest.bike_ids(cur, {"101"})
+        cur.execute.assert_not_called()
+
+    def test_bike_type_counts_are_indexed_by_ordinal(self):
+        ordinals = {"5": 1, "196": 4}
+        self.assertEqual(ingest.bike_type_counts({196: 2, "5": "1"}, ordinals), [1, 0, 0, 2])
+        self.assertEqual(ingest.bike_type_counts({"5": None}, ordinals), [0])
+        self.assertEqual(ingest.bike_type_counts(None, ordinals), [])
+        places = [{"bike_types": {"5": 1}}, {"bike_types": {196: 0}}, {}]
+        self.assertEqual(ingest.bike_type_ids(places), {"5", "196"})
+
 
 if __name__ == "__main__":
     unittest.main()
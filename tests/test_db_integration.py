@@ -9,7 +9,8 @@ import psycopg
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
-from nextspyke import config, db, ingest
+from nextspyke import config, db, ingest, maintenance
+from nextspyke.metrics import StageTimings
 
 
 class EnvGuard:
@@ -144,6 +145,8 @@ class TestDbIntegration(unittest.TestCase):
                     cur,
                     [(bike_number, None, None, True, ["frame_lock"], fetched_at, fetched_at)],
                 )
+                cur.execute("SELECT bike_id FROM bike WHERE bike_number = %s", (bike_number,))
+                ids = {bike_number: cur.fetchone()[0]}
                 first_snapshot_id = ingest.insert_snapshot(
                     cur,
                     fetched_at,
@@ -168,6 +171,7 @@ class TestDbIntegration(unittest.TestCase):
                             start_place["lat"],
                         )
                     ],
+                    ids,
                 )
                 ingest.update_bike_last_status(cur, first_snapshot_id, fetched_at)
                 second_snapshot_id = ingest.insert_snapshot(
@@ -194,6 +198,7 @@ class TestDbIntegration(unittest.TestCase):
                             end_place["lat"],
                         )
                     ],
+                    ids,
                 )
 
                 inserted = ingest.insert_bike_movements(
@@ -205,18 +210,429 @@ class TestDbIntegration(unittest.TestCase):
                 cur.execute(
                     """
                     SELECT movement_reason, distance_m
-                    FROM bike_movement
+                    FROM v_bike_movement
                     WHERE bike_number = %s AND end_snapshot_id = %s
                     """,
                     (bike_number, second_snapshot_id),
                 )
                 movement = cur.fetchone()
+                cur.execute(
+                    "SELECT bike_number FROM bike_status "
+                    "WHERE snapshot_id = %s AND fetched_at = %s",
+                    (second_snapshot_id, next_fetched_at),
+                )
+                stored_number = cur.fetchone()[0]
 
             self.assertEqual(inserted, 1)
             self.assertEqual(movement[0], "coordinate_change")
             self.assertGreaterEqual(movement[1], 100)
+            self.assertIsNone(stored_number)
+        finally:
+            self.conn.rollback()
+
+    def test_place_status_filled_carries_unchanged_stations_forward(self):
+        fetched_at = datetime.now(timezone.utc).replace(microsecond=0)
+        city_uid = -920001
+        country = {"domain": "test-diff", "name": "Diff test"}
+        stations = [
+            {"uid": -920001, "name": "A", "spot": True, "lat": 49.0, "lng": 8.4, "bikes": 1},
+            {"uid": -920002, "name": "B", "spot": True, "lat": 49.0, "lng": 8.4, "bikes": 5},
+        ]
+        try:
+            with self.conn.cursor() as cur:
+                db.ensure_partitions(cur, fetched_at)
+                ingest.upsert_country(cur, country)
+                ingest.upsert_cities(cur, country["domain"], [{"uid": city_uid, "name": "Diff"}])
+                ingest.upsert_places(cur, city_uid, stations)
+                keyframe_id = ingest.insert_snapshot(cur, fetched_at, country["domain"], None)
+                ingest.insert_place_status(cur, keyframe_id, fetched_at, stations, {})
+                later = fetched_at + timedelta(seconds=60)
+                diff_id = ingest.insert_snapshot(cur, later, country["domain"], None, False)
+                ingest.insert_place_status(cur, diff_id, later, [{**stations[0], "bikes": 2}], {})
+
+                cur.execute(
+                    """
+                    SELECT snapshot_id, place_uid, bikes
+                    FROM place_status_filled(%s, %s, %s)
+                    ORDER BY fetched_at, place_uid DESC
+                    """,
+                    (fetched_at, later + timedelta(seconds=1), country["domain"]),
+                )
+                filled = cur.fetchall()
+                cur.execute(
+                    "SELECT place_uid, bikes FROM place_status_at(%s, %s) ORDER BY place_uid DESC",
+                    (country["domain"], later + timedelta(minutes=5)),
+                )
+                current = cur.fetchall()
+
+            self.assertEqual(
+                filled,
+                [
+                    (keyframe_id, -920001, 1),
+                    (keyframe_id, -920002, 5),
+                    (diff_id, -920001, 2),
+                    (diff_id, -920002, 5),
+                ],
+            )
+            self.assertEqual(current, [(-920001, 2), (-920002, 5)])
+        finally:
+            self.conn.rollback()
+
+    def test_movements_feed_route_stats_dwells_and_trajectories(self):
+        def per_snapshot(cur, snapshots):
+            for snapshot_id, fetched_at, _rows in snapshots:
+                if ingest.insert_bike_movements(cur, snapshot_id, fetched_at, 10):
+                    ingest.upsert_route_stats(cur, snapshot_id, fetched_at)
+                    ingest.close_bike_dwells(cur, snapshot_id, fetched_at)
+                    ingest.append_bike_trajectories(cur, snapshot_id, fetched_at)
+                ingest.update_bike_last_status(cur, snapshot_id, fetched_at)
+
+        def batched(cur, snapshots):
+            # Two batches, so the second one starts from bike_last_status and extends the
+            # trajectory the first one began.
+            for batch in (snapshots[:2], snapshots[2:]):
+                rows = [row for _snapshot_id, _fetched_at, rows in batch for row in rows]
+                ingest.apply_batch_movements(cur, rows, 10, StageTimings())
+
+        for apply_movements in (per_snapshot, batched):
+            with self.subTest(apply_movements.__name__):
+                self._check_movement_rollups(apply_movements)
+
+    def _check_movement_rollups(self, apply_movements):
+        start = datetime(2031, 3, 4, 10, 0, tzinfo=timezone.utc)
+        times = [start + timedelta(minutes=minute) for minute in range(4)]
+        city_uid = -930001
+        country = {"domain": "test-rollups", "name": "Rollup test"}
+        stations = [
+            {"uid": -930001 - i, "name": f"S{i}", "spot": True, "lat": 49.0 + 0.01 * i, "lng": 8.4}
+            for i in range(3)
+        ]
+        docked = "integration-docked-bike"
+        free = "integration-free-floating-bike"
+        # Per snapshot: the docked bike's station, and the free-floating bike's latitude. Both
+        # move at the second and the fourth snapshot and stay put at the third.
+        docked_stations = [0, 1, 1, 2]
+        free_lats = [49.1, 49.11, 49.11, 49.12]
+        try:
+            with self.conn.cursor() as cur:
+                # Hour buckets and days are UTC whatever the session time zone.
+                cur.execute("SET LOCAL TimeZone = 'Asia/Kolkata'")
+                db.ensure_partitions(cur, start)
+                ingest.upsert_country(cur, country)
+                ingest.upsert_cities(cur, country["domain"], [{"uid": city_uid, "name": "R"}])
+                ingest.upsert_places(cur, city_uid, stations)
+                ingest.upsert_bikes(
+                    cur,
+                    [(number, None, None, True, None, start, start) for number in (docked, free)],
+                )
+                cur.execute(
+                    "SELECT bike_number, bike_id FROM bike WHERE bike_number = ANY(%s)",
+                    ([docked, free],),
+                )
+                ids = dict(cur.fetchall())
+                snapshots = []
+                for fetched_at, station, free_lat in zip(
+                    times, docked_stations, free_lats, strict=True
+                ):
+                    snapshot_id = ingest.insert_snapshot(cur, fetched_at, country["domain"], None)
+                    place = stations[station]
+                    rows = [
+                        (snapshot_id, fetched_at, docked, place["uid"], True, "ok")
+                        + (None, None, None, place["lng"], place["lat"]),
+                        (snapshot_id, fetched_at, free, None, True, "ok")
+                        + (None, None, None, 8.4, free_lat),
+                    ]
+                    ingest.insert_bike_status(cur, snapshot_id, rows, ids)
+                    snapshots.append(
+                        (snapshot_id, fetched_at, ingest.bike_status_id_rows(rows, ids))
+                    )
+                apply_movements(cur, snapshots)
+
+                cur.execute(
+                    """
+                    SELECT start_place_uid, end_place_uid, bucket_start, movements
+                    FROM route_stats
+                    WHERE bucket_start >= %s AND bucket_start < %s
+                    ORDER BY start_place_uid DESC NULLS FIRST
+                    """,
+                    (start - timedelta(days=1), start + timedelta(days=1)),
+                )
+                routes = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT bike_number, place_uid, dwell_start, dwell_end, seconds
+                    FROM bike_dwell
+                    WHERE bike_number = ANY(%s)
+                    ORDER BY bike_number
+                    """,
+                    ([docked, free],),
+                )
+                dwells = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT bucket_day, lower_bound_s, dwells, seconds_sum
+                    FROM place_dwell_histogram
+                    WHERE place_uid = %s
+                    """,
+                    (stations[1]["uid"],),
+                )
+                histogram = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT day, ST_NPoints(path), point_times, place_uids
+                    FROM bike_trajectory
+                    WHERE bike_number = %s
+                    """,
+                    (docked,),
+                )
+                trajectory = cur.fetchall()
+                cur.execute(
+                    "SELECT seq, point_time, place_uid FROM bike_path(%s, %s, %s)",
+                    (docked, start, times[-1] + timedelta(seconds=1)),
+                )
+                path = cur.fetchall()
+                cur.execute(
+                    "SELECT seq, point_time, place_uid FROM bike_path(%s, %s, %s)",
+                    (docked, times[1] + timedelta(seconds=30), times[-1] + timedelta(seconds=1)),
+                )
+                later_path = cur.fetchall()
+
+            uids = [station["uid"] for station in stations]
+            # Both free-floating legs share the NULL/NULL route and are counted in one row.
+            self.assertEqual(
+                routes,
+                [
+                    (None, None, start, 2),
+                    (uids[0], uids[1], start, 1),
+                    (uids[1], uids[2], start, 1),
+                ],
+            )
+            self.assertEqual(
+                dwells,
+                [
+                    (docked, uids[1], times[1], times[2], 60),
+                    (free, None, times[1], times[2], 60),
+                ],
+            )
+            self.assertEqual(histogram, [(start.date(), 0, 1, 60)])
+            self.assertEqual(trajectory, [(start.date(), 3, [times[0], times[1], times[3]], uids)])
+            self.assertEqual(
+                path,
+                [(1, times[0], uids[0]), (2, times[1], uids[1]), (3, times[3], uids[2])],
+            )
+            # The leg that ends inside the range starts with its departure point.
+            self.assertEqual(later_path, [(1, times[1], uids[1]), (2, times[3], uids[2])])
+        finally:
+            self.conn.rollback()
+
+    def test_migrate_bike_ids_converts_pre_bike_id_schema(self):
+        schema = "nextspyke_upgrade_test"
+        schema_path = Path(__file__).resolve().parents[1] / "schema.sql"
+        schema_sql = schema_path.read_text(encoding="utf-8")
+        # The schema before bike_id: everything up to the statements that introduced it.
+        legacy_sql = schema_sql[: schema_sql.index("-- Integer surrogate for bike_number")]
+        fetched_at = datetime(2031, 3, 4, 10, 0, tzinfo=timezone.utc)
+        later = fetched_at + timedelta(seconds=60)
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"CREATE SCHEMA {schema}")
+                cur.execute(f"SET search_path TO {schema}, public")
+                cur.execute(legacy_sql)
+                cur.execute(
+                    """
+                    INSERT INTO bike (bike_number, first_seen_at, last_seen_at)
+                    VALUES ('legacy-bike', %s, %s)
+                    """,
+                    (fetched_at, later),
+                )
+                snapshot_ids = []
+                for ts in (fetched_at, later):
+                    cur.execute(
+                        """
+                        INSERT INTO snapshot (fetched_at, domain, source)
+                        VALUES (%s, 'test-upgrade', 'test')
+                        RETURNING snapshot_id
+                        """,
+                        (ts,),
+                    )
+                    snapshot_ids.append(cur.fetchone()[0])
+                    cur.execute(
+                        """
+                        INSERT INTO bike_status (snapshot_id, fetched_at, bike_number, geom)
+                        VALUES (%s, %s, 'legacy-bike', ST_SetSRID(ST_MakePoint(8.4, 49.0), 4326))
+                        """,
+                        (snapshot_ids[-1], ts),
+                    )
+                cur.execute(
+                    """
+                    INSERT INTO bike_movement (
+                        bike_number, start_snapshot_id, start_fetched_at, end_snapshot_id,
+                        end_fetched_at
+                    )
+                    VALUES ('legacy-bike', %s, %s, %s, %s)
+                    """,
+                    (snapshot_ids[0], fetched_at, snapshot_ids[1], later),
+                )
+                cur.execute(
+                    """
+                    INSERT INTO bike_last_status (bike_number, snapshot_id, fetched_at)
+                    VALUES ('legacy-bike', %s, %s)
+                    """,
+                    (snapshot_ids[1], later),
+                )
+                cur.execute(
+                    "CREATE INDEX idx_bike_status_bike_time "
+                    "ON bike_status (bike_number, fetched_at)"
+                )
+                cur.execute(
+                    "CREATE INDEX idx_bike_movement_bike_time "
+                    "ON bike_movement (bike_number, end_fetched_at)"
+                )
+            self.conn.commit()
+
+            with EnvGuard(SCHEMA_PATH=str(schema_path)):
+                db.init_db(self.conn)
+                db.init_db(self.conn)
+
+            # Startup leaves a database with history alone and the collector refuses it.
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT COUNT(*) FROM pg_constraint "
+                    "WHERE conrelid = 'bike_status'::regclass AND contype = 'p'"
+                )
+                keys_after_startup = cur.fetchone()[0]
+            self.conn.commit()
+            with self.assertRaisesRegex(RuntimeError, "migrate-bike-ids"):
+                maintenance.require_bike_id_keys(self.conn)
+
+            converted = maintenance.convert_bike_id_keys(self.conn)
+            maintenance.require_bike_id_keys(self.conn)
+
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT COUNT(*) FROM pg_constraint "
+                    "WHERE conrelid = 'bike_status'::regclass AND contype = 'p'"
+                )
+                bike_status_keys = cur.fetchone()[0]
+                cur.execute(
+                    """
+                    SELECT a.attname
+                    FROM pg_index i
+                    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                    WHERE i.indrelid = 'bike_last_status'::regclass AND i.indisprimary
+                    """
+                )
+                last_status_key = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT bls.bike_id = b.bike_id, v.bike_number
+                    FROM bike_last_status bls
+                    JOIN bike b ON b.bike_number = 'legacy-bike'
+                    JOIN v_bike_last_status v ON v.bike_id = bls.bike_id
+                    """
+                )
+                last_status = cur.fetchall()
+                cur.execute("SELECT bike_number FROM v_bike_status ORDER BY fetched_at")
+                before_migration = cur.fetchall()
+                # Existing history keeps its indexes until `migrate-indexes`.
+                cur.execute(
+                    "SELECT to_regclass(%s)", (f"{schema}.idx_bike_status_fetched_at_brin",)
+                )
+                brin = cur.fetchone()[0]
+            self.conn.commit()
+
+            result = maintenance.migrate_bike_ids(self.conn)
+            again = maintenance.migrate_bike_ids(self.conn)
+
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT bike_number, bike_id IS NOT NULL FROM bike_status")
+                migrated = cur.fetchall()
+                cur.execute("SELECT bike_number FROM v_bike_movement")
+                movements = cur.fetchall()
+                cur.execute(
+                    "SELECT to_regclass(%s), to_regclass(%s)",
+                    (
+                        f"{schema}.idx_bike_status_bike_time",
+                        f"{schema}.idx_bike_movement_bike_time",
+                    ),
+                )
+                old_indexes = cur.fetchone()
+                cur.execute(
+                    """
+                    SELECT c.relname, i.indisvalid, i.indisunique
+                    FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname IN ('idx_bike_status_key', 'idx_bike_movement_bike_id_unique')
+                      AND pg_table_is_visible(c.oid)
+                    ORDER BY c.relname
+                    """
+                )
+                id_indexes = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT conrelid::regclass::text, convalidated
+                    FROM pg_constraint
+                    WHERE contype = 'f'
+                      AND conrelid IN ('bike_status'::regclass, 'bike_movement'::regclass)
+                      AND confrelid = 'bike'::regclass
+                      AND conkey = ARRAY[
+                          (SELECT attnum FROM pg_attribute
+                           WHERE attrelid = conrelid AND attname = 'bike_id')
+                      ]
+                    ORDER BY 1
+                    """
+                )
+                foreign_keys = cur.fetchall()
+            self.conn.commit()
+
+            self.assertEqual(keys_after_startup, 1)
+            self.assertTrue(converted)
+            self.assertEqual(bike_status_keys, 0)
+            self.assertEqual(last_status_key, [("bike_id",)])
+            self.assertEqual(last_status, [(True, "legacy-bike")])
+            self.assertEqual(before_migration, [("legacy-bike",), ("legacy-bike",)])
+            self.assertIsNone(brin)
+            self.assertEqual(
+                result["built_indexes"],
+                [
+                    "bike_status_default_key",
+                    "bike_status_default_unmigrated",
+                    "idx_bike_movement_bike_id_time",
+                    "idx_bike_movement_unmigrated",
+                    "idx_bike_movement_bike_id_unique",
+                ],
+            )
+            self.assertEqual(result["rows"], {"bike_status": 2, "bike_movement": 1})
+            self.assertEqual(result["completed_tables"], ["bike_status", "bike_movement"])
+            self.assertEqual(
+                result["foreign_keys"],
+                [
+                    "bike_movement_bike_id_fkey",
+                    "bike_status_default_bike_id_fkey",
+                    "bike_status_bike_id_fkey",
+                ],
+            )
+            self.assertEqual((again["built_indexes"], again["foreign_keys"]), ([], []))
+            self.assertEqual(migrated, [(None, True), (None, True)])
+            self.assertEqual(movements, [("legacy-bike",)])
+            self.assertEqual(old_indexes, (None, None))
+            self.assertEqual(
+                id_indexes,
+                [
+                    ("idx_bike_movement_bike_id_unique", True, True),
+                    ("idx_bike_status_key", True, True),
+                ],
+            )
+            self.assertEqual(
+                foreign_keys,
+                [("bike_movement", True), ("bike_status", True)],
+            )
         finally:
             self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+                cur.execute("RESET search_path")
+            self.conn.commit()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+import json
+import sys
+import unittest
+from contextlib import contextmanager
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import psycopg
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke import dbstats
+from nextspyke.config import AppConfig
+from nextspyke.dbstats import QueryStatsSampler, plan_shape, statement_target
+
+FETCHED_AT = datetime(2026, 6, 1, 12, tzinfo=timezone.utc)
+
+
+def sample_config(interval: int = 1) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+    return replace(config, query_stats_interval=interval)
+
+
+def explain_result(relation: str, execution_ms: float = 12.0) -> list[dict]:
+    return [
+        {
+            "Plan": {
+                "Node Type": "ModifyTable",
+                "Shared Hit Blocks": 40,
+                "Shared Read Blocks": 3,
+                "Plans": [{"Node Type": "Seq Scan", "Relation Name": relation}],
+            },
+            "Execution Time": execution_ms,
+        }
+    ]
+
+
+class FakeCursor:
+    def __init__(self, results):
+        self.results = list(results)
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class FakeConn:
+    def __init__(self, results=()):
+        self.cur = FakeCursor(results)
+        self.cur.connection = self
+        self.transactions = []
+
+    @contextmanager
+    def transaction(self, **kwargs):
+        self.transactions.append(kwargs)
+        yield
+
+    def cursor(self):
+        return self.cur
+
+
+def sample_value(metric, name: str) -> float:
+    return metric.labels(statement=name)._value.get()
+
+
+class TestPlanShape(unittest.TestCase):
+    def test_partition_suffixes_are_ignored(self):
+        plan = {
+            "Node Type": "Append",
+            "Plans": [
+                {"Node Type": "Index Scan", "Relation Name": "bike_status_202606"},
+                {"Node Type": "Seq Scan", "Relation Name": "bike_status_default"},
+                {"Node Type": "Result"},
+            ],
+        }
+        self.assertEqual(
+            plan_shape(plan),
+            "Append(Index Scan:bike_status,Seq Scan:bike_status,Result)",
+        )
+
+    def test_statement_target_only_tracks_ingest_tables(self):
+        self.assertEqual(
+            statement_target("INSERT INTO bike_movement (a) SELECT $1"), "bike_movement"
+        )
+        self.assertEqual(
+            statement_target("insert  into Route_Stats AS rs VALUES ($1)"), "route_stats"
+        )
+        self.assertIsNone(statement_target("INSERT INTO other_table VALUES ($1)"))
+        self.assertIsNone(statement_target("SELECT 1"))
+
+
+class TestQueryStatsSampler(unittest.TestCase):
+    def test_disabled_sampler_never_samples(self):
+        sampler = QueryStatsSampler(sample_config(interval=0))
+        with patch.object(sampler, "sample_stat_statements") as sample_stats:
+            self.assertIsNone(sampler.start())
+            self.assertFalse(sampler.finish(FakeConn()))
+        sample_stats.assert_not_called()
+
+    def test_samples_every_nth_iteration(self):
+        sampler = QueryStatsSampler(sample_config(interval=3))
+        hooks = []
+        results = []
+        with patch.object(sampler, "sample_stat_statements") as sample_stats:
+            for _iteration in range(6):
+                hooks.append(sampler.start())
+                results.append(sampler.finish(FakeConn()))
+        self.assertEqual(results, [False, False, True, False, False, True])
+        self.assertEqual(hooks, [None, None, sampler.sample_plans] * 2)
+        self.assertEqual(sample_stats.call_count, 2)
+
+    def test_database_errors_are_logged(self):
+        sampler = QueryStatsSampler(sample_config())
+        error = psycopg.errors.InsufficientPrivilege("denied")
+        with patch.object(sampler, "sample_stat_statements", side_effect=error):
+            with patch("nextspyke.dbstats.log_event") as log_event:
+                sampler.start()
+                self.assertFalse(sampler.finish(FakeConn()))
+        self.assertEqual(log_event.call_args.kwargs["event"], "query_stats_failed")
+
+    def test_failed_plan_sample_is_logged_without_raising(self):
+        conn = FakeConn()
+        conn.cur.execute = Mock(side_effect=psycopg.errors.QueryCanceled("timeout"))
+        sampler = QueryStatsSampler(sample_config())
+        with patch("nextspyke.dbstats.log_event") as log_event:
+            sampler.sample_plans(conn.cur, 9, FETCHED_AT)
+        self.assertEqual(conn.transactions, [{"force_rollback": True}])
+        self.assertEqual(log_event.call_args.kwargs["event"], "query_stats_failed")
+
+    def test_sample_plans_explains_statements_in_rolled_back_transaction(self):
+        results = []
+        for index, (name, _sql, _kind) in enumerate(dbstats.EXPLAINED_STATEMENTS):
+            explain = explain_result(f"{name}_202606")
+            # Depending on the adapter setup, json columns arrive parsed or as text.
+            results.append((json.dumps(explain) if index % 2 else explain,))
+        conn = FakeConn(results)
+        sampler = QueryStatsSampler(sample_config())
+        sampler.sample_plans(conn.cur, 9, FETCHED_AT)
+
+        self.assertEqual(conn.transactions, [{"force_rollback": True}])
+        params = [params for _query, params in conn.cur.executed]
+        self.assertEqual(params[0], (9, FETCHED_AT, 10))
+        self.assertEqual(params[1], (9, FETCHED_AT))
+        self.assertEqual(params[2][:2], (9, FETCHED_AT))
+        self.assertEqual(params[2][2], params[2][3])
+        for query, _params in conn.cur.executed:
+            self.assertTrue(query.startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "))
+        self.assertEqual(
+            sampler.plan_shapes["bike_movement"], "ModifyTable(Seq Scan:bike_movement)"
+        )
+        self.assertEqual(sample_value(dbstats.DB_EXPLAIN_EXECUTION_SECONDS, "bike_movement"), 0.012)
+        self.assertEqual(sample_value(dbstats.DB_EXPLAIN_SHARED_BLKS_READ, "route_stats"), 3)
+
+    def test_plan_changes_are_counted_and_logged(self):
+        sampler = QueryStatsSampler(sample_config())
+        before = sample_value(dbstats.DB_PLAN_CHANGES_TOTAL, "bike_dwell")
+        with patch("nextspyke.dbstats.log_event") as log_event:
+            sampler._record_plan("bike_dwell", explain_result("bike_status_202605")[0])
+            sampler._record_plan("bike_dwell", explain_result("bike_status_202606")[0])
+            log_event.assert_not_called()
+            changed = explain_result("bike_status_202606")[0]
+            changed["Plan"]["Plans"][0]["Node Type"] = "Index Scan"
+            sampler._record_plan("bike_dwell", changed)
+        self.assertEqual(sample_value(dbstats.DB_PLAN_CHANGES_TOTAL, "bike_dwell"), before + 1)
+        extra = log_event.call_args.kwargs["extra"]
+        self.assertEqual(log_event.call_args.kwargs["event"], "query_plan_changed")
+        self.assertEqual(extra["plan_shape"], "ModifyTable(Index Scan:bike_status)")
+        self.assertNotEqual(extra["plan"], extra["previous_plan"])
+
+    def test_missing_extension_is_checked_once(self):
+        conn = FakeConn([(False,)])
+        sampler = QueryStatsSampler(sample_config())
+        sampler.sample_stat_statements(conn)
+        sampler.sample_stat_statements(conn)
+        self.assertFalse(sampler.stat_statements_available)
+        self.assertEqual(len(conn.cur.executed), 1)
+
+    def test_stat_statement_deltas_become_counters(self):
+        insert_movement = "INSERT INTO bike_movement (bike_number) SELECT $1"
+        insert_route = "INSERT INTO route_stats AS rs (bucket_start) VALUES ($1)"
+        conn = FakeConn(
+            [
+                (True,),
+                [
+                    (insert_movement, 10, 500.0, 100, 10, 40),
+                    (insert_route, 10, 100.0, 50, 0, None),
+                    ("INSERT INTO other_table VALUES ($1)", 1, 1.0, 1, 1, 1),
+                ],
+                [
+                    (insert_movement, 12, 1500.0, 160, 14, 46),
+                    # The same table written by two statement variants is summed.
+                    (insert_movement + " ON CONFLICT DO NOTHING", 1, 500.0, 0, 0, 1),
+                    (insert_route, 2, 20.0, 10, 0, 2),
+                    ("INSERT INTO place (place_uid) VALUES ($1)", 5, 5.0, 5, 5, 5),
+                ],
+            ]
+        )
+        sampler = QueryStatsSampler(sample_config())
+        before_calls = sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "bike_movement")
+        before_seconds = sample_value(dbstats.DB_STATEMENT_SECONDS_TOTAL, "bike_movement")
+        before_route = sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "route_stats")
+        before_place = sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "place")
+
+        sampler.sample_stat_statements(conn)
+        self.assertEqual(
+            sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "bike_movement"), before_calls
+        )
+        sampler.sample_stat_statements(conn)
+
+        self.assertEqual(
+            sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "bike_movement"), before_calls + 3
+        )
+        self.assertAlmostEqual(
+            sample_value(dbstats.DB_STATEMENT_SECONDS_TOTAL, "bike_movement"),
+            before_seconds + 1.5,
+        )
+        # A reset between samples shows up as a negative delta and is skipped.
+        self.assertEqual(
+            sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "route_stats"), before_route
+        )
+        # Tables first seen in this sample only become the baseline.
+        self.assertEqual(sample_value(dbstats.DB_STATEMENT_CALLS_TOTAL, "place"), before_place)
+        self.assertEqual(sampler.previous_stats["place"]["calls"], 5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,362 @@
+import importlib.util
+import json
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.export import (
+    BIKE_MOVEMENT_EXPORT,
+    BIKE_STATUS_EXPORT,
+    ExportUnit,
+    ParquetSink,
+    export_history,
+    export_unit,
+    parse_export_args,
+    plan_units,
+    unit_signature,
+)
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+MAY_31 = datetime(2026, 5, 31, tzinfo=timezone.utc)
+JUNE_1 = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def status_row(fetched_at: datetime, city_uid: int | None, bike_number: str) -> tuple:
+    return (fetched_at, city_uid, 1, bike_number, 7, True, "ok", 80, 75, 12.5, 49.0, 8.4)
+
+
+class RecordingSink:
+    def __init__(self, path: Path, columns: tuple) -> None:
+        self.path = path
+        self.columns = columns
+        self.rows: list[tuple] = []
+        self.closed = False
+        self.aborted = False
+
+    def write(self, rows: list[tuple]) -> None:
+        self.rows.extend(rows)
+
+    def close(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(len(self.rows)), encoding="utf-8")
+        self.closed = True
+
+    def abort(self) -> None:
+        self.aborted = True
+
+
+class ServerCursor:
+    """Named cursor returning `batches_by_start[day_start]` one fetchmany call at a time."""
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        self.batches: list[list[tuple]] = []
+
+    def execute(self, query, params) -> None:
+        if isinstance(params, dict):
+            return
+        self.conn.queries.append((query, params))
+        self.batches = list(self.conn.batches_by_start.get(params[0], []))
+
+    def fetchmany(self, _size: int) -> list[tuple]:
+        if self.conn.fail_fetch:
+            raise RuntimeError("connection lost")
+        return self.batches.pop(0) if self.batches else []
+
+    def fetchone(self):
+        return self.conn.signature
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class ExportConn:
+    def __init__(self, batches_by_start=None, signature=(10, 99)) -> None:
+        self.batches_by_start = batches_by_start or {}
+        self.signature = signature
+        self.fail_fetch = False
+        self.queries = []
+        self.cursor_names = []
+        self.commits = 0
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def cursor(self, name=None):
+        self.cursor_names.append(name)
+        return ServerCursor(self)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+class TestExportPlanning(unittest.TestCase):
+    def test_partitioned_table_uses_overlapping_partitions(self):
+        partitions = [
+            ("bike_status_202604", datetime(2026, 4, 1, tzinfo=timezone.utc), MAY_31),
+            ("bike_status_202605", datetime(2026, 5, 1, tzinfo=timezone.utc), JUNE_1),
+            ("bike_status_202606", JUNE_1, datetime(2026, 7, 1, tzinfo=timezone.utc)),
+        ]
+        with patch("nextspyke.export.list_month_partitions", return_value=partitions):
+            units = plan_units(Mock(), BIKE_STATUS_EXPORT, MAY_31, JUNE_1 + timedelta(days=2))
+        self.assertEqual(
+            units,
+            [
+                ExportUnit("bike_status_202605", "bike_status_202605", MAY_31, JUNE_1),
+                ExportUnit(
+                    "bike_status_202606",
+                    "bike_status_202606",
+                    JUNE_1,
+                    JUNE_1 + timedelta(days=2),
+                ),
+            ],
+        )
+
+    def test_unpartitioned_table_is_split_by_month(self):
+        units = plan_units(
+            Mock(), BIKE_MOVEMENT_EXPORT, MAY_31, datetime(2026, 7, 1, tzinfo=timezone.utc)
+        )
+        self.assertEqual(
+            [unit.key for unit in units], ["bike_movement_202605", "bike_movement_202606"]
+        )
+        self.assertEqual({unit.source for unit in units}, {"bike_movement"})
+        self.assertEqual(units[0].end, JUNE_1)
+
+    def test_unit_signature(self):
+        cur = Mock()
+        unit = ExportUnit("bike_movement_202606", "bike_movement", JUNE_1, JUNE_1 + timedelta(1))
+        cur.fetchone.return_value = (12, 99)
+        self.assertEqual(unit_signature(cur, BIKE_MOVEMENT_EXPORT, unit), [12, 99])
+        self.assertEqual(cur.execute.call_args.args[1]["start"], JUNE_1)
+        cur.fetchone.return_value = None
+        partition = ExportUnit("bike_status_202606", "bike_status_202606", JUNE_1, JUNE_1)
+        self.assertEqual(unit_signature(cur, BIKE_STATUS_EXPORT, partition), [])
+        self.assertIn(
+            'COUNT(*), MAX(snapshot_id)\n        FROM "bike_status_202606"',
+            cur.execute.call_args.args[0].as_string(None),
+        )
+
+
+class TestExportUnit(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.unit = ExportUnit(
+            "bike_status_202605", "bike_status_202605", MAY_31 - timedelta(1), JUNE_1
+        )
+
+    def test_writes_one_file_per_day_and_city(self):
+        day1 = MAY_31 - timedelta(days=1)
+        conn = ExportConn(
+            {
+                day1: [
+                    [status_row(day1, 21, "100"), status_row(day1, None, "200")],
+                    [status_row(day1, 21, "101")],
+                ],
+                MAY_31: [[status_row(MAY_31, 22, "100")]],
+            }
+        )
+        sinks = []
+
+        def sink_factory(path, columns):
+            sinks.append(RecordingSink(path, columns))
+            return sinks[-1]
+
+        result = export_unit(conn, BIKE_STATUS_EXPORT, self.unit, self.out_dir, sink_factory)
+
+        self.assertEqual(result["rows"], 4)
+        self.assertEqual(
+            result["files"],
+            [
+                "bike_status/date=2026-05-30/city_uid=21/data.parquet",
+                "bike_status/date=2026-05-30/city_uid=__HIVE_DEFAULT_PARTITION__/data.parquet",
+                "bike_status/date=2026-05-31/city_uid=22/data.parquet",
+            ],
+        )
+        self.assertEqual([len(sink.rows) for sink in sinks], [2, 1, 1])
+        self.assertTrue(all(sink.closed for sink in sinks))
+        self.assertEqual(
+            [params for _query, params in conn.queries], [(day1, MAY_31), (MAY_31, JUNE_1)]
+        )
+        self.assertEqual(set(conn.cursor_names), {"export_bike_status_202605"})
+
+    def test_days_are_labelled_in_utc(self):
+        # 01:00+02:00 on May 31 is still May 30 in UTC; both days must get their own files.
+        start = datetime(2026, 5, 31, 1, tzinfo=timezone(timedelta(hours=2)))
+        unit = ExportUnit("bike_status_202605", "bike_status_202605", start, JUNE_1)
+        conn = ExportConn(
+            {
+                start: [[status_row(start, 21, "100")]],
+                MAY_31: [[status_row(MAY_31, 21, "100")]],
+            }
+        )
+
+        result = export_unit(conn, BIKE_STATUS_EXPORT, unit, self.out_dir, RecordingSink)
+
+        self.assertEqual(
+            result["files"],
+            [
+                "bike_status/date=2026-05-30/city_uid=21/data.parquet",
+                "bike_status/date=2026-05-31/city_uid=21/data.parquet",
+            ],
+        )
+
+    def test_failed_day_is_not_published(self):
+        day1 = MAY_31 - timedelta(days=1)
+        conn = ExportConn({day1: [[status_row(day1, 21, "100")]]})
+        sinks = []
+
+        def sink_factory(path, columns):
+            sinks.append(RecordingSink(path, columns))
+            conn.fail_fetch = True
+            return sinks[-1]
+
+        with self.assertRaises(RuntimeError):
+            export_unit(conn, BIKE_STATUS_EXPORT, self.unit, self.out_dir, sink_factory)
+        self.assertTrue(sinks[0].aborted)
+        self.assertFalse(sinks[0].closed)
+
+
+class TestExportHistory(unittest.TestCase):
+    def setUp(self):
+        self.out_dir = Path(self.enterContext(tempfile.TemporaryDirectory())) / "exports"
+        self.conn = ExportConn({JUNE_1: [[status_row(JUNE_1, 21, "100")]]}, signature=(1, 100))
+        partitions = [("bike_status_202606", JUNE_1, datetime(2026, 7, 1, tzinfo=timezone.utc))]
+        self.enterContext(patch("nextspyke.export.list_month_partitions", return_value=partitions))
+
+    def run_export(self):
+        return export_history(
+            self.conn,
+            ["bike_status"],
+            JUNE_1,
+            JUNE_1 + timedelta(days=1),
+            self.out_dir,
+            RecordingSink,
+        )
+
+    def test_reexports_only_changed_units(self):
+        first = self.run_export()
+        self.assertEqual(first, {"exported_units": 1, "skipped_units": 0, "rows": 1, "files": 1})
+        manifest = json.loads((self.out_dir / "manifest.json").read_text(encoding="utf-8"))
+        entry = manifest["tables"]["bike_status"]["bike_status_202606"]
+        self.assertEqual(entry["signature"], [1, 100])
+        self.assertEqual(entry["end"], "2026-06-02T00:00:00.000Z")
+
+        second = self.run_export()
+        self.assertEqual(second["skipped_units"], 1)
+        self.assertEqual(second["exported_units"], 0)
+
+        # New rows arrived; the old files are replaced by the new export.
+        stale = self.out_dir / entry["files"][0]
+        self.conn.signature = (2, 101)
+        self.conn.batches_by_start = {}
+        third = self.run_export()
+        self.assertEqual(third, {"exported_units": 1, "skipped_units": 0, "rows": 0, "files": 0})
+        self.assertFalse(stale.exists())
+
+
+class TestExportArgs(unittest.TestCase):
+    def test_defaults_and_tables(self):
+        args = parse_export_args(["--from", "2026-06-01T00:00:00+00:00"])
+        self.assertEqual(args.start, JUNE_1)
+        self.assertEqual(args.tables, ["bike_status", "bike_movement"])
+        self.assertEqual(args.out, Path("exports"))
+
+        args = parse_export_args(
+            [
+                "--from",
+                "2026-05-31T00:00:00+00:00",
+                "--to",
+                "2026-06-01T00:00:00+00:00",
+                "--tables",
+                "bike_movement",
+                "--out",
+                "/data/export",
+            ]
+        )
+        self.assertEqual((args.start, args.end), (MAY_31, JUNE_1))
+        self.assertEqual(args.tables, ["bike_movement"])
+
+        args = parse_export_args(["--from", "2026-06-01T02:00:00+02:00"])
+        self.assertEqual(args.start, JUNE_1)
+        self.assertIs(args.start.tzinfo, timezone.utc)
+
+    def test_rejects_invalid_arguments(self):
+        invalid = (
+            ["--from", "yesterday"],
+            ["--from", "2026-06-01T00:00:00"],
+            ["--from", "2026-06-01T00:00:00+00:00", "--tables", "place_status"],
+            ["--from", "2026-06-01T00:00:00+00:00", "--to", "2026-05-31T00:00:00+00:00"],
+        )
+        for argv in invalid:
+            with self.subTest(argv=argv):
+                with patch("sys.stderr", StringIO()):
+                    with self.assertRaises(SystemExit):
+                        parse_export_args(argv)
+
+
+class TestParquetSink(unittest.TestCase):
+    def test_missing_pyarrow_raises_helpful_error(self):
+        with patch.dict(sys.modules, {"pyarrow": None, "pyarrow.parquet": None}):
+            with self.assertRaisesRegex(RuntimeError, "--extras parquet"):
+                ParquetSink(Path("unused.parquet"), BIKE_STATUS_EXPORT.columns)
+
+    def test_writes_through_pyarrow_writer(self):
+        pa = Mock()
+        pa.schema.side_effect = lambda fields: [Mock(type=kind) for _name, kind in fields]
+        pq = Mock()
+        pa.parquet = pq
+        out_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        path = out_dir / "date=2026-06-01" / "city_uid=21" / "data.parquet"
+        with patch.dict(sys.modules, {"pyarrow": pa, "pyarrow.parquet": pq}):
+            sink = ParquetSink(
+                path,
+                (("fetched_at", "timestamp"), ("bike_number", "dictionary"), ("bikes", "int32")),
+            )
+            sink.write([(JUNE_1, "100", 1), (JUNE_1, "101", 2)])
+            path.with_name("data.parquet.tmp").write_bytes(b"PAR1")
+            sink.close()
+
+        pa.timestamp.assert_called_once_with("us", tz="UTC")
+        pa.dictionary.assert_called_once_with(pa.int32.return_value, pa.string.return_value)
+        self.assertEqual(pq.ParquetWriter.call_args.kwargs["compression"], "zstd")
+        self.assertEqual(pa.array.call_args_list[1].args[0], ("100", "101"))
+        pq.ParquetWriter.return_value.write_batch.assert_called_once()
+        self.assertEqual(path.read_bytes(), b"PAR1")
+
+        sink.abort()
+        self.assertEqual(pq.ParquetWriter.return_value.close.call_count, 2)
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_round_trip_with_pyarrow(self):
+        import pyarrow.parquet as pq
+
+        out_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        path = out_dir / "data.parquet"
+        sink = ParquetSink(path, BIKE_STATUS_EXPORT.columns)
+        sink.write([status_row(JUNE_1, 21, "100"), status_row(JUNE_1, None, "100")])
+        sink.close()
+
+        table = pq.read_table(path)
+        self.assertEqual(table.num_rows, 2)
+        self.assertEqual(
+            str(table.schema.field("bike_number").type),
+            "dictionary<values=string, indices=int32, ordered=0>",
+        )
+        self.assertEqual(pq.ParquetFile(path).metadata.row_group(0).column(0).compression, "ZSTD")
+        self.assertEqual(table.column("city_uid").to_pylist(), [21, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,27 @@
 import json
 import sys
 import unittest
+from contextlib import contextmanager
+from dataclasses import replace
 from datetime import datetime, timedelta, timezone
 from io import StringIO
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import Mock, patch
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import psycopg
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
 from nextspyke.config import AppConfig
-from nextspyke.health import health_check
+from nextspyke.health import (
+    HealthEndpoints,
+    HealthState,
+    health_check,
+    start_health_server,
+)
 
 
 class DummyCursor:
@@ -111,5 +122,155 @@ class TestHealth(unittest.TestCase):
         self.assertEqual(payload["checks"][1]["status"], "fail")
 
 
+class DummyPool:
+    def __init__(self, error=None):
+        self.conn = Mock()
+        if error:
+            self.conn.execute.side_effect = error
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+def ready_state() -> HealthState:
+    state = HealthState()
+    state.mark_connected()
+    state.mark_success(42, datetime.now(timezone.utc))
+    return state
+
+
+class TestHealthEndpoints(unittest.TestCase):
+    def handle(self, state, target, pool=None):
+        endpoints = HealthEndpoints(sample_config(), state, pool or DummyPool())
+        status, body = endpoints.handle(target)
+        return status, json.loads(body)
+
+    def test_readyz_ok_after_successful_snapshot(self):
+        status, payload = self.handle(ready_state(), "/readyz")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["status"], "ok")
+        self.assertEqual(payload["checks"][1]["name"], "db")
+        self.assertEqual(payload["checks"][2]["name"], "snapshot_freshness")
+        self.assertEqual(payload["checks"][2]["snapshot_id"], 42)
+
+    def test_readyz_fails_before_first_snapshot(self):
+        state = HealthState()
+        state.mark_connected()
+        status, payload = self.handle(state, "/readyz")
+        self.assertEqual(status, 503)
+        self.assertEqual(payload["checks"][1]["status"], "ok")
+        self.assertEqual(payload["checks"][2]["status"], "fail")
+        self.assertIsNone(payload["checks"][2]["age_seconds"])
+
+    def test_readyz_reports_last_error_and_lost_connection(self):
+        state = ready_state()
+        state.mark_failure(RuntimeError("connection reset"), connected=False)
+        status, payload = self.handle(state, "/readyz")
+        self.assertEqual(status, 503)
+        self.assertEqual(payload["checks"][1]["status"], "fail")
+        self.assertEqual(payload["checks"][1]["last_error"], "RuntimeError: connection reset")
+        self.assertIsNotNone(payload["checks"][1]["last_error_at"])
+        # The last snapshot is still fresh; only the connection is down.
+        self.assertEqual(payload["checks"][2]["status"], "ok")
+
+    def test_readyz_ok_on_standby_without_own_snapshots(self):
+        state = HealthState()
+        state.mark_connected()
+        state.mark_standby()
+        status, payload = self.handle(state, "/readyz")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["checks"][2]["role"], "standby")
+        state.mark_success(43, datetime.now(timezone.utc))
+        _status, payload = self.handle(state, "/readyz")
+        self.assertEqual(payload["checks"][2]["role"], "leader")
+
+    def test_readyz_fails_while_shutting_down(self):
+        state = ready_state()
+        state.mark_shutdown()
+        status, payload = self.handle(state, "/readyz")
+        self.assertEqual(status, 503)
+        self.assertEqual(payload["checks"][1]["status"], "fail")
+
+    def test_readyz_deep_check_uses_pool(self):
+        pool = DummyPool()
+        status, payload = self.handle(ready_state(), "/readyz?deep=1", pool)
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["checks"][3]["name"], "db_query")
+        self.assertEqual(payload["checks"][3]["status"], "ok")
+        pool.conn.execute.assert_called_once_with("SELECT 1")
+
+    def test_readyz_deep_check_fails_on_database_error(self):
+        pool = DummyPool(psycopg.OperationalError("gone"))
+        status, payload = self.handle(ready_state(), "/readyz?deep=1", pool)
+        self.assertEqual(status, 503)
+        self.assertEqual(payload["checks"][3]["status"], "fail")
+
+    def test_healthz_tracks_loop_activity(self):
+        state = HealthState()
+        status, payload = self.handle(state, "/healthz")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["checks"][1]["name"], "loop")
+
+        state._last_activity_at = datetime.now(timezone.utc) - timedelta(seconds=181)
+        status, payload = self.handle(state, "/healthz")
+        self.assertEqual(status, 503)
+        self.assertEqual(payload["checks"][1]["status"], "fail")
+
+    def test_unknown_path_is_not_found(self):
+        status, payload = self.handle(HealthState(), "/metrics")
+        self.assertEqual(status, 404)
+        self.assertEqual(payload, {"error": "not found"})
+
+
+class TestHealthServer(unittest.TestCase):
+    def test_server_disabled_by_default(self):
+        self.assertIsNone(start_health_server(sample_config(), HealthState()))
+
+    def test_cli_uses_endpoint_before_database(self):
+        config = replace(sample_config(), health_server_enabled=True, health_port=0)
+        state = ready_state()
+        with patch("nextspyke.health.ReadOnlyPool") as pool_cls:
+            server = start_health_server(config, state)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        pool_cls.assert_called_once()
+        config = replace(config, health_port=server.server_address[1])
+
+        with urlopen(f"http://127.0.0.1:{config.health_port}/healthz") as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.headers["Content-Type"], "application/json")
+
+        buffer = StringIO()
+        with patch("nextspyke.health.psycopg.connect") as connect:
+            with patch("sys.stdout", buffer):
+                code = health_check(config)
+        connect.assert_not_called()
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(buffer.getvalue())["checks"][2]["snapshot_id"], 42)
+
+        state.mark_failure(RuntimeError("boom"), connected=False)
+        buffer = StringIO()
+        with patch("nextspyke.health.psycopg.connect") as connect:
+            with patch("sys.stdout", buffer):
+                code = health_check(config)
+        connect.assert_not_called()
+        self.assertEqual(code, 1)
+        self.assertEqual(json.loads(buffer.getvalue())["status"], "fail")
+
+    def test_cli_falls_back_to_database_when_endpoint_unreachable(self):
+        config = replace(sample_config(), health_server_enabled=True)
+        buffer = StringIO()
+        with patch("nextspyke.health.urlopen", side_effect=URLError("refused")):
+            with patch(
+                "nextspyke.health.psycopg.connect",
+                return_value=DummyConn(datetime.now(timezone.utc)),
+            ):
+                with patch("sys.stdout", buffer):
+                    code = health_check(config)
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(buffer.getvalue())["checks"][1]["name"], "db")
+
+
 if __name__ == "__main__":
     unittest.main()
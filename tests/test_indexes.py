@@ -0,0 +1,302 @@
+import sys
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import MagicMock, Mock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.indexes import (
+    build_bike_id_indexes,
+    build_closed_partition_indexes,
+    closed_partition_index_names,
+    format_index_report,
+    index_report,
+    migrate_indexes,
+)
+
+NOW = datetime(2026, 7, 15, tzinfo=timezone.utc)
+JUNE = (datetime(2026, 6, 1, tzinfo=timezone.utc), datetime(2026, 7, 1, tzinfo=timezone.utc))
+JULY = (datetime(2026, 7, 1, tzinfo=timezone.utc), datetime(2026, 8, 1, tzinfo=timezone.utc))
+PARTITIONS = {
+    "bike_status": [("bike_status_202606", *JUNE), ("bike_status_202607", *JULY)],
+    "place_status": [("place_status_202606", *JUNE), ("place_status_202607", *JULY)],
+}
+
+
+def list_partitions(_cur, table):
+    return PARTITIONS[table]
+
+
+def connection(index_state):
+    conn = MagicMock()
+    conn.autocommit = False
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = index_state
+    return conn
+
+
+def executed(conn) -> list[str]:
+    return [
+        query if isinstance(query, str) else query.as_string(None)
+        for query, *_params in (call.args for call in conn.execute.call_args_list)
+    ]
+
+
+@patch("nextspyke.indexes.list_month_partitions", side_effect=list_partitions)
+class TestClosedPartitionIndexes(unittest.TestCase):
+    def test_only_closed_partitions_get_indexes(self, _list_partitions):
+        names = [name for _index, _partition, name in closed_partition_index_names(Mock(), NOW)]
+        self.assertEqual(
+            names,
+            [
+                "bike_status_202606_geom",
+                "bike_status_202606_bike_id_time",
+                "place_status_202606_place_time",
+            ],
+        )
+
+    def test_builds_missing_indexes_concurrently_outside_transaction(self, _list_partitions):
+        conn = connection([("bike_status_202606_geom", True)])
+        autocommit = []
+        conn.execute.side_effect = lambda _query: autocommit.append(conn.autocommit)
+
+        result = build_closed_partition_indexes(conn, NOW)
+
+        self.assertEqual(
+            result["built_indexes"],
+            ["bike_status_202606_bike_id_time", "place_status_202606_place_time"],
+        )
+        self.assertEqual(result["closed_partition_indexes"], 3)
+        self.assertEqual(autocommit, [True, True])
+        self.assertFalse(conn.autocommit)
+        conn.commit.assert_called_once()
+        self.assertEqual(
+            executed(conn)[0],
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "bike_status_202606_bike_id_time" '
+            'ON "bike_status_202606" (bike_id, fetched_at)',
+        )
+
+    def test_rebuilds_invalid_index_left_by_failed_build(self, _list_partitions):
+        conn = connection(
+            [
+                ("bike_status_202606_geom", False),
+                ("bike_status_202606_bike_id_time", True),
+                ("place_status_202606_place_time", True),
+            ]
+        )
+
+        result = build_closed_partition_indexes(conn, NOW)
+
+        self.assertEqual(result["built_indexes"], ["bike_status_202606_geom"])
+        self.assertEqual(
+            executed(conn),
+            [
+                'DROP INDEX CONCURRENTLY IF EXISTS "bike_status_202606_geom"',
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "bike_status_202606_geom" '
+                'ON "bike_status_202606" USING GIST (geom)',
+            ],
+        )
+
+    def test_restores_autocommit_when_build_fails(self, _list_partitions):
+        conn = connection([])
+        conn.execute.side_effect = RuntimeError("lock timeout")
+        with self.assertRaises(RuntimeError):
+            build_closed_partition_indexes(conn, NOW)
+        self.assertFalse(conn.autocommit)
+
+
+@patch("nextspyke.indexes.list_month_partitions", side_effect=list_partitions)
+class TestMigrateIndexes(unittest.TestCase):
+    def test_builds_replacements_before_dropping_old_indexes(self, _list_partitions):
+        conn = connection(None)
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.side_effect = [
+            # closed partition indexes
+            [
+                ("bike_status_202606_geom", True),
+                ("bike_status_202606_bike_id_time", True),
+                ("place_status_202606_place_time", True),
+            ],
+            # parent BRIN index
+            [],
+            # bike_status partitions, and the one already attached
+            [
+                ("bike_status_202605",),
+                ("bike_status_202606",),
+                ("bike_status_202607",),
+                ("bike_status_default",),
+            ],
+            [("bike_status_202607",)],
+            # built by an earlier run that stopped before attaching it, and a failed build
+            [
+                ("bike_status_202605_fetched_at_brin", True),
+                ("bike_status_202606_fetched_at_brin", False),
+            ],
+            # place_status BRIN index, one partition
+            [],
+            [("place_status_202606",)],
+            [],
+            [],
+            # covering index
+            [],
+            # replaced indexes
+            [("idx_bike_status_geom", True), ("idx_bike_movement_time", True)],
+        ]
+
+        result = migrate_indexes(conn, NOW)
+
+        self.assertEqual(
+            result["built_indexes"],
+            [
+                "bike_status_202606_fetched_at_brin",
+                "bike_status_default_fetched_at_brin",
+                "place_status_202606_fetched_at_brin",
+                "idx_bike_movement_time_covering",
+            ],
+        )
+        self.assertEqual(
+            result["dropped_indexes"], ["idx_bike_status_geom", "idx_bike_movement_time"]
+        )
+        self.assertEqual(
+            executed(conn),
+            [
+                'CREATE INDEX IF NOT EXISTS "idx_bike_status_fetched_at_brin" '
+                'ON ONLY "bike_status" USING BRIN (fetched_at)',
+                'ALTER INDEX "idx_bike_status_fetched_at_brin" '
+                'ATTACH PARTITION "bike_status_202605_fetched_at_brin"',
+                'DROP INDEX CONCURRENTLY IF EXISTS "bike_status_202606_fetched_at_brin"',
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "bike_status_202606_fetched_at_brin" '
+                'ON "bike_status_202606" USING BRIN (fetched_at)',
+                'ALTER INDEX "idx_bike_status_fetched_at_brin" '
+                'ATTACH PARTITION "bike_status_202606_fetched_at_brin"',
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "bike_status_default_fetched_at_brin" '
+                'ON "bike_status_default" USING BRIN (fetched_at)',
+                'ALTER INDEX "idx_bike_status_fetched_at_brin" '
+                'ATTACH PARTITION "bike_status_default_fetched_at_brin"',
+                'CREATE INDEX IF NOT EXISTS "idx_place_status_fetched_at_brin" '
+                'ON ONLY "place_status" USING BRIN (fetched_at)',
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "place_status_202606_fetched_at_brin" '
+                'ON "place_status_202606" USING BRIN (fetched_at)',
+                'ALTER INDEX "idx_place_status_fetched_at_brin" '
+                'ATTACH PARTITION "place_status_202606_fetched_at_brin"',
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_bike_movement_time_covering" '
+                'ON "bike_movement" (end_fetched_at) '
+                "INCLUDE (distance_m, duration_seconds, start_place_uid, end_place_uid)",
+                "SELECT set_config('lock_timeout', %s, false)",
+                'DROP INDEX IF EXISTS "idx_bike_status_geom"',
+                'DROP INDEX CONCURRENTLY IF EXISTS "idx_bike_movement_time"',
+            ],
+        )
+        self.assertFalse(conn.autocommit)
+
+    def test_migrated_database_is_left_alone(self, _list_partitions):
+        conn = connection(None)
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.side_effect = [
+            [
+                ("bike_status_202606_geom", True),
+                ("bike_status_202606_bike_id_time", True),
+                ("place_status_202606_place_time", True),
+            ],
+            [("idx_bike_status_fetched_at_brin", True)],
+            [("idx_place_status_fetched_at_brin", True)],
+            [("idx_bike_movement_time_covering", True)],
+            [],
+        ]
+
+        result = migrate_indexes(conn, NOW)
+
+        self.assertEqual(result, {"built_indexes": [], "dropped_indexes": []})
+        self.assertEqual(executed(conn), ["SELECT set_config('lock_timeout', %s, false)"])
+
+
+class TestBikeIdIndexes(unittest.TestCase):
+    def test_builds_unique_key_per_partition_and_skips_existing(self):
+        conn = connection(None)
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.side_effect = [
+            # idx_bike_status_key: parent, partitions, attached ones, partition indexes
+            [],
+            [("bike_status_202606",)],
+            [],
+            [],
+            # idx_bike_status_unmigrated exists
+            [("idx_bike_status_unmigrated", True)],
+            # bike_movement indexes
+            [("idx_bike_movement_bike_id_time", True)],
+            [("idx_bike_movement_unmigrated", True)],
+            [],
+        ]
+
+        built = build_bike_id_indexes(conn)
+
+        self.assertEqual(built, ["bike_status_202606_key", "idx_bike_movement_bike_id_unique"])
+        self.assertEqual(
+            executed(conn),
+            [
+                'CREATE UNIQUE INDEX IF NOT EXISTS "idx_bike_status_key" '
+                'ON ONLY "bike_status" (snapshot_id, bike_id, fetched_at)',
+                'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "bike_status_202606_key" '
+                'ON "bike_status_202606" (snapshot_id, bike_id, fetched_at)',
+                'ALTER INDEX "idx_bike_status_key" ATTACH PARTITION "bike_status_202606_key"',
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "
+                '"idx_bike_movement_bike_id_unique" '
+                'ON "bike_movement" (bike_id, start_snapshot_id, end_snapshot_id)',
+            ],
+        )
+        self.assertFalse(conn.autocommit)
+
+
+class TestIndexReport(unittest.TestCase):
+    def test_reads_rows_as_dicts(self):
+        cur = Mock()
+        cur.fetchall.return_value = [("bike_status", "idx_bike_status_key", 2, 2048, 5, 9)]
+        self.assertEqual(
+            index_report(cur),
+            [
+                {
+                    "table": "bike_status",
+                    "index": "idx_bike_status_key",
+                    "indexes": 2,
+                    "size_bytes": 2048,
+                    "scans": 5,
+                    "tuples_read": 9,
+                }
+            ],
+        )
+
+    def test_formats_size_against_scans_and_flags_unused(self):
+        rows = [
+            {
+                "table": "bike_status",
+                "index": "bike_status_*_geom",
+                "indexes": 3,
+                "size_bytes": 3 * 1024 * 1024,
+                "scans": 0,
+                "tuples_read": None,
+            },
+            {
+                "table": "snapshot",
+                "index": "idx_snapshot_fetched_at",
+                "indexes": 1,
+                "size_bytes": 1024 * 1024,
+                "scans": 42,
+                "tuples_read": 84,
+            },
+        ]
+        lines = format_index_report(rows)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith("index "))
+        self.assertTrue(lines[1].startswith("bike_status.bike_status_*_geom"))
+        self.assertIn("3.0", lines[1])
+        self.assertTrue(lines[1].endswith("unused"))
+        self.assertTrue(lines[2].endswith(" 84"))
+
+    def test_formats_empty_report(self):
+        self.assertEqual(len(format_index_report([])), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
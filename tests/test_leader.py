@@ -0,0 +1,106 @@
+import sys
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke import ingest
+from nextspyke.config import AppConfig
+from nextspyke.leader import TRY_LEADER_LOCK_SQL, LeaderElection
+from nextspyke.metrics import APP_LEADER, APP_LEADER_CHANGES_TOTAL
+
+
+def sample_config(**overrides) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+        leader_election_enabled=True,
+    )
+    return replace(config, **overrides)
+
+
+def lock_conn(*results: bool) -> Mock:
+    conn = Mock(closed=False)
+    conn.execute.return_value.fetchone.side_effect = [(result,) for result in results]
+    return conn
+
+
+def leader_changes(domain: str) -> float:
+    return APP_LEADER_CHANGES_TOTAL.labels(domain=domain)._value.get()
+
+
+class TestLeaderElection(unittest.TestCase):
+    def setUp(self):
+        self.log_event = self.enterContext(patch("nextspyke.leader.log_event"))
+
+    def test_disabled_election_always_leads_without_queries(self):
+        conn = lock_conn()
+        election = LeaderElection(sample_config(leader_election_enabled=False))
+        self.assertTrue(election.ensure(conn))
+        conn.execute.assert_not_called()
+
+    def test_may_ingest_follows_leadership(self):
+        self.assertTrue(LeaderElection(sample_config(leader_election_enabled=False)).may_ingest)
+        election = LeaderElection(sample_config(domain="leader-d"))
+        self.assertFalse(election.may_ingest)
+        election.ensure(lock_conn(True))
+        self.assertTrue(election.may_ingest)
+
+    def test_takes_lock_once_per_connection(self):
+        conn = lock_conn(True)
+        election = LeaderElection(sample_config(domain="leader-a"))
+        self.assertTrue(election.ensure(conn))
+        self.assertTrue(election.ensure(conn))
+        conn.execute.assert_called_once_with(TRY_LEADER_LOCK_SQL, ("nextspyke.ingest:leader-a",))
+        conn.commit.assert_called_once()
+        self.assertTrue(election.is_leader)
+        self.assertEqual(APP_LEADER.labels(domain="leader-a")._value.get(), 1)
+        self.assertEqual(leader_changes("leader-a"), 0)
+        self.assertEqual(self.log_event.call_args.kwargs["event"], "leader_acquired")
+
+    def test_standby_retries_and_takes_over(self):
+        conn = lock_conn(False, False, True)
+        election = LeaderElection(sample_config(domain="leader-b"))
+        with patch.dict(ingest._last_fetched_at, {"leader-b": None}, clear=True):
+            self.assertFalse(election.ensure(conn))
+            self.assertFalse(election.ensure(conn))
+            self.assertEqual(APP_LEADER.labels(domain="leader-b")._value.get(), 0)
+            self.assertTrue(election.ensure(conn))
+            # Snapshot times remembered before the takeover may be stale.
+            self.assertEqual(ingest._last_fetched_at, {})
+        events = [call.kwargs["event"] for call in self.log_event.call_args_list]
+        self.assertEqual(events, ["leader_standby", "leader_acquired"])
+        self.assertEqual(leader_changes("leader-b"), 1)
+
+    def test_lost_connection_drops_leadership(self):
+        first = lock_conn(True)
+        election = LeaderElection(sample_config(domain="leader-c"))
+        self.assertTrue(election.ensure(first))
+        first.closed = True
+        self.assertFalse(election.ensure(lock_conn(False)))
+        self.assertFalse(election.is_leader)
+        self.assertEqual(self.log_event.call_args.kwargs["event"], "leader_standby")
+        self.assertEqual(leader_changes("leader-c"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,58 @@
 import json
 import sys
+import time
 import unittest
+from dataclasses import replace
 from datetime import datetime, timezone
 from io import StringIO
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
-from nextspyke.logging import log_event
+from nextspyke import logging as app_logging
+from nextspyke.config import AppConfig
+from nextspyke.logging import (
+    LOG_RECORDS_DROPPED_TOTAL,
+    BufferedLogWriter,
+    DuplicateFilter,
+    configure_logging,
+    flush_logs,
+    log_event,
+)
+
+
+def sample_config(**overrides) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+    return replace(config, **overrides)
+
+
+def dropped_total(reason: str) -> float:
+    return LOG_RECORDS_DROPPED_TOTAL.labels(reason=reason)._value.get()
+
+
+def records(output: StringIO) -> list[dict]:
+    return [json.loads(line) for line in output.getvalue().splitlines()]
 
 
 class TestLogging(unittest.TestCase):
@@ -30,5 +73,174 @@ class TestLogging(unittest.TestCase):
         self.assertEqual(record["gap_start"], "2026-06-26T20:38:05.000Z")
 
 
+class TestBufferedLogging(unittest.TestCase):
+    def tearDown(self):
+        flush_logs()
+        app_logging._duplicates = None
+
+    def test_default_config_logs_synchronously(self):
+        configure_logging(sample_config())
+        self.assertIsNone(app_logging._writer)
+        output = StringIO()
+        with patch("sys.stdout", output):
+            log_event("info", "app", "hello", event="hello")
+        self.assertEqual(records(output)[0]["event"], "hello")
+
+    def test_async_writer_batches_and_flushes_on_shutdown(self):
+        output = StringIO()
+        config = sample_config(log_async=True, log_flush_interval_s=0.01)
+        with patch("sys.stdout", output):
+            with patch("nextspyke.logging.atexit.register") as register:
+                configure_logging(config)
+                writer = app_logging._writer
+                configure_logging(config)
+                self.assertIs(app_logging._writer, writer)
+                try:
+                    raise RuntimeError("boom")
+                except RuntimeError as exc:
+                    log_event("error", "app", "failed", event="ingest_failed", exc=exc)
+                log_event("info", "app", "ok", event="ingest_success", config=config)
+                # Let the writer go idle at least once before shutting it down.
+                time.sleep(0.05)
+                flush_logs()
+        register.assert_called_once_with(flush_logs)
+        self.assertIsNone(app_logging._writer)
+        failed, succeeded = records(output)
+        self.assertEqual(failed["exception_type"], "RuntimeError")
+        self.assertIn("RuntimeError: boom", failed["stack"])
+        self.assertEqual(succeeded["service"], "nextspyke")
+
+    def test_full_queue_drops_and_reports_records(self):
+        writer = BufferedLogWriter(max_queue=1, flush_interval_s=0.01, config=sample_config())
+        before = dropped_total("queue_full")
+        writer.submit({"msg": "kept"}, None)
+        writer.submit({"msg": "dropped"}, None)
+        self.assertEqual(dropped_total("queue_full"), before + 1)
+
+        output = StringIO()
+        with patch("sys.stdout", output):
+            with patch("nextspyke.logging.LOG_BATCH_SIZE", 1):
+                writer.start()
+                writer.close(timeout_s=5)
+                writer.close(timeout_s=5)
+        kept, report = records(output)
+        self.assertEqual(kept, {"msg": "kept"})
+        self.assertEqual(report["event"], "log_records_dropped")
+        self.assertEqual(report["dropped"], 1)
+
+    def test_failed_write_is_reported_and_the_writer_keeps_running(self):
+        writer = BufferedLogWriter(max_queue=10, flush_interval_s=0.01, config=sample_config())
+        before = dropped_total("write_failed")
+        output = StringIO()
+        errors = StringIO()
+        failing = Mock(**{"write.side_effect": OSError("broken pipe")})
+        with patch("sys.stderr", errors):
+            with patch("sys.stdout", failing):
+                writer.start()
+                writer.submit({"msg": "lost"}, None)
+                # Let the writer fail on the first record before stdout recovers.
+                deadline = time.monotonic() + 5
+                while not errors.getvalue() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            with patch("sys.stdout", output):
+                writer.submit({"msg": "after"}, None)
+                writer.close(timeout_s=5)
+        self.assertEqual(dropped_total("write_failed"), before + 1)
+        (report,) = records(errors)
+        self.assertEqual(report["event"], "log_write_failed")
+        self.assertEqual((report["exception_type"], report["lost"]), ("OSError", 1))
+        self.assertEqual(records(output), [{"msg": "after"}])
+
+    def test_failure_report_tolerates_a_broken_stderr(self):
+        writer = BufferedLogWriter(max_queue=1, flush_interval_s=0.01)
+        with patch("sys.stderr", Mock(**{"write.side_effect": OSError("gone")})):
+            writer._report_failure(OSError("broken pipe"), 3)
+
+    def test_records_are_written_directly_once_the_writer_thread_is_gone(self):
+        writer = BufferedLogWriter(max_queue=1, flush_interval_s=0.01)
+        writer.start()
+        writer.close(timeout_s=5)
+        output = StringIO()
+        with patch("sys.stdout", output):
+            writer.submit({"msg": "late"}, None)
+        self.assertEqual(records(output), [{"msg": "late"}])
+        self.assertTrue(writer._queue.empty())
+
+    def test_close_gives_up_when_the_queue_stays_full(self):
+        writer = BufferedLogWriter(max_queue=1, flush_interval_s=0.01)
+        writer._thread = Mock(**{"is_alive.return_value": True})
+        writer.submit({"msg": "pending"}, None)
+        writer.close(timeout_s=0.01)
+        writer._thread.join.assert_not_called()
+
+
+class TestDuplicateFilter(unittest.TestCase):
+    def tearDown(self):
+        app_logging._duplicates = None
+
+    def test_check_suppresses_within_window_and_reports_count(self):
+        duplicates = DuplicateFilter(window_s=60)
+        self.assertEqual(duplicates.check(("a",), 0.0), 0)
+        self.assertIsNone(duplicates.check(("a",), 10.0))
+        self.assertIsNone(duplicates.check(("a",), 20.0))
+        self.assertEqual(duplicates.check(("b",), 20.0), 0)
+        self.assertEqual(duplicates.check(("a",), 61.0), 2)
+
+    def test_stale_keys_are_pruned(self):
+        duplicates = DuplicateFilter(window_s=60)
+        with patch("nextspyke.logging.DUPLICATE_KEYS_MAX", 2):
+            duplicates.check(("a",), 0.0)
+            duplicates.check(("b",), 50.0)
+            duplicates.check(("c",), 100.0)
+        self.assertEqual(set(duplicates._seen), {("b",), ("c",)})
+
+    def test_log_event_rate_limits_duplicate_failures(self):
+        configure_logging(sample_config(log_duplicate_window_s=60))
+        before = dropped_total("duplicate")
+        output = StringIO()
+        error = RuntimeError("zone service down")
+        with patch("sys.stdout", output):
+            with patch("nextspyke.logging.time.monotonic", return_value=100.0):
+                for source in ("zone-service", "zone-service", "flexzone", "zone-service"):
+                    log_event(
+                        "warn",
+                        "ingest",
+                        "Optional ingest step failed",
+                        event="optional_ingest_failed",
+                        extra={"optional_source": source, "duration_ms": 3},
+                        exc=error,
+                    )
+                log_event("info", "app", "progress", event="progress")
+                log_event("info", "app", "progress", event="progress")
+                log_event("error", "app", "crash", event="crashed")
+                log_event("error", "app", "crash", event="crashed")
+            with patch("nextspyke.logging.time.monotonic", return_value=200.0):
+                log_event(
+                    "warn",
+                    "ingest",
+                    "Optional ingest step failed",
+                    event="optional_ingest_failed",
+                    extra={"optional_source": "zone-service", "duration_ms": 5},
+                    exc=error,
+                )
+        events = [
+            (record["event"], record.get("optional_source"), record.get("suppressed_duplicates"))
+            for record in records(output)
+        ]
+        self.assertEqual(
+            events,
+            [
+                ("optional_ingest_failed", "zone-service", None),
+                ("optional_ingest_failed", "flexzone", None),
+                ("progress", None, None),
+                ("progress", None, None),
+                ("crashed", None, None),
+                ("crashed", None, None),
+                ("optional_ingest_failed", "zone-service", 2),
+            ],
+        )
+        self.assertEqual(dropped_total("duplicate"), before + 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,12 @@
 import sys
 import unittest
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from unittest.mock import Mock, patch
 from urllib.error import URLError
 
 import psycopg
+from prometheus_client import REGISTRY
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
@@ -104,11 +106,112 @@ class TestMetrics(unittest.TestCase):
         duration.observe.assert_called_once_with(2.0)
         last_ts.set.assert_called_once()
 
+    def test_stage_timings_sum_repeated_stages(self):
+        timings = metrics.StageTimings()
+        with patch("nextspyke.metrics.time.perf_counter", side_effect=[1.0, 1.25, 2.0, 2.5]):
+            with timings.stage("upsert_places", rows=3):
+                pass
+            with timings.stage("upsert_places", rows=4):
+                pass
+        timings.record("commit", 0.01)
+        self.assertEqual(
+            timings.summary(),
+            {"upsert_places": {"ms": 750.0, "rows": 7}, "commit": {"ms": 10.0}},
+        )
+
+    def test_stage_timings_observe_exports_histogram_and_rows(self):
+        timings = metrics.StageTimings()
+        timings.record("http", 0.2)
+        timings.record("insert_bike_status", 0.1, rows=50)
+        with patch.object(metrics, "APP_INGEST_STAGE_DURATION") as duration:
+            with patch.object(metrics, "APP_INGEST_STAGE_ROWS_TOTAL") as rows:
+                timings.observe()
+        duration.labels.assert_any_call(stage="http")
+        duration.labels.return_value.observe.assert_any_call(0.2)
+        rows.labels.assert_called_once_with(stage="insert_bike_status")
+        rows.labels.return_value.inc.assert_called_once_with(50)
+
+    def test_stage_timings_record_failed_stage(self):
+        timings = metrics.StageTimings()
+        with self.assertRaises(RuntimeError):
+            with timings.stage("http"):
+                raise RuntimeError("boom")
+        self.assertIn("http", timings.seconds)
+
     def test_classify_failure_reason(self):
         self.assertEqual(metrics.classify_failure_reason(psycopg.Error("x")), "db")
         self.assertEqual(metrics.classify_failure_reason(URLError("x")), "http")
         self.assertEqual(metrics.classify_failure_reason(Exception("x")), "unknown")
 
 
+def sample_value(name: str, **labels) -> float | None:
+    return REGISTRY.get_sample_value(name, labels)
+
+
+class TestSnapshotMetrics(unittest.TestCase):
+    def test_observe_sets_city_gauges_and_histograms(self):
+        fetched_at = datetime.now(timezone.utc) - timedelta(seconds=30)
+        snapshot_metrics = metrics.SnapshotMetrics()
+        snapshot_metrics.observe(
+            "test-observe",
+            fetched_at,
+            {21: (120, 900), 22: (10, 50)},
+            movements=7,
+            feed_updated_at=fetched_at - timedelta(seconds=12),
+            gap_seconds=300,
+        )
+
+        domain = {"domain": "test-observe"}
+        self.assertEqual(sample_value("app_snapshot_stations", city="21", **domain), 120)
+        self.assertEqual(sample_value("app_snapshot_bikes", city="22", **domain), 50)
+        self.assertEqual(
+            sample_value("app_city_last_snapshot_timestamp_seconds", city="21", **domain),
+            fetched_at.timestamp(),
+        )
+        self.assertGreaterEqual(sample_value("app_snapshot_age_seconds", **domain), 30)
+        self.assertEqual(sample_value("app_snapshot_movements_sum", **domain), 7)
+        self.assertEqual(sample_value("app_feed_lag_seconds_sum", **domain), 12)
+        self.assertEqual(sample_value("app_snapshot_gap_seconds_sum", **domain), 300)
+
+        snapshot_metrics.observe("test-observe", fetched_at + timedelta(seconds=60), {}, 0)
+        self.assertEqual(sample_value("app_feed_lag_seconds_count", **domain), 1)
+        self.assertEqual(sample_value("app_snapshot_gap_seconds_count", **domain), 1)
+        self.assertEqual(sample_value("app_snapshot_movements_count", **domain), 2)
+
+    def test_city_labels_are_capped(self):
+        snapshot_metrics = metrics.SnapshotMetrics(city_limit=2)
+        snapshot_metrics.observe(
+            "test-cap",
+            datetime.now(timezone.utc),
+            {1: (1, 10), 2: (2, 20), 3: (3, 30), 4: (4, 40)},
+            movements=0,
+        )
+
+        domain = {"domain": "test-cap"}
+        self.assertEqual(sample_value("app_snapshot_bikes", city="2", **domain), 20)
+        self.assertIsNone(sample_value("app_snapshot_bikes", city="3", **domain))
+        self.assertEqual(sample_value("app_snapshot_bikes", city="other", **domain), 70)
+        self.assertEqual(sample_value("app_snapshot_stations", city="other", **domain), 7)
+        # Known cities keep their label even after the limit is reached.
+        self.assertEqual(snapshot_metrics.city_label(1), "1")
+        self.assertEqual(snapshot_metrics.city_label(99), "other")
+
+    def test_observe_snapshot_uses_module_instance(self):
+        with patch.object(metrics, "_snapshot_metrics") as snapshot_metrics:
+            fetched_at = datetime.now(timezone.utc)
+            metrics.observe_snapshot("fg", fetched_at, {21: (1, 2)}, 3)
+        snapshot_metrics.observe.assert_called_once_with(
+            "fg", fetched_at, {21: (1, 2)}, 3, None, None
+        )
+
+    def test_mark_place_status_rows_counts_keyframes(self):
+        metrics.mark_place_status_rows("test-diff", 120, 0, True)
+        metrics.mark_place_status_rows("test-diff", 3, 117, False)
+        domain = {"domain": "test-diff"}
+        self.assertEqual(sample_value("app_place_status_rows_written_total", **domain), 123)
+        self.assertEqual(sample_value("app_place_status_rows_skipped_total", **domain), 117)
+        self.assertEqual(sample_value("app_place_status_keyframes_total", **domain), 1)
+
+
 if __name__ == "__main__":
     unittest.main()
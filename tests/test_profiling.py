@@ -0,0 +1,104 @@
+import sys
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.config import AppConfig
+from nextspyke.profiling import IterationProfiler
+
+
+def sample_config(profile_dir: str, threshold_s: float = 0.0, keep: int = 20) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=1,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+    return replace(
+        config,
+        profile_slow_iteration_s=threshold_s,
+        profile_dir=profile_dir,
+        profile_keep=keep,
+    )
+
+
+class TestIterationProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = Path(self.tmp.name) / "profiles"
+
+    def test_disabled_without_threshold_or_request(self):
+        profiler = IterationProfiler(sample_config(str(self.directory)))
+        profile = profiler.start()
+        self.assertIsNone(profile)
+        self.assertIsNone(profiler.finish(profile, 10.0, 1))
+        self.assertFalse(self.directory.exists())
+
+    def test_iterations_run_unprofiled_until_one_is_slow(self):
+        profiler = IterationProfiler(sample_config(str(self.directory), threshold_s=5.0))
+        self.assertIsNone(profiler.start())
+        self.assertIsNone(profiler.finish(None, 1.0, 1))
+        self.assertIsNone(profiler.start())
+        # A slow iteration arms the profiler for the next one only.
+        self.assertIsNone(profiler.finish(None, 6.0, 2))
+        profile = profiler.start()
+        self.assertIsNotNone(profile)
+        self.assertIsNone(profiler.finish(profile, 1.0, 3))
+        self.assertIsNone(profiler.start())
+        self.assertFalse(self.directory.exists())
+
+    def test_slow_iteration_is_written_and_logged(self):
+        profiler = IterationProfiler(sample_config(str(self.directory), threshold_s=0.5))
+        profiler.finish(profiler.start(), 0.6, 41)
+        profile = profiler.start()
+        with patch("nextspyke.profiling.log_event") as log_event:
+            path = profiler.finish(profile, 0.75, 42)
+        self.assertTrue(path.is_file())
+        self.assertTrue(path.name.endswith("_42.prof"))
+        extra = log_event.call_args.kwargs["extra"]
+        self.assertEqual(log_event.call_args.kwargs["event"], "slow_iteration_profiled")
+        self.assertEqual(extra["duration_ms"], 750)
+        self.assertEqual(extra["threshold_ms"], 500)
+        self.assertFalse(extra["requested"])
+        # Still slow, so the iteration after it is profiled as well.
+        self.assertIsNotNone(profiler.start())
+
+    def test_requested_profile_is_kept_once_and_rotated(self):
+        profiler = IterationProfiler(sample_config(str(self.directory), keep=2))
+        self.directory.mkdir()
+        for name in ("20260101T000000Z_a_1.prof", "20260102T000000Z_a_2.prof"):
+            (self.directory / name).write_bytes(b"")
+        profiler.request()
+        with patch("nextspyke.profiling.log_event") as log_event:
+            path = profiler.finish(profiler.start(), 0.1, None)
+        self.assertTrue(path.name.endswith("_failed.prof"))
+        self.assertTrue(log_event.call_args.kwargs["extra"]["requested"])
+        self.assertEqual(
+            sorted(p.name for p in self.directory.glob("*.prof")),
+            ["20260102T000000Z_a_2.prof", path.name],
+        )
+        self.assertIsNone(profiler.start())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,283 @@
+import json
+import sys
+import unittest
+from contextlib import contextmanager
+from dataclasses import replace
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+from urllib.request import urlopen
+
+import psycopg
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke import query_api
+from nextspyke.config import AppConfig
+
+
+def sample_config() -> AppConfig:
+    return AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+
+
+class FakeCursor:
+    def __init__(self, columns, rows):
+        self.description = [SimpleNamespace(name=name) for name in columns]
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class FakePool:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @contextmanager
+    def connection(self):
+        yield SimpleNamespace(cursor=lambda: self.cursor)
+
+
+def build_api(columns=("value",), rows=((1,),)):
+    cursor = FakeCursor(columns, list(rows))
+    api = query_api.QueryApi(sample_config(), FakePool(cursor), query_api.ResponseCache(ttl_s=60))
+    return api, cursor
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_entries_expire_and_clear(self):
+        cache = query_api.ResponseCache(ttl_s=10)
+        with patch("nextspyke.query_api.time.monotonic", return_value=100.0):
+            cache.set("/summary", b"a", cache.generation)
+            self.assertEqual(cache.get("/summary"), b"a")
+        with patch("nextspyke.query_api.time.monotonic", return_value=110.0):
+            self.assertIsNone(cache.get("/summary"))
+        cache.set("/summary", b"b", cache.generation)
+        cache.clear()
+        self.assertIsNone(cache.get("/summary"))
+        self.assertIsNone(cache.get("/routes"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = query_api.ResponseCache(ttl_s=10, max_entries=2)
+        cache.set(("/summary",), b"a", cache.generation)
+        cache.set(("/routes", None, None, 20), b"b", cache.generation)
+        self.assertEqual(cache.get(("/summary",)), b"a")
+        cache.set(("/hotspots", None, None, 20), b"c", cache.generation)
+        self.assertIsNone(cache.get(("/routes", None, None, 20)))
+        self.assertEqual(cache.get(("/summary",)), b"a")
+        self.assertEqual(cache.get(("/hotspots", None, None, 20)), b"c")
+
+    def test_response_started_before_clear_is_not_stored(self):
+        cache = query_api.ResponseCache(ttl_s=10)
+        generation = cache.generation
+        cache.clear()
+        cache.set("/summary", b"stale", generation)
+        self.assertIsNone(cache.get("/summary"))
+        cache.set("/summary", b"fresh", cache.generation)
+        self.assertEqual(cache.get("/summary"), b"fresh")
+
+
+class TestReadOnlyPool(unittest.TestCase):
+    def test_connections_are_reused_and_read_only(self):
+        conn = Mock(closed=False)
+        with patch("nextspyke.query_api.psycopg.connect", return_value=conn) as connect:
+            pool = query_api.ReadOnlyPool("postgresql://reader@db/nextspyke", size=2)
+            with pool.connection() as first:
+                pass
+            with pool.connection() as second:
+                pass
+        self.assertIs(first, second)
+        connect.assert_called_once()
+        self.assertTrue(connect.call_args.kwargs["autocommit"])
+        self.assertIn("default_transaction_read_only=on", connect.call_args.kwargs["options"])
+        pool.close()
+        conn.close.assert_called_once_with()
+
+    def test_broken_connections_are_discarded(self):
+        conn = Mock(closed=False)
+
+        def close():
+            conn.closed = True
+
+        conn.close.side_effect = close
+        with patch("nextspyke.query_api.psycopg.connect", return_value=conn):
+            pool = query_api.ReadOnlyPool("postgresql://reader@db/nextspyke", size=1)
+            with self.assertRaises(psycopg.OperationalError):
+                with pool.connection():
+                    raise psycopg.OperationalError("gone")
+        self.assertTrue(pool._idle.empty())
+
+
+class TestQueryApi(unittest.TestCase):
+    def test_summary_returns_latest_snapshot_row(self):
+        fetched_at = datetime(2026, 6, 1, 12, tzinfo=timezone.utc)
+        api, cursor = build_api(("snapshot_id", "fetched_at"), [(7, fetched_at)])
+        status, body = api.handle("/summary")
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            json.loads(body),
+            {"data": {"snapshot_id": 7, "fetched_at": "2026-06-01T12:00:00.000Z"}},
+        )
+        self.assertEqual(cursor.executed[0][1], ("fg", "fg"))
+
+    def test_summary_without_snapshots(self):
+        api, _cursor = build_api(rows=[])
+        self.assertEqual(json.loads(api.handle("/summary")[1]), {"data": None})
+
+    def test_responses_are_cached_until_invalidated(self):
+        api, cursor = build_api()
+        api.handle("/summary")
+        api.handle("/summary")
+        self.assertEqual(len(cursor.executed), 1)
+        api.cache.clear()
+        api.handle("/summary")
+        self.assertEqual(len(cursor.executed), 2)
+
+    def test_response_read_during_invalidation_is_not_cached(self):
+        api, cursor = build_api()
+        cursor.fetchall = lambda: (api.cache.clear(), [(1,)])[1]
+        api.handle("/summary")
+        self.assertIsNone(api.cache.get(("/summary",)))
+
+    def test_cache_key_is_the_route_and_its_parsed_parameters(self):
+        api, cursor = build_api()
+        api.handle("/routes?from=2026-06-01T00:00:00Z&to=2026-06-02T00:00:00Z&limit=5")
+        # Same range in another order, offset and spelling, plus an unknown parameter.
+        api.handle("/routes?limit=05&to=2026-06-02T02:00:00%2B02:00&from=2026-06-01T00:00:00Z&x=1")
+        api.handle("/stations/123/series?utm=1")
+        api.handle("/stations/0123/series")
+        api.handle("/bikes/100%2042/path")
+        api.handle("/bikes/100 42/path")
+        self.assertEqual(len(cursor.executed), 3)
+        api.handle("/routes?from=2026-06-01T00:00:00Z&to=2026-06-02T00:00:00Z")
+        self.assertEqual(len(cursor.executed), 4)
+
+    def test_hotspots_and_routes_use_time_range_and_limit(self):
+        api, cursor = build_api()
+        api.handle("/hotspots?from=2026-06-01T00:00:00Z&to=2026-06-02T00:00:00+00:00&limit=5")
+        api.handle("/routes?from=2026-06-01T00:00:00Z&to=2026-06-02T00:00:00Z")
+        hotspots_query, hotspots_params = cursor.executed[0]
+        routes_query, routes_params = cursor.executed[1]
+        self.assertIn("SUM(rs.movements) AS arrivals", hotspots_query)
+        self.assertEqual(
+            hotspots_params,
+            (
+                datetime(2026, 6, 1, tzinfo=timezone.utc),
+                datetime(2026, 6, 2, tzinfo=timezone.utc),
+                5,
+            ),
+        )
+        self.assertIn("AS trips", routes_query)
+        self.assertEqual(routes_params[2], 20)
+
+    def test_station_series_and_bike_path(self):
+        api, cursor = build_api()
+        now = datetime(2026, 6, 2, tzinfo=timezone.utc)
+        with patch("nextspyke.query_api.utc_now", return_value=now):
+            api.handle("/stations/123/series")
+            api.handle("/bikes/BIKE%2F10042/path?from=2026-06-01T12:00:00Z")
+        self.assertIn("place_status_series", cursor.executed[0][0])
+        self.assertEqual(
+            cursor.executed[0][1], (datetime(2026, 6, 1, tzinfo=timezone.utc), now, 123)
+        )
+        self.assertIn("bike_path", cursor.executed[1][0])
+        self.assertEqual(
+            cursor.executed[1][1],
+            ("BIKE/10042", datetime(2026, 6, 1, 12, tzinfo=timezone.utc), now),
+        )
+
+    def test_invalid_requests_are_rejected(self):
+        api, cursor = build_api()
+        cases = {
+            "/unknown": 404,
+            "/routes?limit=0": 400,
+            "/routes?limit=x": 400,
+            "/routes?from=yesterday": 400,
+            "/routes?from=2026-06-01T00:00:00": 400,
+            "/routes?from=2026-06-02T00:00:00Z&to=2026-06-01T00:00:00Z": 400,
+        }
+        for target, expected in cases.items():
+            status, body = api.handle(target)
+            self.assertEqual(status, expected, target)
+            self.assertIn("error", json.loads(body))
+        self.assertEqual(cursor.executed, [])
+
+    def test_database_errors_return_503_and_are_logged(self):
+        api, cursor = build_api()
+        cursor.execute = Mock(side_effect=psycopg.OperationalError("down"))
+        with patch("nextspyke.query_api.log_event") as log_event:
+            status, _body = api.handle("/summary")
+        self.assertEqual(status, 503)
+        self.assertEqual(log_event.call_args.kwargs["event"], "query_api_failed")
+        self.assertIsNone(api.cache.get(("/summary",)))
+
+    def test_json_value_stringifies_other_types(self):
+        self.assertEqual(
+            query_api._json_value(datetime(2026, 6, 1, tzinfo=timezone.utc)),
+            "2026-06-01T00:00:00.000Z",
+        )
+        self.assertEqual(query_api._json_value(Path("x")), "x")
+
+
+class TestQueryApiServer(unittest.TestCase):
+    def tearDown(self):
+        query_api._cache = None
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(query_api.start_query_api(sample_config()))
+        query_api.invalidate_query_cache()
+
+    def test_serves_json_and_invalidates_cache(self):
+        config = replace(sample_config(), query_api_enabled=True, query_api_port=0)
+        with patch("nextspyke.query_api.build_query_dsn", return_value="postgresql://x"):
+            server = query_api.start_query_api(config)
+        self.assertIsNotNone(server)
+        self.assertIsNone(query_api.start_query_api(config))
+        try:
+            server.api.handle = Mock(return_value=(200, b'{"data":1}'))
+            port = server.server_address[1]
+            with urlopen(f"http://127.0.0.1:{port}/summary", timeout=5) as response:
+                self.assertEqual(response.headers["Content-Type"], "application/json")
+                self.assertEqual(json.loads(response.read()), {"data": 1})
+            server.api.handle.assert_called_once_with("/summary")
+            query_api._cache.set("/summary", b"cached", query_api._cache.generation)
+            query_api.invalidate_query_cache()
+            self.assertIsNone(query_api._cache.get("/summary"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
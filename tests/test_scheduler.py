@@ -0,0 +1,248 @@
+import sys
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from threading import Timer
+from unittest.mock import MagicMock, Mock, patch
+
+import psycopg
+from prometheus_client import REGISTRY
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.config import AppConfig
+from nextspyke.maintenance import drop_expired_place_status
+from nextspyke.scheduler import MAINTENANCE_JOBS, MaintenanceJob, MaintenanceScheduler
+
+
+def sample_config(**overrides) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=60,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+    return replace(config, **overrides)
+
+
+def runs(job: str, outcome: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "app_maintenance_job_runs_total", {"job": job, "outcome": outcome}
+    )
+    return value or 0.0
+
+
+class TestMaintenanceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.log_event = self.enterContext(patch("nextspyke.scheduler.log_event"))
+        self.connect = self.enterContext(patch("nextspyke.scheduler.psycopg.connect"))
+        self.conn = self.connect.return_value
+        self.conn.closed = False
+        # No jitter: every job is due immediately and then exactly one interval later.
+        self.enterContext(patch("nextspyke.scheduler.random.uniform", return_value=0.0))
+        self.clock = self.enterContext(patch("nextspyke.scheduler.time.monotonic"))
+        self.clock.return_value = 1000.0
+
+    def scheduler(self, *jobs, **kwargs) -> MaintenanceScheduler:
+        return MaintenanceScheduler(sample_config(), jobs, **kwargs)
+
+    def test_disabled_without_interval(self):
+        scheduler = MaintenanceScheduler(sample_config(refresh_mv_interval=0))
+        with patch("nextspyke.scheduler.Thread") as thread:
+            scheduler.start()
+        thread.assert_not_called()
+        self.assertFalse(scheduler.running)
+
+    def test_start_runs_loop_once(self):
+        scheduler = self.scheduler()
+        with patch("nextspyke.scheduler.Thread") as thread:
+            scheduler.start()
+            scheduler.start()
+        thread.assert_called_once_with(target=scheduler._loop, name="maintenance", daemon=True)
+        self.assertTrue(scheduler.running)
+
+    def test_intervals_and_timeouts_fall_back_to_config(self):
+        scheduler = self.scheduler()
+        default = MaintenanceJob("default", Mock())
+        fixed = MaintenanceJob("fixed", Mock(), 3600, 0)
+        self.assertEqual((scheduler.interval(default), scheduler.timeout(default)), (60, 30))
+        self.assertEqual((scheduler.interval(fixed), scheduler.timeout(fixed)), (3600, 0))
+
+    def test_runs_due_jobs_and_reschedules_them(self):
+        fast = MaintenanceJob("fast", Mock())
+        slow = MaintenanceJob("slow", Mock(), 600)
+        scheduler = self.scheduler(fast, slow)
+
+        self.assertEqual(scheduler.run_pending(), ["fast", "slow"])
+        self.assertEqual(scheduler.seconds_until_due(), 60)
+        self.clock.return_value = 1060.0
+        self.assertEqual(scheduler.run_pending(), ["fast"])
+        self.assertEqual(fast.run.call_count, 2)
+        slow.run.assert_called_once_with(self.conn, scheduler.config)
+
+    def test_standby_skips_due_jobs(self):
+        job = MaintenanceJob("standby", Mock())
+        scheduler = self.scheduler(job, may_run=lambda: False)
+        self.assertEqual(scheduler.run_pending(), [])
+        job.run.assert_not_called()
+        self.assertEqual(scheduler.seconds_until_due(), 60)
+
+    def test_sets_timeouts_on_its_own_connection(self):
+        job = MaintenanceJob("timeouts", Mock(), timeout_s=12)
+        scheduler = self.scheduler(job)
+        self.assertTrue(scheduler.run_job(job))
+        self.assertTrue(scheduler.run_job(job))
+        self.connect.assert_called_once()
+        settings = [call.args[1][0] for call in self.conn.execute.call_args_list]
+        self.assertEqual(settings, ["1000ms", "12000ms", "12000ms"])
+        self.assertEqual(runs("timeouts", "success"), 2)
+        self.assertIsNotNone(
+            REGISTRY.get_sample_value(
+                "app_maintenance_job_last_success_timestamp_seconds", {"job": "timeouts"}
+            )
+        )
+        self.assertEqual(self.log_event.call_args.kwargs["event"], "maintenance_job_complete")
+
+    def test_failed_jobs_are_counted_by_outcome_and_reconnect(self):
+        failures = (
+            ("locked", psycopg.errors.LockNotAvailable("locked"), "lock_timeout", "warn"),
+            ("slow", psycopg.errors.QueryCanceled("canceled"), "timeout", "error"),
+            ("broken", RuntimeError("boom"), "failure", "error"),
+        )
+        for name, exc, outcome, level in failures:
+            with self.subTest(outcome=outcome):
+                job = MaintenanceJob(name, Mock(side_effect=exc))
+                scheduler = self.scheduler(job)
+                self.assertFalse(scheduler.run_job(job))
+                self.assertEqual(runs(name, outcome), 1)
+                self.assertEqual(self.log_event.call_args.args[0], level)
+                self.assertEqual(self.log_event.call_args.kwargs["extra"]["outcome"], outcome)
+                self.conn.close.assert_called_once()
+                self.conn.close.reset_mock()
+
+    def test_waits_for_running_ingest(self):
+        job = MaintenanceJob("yielding", Mock())
+        scheduler = self.scheduler(job)
+        ingest = scheduler.ingesting()
+        ingest.__enter__()
+        Timer(0.05, ingest.__exit__, (None, None, None)).start()
+        with patch("nextspyke.scheduler.MAINTENANCE_IDLE_POLL_S", 0.01):
+            self.assertEqual(scheduler.run_pending(), ["yielding"])
+        self.assertEqual(
+            REGISTRY.get_sample_value("app_maintenance_yields_total", {"job": "yielding"}), 1
+        )
+
+    def test_stop_while_waiting_for_ingest_skips_job(self):
+        job = MaintenanceJob("stopping", Mock())
+        scheduler = self.scheduler(job)
+        with scheduler.ingesting():
+            Timer(0.05, scheduler.stop).start()
+            with patch("nextspyke.scheduler.MAINTENANCE_IDLE_POLL_S", 0.01):
+                self.assertEqual(scheduler.run_pending(), [])
+        job.run.assert_not_called()
+
+    def test_after_ingest_job_runs_once_next_snapshot_committed(self):
+        job = MaintenanceJob("detaching", Mock(), after_ingest=True)
+        scheduler = self.scheduler(job)
+        # A commit before the job came due does not count; the gap after it may be over.
+        with scheduler.ingesting():
+            pass
+
+        def failed_ingest():
+            with self.assertRaises(RuntimeError), scheduler.ingesting():
+                job.run.assert_not_called()
+                raise RuntimeError("fetch failed")
+
+        def ingest():
+            failed_ingest()
+            with scheduler.ingesting():
+                job.run.assert_not_called()
+
+        Timer(0.05, ingest).start()
+        with patch("nextspyke.scheduler.MAINTENANCE_IDLE_POLL_S", 0.01):
+            self.assertEqual(scheduler.run_pending(), ["detaching"])
+        job.run.assert_called_once()
+        self.assertEqual(
+            REGISTRY.get_sample_value("app_maintenance_yields_total", {"job": "detaching"}), 1
+        )
+
+    def test_stop_while_waiting_for_commit_skips_job(self):
+        job = MaintenanceJob("waiting", Mock(), after_ingest=True)
+        scheduler = self.scheduler(job)
+        Timer(0.05, scheduler.stop).start()
+        with patch("nextspyke.scheduler.MAINTENANCE_IDLE_POLL_S", 0.01):
+            self.assertEqual(scheduler.run_pending(), [])
+        job.run.assert_not_called()
+
+    def test_loop_runs_until_stopped(self):
+        scheduler = self.scheduler(MaintenanceJob("loop", Mock()))
+        with patch.object(scheduler, "run_pending", side_effect=scheduler._stop.set) as pending:
+            scheduler._loop()
+        pending.assert_called_once_with()
+
+    def test_stop_closes_connection_once_thread_ended(self):
+        job = MaintenanceJob("closing", Mock())
+        scheduler = self.scheduler(job)
+        scheduler.run_job(job)
+        scheduler._thread = Mock()
+        scheduler._thread.is_alive.return_value = True
+        scheduler.stop(timeout_s=0.1)
+        scheduler._thread.join.assert_called_once_with(0.1)
+        self.conn.close.assert_not_called()
+
+        scheduler._thread.is_alive.return_value = False
+        scheduler.stop()
+        self.conn.close.assert_called_once()
+        scheduler.stop()
+        self.conn.close.assert_called_once()
+
+    def test_default_jobs_call_maintenance(self):
+        conn = MagicMock()
+        targets = (
+            "ensure_upcoming_partitions",
+            "refresh_zone_metadata",
+            "refresh_vehicle_type_metadata",
+            "run_place_status_maintenance",
+            "vacuum_fresh_partitions",
+            "build_closed_partition_indexes",
+        )
+        mocks = {name: self.enterContext(patch(f"nextspyke.scheduler.{name}")) for name in targets}
+        for job in MAINTENANCE_JOBS:
+            if job.run is not drop_expired_place_status:
+                job.run(conn, sample_config())
+        for target in mocks.values():
+            target.assert_called_once()
+        # Retention runs as its own job, right after an ingest.
+        self.assertEqual(
+            mocks["run_place_status_maintenance"].call_args.kwargs, {"drop_expired": False}
+        )
+        self.assertEqual(
+            [(job.name, job.after_ingest) for job in MAINTENANCE_JOBS],
+            [
+                ("partitions", True),
+                ("metadata", False),
+                ("place_status_rollups", False),
+                ("place_status_retention", True),
+                ("vacuum_fresh_partitions", False),
+                ("closed_partition_indexes", False),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
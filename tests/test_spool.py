@@ -0,0 +1,183 @@
+import gzip
+import json
+import sys
+import tempfile
+import unittest
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import psycopg
+from prometheus_client import REGISTRY
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.config import AppConfig
+from nextspyke.ingest import FetchedFeed
+from nextspyke.metrics import (
+    APP_SPOOL_BYTES,
+    APP_SPOOL_DRAINED_TOTAL,
+    APP_SPOOL_SNAPSHOTS,
+)
+from nextspyke.spool import SnapshotBuffer, SnapshotSpool, drain_spool
+
+FETCHED_AT = datetime(2026, 6, 29, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+def sample_config(**overrides) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+    return replace(config, **overrides)
+
+
+def live_feed(minute: int, bikes: int = 1) -> FetchedFeed:
+    payload = {"countries": [{"domain": "fg", "cities": [{"uid": 21, "bikes": "x" * bikes}]}]}
+    return FetchedFeed(FETCHED_AT + timedelta(minutes=minute), json.dumps(payload))
+
+
+class TestSnapshotSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory())) / "spool"
+
+    def test_disabled_spool_touches_nothing(self):
+        spool = SnapshotSpool(self.directory, 0)
+        self.assertFalse(spool.enabled)
+        self.assertEqual(len(spool), 0)
+        self.assertFalse(self.directory.exists())
+
+    def test_appends_in_order_and_round_trips(self):
+        spool = SnapshotSpool(self.directory, 1024 * 1024)
+        spool.append(live_feed(1))
+        spool.append(live_feed(0))
+        self.assertEqual(len(spool), 2)
+        first = spool.load(spool.peek(1)[0])
+        self.assertEqual(first, live_feed(0))
+        self.assertEqual(APP_SPOOL_SNAPSHOTS._value.get(), 2)
+        self.assertEqual(APP_SPOOL_BYTES._value.get(), spool.size_bytes)
+        self.assertEqual(list(self.directory.glob("*.tmp")), [])
+
+    def test_drops_oldest_feeds_beyond_limit(self):
+        size = len(gzip.compress(live_feed(0).payload.encode("utf-8"), compresslevel=6))
+        spool = SnapshotSpool(self.directory, size * 2)
+        self.assertEqual(spool.append(live_feed(0)), 0)
+        self.assertEqual(spool.append(live_feed(1)), 0)
+        self.assertEqual(spool.append(live_feed(2)), 1)
+        self.assertEqual([spool.load(path) for path in spool.peek(5)], [live_feed(1), live_feed(2)])
+        self.assertLessEqual(spool.size_bytes, size * 2)
+
+    def test_keeps_single_feed_larger_than_limit(self):
+        spool = SnapshotSpool(self.directory, 1)
+        self.assertEqual(spool.append(live_feed(0)), 0)
+        self.assertEqual(len(spool), 1)
+
+    def test_reloads_after_restart_and_removes_partial_writes(self):
+        SnapshotSpool(self.directory, 1024 * 1024).append(live_feed(0))
+        (self.directory / "20260629T120500.000000Z.json.gz.tmp").write_bytes(b"partial")
+        spool = SnapshotSpool(self.directory, 1024 * 1024)
+        self.assertEqual(len(spool), 1)
+        self.assertEqual(list(self.directory.glob("*.tmp")), [])
+
+    def test_oldest_age_follows_queue_head(self):
+        spool = SnapshotSpool(self.directory, 1024 * 1024)
+        self.assertEqual(spool.oldest_age_seconds(), 0.0)
+        spool.append(live_feed(0))
+        with patch("nextspyke.spool.utc_now", return_value=FETCHED_AT + timedelta(minutes=10)):
+            self.assertEqual(spool.oldest_age_seconds(), 600)
+            self.assertEqual(REGISTRY.get_sample_value("app_spool_oldest_age_seconds"), 600)
+        self.assertEqual(spool.clear(), 1)
+        self.assertEqual(spool.oldest_age_seconds(), 0.0)
+
+
+class TestDrainSpool(unittest.TestCase):
+    def setUp(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.spool = SnapshotSpool(directory, 1024 * 1024)
+        self.log_event = self.enterContext(patch("nextspyke.spool.log_event"))
+
+    def test_drains_oldest_first_in_batches(self):
+        for minute in range(5):
+            self.spool.append(live_feed(minute))
+        drained_before = APP_SPOOL_DRAINED_TOTAL._value.get()
+        with patch("nextspyke.spool.ingest_backlog") as ingest_backlog:
+            result = drain_spool(Mock(), sample_config(), self.spool, batch_size=2)
+
+        self.assertEqual(result["snapshots"], 5)
+        self.assertEqual(result["batches"], 3)
+        batches = [call.args[2] for call in ingest_backlog.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][0][0], FETCHED_AT)
+        self.assertEqual(batches[0][0][1]["countries"][0]["domain"], "fg")
+        self.assertEqual(len(self.spool), 0)
+        self.assertEqual(APP_SPOOL_DRAINED_TOTAL._value.get() - drained_before, 5)
+
+    def test_drops_unreadable_feeds(self):
+        self.spool.append(live_feed(0))
+        self.spool.append(FetchedFeed(FETCHED_AT + timedelta(minutes=1), "not json"))
+        self.spool.append(FetchedFeed(FETCHED_AT + timedelta(minutes=2), '{"countries": []}'))
+        self.spool.peek(1)[0].write_bytes(b"truncated")
+        with patch("nextspyke.spool.ingest_backlog") as ingest_backlog:
+            result = drain_spool(Mock(), sample_config(), self.spool)
+        self.assertEqual(result["dropped"], 3)
+        ingest_backlog.assert_not_called()
+        self.assertEqual(len(self.spool), 0)
+        self.assertEqual(self.log_event.call_args.kwargs["event"], "spool_entry_dropped")
+
+    def test_failed_batch_stays_spooled(self):
+        for minute in range(3):
+            self.spool.append(live_feed(minute))
+        with patch(
+            "nextspyke.spool.ingest_backlog",
+            side_effect=[None, psycopg.OperationalError("gone")],
+        ):
+            with self.assertRaises(psycopg.OperationalError):
+                drain_spool(Mock(), sample_config(), self.spool, batch_size=2)
+        self.assertEqual([self.spool.load(path) for path in self.spool.peek(5)], [live_feed(2)])
+
+
+class TestSnapshotBuffer(unittest.TestCase):
+    def test_single_snapshot_batches_are_disabled(self):
+        self.assertFalse(SnapshotBuffer(1, 60).enabled)
+        self.assertTrue(SnapshotBuffer(2, 60).enabled)
+
+    def test_due_when_full_or_window_elapsed(self):
+        buffer = SnapshotBuffer(3, 60)
+        self.assertFalse(buffer.due(FETCHED_AT))
+        buffer.add(live_feed(0))
+        self.assertEqual(buffer.entries[0][1]["countries"][0]["domain"], "fg")
+        self.assertFalse(buffer.due(FETCHED_AT + timedelta(seconds=59)))
+        self.assertTrue(buffer.due(FETCHED_AT + timedelta(seconds=60)))
+        buffer.add(live_feed(0))
+        buffer.add(live_feed(0))
+        self.assertTrue(buffer.due(FETCHED_AT))
+        self.assertEqual(buffer.take(), [live_feed(0)] * 3)
+        self.assertEqual(len(buffer), 0)
+
+    def test_rejects_malformed_feed_without_buffering_it(self):
+        buffer = SnapshotBuffer(3, 60)
+        with self.assertRaises(RuntimeError):
+            buffer.add(FetchedFeed(FETCHED_AT, '{"countries": []}'))
+        self.assertEqual(len(buffer), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
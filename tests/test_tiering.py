@@ -0,0 +1,566 @@
+import hashlib
+import importlib.util
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from nextspyke.config import AppConfig
+from nextspyke.export import ParquetSink
+from nextspyke.tiering import (
+    COLD_TABLES,
+    TIER_BATCH_ROWS,
+    HistoryReader,
+    TieringError,
+    fill_place_status,
+    fsync_file,
+    read_cold_file,
+    read_cold_range,
+    tier_cold_partitions,
+    tier_partition,
+    update_row_digest,
+    verify_cold_file,
+)
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+JUNE_1 = datetime(2026, 6, 1, tzinfo=timezone.utc)
+JULY_1 = datetime(2026, 7, 1, tzinfo=timezone.utc)
+BIKE_STATUS = COLD_TABLES["bike_status"]
+
+
+def sample_config(**overrides) -> AppConfig:
+    config = AppConfig(
+        service="nextspyke",
+        env="test",
+        version="0.1.0",
+        commit="abc123",
+        domain="fg",
+        city_id=21,
+        poll_interval=60,
+        fetch_zones=True,
+        fetch_gbfs=True,
+        store_raw_json=True,
+        movement_min_distance_m=10,
+        refresh_mv_interval=0,
+        refresh_mv_timeout=30,
+        gbfs_system_id="nextbike_fg",
+        metrics_enabled=False,
+        metrics_port=8000,
+        config_source="env",
+        config_hash="sha256:test",
+    )
+    return replace(config, **overrides)
+
+
+def status_row(minute: int, bike_number: str = "100") -> tuple:
+    return (
+        JUNE_1 + timedelta(minutes=minute),
+        minute,
+        bike_number,
+        7,
+        True,
+        "ok",
+        80,
+        None,
+        1.5,
+        49.0,
+        8.4,
+    )
+
+
+class RecordingSink:
+    def __init__(self, path: Path, columns: tuple) -> None:
+        self.path = path
+        self.rows: list[tuple] = []
+        self.closed = False
+        self.aborted = False
+
+    def write(self, rows: list[tuple]) -> None:
+        self.rows.extend(rows)
+
+    def close(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(b"PAR1")
+        self.closed = True
+
+    def abort(self) -> None:
+        self.aborted = True
+
+
+class TierCursor:
+    def __init__(self, conn, name=None) -> None:
+        self.conn = conn
+        self.name = name
+        self.batches: list[list[tuple]] = []
+        self.itersize = None
+
+    def execute(self, query, params=None) -> None:
+        self.conn.executed.append((self.name, query, params))
+        if self.name:
+            self.batches = list(self.conn.batches)
+
+    def fetchone(self):
+        return (self.conn.count,)
+
+    def fetchall(self):
+        return self.conn.cold_paths
+
+    def fetchmany(self, _size: int) -> list[tuple]:
+        if self.conn.fail_fetch:
+            raise RuntimeError("connection lost")
+        return self.batches.pop(0) if self.batches else []
+
+    def __iter__(self):
+        return iter([row for batch in self.conn.batches for row in batch])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class TierConn:
+    def __init__(self, batches=(), count=None, cold_paths=()) -> None:
+        self.batches = list(batches)
+        self.count = sum(len(batch) for batch in self.batches) if count is None else count
+        self.cold_paths = list(cold_paths)
+        self.fail_fetch = False
+        self.executed = []
+        self.transactions = 0
+        self.commits = 0
+
+    @contextmanager
+    def transaction(self):
+        self.transactions += 1
+        yield
+
+    def execute(self, query, params=None) -> None:
+        self.executed.append(("conn", query, params))
+
+    def cursor(self, name=None):
+        return TierCursor(self, name)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+class FillCursor(TierCursor):
+    def fetchone(self):
+        return (self.conn.fill_from,)
+
+    def fetchall(self):
+        return self.conn.results.pop(0)
+
+
+class FillConn(TierConn):
+    def __init__(self, fill_from, snapshots, cold_paths=(), batches=()) -> None:
+        super().__init__(batches)
+        self.fill_from = fill_from
+        self.results = [snapshots, list(cold_paths)]
+
+    def cursor(self, name=None):
+        return FillCursor(self, name)
+
+
+PLACE_COLUMNS = [name for name, _kind in COLD_TABLES["place_status"].columns]
+
+
+def place_row(snapshot_id: int, fetched_at: datetime, place_uid: int, bikes: int) -> tuple:
+    return (fetched_at, snapshot_id, place_uid, 0, bikes, bikes, 10, 10 - bikes, 0, 0, None)
+
+
+def statements(conn: TierConn) -> list[str]:
+    return [str(query) for _name, query, _params in conn.executed]
+
+
+class TestTierPartition(unittest.TestCase):
+    def setUp(self):
+        self.cold_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.batches = [[status_row(0), status_row(1)], [status_row(2)]]
+        digest = hashlib.sha256()
+        update_row_digest(digest, [row for batch in self.batches for row in batch])
+        self.checksum = digest.hexdigest()
+
+    def tier(self, conn, table=BIKE_STATUS, partition="bike_status_202606", verify=None):
+        sinks = []
+
+        def sink_factory(path, columns):
+            sinks.append(RecordingSink(path, columns))
+            return sinks[-1]
+
+        result = tier_partition(
+            conn,
+            table,
+            partition,
+            JUNE_1,
+            JULY_1,
+            self.cold_dir,
+            sink_factory,
+            verify or Mock(),
+        )
+        return result, sinks
+
+    def test_copies_verifies_records_and_drops(self):
+        conn = TierConn(self.batches)
+        verify = Mock()
+        with patch("nextspyke.tiering.drop_partition") as drop_partition:
+            with patch("nextspyke.tiering.fsync_file") as fsync_file:
+                result, sinks = self.tier(conn, verify=verify)
+
+        self.assertEqual(
+            result,
+            {
+                "partition": "bike_status_202606",
+                "rows": 3,
+                "path": "bike_status/bike_status_202606.parquet",
+            },
+        )
+        self.assertEqual(len(sinks[0].rows), 3)
+        self.assertTrue(sinks[0].closed)
+        fsync_file.assert_called_once_with(
+            self.cold_dir / "bike_status" / "bike_status_202606.parquet"
+        )
+        verify.assert_called_once_with(
+            self.cold_dir / "bike_status" / "bike_status_202606.parquet", 3, self.checksum
+        )
+        self.assertIn("REPEATABLE READ", statements(conn)[0])
+        insert = next(
+            params for _n, query, params in conn.executed if "cold_partition" in str(query)
+        )
+        self.assertEqual(insert[0:4], ("bike_status_202606", "bike_status", JUNE_1, JULY_1))
+        self.assertEqual(insert[5:], (3, self.checksum))
+        drop_partition.assert_called_once_with(ANY_CURSOR, "bike_status", "bike_status_202606")
+        self.assertFalse(any("maintenance_state" in query for query in statements(conn)))
+
+    def test_place_status_moves_raw_from_marker(self):
+        conn = TierConn([[]], count=0)
+        with patch("nextspyke.tiering.drop_partition"):
+            self.tier(conn, COLD_TABLES["place_status"], "place_status_202606")
+        marker = next(
+            params for _n, query, params in conn.executed if "maintenance_state" in str(query)
+        )
+        self.assertEqual(marker, ("place_status_raw_from", JULY_1))
+
+    def test_row_count_mismatch_keeps_partition(self):
+        conn = TierConn(self.batches, count=4)
+        with patch("nextspyke.tiering.drop_partition") as drop_partition:
+            with self.assertRaisesRegex(TieringError, "expected 4"):
+                self.tier(conn)
+        drop_partition.assert_not_called()
+        self.assertFalse((self.cold_dir / "bike_status" / "bike_status_202606.parquet").exists())
+
+    def test_failed_verification_keeps_partition(self):
+        conn = TierConn(self.batches)
+        with patch("nextspyke.tiering.drop_partition") as drop_partition:
+            with self.assertRaises(TieringError):
+                self.tier(conn, verify=Mock(side_effect=TieringError("checksum")))
+        drop_partition.assert_not_called()
+        self.assertFalse((self.cold_dir / "bike_status" / "bike_status_202606.parquet").exists())
+
+    def test_failed_copy_aborts_file(self):
+        conn = TierConn(self.batches)
+        conn.fail_fetch = True
+        with patch("nextspyke.tiering.drop_partition") as drop_partition:
+            with self.assertRaises(RuntimeError):
+                self.tier(conn)
+        drop_partition.assert_not_called()
+
+
+class TestFsyncFile(unittest.TestCase):
+    def setUp(self):
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "x.parquet"
+        self.path.write_bytes(b"PAR1")
+
+    def test_flushes_file_and_directory(self):
+        with patch("nextspyke.tiering.os.fsync") as fsync:
+            fsync_file(self.path)
+        self.assertEqual(fsync.call_count, 2)
+
+    def test_skips_directory_where_it_cannot_be_opened(self):
+        with patch("nextspyke.tiering.os.fsync") as fsync:
+            with patch("nextspyke.tiering.os.name", "nt"):
+                fsync_file(self.path)
+        fsync.assert_called_once()
+
+
+class AnyCursor:
+    def __eq__(self, other):
+        return isinstance(other, TierCursor)
+
+
+ANY_CURSOR = AnyCursor()
+
+
+class TestTierColdPartitions(unittest.TestCase):
+    def test_disabled_by_default(self):
+        self.assertEqual(tier_cold_partitions(TierConn(), sample_config()), [])
+
+    def test_selects_old_partitions_and_waits_for_place_status_rollups(self):
+        now = datetime(2026, 9, 15, tzinfo=timezone.utc)
+        partitions = {
+            "bike_status": [
+                ("bike_status_202606", JUNE_1, JULY_1),
+                ("bike_status_202607", JULY_1, datetime(2026, 8, 1, tzinfo=timezone.utc)),
+                ("bike_status_202609", datetime(2026, 9, 1, tzinfo=timezone.utc), now),
+            ],
+            "place_status": [
+                ("place_status_202606", JUNE_1, JULY_1),
+                ("place_status_202607", JULY_1, datetime(2026, 8, 1, tzinfo=timezone.utc)),
+            ],
+        }
+        config = sample_config(cold_tier_after_days=30, cold_storage_dir="/data/cold")
+        conn = TierConn()
+        with (
+            patch("nextspyke.tiering.utc_now", return_value=now),
+            patch(
+                "nextspyke.tiering.get_maintenance_state",
+                return_value=datetime(2026, 7, 10, tzinfo=timezone.utc),
+            ),
+            patch(
+                "nextspyke.tiering.list_month_partitions",
+                side_effect=lambda _cur, table: partitions[table],
+            ),
+            patch("nextspyke.tiering.tier_partition", return_value={"rows": 1}) as tier,
+        ):
+            result = tier_cold_partitions(conn, config)
+
+        self.assertEqual(len(result), 3)
+        tiered = [call.args[2] for call in tier.call_args_list]
+        self.assertEqual(
+            tiered, ["bike_status_202606", "bike_status_202607", "place_status_202606"]
+        )
+        self.assertEqual(tier.call_args.args[5], Path("/data/cold"))
+        self.assertEqual(conn.commits, 1)
+
+    def test_place_status_is_kept_without_rollups(self):
+        conn = TierConn()
+        partitions = {"bike_status": [], "place_status": [("place_status_202606", JUNE_1, JULY_1)]}
+        with (
+            patch("nextspyke.tiering.get_maintenance_state", return_value=None),
+            patch(
+                "nextspyke.tiering.list_month_partitions",
+                side_effect=lambda _cur, table: partitions[table],
+            ),
+            patch("nextspyke.tiering.tier_partition") as tier,
+        ):
+            tier_cold_partitions(conn, sample_config(cold_tier_after_days=1))
+        tier.assert_not_called()
+
+
+class TestHistoryReader(unittest.TestCase):
+    def test_reads_cold_files_before_live_partitions(self):
+        conn = TierConn(
+            [[status_row(90)]], cold_paths=[("bike_status/bike_status_202605.parquet",)]
+        )
+        read_file = Mock(return_value=iter([{"fetched_at": JUNE_1, "bike_number": "100"}]))
+        reader = HistoryReader(conn, "/data/cold", read_file)
+
+        rows = list(
+            reader.rows("bike_status", JUNE_1 - timedelta(days=3), JULY_1, bike_number="100")
+        )
+
+        self.assertEqual(rows[0], {"fetched_at": JUNE_1, "bike_number": "100"})
+        self.assertEqual(rows[1]["snapshot_id"], 90)
+        self.assertEqual(rows[1]["lon"], 8.4)
+        read_file.assert_called_once_with(
+            Path("/data/cold/bike_status/bike_status_202605.parquet"),
+            BIKE_STATUS,
+            JUNE_1 - timedelta(days=3),
+            JULY_1,
+            {"bike_number": "100"},
+        )
+        _name, live_query, live_params = conn.executed[-1]
+        self.assertIn('FROM "v_bike_status"', live_query.as_string(None))
+        self.assertEqual(live_params, (JUNE_1 - timedelta(days=3), JULY_1, "100"))
+
+    def test_place_status_is_filled_from_the_keyframe_before_the_range(self):
+        start = JUNE_1 + timedelta(minutes=1)
+        keyframe_at = JUNE_1 - timedelta(minutes=30)
+        conn = FillConn(
+            fill_from=keyframe_at,
+            snapshots=[
+                (1, keyframe_at, "fg", True),
+                (2, start, "fg", False),
+                (3, start + timedelta(minutes=1), "fg", False),
+            ],
+            cold_paths=[("place_status/place_status_202605.parquet",)],
+            # Snapshot 2 only wrote the station that changed.
+            batches=[[place_row(2, start, 7, bikes=3)]],
+        )
+        cold_row = dict(zip(PLACE_COLUMNS, place_row(1, keyframe_at, 7, bikes=5), strict=True))
+        read_file = Mock(
+            return_value=iter(
+                [cold_row, {**cold_row, "place_uid": 9, "bikes": 2}],
+            )
+        )
+        reader = HistoryReader(conn, "/data/cold", read_file)
+
+        rows = list(reader.rows("place_status", start, JULY_1, snapshot_id=2))
+
+        self.assertEqual(
+            [
+                (row["snapshot_id"], row["fetched_at"], row["place_uid"], row["bikes"])
+                for row in rows
+            ],
+            [(2, start, 7, 3), (2, start, 9, 2)],
+        )
+        # Written rows are read from the keyframe on, without the snapshot_id filter.
+        self.assertEqual(read_file.call_args.args[2:], (keyframe_at, JULY_1, {}))
+        self.assertEqual(conn.executed[0][2], {"start": start, "end": JULY_1})
+        self.assertEqual(conn.executed[1][2], (keyframe_at, JULY_1))
+        _name, live_query, live_params = conn.executed[-1]
+        self.assertIn('FROM "place_status"', live_query.as_string(None))
+        self.assertEqual(live_params, (keyframe_at, JULY_1))
+
+    def test_fill_place_status_starts_over_at_each_keyframe_per_domain(self):
+        minutes = [JUNE_1 + timedelta(minutes=minute) for minute in range(4)]
+        snapshots = [
+            (1, minutes[0], "fg", True),
+            (2, minutes[1], "fg", False),
+            (3, minutes[1], "ka", False),
+            (4, minutes[2], "fg", True),
+            (5, minutes[3], "fg", False),
+        ]
+        written = [
+            {"snapshot_id": 1, "fetched_at": minutes[0], "place_uid": 7, "bikes": 1},
+            {"snapshot_id": 1, "fetched_at": minutes[0], "place_uid": 8, "bikes": 1},
+            {"snapshot_id": 2, "fetched_at": minutes[1], "place_uid": 8, "bikes": 2},
+            {"snapshot_id": 3, "fetched_at": minutes[1], "place_uid": 30, "bikes": 4},
+            # The keyframe no longer lists station 8.
+            {"snapshot_id": 4, "fetched_at": minutes[2], "place_uid": 7, "bikes": 3},
+        ]
+
+        rows = fill_place_status(snapshots, written, minutes[1])
+
+        self.assertEqual(
+            [(row["snapshot_id"], row["place_uid"], row["bikes"]) for row in rows],
+            [(2, 7, 1), (2, 8, 2), (3, 30, 4), (4, 7, 3), (5, 7, 3)],
+        )
+
+    def test_rejects_unknown_filters(self):
+        reader = HistoryReader(TierConn(), "/data/cold")
+        with self.assertRaisesRegex(ValueError, "cannot filter place_status on bike_number"):
+            list(reader.rows("place_status", JUNE_1, JULY_1, bike_number="100"))
+
+
+class FakeColumn:
+    def __init__(self, values) -> None:
+        self.values = values
+
+    def to_pylist(self):
+        return self.values
+
+
+class TestColdFiles(unittest.TestCase):
+    def fake_pyarrow(self):
+        pa = Mock()
+        pq = Mock()
+        pa.parquet = pq
+        pa.dataset = Mock()
+        self.enterContext(
+            patch.dict(
+                sys.modules,
+                {"pyarrow": pa, "pyarrow.parquet": pq, "pyarrow.dataset": pa.dataset},
+            )
+        )
+        return pq
+
+    def test_read_cold_file_yields_row_tuples(self):
+        pq = self.fake_pyarrow()
+        batch = Mock(columns=[FakeColumn([1, 2]), FakeColumn(["a", "b"])])
+        pq.ParquetFile.return_value.iter_batches.return_value = [batch]
+        self.assertEqual(list(read_cold_file(Path("x.parquet"))), [(1, "a"), (2, "b")])
+
+    def test_verify_cold_file_checks_rows_and_checksum(self):
+        rows = [status_row(0), status_row(1)]
+        digest = hashlib.sha256()
+        update_row_digest(digest, rows)
+        with patch("nextspyke.tiering.read_cold_file", return_value=iter(rows)):
+            verify_cold_file(Path("x.parquet"), 2, digest.hexdigest())
+        with patch("nextspyke.tiering.read_cold_file", return_value=iter(rows)):
+            with self.assertRaisesRegex(TieringError, "has 2 rows, expected 3"):
+                verify_cold_file(Path("x.parquet"), 3, digest.hexdigest())
+        with patch("nextspyke.tiering.read_cold_file", return_value=iter(rows[:1] * 2)):
+            with self.assertRaisesRegex(TieringError, "checksum"):
+                verify_cold_file(Path("x.parquet"), 2, digest.hexdigest())
+
+    def test_read_cold_range_pushes_filters_down(self):
+        pq = self.fake_pyarrow()
+        dataset = sys.modules["pyarrow.dataset"].dataset
+        batches = [
+            Mock(to_pylist=Mock(return_value=[{"bike_number": "100"}])),
+            Mock(to_pylist=Mock(return_value=[{"bike_number": "100", "snapshot_id": 2}])),
+        ]
+        dataset.return_value.to_batches.return_value = iter(batches)
+        rows = list(
+            read_cold_range(Path("x.parquet"), BIKE_STATUS, JUNE_1, JULY_1, {"bike_number": "100"})
+        )
+        self.assertEqual(rows, [{"bike_number": "100"}, {"bike_number": "100", "snapshot_id": 2}])
+        dataset.assert_called_once_with(Path("x.parquet"), format="parquet")
+        self.assertEqual(
+            dataset.return_value.to_batches.call_args.kwargs,
+            {"filter": pq.filters_to_expression.return_value, "batch_size": TIER_BATCH_ROWS},
+        )
+        self.assertEqual(
+            pq.filters_to_expression.call_args.args[0],
+            [
+                ("fetched_at", ">=", JUNE_1),
+                ("fetched_at", "<", JULY_1),
+                ("bike_number", "=", "100"),
+            ],
+        )
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_round_trip_with_pyarrow(self):
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "bike_status_202606.parquet"
+        rows = [status_row(minute, str(100 + minute % 2)) for minute in range(6)]
+        sink = ParquetSink(path, BIKE_STATUS.columns)
+        sink.write(rows)
+        sink.close()
+        digest = hashlib.sha256()
+        update_row_digest(digest, rows)
+
+        verify_cold_file(path, 6, digest.hexdigest())
+        selected = list(
+            read_cold_range(
+                path, BIKE_STATUS, JUNE_1, JUNE_1 + timedelta(minutes=4), {"bike_number": "101"}
+            )
+        )
+        self.assertEqual([row["snapshot_id"] for row in selected], [1, 3])
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_cold_file_round_trip_with_pyarrow(self):
+        cold_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        samples = {
+            "bike_status": [status_row(0), status_row(1, "101"), status_row(2)],
+            "place_status": [
+                place_row(1, JUNE_1, 7, bikes=5),
+                (*place_row(1, JUNE_1, 9, bikes=2)[:-1], '{"71": 2}'),
+                place_row(2, JUNE_1 + timedelta(minutes=1), 7, bikes=4),
+            ],
+        }
+        for table, rows in samples.items():
+            with self.subTest(table=table):
+                path = cold_dir / f"{table}_202606.parquet"
+                sink = ParquetSink(path, COLD_TABLES[table].columns)
+                sink.write(rows)
+                sink.close()
+                digest = hashlib.sha256()
+                update_row_digest(digest, rows)
+
+                self.assertEqual(list(read_cold_file(path)), rows)
+                verify_cold_file(path, len(rows), digest.hexdigest())
+                with self.assertRaisesRegex(TieringError, "expected 4"):
+                    verify_cold_file(path, 4, digest.hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()